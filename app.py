@@ -1,5 +1,5 @@
 # -*- coding: utf-8 -*-
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session, make_response, send_from_directory, send_file
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session, make_response, send_from_directory, send_file, abort
 try:
     from flask_cors import CORS
     CORS_AVAILABLE = True
@@ -15,11 +15,17 @@ import mimetypes
 import secrets
 import string
 import json
+import click
 from functools import wraps
 from werkzeug.utils import secure_filename
 from config import Config
 from utils.timezone import now_vn, today_vn
-from utils.email_sender import send_email_from_config
+from utils.query_profiler import query_profiler
+from utils.audit import audit
+from utils.jobs import background_export, enqueue, job_runner
+from utils.report_cache import cached_report_export
+from utils.search_index import apply_search
+from utils.suggest_index import suggest_index
 import pandas as pd
 
 app = Flask(__name__)
@@ -213,14 +219,19 @@ except Exception:
 
 # Import db from models
 from models import (
-    db, Asset, Role, User, AssetType, AuditLog, MaintenanceRecord, AssetTransfer, 
+    db, Asset, Role, User, AssetType, MaintenanceRecord, AssetTransfer, 
     Permission, UserPermission, AssetVoucher, AssetVoucherItem, AssetTransferHistory,
     AssetProcessRequest, AssetDepreciation, AssetAmortization,
     Inventory, InventoryResult, InventoryTeam, InventoryTeamMember,
-    InventorySurplusAsset, InventoryLog, InventoryLinePhoto, asset_user, SystemSetting
+    InventorySurplusAsset, InventoryLog, InventoryLinePhoto, asset_user, SystemSetting,
+    AssetTypeRollup, AssetImportJob, SearchDocument, BackgroundJob
 )
 db.init_app(app)
 migrate = Migrate(app, db)
+query_profiler.init_app(app)
+suggest_index.init_app(app)
+job_runner.init_app(app)
+audit.init_app(app)
 
 # Context processor để các cấu hình hệ thống có sẵn trong tất cả templates
 @app.context_processor
@@ -491,6 +502,18 @@ def admin_or_manager_required(f):
     """Admin hoặc Manager được truy cập (alias của manager_required)"""
     return manager_required(f)
 
+# Thống kê truy vấn SQL theo endpoint (cần bật QUERY_PROFILER_ENABLED)
+@app.route('/dev/diag/queries', methods=['GET', 'POST'])
+@admin_required
+def dev_diag_queries():
+    if request.method == 'POST':
+        query_profiler.reset()
+    return jsonify({
+        'enabled': bool(app.config.get('QUERY_PROFILER_ENABLED')),
+        'slow_ms': app.config.get('QUERY_PROFILER_SLOW_MS'),
+        'endpoints': query_profiler.snapshot()
+    }), 200
+
 # Root/index route
 @app.route('/')
 @login_required
@@ -501,6 +524,7 @@ def index():
     """
     try:
         from datetime import date
+        from utils.dashboard_stats import compute_dashboard_stats
         today = date.today()
         
         # Lấy các loại tài sản
@@ -508,236 +532,16 @@ def index():
             AssetType.deleted_at.is_(None)
         ).all()
         
-        # Lấy tất cả tài sản để tính toán thống kê
-        all_assets = Asset.query.filter(Asset.deleted_at.is_(None)).all()
-        
         # Lấy một số tài sản gần đây
         assets = Asset.query.filter(
             Asset.deleted_at.is_(None)
         ).order_by(Asset.created_at.desc()).limit(10).all()
         
-        # Hàm mapping icon theo tên loại thiết bị
-        def get_asset_type_icon(type_name):
-            """Trả về icon phù hợp với loại thiết bị"""
-            if not type_name:
-                return 'fa-box'
-            type_name_lower = type_name.lower().strip()
-            
-            icon_map = [
-                ('thiết bị văn phòng', 'fa-print'),
-                ('thiết bị điện tử', 'fa-microchip'),
-                ('thiết bị mạng', 'fa-network-wired'),
-                ('thiết bị điện', 'fa-plug'),
-                ('thiết bị an ninh', 'fa-shield-alt'),
-                ('cây máy tính', 'fa-desktop'),
-                ('bàn ghế', 'fa-couch'),
-                ('air conditioner', 'fa-snowflake'),
-                ('cơ sở dữ liệu', 'fa-database'),
-                ('máy chủ', 'fa-server'),
-                ('sao lưu', 'fa-hdd'),
-                ('máy tính', 'fa-desktop'),
-                ('computer', 'fa-desktop'),
-                ('pc', 'fa-desktop'),
-                ('laptop', 'fa-laptop'),
-                ('office', 'fa-print'),
-                ('máy in', 'fa-print'),
-                ('printer', 'fa-print'),
-                ('nội thất', 'fa-couch'),
-                ('furniture', 'fa-couch'),
-                ('bàn', 'fa-table'),
-                ('ghế', 'fa-chair'),
-                ('tủ', 'fa-archive'),
-                ('kệ', 'fa-archive'),
-                ('network', 'fa-network-wired'),
-                ('router', 'fa-network-wired'),
-                ('switch', 'fa-network-wired'),
-                ('wifi', 'fa-wifi'),
-                ('điện', 'fa-plug'),
-                ('electrical', 'fa-plug'),
-                ('điện tử', 'fa-microchip'),
-                ('electronic', 'fa-microchip'),
-                ('điện thoại', 'fa-mobile-alt'),
-                ('phone', 'fa-mobile-alt'),
-                ('smartphone', 'fa-mobile-alt'),
-                ('phần mềm', 'fa-code'),
-                ('software', 'fa-code'),
-                ('app', 'fa-code'),
-                ('security', 'fa-shield-alt'),
-                ('camera', 'fa-video'),
-                ('dụng cụ', 'fa-tools'),
-                ('tool', 'fa-tools'),
-                ('tools', 'fa-tools'),
-                ('máy chiếu', 'fa-video'),
-                ('projector', 'fa-video'),
-                ('màn hình', 'fa-tv'),
-                ('monitor', 'fa-tv'),
-                ('screen', 'fa-tv'),
-                ('máy lạnh', 'fa-snowflake'),
-                ('ac', 'fa-snowflake'),
-                ('quạt', 'fa-wind'),
-                ('fan', 'fa-wind'),
-                ('server', 'fa-server'),
-                ('database', 'fa-database'),
-                ('backup', 'fa-hdd'),
-                ('khác', 'fa-box'),
-                ('other', 'fa-box'),
-            ]
-            
-            for key, icon in icon_map:
-                if key in type_name_lower:
-                    return icon
-            return 'fa-box'
-        
-        # Thống kê số lượng thiết bị theo từng loại
-        asset_type_stats = []
-        for asset_type in asset_types:
-            if not asset_type or not asset_type.name:
-                continue
-            try:
-                count = Asset.query.filter(
-                    Asset.asset_type_id == asset_type.id,
-                    Asset.deleted_at.is_(None),
-                    Asset.status != 'disposed'  # Loại bỏ tài sản đã thanh lý
-                ).count()
-                active_count = Asset.query.filter(
-                    Asset.asset_type_id == asset_type.id,
-                    Asset.status == 'active',
-                    Asset.deleted_at.is_(None)
-                ).count()
-                inactive_count = Asset.query.filter(
-                    Asset.asset_type_id == asset_type.id,
-                    Asset.status == 'inactive',
-                    Asset.deleted_at.is_(None)
-                ).count()
-                maintenance_count = Asset.query.filter(
-                    Asset.asset_type_id == asset_type.id,
-                    Asset.status == 'maintenance',
-                    Asset.deleted_at.is_(None)
-                ).count()
-                asset_type_stats.append({
-                    'type_id': asset_type.id,
-                    'type_name': asset_type.name or 'Không có tên',
-                    'total_count': count,
-                    'active_count': active_count,
-                    'inactive_count': inactive_count,
-                    'maintenance_count': maintenance_count,
-                    'icon': get_asset_type_icon(asset_type.name or '')
-                })
-            except Exception as ex:
-                app.logger.warning(f"Error processing asset_type {asset_type.id}: {ex}")
-                continue
-        
-        # Sắp xếp theo số lượng giảm dần
-        asset_type_stats.sort(key=lambda x: x['total_count'], reverse=True)
-        
-        # Tính tổng giá trị tài sản (VNĐ) - loại bỏ tài sản đã thanh lý
-        total_value = 0
-        try:
-            for asset in all_assets:
-                # Không tính tài sản đã thanh lý vào tổng giá trị
-                if asset.status != 'disposed' and asset.price:
-                    total_value += asset.price * (asset.quantity or 1)
-        except Exception:
-            total_value = 0
-        
-        # Thống kê tài sản - đếm số lượng (có tính quantity)
-        active_count = sum(a.quantity or 1 for a in all_assets if a.status == 'active')
-        inactive_count = sum(a.quantity or 1 for a in all_assets if a.status == 'inactive')
-        maintenance_count = sum(a.quantity or 1 for a in all_assets if a.status == 'maintenance')
-        disposed_count = sum(a.quantity or 1 for a in all_assets if a.status == 'disposed')
-        
-        # Debug: Log số lượng tài sản đã thanh lý
-        disposed_assets_list = [a for a in all_assets if a.status == 'disposed']
-        app.logger.info(f"[Dashboard] Disposed assets count: {disposed_count}, actual disposed assets: {len(disposed_assets_list)}")
-        if disposed_assets_list:
-            app.logger.info(f"[Dashboard] Sample disposed assets: {[(a.id, a.name, a.status) for a in disposed_assets_list[:5]]}")
-        # Đếm các status khác (null hoặc status khác, nhưng KHÔNG tính disposed)
-        other_count = sum(a.quantity or 1 for a in all_assets 
-                         if a.status != 'disposed' and 
-                         ((a.status is None) or (a.status not in ['active', 'inactive', 'maintenance', 'disposed'])))
-        
-        # Tính tổng số từ tất cả các status (KHÔNG bao gồm disposed) để đảm bảo chính xác
-        calculated_total = active_count + inactive_count + maintenance_count + other_count
-        total_count = calculated_total  # Luôn dùng calculated_total để đảm bảo khớp
-        
-        # Debug: Kiểm tra tổng số (loại bỏ disposed)
-        direct_total = sum(a.quantity or 1 for a in all_assets if a.status != 'disposed')
-        if abs(calculated_total - direct_total) > 0:
-            app.logger.warning(f"Asset count mismatch: direct_total={direct_total}, calculated={calculated_total}, active={active_count}, inactive={inactive_count}, maintenance={maintenance_count}, disposed={disposed_count}, other={other_count}")
-        
-        # Đếm số lượng bản ghi bảo trì (khác với maintenance_assets)
-        maintenance_record_count = MaintenanceRecord.query.filter(
-            MaintenanceRecord.deleted_at.is_(None)
-        ).count()
-        
-        # Tính tổng chi phí bảo trì
-        from sqlalchemy import func
-        total_maintenance_cost = db.session.query(func.sum(MaintenanceRecord.cost)).filter(
-            MaintenanceRecord.deleted_at.is_(None)
-        ).scalar() or 0
-        
-        stats = {
-            'total_assets': total_count,
-            'active_assets': active_count,
-            'inactive_assets': inactive_count,
-            'maintenance_assets': maintenance_count,
-            'disposed_assets': disposed_count,  # Số lượng tài sản đã thanh lý
-            'other_assets': other_count,  # Thêm để debug
-            'total_asset_types': len(asset_types),
-            'total_users': User.query.filter(User.deleted_at.is_(None)).count(),
-            'maintenance_count': maintenance_record_count,  # Số lượng bản ghi bảo trì
-            'total_value': total_value,
-            'total_maintenance_cost': total_maintenance_cost, # Tổng chi phí bảo trì
-            'asset_type_stats': asset_type_stats,
-        }
-        
-        # Lấy các bảo trì sắp đến hạn
-        due_records = []
-        overdue = 0
-        due_soon = 0
-        try:
-            from datetime import timedelta, datetime
-            next_30_days = today + timedelta(days=30)
-            
-            # Query all records with next_due_date
-            all_due_records = MaintenanceRecord.query.filter(
-                MaintenanceRecord.deleted_at.is_(None),
-                MaintenanceRecord.next_due_date.isnot(None)
-            ).all()
-            
-            # Filter in Python to handle both date and datetime types
-            filtered_records = []
-            for r in all_due_records:
-                if r.next_due_date:
-                    try:
-                        # Convert to date for comparison
-                        r_date = r.next_due_date.date() if isinstance(r.next_due_date, datetime) else r.next_due_date
-                        if r_date and r_date <= next_30_days:
-                            filtered_records.append(r)
-                            # Count overdue and due soon
-                            if r_date < today:
-                                overdue += 1
-                            elif r_date >= today:
-                                due_soon += 1
-                    except Exception:
-                        continue
-            
-            # Sort by date
-            try:
-                filtered_records.sort(key=lambda x: x.next_due_date.date() if isinstance(x.next_due_date, datetime) else x.next_due_date)
-            except Exception:
-                pass  # If sort fails, use unsorted list
-            
-            due_records = filtered_records[:10]
-        except Exception as ex:
-            app.logger.warning(f"Error querying due records: {ex}")
-            due_records = []
-            overdue = 0
-            due_soon = 0
-        
-        # Thêm thống kê bảo trì vào stats
-        stats['overdue_maintenance'] = overdue
-        stats['due_soon_maintenance'] = due_soon
+        # Toàn bộ KPI được tính bằng vài truy vấn GROUP BY (xem utils/dashboard_stats.py)
+        stats = compute_dashboard_stats(today=today)
+        due_records = stats['due_records']
+        overdue = stats['overdue_maintenance']
+        due_soon = stats['due_soon_maintenance']
         
         try:
             if overdue:
@@ -904,28 +708,16 @@ def trash_restore():
             for rec in obj.maintenance_records:
                 if rec.deleted_at is not None and hasattr(rec, 'restore'):
                     rec.restore()
-        db.session.commit()
 
-        # Ghi nhật ký hoạt động
+        # Ghi nhật ký hoạt động (cùng transaction với thao tác khôi phục)
         module_map = {
             'asset': 'assets',
             'asset_type': 'asset_types',
             'user': 'users',
             'maintenance': 'maintenance'
         }
-        try:
-            uid = session.get('user_id')
-            if uid:
-                db.session.add(AuditLog(
-                    user_id=uid,
-                    module=module_map.get(module, module),
-                    action='restore',
-                    entity_id=entity_id,
-                    details=f'restored_from_trash module={module}'
-                ))
-                db.session.commit()
-        except Exception:
-            db.session.rollback()
+        audit.record(module_map.get(module, module), 'restore', entity_id, f'restored_from_trash module={module}')
+        db.session.commit()
 
         flash('Khôi phục thành công.', 'success')
     else:
@@ -955,7 +747,6 @@ def trash_bulk_restore():
         return redirect(url_for('trash', module='all'))
         
     count = 0
-    uid = session.get('user_id')
     
     module_map = {
         'asset': 'assets',
@@ -974,14 +765,8 @@ def trash_bulk_restore():
                         if rec.deleted_at is not None and hasattr(rec, 'restore'):
                             rec.restore()
                 
-                if uid:
-                    db.session.add(AuditLog(
-                        user_id=uid,
-                        module=module_map.get(module, module),
-                        action='restore',
-                        entity_id=int(entity_id),
-                        details=f'bulk_restored_from_trash module={module}'
-                    ))
+                audit.record(module_map.get(module, module), 'restore', int(entity_id),
+                             f'bulk_restored_from_trash module={module}')
                 count += 1
         except Exception:
             continue
@@ -1018,7 +803,6 @@ def trash_bulk_delete():
         return redirect(url_for('trash', module='all'))
         
     count = 0
-    uid = session.get('user_id')
     
     module_map = {
         'asset': 'assets',
@@ -1059,14 +843,8 @@ def trash_bulk_delete():
                         continue # Skip deleting this type if no alternative
             
             db.session.delete(obj)
-            if uid:
-                db.session.add(AuditLog(
-                    user_id=uid,
-                    module=module_map.get(module, module),
-                    action='permanent_delete',
-                    entity_id=entity_id_int,
-                    details=f'bulk_deleted_from_trash module={module}'
-                ))
+            audit.record(module_map.get(module, module), 'permanent_delete', entity_id_int,
+                         f'bulk_deleted_from_trash module={module}')
             count += 1
         except Exception:
             continue
@@ -1138,28 +916,16 @@ def trash_permanent_delete():
                 flash(f'Đã gán {len(related_assets)} tài sản sang loại "{alternative_type.name}" trước khi xóa loại tài sản này.', 'info')
         
         db.session.delete(obj)
-        db.session.commit()
 
-        # Ghi nhật ký hoạt động
+        # Ghi nhật ký hoạt động (cùng transaction với thao tác xóa)
         module_map = {
             'asset': 'assets',
             'asset_type': 'asset_types',
             'user': 'users',
             'maintenance': 'maintenance'
         }
-        try:
-            uid = session.get('user_id')
-            if uid:
-                db.session.add(AuditLog(
-                    user_id=uid,
-                    module=module_map.get(module, module),
-                    action='permanent_delete',
-                    entity_id=entity_id,
-                    details=f'deleted_from_trash module={module}'
-                ))
-                db.session.commit()
-        except Exception:
-            db.session.rollback()
+        audit.record(module_map.get(module, module), 'permanent_delete', entity_id, f'deleted_from_trash module={module}')
+        db.session.commit()
 
         flash('Đã xóa vĩnh viễn.', 'success')
     except Exception as e:
@@ -1415,9 +1181,8 @@ def assets():
         # Bỏ filter theo user_id trên URL để tránh xem tài sản của người khác
         user_id = None
     if search:
-        # Use case-insensitive search compatible with both SQLite and PostgreSQL
-        search_lower = f'%{search.lower()}%'
-        query = query.filter(db.func.lower(Asset.name).like(search_lower))
+        # Tìm không dấu qua chỉ mục search_document (tên, mã thiết bị)
+        query = apply_search(query, SearchDocument.ASSET, Asset.id, search)
     if type_id:
         query = query.filter(Asset.asset_type_id == type_id)
     if status:
@@ -1440,28 +1205,18 @@ def assets():
 @login_required
 def assets_value_detail():
     """Hiển thị danh sách loại tài sản với tổng giá trị của mỗi loại"""
+    from utils.dashboard_stats import asset_value_by_type
     asset_types = AssetType.query.filter(AssetType.deleted_at.is_(None)).all()
     
-    # Tính tổng giá trị cho mỗi loại tài sản
+    # Tổng giá trị mỗi loại đọc từ bảng tổng hợp asset_type_rollup (đã loại bỏ tài sản thanh lý)
+    value_by_type = asset_value_by_type()
     type_stats = []
     for asset_type in asset_types:
-        assets = Asset.query.filter(
-            Asset.asset_type_id == asset_type.id,
-            Asset.deleted_at.is_(None),
-            Asset.status != 'disposed'  # Loại bỏ tài sản đã thanh lý
-        ).all()
-        
-        total_value = 0
-        total_count = 0
-        for asset in assets:
-            if asset.price:
-                total_value += asset.price * (asset.quantity or 1)
-            total_count += asset.quantity or 1
-        
+        totals = value_by_type.get(asset_type.id, {})
         type_stats.append({
             'type': asset_type,
-            'total_value': total_value,
-            'total_count': total_count
+            'total_value': totals.get('total_value', 0),
+            'total_count': totals.get('total_count', 0)
         })
     
     # Sắp xếp theo tổng giá trị giảm dần
@@ -1470,153 +1225,86 @@ def assets_value_detail():
     return render_template('assets/value_detail.html', type_stats=type_stats)
 
 
+def _suggest_owner():
+    """Tài khoản user chỉ được gợi ý tài sản / bảo trì của tài sản thuộc về mình"""
+    if session.get('role') == 'user' and session.get('user_id'):
+        return session.get('user_id')
+    return None
+
 @app.route('/assets/suggest')
 @login_required
 def assets_suggest():
     """
-    Trả về danh sách gợi ý tài sản theo tên (tìm kiếm tương đối, không phân biệt hoa thường).
-    Dùng cho autocomplete ở ô tìm kiếm danh sách tài sản.
+    Trả về danh sách gợi ý tài sản theo tên/mã (không phân biệt hoa thường và dấu).
+    Dùng cho autocomplete ở ô tìm kiếm danh sách tài sản; trả lời từ chỉ mục trong bộ nhớ (utils/suggest_index.py).
     """
     term = request.args.get('term', '', type=str) or ''
     term = term.strip()
     if len(term) < 2:
         return jsonify([])
 
-    search_lower = f"%{term.lower()}%"
-    query = Asset.query.filter(
-        Asset.deleted_at.is_(None),
-        db.func.lower(Asset.name).like(search_lower)
-    ).order_by(Asset.created_at.desc()).limit(10)
-
-    results = []
-    for a in query:
-        label = a.name
-        if a.device_code:
-            label = f"{a.name} ({a.device_code})"
-        results.append({
-            "id": a.id,
-            "label": label,
-            "name": a.name,
-            "device_code": a.device_code or ""
-        })
-    return jsonify(results)
+    return jsonify(suggest_index.suggest('assets', term, owner=_suggest_owner()))
 
 @app.route('/assets/export/<string:fmt>')
 @manager_required
+@background_export('Xuất danh sách tài sản')
 def export_assets(fmt: str):
+    from flask import stream_with_context
+    from utils.asset_export import (
+        HEADERS_VI, ORDERED_FIELDS, CONTENT_TYPES, live_asset_query, stream_assets,
+        collect_asset_rows, archive_path, tee_to_archive
+    )
     fmt = (fmt or '').lower()
-    # Common, normalized dataset
-    assets = Asset.query.filter(Asset.deleted_at.is_(None)).order_by(Asset.id.asc()).all()
-    rows = []
-    for a in assets:
-        rows.append({
-            'id': a.id,
-            'name': a.name,
-            'asset_type': a.asset_type.name if a.asset_type else '',
-            'price': float(a.price or 0),
-            'quantity': int(a.quantity or 0),
-            'purchase_date': a.purchase_date.strftime('%d/%m/%Y') if a.purchase_date else '',
-            'device_code': a.device_code or '',
-            'user': a.user.username if a.user else '',
-            'condition': a.condition_label or '',
-            'status': a.status or '',
-            'notes': a.notes or ''
-        })
-    headers_vi = {
-        'id': 'ID',
-        'name': 'Tên tài sản',
-        'asset_type': 'Loại',
-        'price': 'Giá',
-        'quantity': 'Số lượng',
-        'purchase_date': 'Ngày mua',
-        'device_code': 'Mã thiết bị',
-        'user': 'Người sử dụng',
-        'condition': 'Tình trạng',
-        'status': 'Trạng thái',
-        'notes': 'Ghi chú'
+    if fmt == 'excel':
+        fmt = 'xlsx'
+    filenames = {
+        'csv': 'tai_san.csv', 'xlsx': 'tai_san.xlsx', 'json': 'tai_san.json', 'ndjson': 'tai_san.ndjson',
+        'docx': 'tai_san.docx', 'pdf': 'tai_san.pdf'
     }
-    ordered_fields = list(headers_vi.keys())
+    if fmt not in filenames:
+        flash('Định dạng không được hỗ trợ. Hỗ trợ: csv, xlsx, json, ndjson, docx, pdf.', 'warning')
+        return redirect(url_for('assets'))
+    filename = filenames[fmt]
 
     # Ghi nhật ký hoạt động cho thao tác xuất dữ liệu tài sản
+    if session.get('user_id'):
+        total_rows = live_asset_query().with_entities(db.func.count(Asset.id)).scalar()
+        audit.record('assets', f'export_{fmt}', None, f'format={fmt}, total_rows={total_rows}')
+
+    # Lưu một bản vào EXPORT_DIR (ghi song song với luồng gửi cho client)
+    export_dir = app.config.get('EXPORT_DIR', 'instance/exports')
+    if not os.path.isabs(export_dir):
+        export_dir = os.path.join(app.root_path, export_dir)
     try:
-        uid = session.get('user_id')
-        if uid:
-            db.session.add(AuditLog(
-                user_id=uid,
-                module='assets',
-                action=f'export_{fmt}',
-                entity_id=None,
-                details=f'format={fmt}, total_rows={len(rows)}'
-            ))
-            db.session.commit()
-    except Exception:
-        db.session.rollback()
-
-    def _save_and_response(data_bytes: bytes, filename: str, content_type: str):
-        # Persist a copy to EXPORT_DIR
-        try:
-            export_dir = app.config.get('EXPORT_DIR', 'instance/exports')
-            # Normalize to absolute path relative to app.root_path if needed
-            if not os.path.isabs(export_dir):
-                export_dir = os.path.join(app.root_path, export_dir)
-            os.makedirs(export_dir, exist_ok=True)
-            ts = now_vn().strftime('%Y%m%d_%H%M%S')
-            base, ext = os.path.splitext(filename)
-            server_filename = f"{base}_{ts}{ext}"
-            out_path = os.path.join(export_dir, server_filename)
-            with open(out_path, 'wb') as f:
-                f.write(data_bytes)
-        except Exception:
-            # Non-fatal: logging to console; still return download
-            print('[Export] Failed to persist exported file to disk.')
-        response = make_response(data_bytes)
+        archive = archive_path(export_dir, filename)
+    except OSError:
+        print('[Export] Failed to persist exported file to disk.')
+        archive = None
+
+    if fmt in CONTENT_TYPES:
+        response = app.response_class(
+            stream_with_context(stream_assets(fmt, archive)),
+            content_type=CONTENT_TYPES[fmt]
+        )
         response.headers['Content-Disposition'] = f'attachment; filename={filename}'
-        response.headers['Content-Type'] = content_type
         return response
 
-    if fmt == 'csv':
-        import csv
-        import io
-        output = io.StringIO()
-        writer = csv.writer(output)
-        writer.writerow([headers_vi[f] for f in ordered_fields])
-        for r in rows:
-            writer.writerow([r[f] for f in ordered_fields])
-        csv_data = output.getvalue().encode('utf-8-sig')
-        return _save_and_response(csv_data, 'tai_san.csv', 'text/csv; charset=utf-8')
-    elif fmt in ('xlsx', 'excel'):
-        # Use pandas/openpyxl
-        import pandas as pd  # type: ignore
-        from io import BytesIO
-        df = pd.DataFrame(rows, columns=ordered_fields)
-        df.columns = [headers_vi[f] for f in ordered_fields]
-        buf = BytesIO()
-        with pd.ExcelWriter(buf, engine='openpyxl') as writer:
-            df.to_excel(writer, index=False, sheet_name='TaiSan')
-        buf.seek(0)
-        data = buf.read()
-        return _save_and_response(data, 'tai_san.xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    elif fmt == 'json':
-        import json
-        data = json.dumps(rows, ensure_ascii=False).encode('utf-8')
-        return _save_and_response(data, 'tai_san.json', 'application/json; charset=utf-8')
-    elif fmt == 'docx':
-        # Use utils.exporters for Word
-        from types import SimpleNamespace
+    # DOCX/PDF cần dựng cả tài liệu trong bộ nhớ
+    from types import SimpleNamespace
+    ns_rows = [SimpleNamespace(**r) for r in collect_asset_rows()]
+    if fmt == 'docx':
         from utils.exporters import export_docx
-        ns_rows = [SimpleNamespace(**r) for r in rows]
-        buf = export_docx(ns_rows, ordered_fields, title='Danh sách tài sản', header_map=headers_vi)
-        return _save_and_response(buf.getvalue(), 'tai_san.docx', 'application/vnd.openxmlformats-officedocument.wordprocessingml.document')
-    elif fmt == 'pdf':
-        # Use utils.exporters for PDF
-        from types import SimpleNamespace
-        from utils.exporters import export_pdf
-        ns_rows = [SimpleNamespace(**r) for r in rows]
-        buf = export_pdf(ns_rows, ordered_fields, title='Danh sách tài sản', header_map=headers_vi)
-        return _save_and_response(buf.getvalue(), 'tai_san.pdf', 'application/pdf')
+        buf = export_docx(ns_rows, ORDERED_FIELDS, title='Danh sách tài sản', header_map=HEADERS_VI)
+        content_type = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
     else:
-        flash('Định dạng không được hỗ trợ. Hỗ trợ: csv, xlsx, json, docx, pdf.', 'warning')
-        return redirect(url_for('assets'))
+        from utils.exporters import export_pdf
+        buf = export_pdf(ns_rows, ORDERED_FIELDS, title='Danh sách tài sản', header_map=HEADERS_VI)
+        content_type = 'application/pdf'
+    data = b''.join(tee_to_archive(iter([buf.getvalue()]), archive))
+    response = make_response(data)
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    response.headers['Content-Type'] = content_type
+    return response
 
 @app.route('/assets/invoice/<path:filename>')
 @login_required
@@ -1674,13 +1362,8 @@ def maintenance_list():
         if asset_id:
             query = query.filter(MaintenanceRecord.asset_id == asset_id)
         if search:
-            # Use case-insensitive search compatible with both SQLite and PostgreSQL
-            search_lower = f'%{search.lower()}%'
-            query = query.filter(
-                (db.func.lower(MaintenanceRecord.description).like(search_lower)) |
-                (db.func.lower(MaintenanceRecord.vendor).like(search_lower)) |
-                (db.func.lower(MaintenanceRecord.person_in_charge).like(search_lower))
-            )
+            # Tìm không dấu: mô tả, đơn vị bảo trì, người phụ trách, tên/mã tài sản
+            query = apply_search(query, SearchDocument.MAINTENANCE, MaintenanceRecord.id, search)
         if month:
             query = query.filter(db.extract('month', MaintenanceRecord.maintenance_date) == month)
         if year:
@@ -1831,32 +1514,7 @@ def maintenance_suggest():
     if len(term) < 2:
         return jsonify([])
 
-    search_lower = f"%{term.lower()}%"
-    query = MaintenanceRecord.query.filter(
-        MaintenanceRecord.deleted_at.is_(None),
-        (
-            db.func.lower(MaintenanceRecord.description).like(search_lower) |
-            db.func.lower(MaintenanceRecord.vendor).like(search_lower) |
-            db.func.lower(MaintenanceRecord.person_in_charge).like(search_lower)
-        )
-    ).order_by(MaintenanceRecord.maintenance_date.desc()).limit(10)
-
-    results = []
-    for rec in query:
-        asset_name = rec.asset.name if rec.asset else "Không rõ tài sản"
-        vendor = rec.vendor or ""
-        desc = rec.description or ""
-        pieces = [asset_name]
-        if vendor:
-            pieces.append(vendor)
-        if desc:
-            pieces.append(desc[:60])
-        label = " - ".join(pieces)
-        results.append({
-            "id": rec.id,
-            "label": label
-        })
-    return jsonify(results)
+    return jsonify(suggest_index.suggest('maintenance', term, owner=_suggest_owner()))
 @app.route('/maintenance/add', methods=['GET','POST'])
 @login_required
 def maintenance_add():
@@ -2044,6 +1702,7 @@ def maintenance_delete(id):
 
 @app.route('/maintenance/export')
 @manager_required
+@background_export('Xuất Excel bảo trì')
 def maintenance_export():
     """Export maintenance records to Excel"""
     try:
@@ -2071,12 +1730,7 @@ def maintenance_export():
         if status:
             query = query.filter(MaintenanceRecord.status == status)
         if search:
-            search_lower = f'%{search.lower()}%'
-            query = query.filter(
-                (db.func.lower(MaintenanceRecord.description).like(search_lower)) |
-                (db.func.lower(MaintenanceRecord.vendor).like(search_lower)) |
-                (db.func.lower(MaintenanceRecord.person_in_charge).like(search_lower))
-            )
+            query = apply_search(query, SearchDocument.MAINTENANCE, MaintenanceRecord.id, search)
         if date_from:
             try:
                 date_from_obj = datetime.strptime(date_from, '%Y-%m-%d').date()
@@ -2093,19 +1747,7 @@ def maintenance_export():
         records = query.order_by(MaintenanceRecord.request_date.desc()).all()
         
         # Ghi nhật ký hoạt động cho thao tác xuất Excel bảo trì
-        try:
-            uid = session.get('user_id')
-            if uid:
-                db.session.add(AuditLog(
-                    user_id=uid,
-                    module='maintenance',
-                    action='export_excel',
-                    entity_id=None,
-                    details=f'total_records={len(records)}'
-                ))
-                db.session.commit()
-        except Exception:
-            db.session.rollback()
+        audit.record('maintenance', 'export_excel', None, f'total_records={len(records)}')
         
         # Export to Excel
         from utils.exporters import export_maintenance_to_excel
@@ -2163,6 +1805,28 @@ def reports_catalog():
 
 # ========== BÁO CÁO THEO THÔNG TƯ ==========
 
+def _report_page_context(report: str):
+    """Trang keyset + tổng hợp SQL cho màn hình báo cáo `report` (giữ nguyên bộ lọc khi chuyển trang)"""
+    from utils.report_cache import cached_report_context
+    from utils.report_queries import keyset_page, report_query, report_row, report_subtotals
+
+    def compute():
+        query = report_query(report, request.args)
+        page = keyset_page(query, request.args.get('after'), request.args.get('per_page', type=int))
+        page['items'] = [report_row(asset) for asset in page['items']]
+        return {'page': page, 'subtotals': report_subtotals(query)}
+
+    snapshot = cached_report_context(report, compute)
+    page = snapshot['page']
+    args = {k: v for k, v in request.args.items() if k != 'after'}
+    return {
+        'assets': page['items'],
+        'page': page,
+        'subtotals': snapshot['subtotals'],
+        'first_url': url_for(request.endpoint, **args) if request.args.get('after') else None,
+        'next_url': url_for(request.endpoint, after=page['next_cursor'], **args) if page['next_cursor'] else None,
+    }
+
 @app.route('/reports/tt144-tt23')
 @login_required
 @manager_required
@@ -2171,61 +1835,30 @@ def report_tt144_tt23():
     current_year = today_vn().year
     year = request.args.get('year', type=int) or current_year
     quarter = request.args.get('quarter', type=str)
-    asset_type_id = request.args.get('asset_type_id', type=int)
-    
-    # Query assets
-    query = Asset.query.filter(Asset.deleted_at.is_(None))
-    
-    if asset_type_id:
-        query = query.filter(Asset.asset_type_id == asset_type_id)
     
-    if quarter:
-        # Filter by quarter if needed
-        quarter_num = int(quarter)
-        start_month = (quarter_num - 1) * 3 + 1
-        end_month = quarter_num * 3
-        from sqlalchemy import extract
-        query = query.filter(
-            extract('month', Asset.created_at).between(start_month, end_month)
-        )
-    
-    assets = query.order_by(Asset.created_at.desc()).all()
     asset_types = AssetType.query.filter(AssetType.deleted_at.is_(None)).all()
     
     return render_template('reports/tt144_tt23.html',
-                         assets=assets,
                          asset_types=asset_types,
                          current_year=current_year,
                          year=year,
-                         quarter=quarter)
+                         quarter=quarter,
+                         **_report_page_context('tt144_tt23'))
 
 @app.route('/reports/tt144-tt23/export')
 @login_required
 @manager_required
+@background_export('Xuất báo cáo TT 144/2017, TT 23/2023')
+@cached_report_export('tt144_tt23')
 def report_tt144_tt23_export():
     """Export báo cáo TT 144/2017, TT 23/2023 ra Excel"""
     from utils.exporters import export_excel
+    from utils.report_queries import report_assets
     from io import BytesIO
     
     year = request.args.get('year', type=int) or today_vn().year
-    quarter = request.args.get('quarter', type=str)
-    asset_type_id = request.args.get('asset_type_id', type=int)
-    
-    query = Asset.query.filter(Asset.deleted_at.is_(None))
     
-    if asset_type_id:
-        query = query.filter(Asset.asset_type_id == asset_type_id)
-    
-    if quarter:
-        quarter_num = int(quarter)
-        start_month = (quarter_num - 1) * 3 + 1
-        end_month = quarter_num * 3
-        from sqlalchemy import extract
-        query = query.filter(
-            extract('month', Asset.created_at).between(start_month, end_month)
-        )
-    
-    assets = query.order_by(Asset.created_at.desc()).all()
+    assets = report_assets('tt144_tt23', request.args)
     
     # Prepare data for export
     fields = ['device_code', 'name', 'asset_type', 'price', 'purchase_date', 'user', 'condition_label', 'status']
@@ -2278,38 +1911,29 @@ def report_tt24():
     report_type = request.args.get('report_type', 'all')
     status = request.args.get('status', '')
     
-    query = Asset.query.filter(Asset.deleted_at.is_(None))
-    
-    if status:
-        query = query.filter(Asset.status == status)
-    
-    assets = query.order_by(Asset.created_at.desc()).all()
-    
     return render_template('reports/tt24.html',
-                         assets=assets,
                          current_year=current_year,
                          year=year,
                          report_type=report_type,
-                         status=status)
+                         status=status,
+                         **_report_page_context('tt24'))
 
 @app.route('/reports/tt24/export')
 @login_required
 @manager_required
+@background_export('Xuất báo cáo TT 24/2024')
+@cached_report_export('tt24')
 def report_tt24_export():
     """Export báo cáo TT 24/2024 ra Excel"""
     from io import BytesIO
     import pandas as pd
+    from utils.report_queries import report_assets
     
     year = request.args.get('year', type=int) or today_vn().year
     report_type = request.args.get('report_type', 'all')
     status = request.args.get('status', '')
     
-    query = Asset.query.filter(Asset.deleted_at.is_(None))
-    
-    if status:
-        query = query.filter(Asset.status == status)
-    
-    assets = query.order_by(Asset.created_at.desc()).all()
+    assets = report_assets('tt24', request.args)
     
     export_data = []
     for idx, asset in enumerate(assets, 1):
@@ -2346,38 +1970,29 @@ def report_tt35():
     infrastructure_type = request.args.get('infrastructure_type', '')
     location = request.args.get('location', '')
     
-    query = Asset.query.filter(Asset.deleted_at.is_(None))
-    
-    if location:
-        query = query.filter(Asset.user_text.contains(location))
-    
-    assets = query.order_by(Asset.created_at.desc()).all()
-    
     return render_template('reports/tt35.html',
-                         assets=assets,
                          current_year=current_year,
                          year=year,
                          infrastructure_type=infrastructure_type,
-                         location=location)
+                         location=location,
+                         **_report_page_context('tt35'))
 
 @app.route('/reports/tt35/export')
 @login_required
 @manager_required
+@background_export('Xuất báo cáo TT 35/2022')
+@cached_report_export('tt35')
 def report_tt35_export():
     """Export báo cáo TT 35/2022 ra Excel"""
     from io import BytesIO
     import pandas as pd
+    from utils.report_queries import report_assets
     
     year = request.args.get('year', type=int) or today_vn().year
     infrastructure_type = request.args.get('infrastructure_type', '')
     location = request.args.get('location', '')
     
-    query = Asset.query.filter(Asset.deleted_at.is_(None))
-    
-    if location:
-        query = query.filter(Asset.user_text.contains(location))
-    
-    assets = query.order_by(Asset.created_at.desc()).all()
+    assets = report_assets('tt35', request.args)
     
     export_data = []
     for idx, asset in enumerate(assets, 1):
@@ -2413,79 +2028,29 @@ def report_special():
     report_type = request.args.get('report_type', 'all')
     status = request.args.get('status', '')
     
-    query = Asset.query.filter(Asset.deleted_at.is_(None))
-    
-    if status:
-        query = query.filter(Asset.status == status)
-    
-    # Filter by report type (có thể filter theo asset_type hoặc keyword trong name)
-    from sqlalchemy import or_
-    if report_type == 'medical':
-        query = query.filter(
-            or_(
-                Asset.name.contains('y tế'),
-                Asset.name.contains('thiết bị y tế'),
-                Asset.name.contains('medical'),
-                Asset.asset_type.has(AssetType.name.contains('y tế'))
-            )
-        )
-    elif report_type == 'intangible':
-        query = query.filter(
-            or_(
-                Asset.name.contains('vô hình'),
-                Asset.name.contains('bản quyền'),
-                Asset.name.contains('thương hiệu'),
-                Asset.asset_type.has(AssetType.name.contains('vô hình'))
-            )
-        )
-    
-    assets = query.order_by(Asset.created_at.desc()).all()
-    
     return render_template('reports/special.html',
-                         assets=assets,
                          current_year=current_year,
                          year=year,
                          report_type=report_type,
-                         status=status)
+                         status=status,
+                         **_report_page_context('special'))
 
 @app.route('/reports/special/export')
 @login_required
 @manager_required
+@background_export('Xuất báo cáo đặc thù')
+@cached_report_export('special')
 def report_special_export():
     """Export báo cáo đặc thù ra Excel"""
     from io import BytesIO
     import pandas as pd
+    from utils.report_queries import report_assets
     
     year = request.args.get('year', type=int) or today_vn().year
     report_type = request.args.get('report_type', 'all')
     status = request.args.get('status', '')
     
-    query = Asset.query.filter(Asset.deleted_at.is_(None))
-    
-    if status:
-        query = query.filter(Asset.status == status)
-    
-    from sqlalchemy import or_
-    if report_type == 'medical':
-        query = query.filter(
-            or_(
-                Asset.name.contains('y tế'),
-                Asset.name.contains('thiết bị y tế'),
-                Asset.name.contains('medical'),
-                Asset.asset_type.has(AssetType.name.contains('y tế'))
-            )
-        )
-    elif report_type == 'intangible':
-        query = query.filter(
-            or_(
-                Asset.name.contains('vô hình'),
-                Asset.name.contains('bản quyền'),
-                Asset.name.contains('thương hiệu'),
-                Asset.asset_type.has(AssetType.name.contains('vô hình'))
-            )
-        )
-    
-    assets = query.order_by(Asset.created_at.desc()).all()
+    assets = report_assets('special', request.args)
     
     export_data = []
     for idx, asset in enumerate(assets, 1):
@@ -2831,18 +2396,7 @@ def add_asset():
             created_asset_ids.append(asset.id)
 
             # Ghi audit log cho từng tài sản
-            try:
-                uid = session.get('user_id')
-                if uid:
-                    db.session.add(AuditLog(
-                        user_id=uid,
-                        module='assets',
-                        action='create',
-                        entity_id=asset.id,
-                        details=f"name={asset_name}"
-                    ))
-            except Exception:
-                db.session.rollback()
+            audit.record('assets', 'create', asset.id, f"name={asset_name}")
 
         # Tạo chứng từ ghi tăng/ghi giảm nếu được chọn
         if voucher_action in ['increase', 'decrease'] and created_asset_ids:
@@ -2915,240 +2469,126 @@ def import_assets():
             flash('File phải có định dạng Excel (.xlsx hoặc .xls).', 'error')
             return redirect(url_for('import_assets'))
         
+        from utils.asset_import import preflight, save_upload, ImportFileError
+        data = file.read()
         try:
-            # Đọc file Excel
-            df = pd.read_excel(file)
-            
-            # Kiểm tra các cột bắt buộc
-            required_columns = ['Tên tài sản', 'Giá tiền', 'Số lượng', 'Loại tài sản']
-            missing_columns = [col for col in required_columns if col not in df.columns]
-            if missing_columns:
-                flash(f'File Excel thiếu các cột bắt buộc: {", ".join(missing_columns)}', 'error')
-                return redirect(url_for('import_assets'))
-            
-            # Lấy danh sách asset types và users để mapping
-            asset_types = {at.name: at.id for at in AssetType.query.filter(AssetType.deleted_at.is_(None)).all()}
-            users = {u.username: u.id for u in User.query.filter(User.deleted_at.is_(None)).all()}
-            users_by_email = {u.email: u.id for u in User.query.filter(User.deleted_at.is_(None)).all()}
-            
-            # Mapping trạng thái linh hoạt hơn
-            status_map = {
-                'đang sử dụng': 'active',
-                'bảo trì': 'maintenance',
-                'đã thanh lý': 'disposed',
-                'active': 'active',
-                'maintenance': 'maintenance',
-                'disposed': 'disposed',
-                'sẵn sàng': 'active',
-                'đang dùng': 'active'
-            }
-            
-            success_count = 0
-            error_count = 0
-            errors = []
-            
-            for index, row in df.iterrows():
-                try:
-                    # Lấy dữ liệu từ Excel
-                    name = str(row['Tên tài sản']).strip()
-                    if not name or name == 'nan':
-                        errors.append(f"Dòng {index + 2}: Tên tài sản không được để trống")
-                        error_count += 1
-                        continue
-                    
-                    # Kiểm tra trùng tên
-                    if Asset.query.filter(Asset.name == name, Asset.deleted_at.is_(None)).first():
-                        errors.append(f"Dòng {index + 2}: Tên tài sản '{name}' đã tồn tại")
-                        error_count += 1
-                        continue
-                    
-                    # Giá tiền
-                    try:
-                        price = float(row['Giá tiền'])
-                        if price < 0:
-                            errors.append(f"Dòng {index + 2}: Giá tiền không được nhỏ hơn 0")
-                            error_count += 1
-                            continue
-                    except (ValueError, TypeError):
-                        errors.append(f"Dòng {index + 2}: Giá tiền không hợp lệ")
-                        error_count += 1
-                        continue
-                    
-                    # Số lượng
-                    try:
-                        quantity = int(row['Số lượng'])
-                        if quantity < 1:
-                            errors.append(f"Dòng {index + 2}: Số lượng phải >= 1")
-                            error_count += 1
-                            continue
-                    except (ValueError, TypeError):
-                        errors.append(f"Dòng {index + 2}: Số lượng không hợp lệ")
-                        error_count += 1
-                        continue
-                    
-                    # Loại tài sản (Tự động tạo nếu chưa có)
-                    asset_type_name = str(row['Loại tài sản']).strip()
-                    if not asset_type_name or asset_type_name == 'nan':
-                        errors.append(f"Dòng {index + 2}: Loại tài sản không được để trống")
-                        error_count += 1
-                        continue
-                        
-                    if asset_type_name not in asset_types:
-                        try:
-                            new_type = AssetType(name=asset_type_name, description=f"Tạo tự động từ file import")
-                            db.session.add(new_type)
-                            db.session.flush()
-                            asset_types[asset_type_name] = new_type.id
-                            print(f"Auto-created asset type: {asset_type_name}")
-                        except Exception as e:
-                            errors.append(f"Dòng {index + 2}: Không thể tạo loại tài sản '{asset_type_name}'")
-                            error_count += 1
-                            continue
-                    asset_type_id = asset_types[asset_type_name]
-                    
-                    # Trạng thái (tùy chọn)
-                    status = 'active'
-                    if 'Trạng thái' in df.columns:
-                        status_str = str(row['Trạng thái']).strip().lower()
-                        status = status_map.get(status_str, 'active')
-                    
-                    # Người sử dụng (Tự động tạo nếu chưa có)
-                    user_id = None
-                    if 'Người sử dụng' in df.columns:
-                        user_value = str(row['Người sử dụng']).strip()
-                        if user_value and user_value != 'nan':
-                            if user_value in users:
-                                user_id = users[user_value]
-                            elif user_value in users_by_email:
-                                user_id = users_by_email[user_value]
-                            else:
-                                # Tự động tạo user mới nếu chưa tồn tại
-                                try:
-                                    # Lấy role mặc định là 'user'
-                                    user_role = Role.query.filter_by(name='user').first()
-                                    if not user_role:
-                                        user_role = Role(name='user', description='Người dùng thông thường')
-                                        db.session.add(user_role)
-                                        db.session.commit()
-                                    
-                                    new_user = User(
-                                        username=user_value,
-                                        email=f"{user_value}@hethong.local", # Email tạm thời
-                                        role_id=user_role.id,
-                                        is_active=True
-                                    )
-                                    new_user.set_password("123456") # Mật khẩu mặc định
-                                    db.session.add(new_user)
-                                    db.session.flush()
-                                    users[user_value] = new_user.id
-                                    user_id = new_user.id
-                                    print(f"Auto-created user: {user_value}")
-                                except Exception as e:
-                                    # Nếu lỗi tạo user thì để trống user_id, vẫn tiếp tục import asset
-                                    print(f"Failed to auto-create user {user_value}: {e}")
-                                    pass
-                    
-                    # Ngày mua (tùy chọn)
-                    purchase_date = None
-                    if 'Ngày mua' in df.columns:
-                        purchase_date_str = str(row['Ngày mua']).strip()
-                        if purchase_date_str and purchase_date_str != 'nan':
-                            try:
-                                # Thử parse nhiều định dạng
-                                if isinstance(row['Ngày mua'], pd.Timestamp):
-                                    purchase_date = row['Ngày mua'].date()
-                                else:
-                                    # Thử các định dạng phổ biến
-                                    for fmt in ['%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%Y/%m/%d']:
-                                        try:
-                                            purchase_date = datetime.strptime(purchase_date_str, fmt).date()
-                                            break
-                                        except:
-                                            continue
-                                if purchase_date and purchase_date > date.today():
-                                    purchase_date = None  # Bỏ qua nếu là ngày tương lai
-                            except:
-                                pass
-                    
-                    # Mã thiết bị (tùy chọn)
-                    device_code = None
-                    if 'Mã thiết bị' in df.columns:
-                        device_code_str = str(row['Mã thiết bị']).strip()
-                        if device_code_str and device_code_str != 'nan':
-                            device_code = device_code_str
-                    
-                    # Tình trạng (tùy chọn)
-                    condition_label = None
-                    if 'Tình trạng' in df.columns:
-                        condition_str = str(row['Tình trạng']).strip()
-                        if condition_str and condition_str != 'nan':
-                            condition_label = condition_str
-                    
-                    # Ghi chú (tùy chọn)
-                    notes = None
-                    if 'Ghi chú' in df.columns:
-                        notes_str = str(row['Ghi chú']).strip()
-                        if notes_str and notes_str != 'nan':
-                            notes = notes_str
-                    
-                    # Tạo asset mới
-                    asset = Asset(
-                        name=name,
-                        price=price,
-                        quantity=quantity,
-                        asset_type_id=asset_type_id,
-                        user_id=user_id,
-                        notes=notes,
-                        status=status,
-                        purchase_date=purchase_date,
-                        device_code=device_code,
-                        condition_label=condition_label
-                    )
-                    
-                    db.session.add(asset)
-                    db.session.flush()
-                    
-                    # Ghi audit log
-                    try:
-                        uid = session.get('user_id')
-                        if uid:
-                            db.session.add(AuditLog(user_id=uid, module='assets', action='create', entity_id=asset.id, details=f"name={name} (imported)"))
-                    except Exception:
-                        pass
-                    
-                    success_count += 1
-                    
-                except Exception as e:
-                    errors.append(f"Dòng {index + 2}: Lỗi không xác định - {str(e)}")
-                    error_count += 1
-                    continue
-            
-            # Commit tất cả
-            try:
-                db.session.commit()
-                if success_count > 0:
-                    flash(f'Import thành công {success_count} tài sản!', 'success')
-                if error_count > 0:
-                    error_msg = f'Có {error_count} dòng bị lỗi. '
-                    if len(errors) <= 10:
-                        error_msg += 'Chi tiết: ' + '; '.join(errors)
-                    else:
-                        error_msg += f'Chi tiết 10 lỗi đầu: ' + '; '.join(errors[:10])
-                    flash(error_msg, 'warning')
-                if success_count == 0 and error_count == 0:
-                    flash('Không có dữ liệu nào được import.', 'warning')
-            except Exception as e:
-                db.session.rollback()
-                flash(f'Lỗi khi lưu dữ liệu: {str(e)}', 'error')
-            
-            return redirect(url_for('assets'))
-        
+            total_rows = preflight(data, file.filename)
+        except ImportFileError as e:
+            flash(str(e), 'error')
+            return redirect(url_for('import_assets'))
         except Exception as e:
             flash(f'Lỗi khi đọc file Excel: {str(e)}', 'error')
             return redirect(url_for('import_assets'))
-    
-    # GET request - hiển thị form import
-    return render_template('assets/import.html')
+        
+        # Đưa vào hàng đợi và chạy nền; trang import hiển thị tiến độ
+        job = AssetImportJob(
+            filename=secure_filename(file.filename) or file.filename,
+            total_rows=total_rows,
+            created_by_id=session.get('user_id')
+        )
+        db.session.add(job)
+        db.session.commit()
+        enqueue('asset_import', {'import_job_id': job.id, 'upload': save_upload(job.id, data)},
+                title=f'Import tài sản: {job.filename}', user_id=session.get('user_id'))
+        flash('Đã nhận file, hệ thống đang import dữ liệu.', 'info')
+        return redirect(url_for('import_assets', job_id=job.id))
+    
+    # GET request - hiển thị form import (kèm tiến độ nếu đang theo dõi một lượt import)
+    job = None
+    job_id = request.args.get('job_id', type=int)
+    if job_id:
+        job = _get_import_job_or_404(job_id)
+    return render_template('assets/import.html', job=job)
+
+def _get_import_job_or_404(job_id):
+    """Chỉ người tạo hoặc Admin được xem lượt import"""
+    job = AssetImportJob.query.get_or_404(job_id)
+    if session.get('role') != 'admin' and job.created_by_id != session.get('user_id'):
+        abort(404)
+    return job
+
+@app.route('/assets/import/jobs/<int:job_id>')
+@login_required
+def import_job_status(job_id):
+    """Tiến độ import (trang import hỏi định kỳ)"""
+    job = _get_import_job_or_404(job_id)
+    return jsonify(job.progress_dict())
+
+@app.route('/assets/import/jobs/<int:job_id>/errors.csv')
+@login_required
+def import_job_errors(job_id):
+    """Tải báo cáo lỗi từng dòng của lượt import"""
+    job = _get_import_job_or_404(job_id)
+    if not job.error_report:
+        flash('Lượt import này không có dòng lỗi.', 'info')
+        return redirect(url_for('import_assets', job_id=job.id))
+    response = make_response('\ufeff' + job.error_report)
+    response.headers['Content-Type'] = 'text/csv; charset=utf-8'
+    response.headers['Content-Disposition'] = f'attachment; filename=import_errors_{job.id}.csv'
+    return response
+
+# ---------- Tác vụ nền ----------
+
+def _get_background_job_or_404(job_id):
+    """Chỉ người tạo hoặc Admin được xem tác vụ nền"""
+    job = BackgroundJob.query.get_or_404(job_id)
+    if session.get('role') != 'admin' and job.created_by_id != session.get('user_id'):
+        abort(404)
+    return job
+
+@app.route('/jobs')
+@login_required
+def jobs_list():
+    """Danh sách tác vụ nền (của mình; Admin xem tất cả). `?format=json` cho client hỏi định kỳ"""
+    query = BackgroundJob.query
+    if session.get('role') != 'admin':
+        query = query.filter(BackgroundJob.created_by_id == session.get('user_id'))
+    status = request.args.get('status', '', type=str)
+    if status:
+        query = query.filter(BackgroundJob.status == status)
+    jobs = query.order_by(BackgroundJob.id.desc()).limit(100).all()
+    if request.args.get('format') == 'json':
+        return jsonify([job.progress_dict() for job in jobs])
+    return render_template('jobs/list.html', jobs=jobs, status=status)
+
+@app.route('/jobs/<int:job_id>')
+@login_required
+def job_detail(job_id):
+    job = _get_background_job_or_404(job_id)
+    return render_template('jobs/detail.html', job=job)
+
+@app.route('/jobs/<int:job_id>/status')
+@login_required
+def job_status(job_id):
+    """Tiến độ tác vụ (trang chi tiết hỏi định kỳ)"""
+    return jsonify(_get_background_job_or_404(job_id).progress_dict())
+
+@app.route('/jobs/<int:job_id>/cancel', methods=['POST'])
+@login_required
+def job_cancel(job_id):
+    from utils.jobs import cancel
+    job = _get_background_job_or_404(job_id)
+    if cancel(job):
+        flash('Đã gửi yêu cầu hủy tác vụ.', 'info')
+    else:
+        flash('Tác vụ đã kết thúc, không thể hủy.', 'warning')
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify(job.progress_dict())
+    return redirect(url_for('job_detail', job_id=job.id))
+
+@app.route('/jobs/<int:job_id>/download')
+@login_required
+def job_download(job_id):
+    """Tải file kết quả của tác vụ (lưu trong EXPORT_DIR/jobs/<id>/)"""
+    from utils.jobs import result_file
+    job = _get_background_job_or_404(job_id)
+    path = result_file(job)
+    if job.status != BackgroundJob.COMPLETED or not path:
+        flash('Tác vụ chưa có file kết quả.', 'warning')
+        return redirect(url_for('job_detail', job_id=job.id))
+    return send_file(path, mimetype=job.result_mimetype or 'application/octet-stream',
+                     as_attachment=True, download_name=job.result_name)
+
 
 @app.route('/assets/edit/<int:id>', methods=['GET', 'POST'])
 @manager_required
@@ -3285,16 +2725,9 @@ def edit_asset(id):
             return redirect(url_for('edit_asset', id=id))
         
         try:
+            audit.record('assets', 'update', id, f"name={asset.name}, status={asset.status}")
             db.session.commit()
             app.logger.info(f"Asset {asset.id} ({asset.name}) updated successfully, status: {asset.status}")
-            try:
-                uid = session.get('user_id')
-                if uid:
-                    db.session.add(AuditLog(user_id=uid, module='assets', action='update', entity_id=id, details=f"name={asset.name}, status={asset.status}"))
-                    db.session.commit()
-            except Exception as e:
-                app.logger.error(f"Error logging audit for asset update: {str(e)}")
-                db.session.rollback()
             flash('Tài sản đã được cập nhật thành công!', 'success')
             return redirect(url_for('assets'))
         except Exception as e:
@@ -3331,6 +2764,7 @@ def delete_asset(id):
             if hasattr(rec, 'soft_delete') and rec.deleted_at is None:
                 rec.soft_delete()
 
+        audit.record('assets', 'delete', id, f"name={asset.name}")
         db.session.commit()
         flash('Tài sản đã được xóa thành công!', 'success')
     except Exception as e:
@@ -3341,14 +2775,7 @@ def delete_asset(id):
         if return_url:
             return redirect(return_url)
         return redirect(url_for('assets'))
-    try:
-        uid = session.get('user_id')
-        if uid:
-            db.session.add(AuditLog(user_id=uid, module='assets', action='delete', entity_id=id, details=f"name={asset.name}"))
-            db.session.commit()
-    except Exception:
-        db.session.rollback()
-    
+
     # Kiểm tra return_url nếu có
     return_url = request.args.get('return_url')
     if return_url:
@@ -3829,174 +3256,19 @@ def asset_depreciation():
                 flash('Vui lòng chọn ít nhất một tài sản.', 'error')
                 return redirect(url_for('asset_depreciation'))
             
-            # Tính khấu hao cho từng tài sản
-            calculated_count = 0
-            skipped_assets = []  # Danh sách tài sản chưa đủ kỳ tính khấu hao
-            for asset_id in asset_ids:
-                asset = Asset.query.get(asset_id)
-                if not asset or asset.deleted_at:
-                    continue
-                
-                original_value = asset.price or 0
-                if original_value <= 0:
-                    continue
-                
-                # Kiểm tra điều kiện tính khấu hao: giá trị tài sản phải >= 30 triệu VNĐ
-                if original_value < 30000000:
-                    skipped_assets.append(asset.name)
-                    continue  # Giá trị < 30 triệu, không tính khấu hao
-                
-                # Kiểm tra điều kiện tính khấu hao: phải đủ 12 tháng từ ngày mua
-                if asset.purchase_date:
-                    # Tính số tháng từ ngày mua đến cuối năm tính khấu hao (31/12/period_year)
-                    purchase_year = asset.purchase_date.year
-                    purchase_month = asset.purchase_date.month
-                    
-                    # Tính số tháng từ tháng mua đến cuối năm period_year
-                    if purchase_year < period_year:
-                        # Năm mua < năm tính: 
-                        # - Từ tháng mua đến cuối năm mua: (12 - purchase_month + 1) tháng
-                        # - Các năm ở giữa: (period_year - purchase_year - 1) * 12 tháng
-                        # - Năm tính: 12 tháng
-                        # Ví dụ: mua 02/2024, tính năm 2025 -> (12-2+1) + 0*12 + 12 = 11 + 12 = 23 tháng
-                        months_from_purchase = (12 - purchase_month + 1) + (period_year - purchase_year - 1) * 12 + 12
-                    elif purchase_year == period_year:
-                        # Cùng năm: tính từ tháng mua đến cuối năm
-                        # Ví dụ: mua 09/2025, tính năm 2025 -> từ 09/2025 đến 12/2025 = 4 tháng
-                        months_from_purchase = 12 - purchase_month + 1
-                    else:
-                        # Năm mua > năm tính (không hợp lý), bỏ qua
-                        continue
-                    
-                    # Chỉ tính khấu hao nếu đã đủ 12 tháng từ ngày mua
-                    if months_from_purchase < 12:
-                        skipped_assets.append(asset.name)
-                        continue  # Chưa đủ 12 tháng, bỏ qua tài sản này
-                
-                # Tính lũy kế khấu hao trước kỳ này
-                prev_query = AssetDepreciation.query.filter(
-                    AssetDepreciation.asset_id == asset_id
-                )
-                
-                # Lọc theo năm và tháng
-                if period_month:
-                    # Tính lũy kế đến trước tháng này trong cùng năm
-                    prev_query = prev_query.filter(
-                        db.or_(
-                            AssetDepreciation.period_year < period_year,
-                            db.and_(
-                                AssetDepreciation.period_year == period_year,
-                                AssetDepreciation.period_month < period_month
-                            )
-                        )
-                    )
-                else:
-                    # Tính lũy kế đến trước năm này
-                    prev_query = prev_query.filter(
-                        AssetDepreciation.period_year < period_year
-                    )
-                
-                prev_depreciations = prev_query.all()
-                prev_accumulated = sum(d.accumulated_depreciation or 0 for d in prev_depreciations)
-                
-                # Khấu hao theo năm (đường thẳng) và tùy chọn số dư giảm dần
-                useful_life_years = getattr(asset, 'useful_life_years', None) or 5
-                depreciation_rate = 1.0 / useful_life_years  # Tỷ lệ khấu hao năm (dạng thập phân)
-                
-                if method == 'straight_line':
-                    # Công thức: Mức trích khấu hao hàng năm = Nguyên giá / Thời gian trích khấu hao
-                    annual_depreciation = original_value / useful_life_years
-                    
-                    if period_month:
-                        # Tính khấu hao hàng tháng = Khấu hao hàng năm / 12
-                        monthly_depreciation = annual_depreciation / 12
-                        
-                        # Nếu có ngày mua trong tháng đó, tính theo số ngày sử dụng thực tế
-                        if asset.purchase_date:
-                            # Lấy số ngày trong tháng tính khấu hao
-                            days_in_month = monthrange(period_year, period_month)[1]
-                            
-                            # Kiểm tra nếu ngày mua trong tháng này
-                            if (asset.purchase_date.year == period_year and 
-                                asset.purchase_date.month == period_month):
-                                # Số ngày sử dụng = Tổng số ngày của tháng - Ngày bắt đầu sử dụng + 1
-                                days_used = days_in_month - asset.purchase_date.day + 1
-                                # Mức trích khấu hao theo tháng phát sinh = (Khấu hao hàng tháng / Tổng số ngày của tháng) x Số ngày sử dụng
-                                depreciation_amount = (monthly_depreciation / days_in_month) * days_used
-                            else:
-                                # Nếu không phải tháng mua, tính đủ tháng
-                                depreciation_amount = monthly_depreciation
-                        else:
-                            # Không có ngày mua, tính đủ tháng
-                            depreciation_amount = monthly_depreciation
-                    else:
-                        # Tính theo năm
-                        depreciation_amount = annual_depreciation
-                else:
-                    # Số dư giảm dần: áp dụng hệ số 2 trên giá trị còn lại
-                    remaining_value_before = original_value - prev_accumulated
-                    annual_depreciation = remaining_value_before * depreciation_rate * 2
-                    
-                    if period_month:
-                        monthly_depreciation = annual_depreciation / 12
-                        
-                        # Nếu có ngày mua trong tháng đó, tính theo số ngày sử dụng thực tế
-                        if asset.purchase_date:
-                            days_in_month = monthrange(period_year, period_month)[1]
-                            
-                            if (asset.purchase_date.year == period_year and 
-                                asset.purchase_date.month == period_month):
-                                days_used = days_in_month - asset.purchase_date.day + 1
-                                depreciation_amount = (monthly_depreciation / days_in_month) * days_used
-                            else:
-                                depreciation_amount = monthly_depreciation
-                        else:
-                            depreciation_amount = monthly_depreciation
-                    else:
-                        depreciation_amount = annual_depreciation
-                
-                # Đảm bảo không vượt quá nguyên giá
-                depreciation_amount = min(depreciation_amount, original_value - prev_accumulated)
-                if depreciation_amount < 0:
-                    depreciation_amount = 0
-                
-                accumulated = prev_accumulated + depreciation_amount
-                remaining_value = original_value - accumulated
-                
-                # Kiểm tra đã tính chưa
-                existing = AssetDepreciation.query.filter(
-                    AssetDepreciation.asset_id == asset_id,
-                    AssetDepreciation.period_year == period_year
-                )
-                if period_month:
-                    existing = existing.filter(AssetDepreciation.period_month == period_month)
-                else:
-                    existing = existing.filter(AssetDepreciation.period_month.is_(None))
-                existing = existing.first()
-                
-                if existing:
-                    existing.depreciation_amount = depreciation_amount
-                    existing.accumulated_depreciation = accumulated
-                    existing.remaining_value = remaining_value
-                    existing.method = method
-                    existing.depreciation_rate = depreciation_rate * 100
-                else:
-                    depreciation = AssetDepreciation(
-                        asset_id=asset_id,
-                        period_year=period_year,
-                        period_month=period_month,
-                        original_value=original_value,
-                        depreciation_amount=depreciation_amount,
-                        accumulated_depreciation=accumulated,
-                        remaining_value=remaining_value,
-                        method=method,
-                        depreciation_rate=depreciation_rate * 100
-                    )
-                    db.session.add(depreciation)
-                
-                calculated_count += 1
+            # Danh sách lớn (hoặc yêu cầu chạy nền): tính bằng tác vụ nền để không vượt timeout của request
+            if request.form.get('background') == '1' or len(asset_ids) > app.config.get('JOB_DEPRECIATION_SYNC_LIMIT', 500):
+                job = enqueue('depreciation', {
+                    'asset_ids': asset_ids, 'year': period_year, 'month': period_month, 'method': method
+                }, title=f'Tính khấu hao {len(asset_ids)} tài sản năm {period_year}', user_id=session.get('user_id'))
+                flash('Đã đưa việc tính khấu hao vào hàng đợi, theo dõi tiến độ tại đây.', 'info')
+                return redirect(url_for('job_detail', job_id=job.id))
             
-            db.session.commit()
+            # Tính khấu hao theo lô (nạp dữ liệu theo lô, tính bằng NumPy, ghi bằng bulk upsert)
+            from utils.depreciation import calculate_depreciation
+            outcome = calculate_depreciation(asset_ids, period_year, period_month, method)
+            calculated_count = len(outcome['results'])
+            skipped_assets = [item['name'] for item in outcome['skipped']]  # Tài sản chưa đủ điều kiện
             
             # Hiển thị thông báo kết quả
             if calculated_count > 0:
@@ -4039,14 +3311,15 @@ def asset_depreciation():
     # Tạo dict để dễ tìm khấu hao theo asset_id
     depreciations_dict = {dep.asset_id: dep for dep in all_depreciations}
     
-    # Tính số kỳ đã khấu hao cho mỗi asset
-    asset_periods_count = {}
-    for asset in assets_paginate.items:
-        # Đếm số bản ghi khấu hao của asset này
-        periods = AssetDepreciation.query.filter(
-            AssetDepreciation.asset_id == asset.id
-        ).count()
-        asset_periods_count[asset.id] = periods
+    # Tính số kỳ đã khấu hao cho mỗi asset (một truy vấn GROUP BY cho cả trang)
+    page_asset_ids = [asset.id for asset in assets_paginate.items]
+    asset_periods_count = {asset_id: 0 for asset_id in page_asset_ids}
+    if page_asset_ids:
+        asset_periods_count.update(dict(db.session.query(
+            AssetDepreciation.asset_id, db.func.count(AssetDepreciation.id)
+        ).filter(
+            AssetDepreciation.asset_id.in_(page_asset_ids)
+        ).group_by(AssetDepreciation.asset_id).all()))
     
     # Hiển thị tất cả khấu hao đã tính (không phân trang)
     all_depreciations_list = depreciations_query.order_by(AssetDepreciation.created_at.desc()).all()
@@ -4320,44 +3593,24 @@ def api_inventory_generate_lines(inventory_id):
     if inv.status not in ['draft', 'in_progress']:
         return jsonify({'success': False, 'message': 'Trạng thái không cho phép tạo danh mục'}), 400
 
+    from utils.inventory_lines import JOB_KIND, active_job, count_scope_assets, generate_book_lines
     try:
-        # Lọc phạm vi
-        scope_locations = json.loads(inv.scope_locations) if inv.scope_locations else []
-        scope_asset_groups = json.loads(inv.scope_asset_groups) if inv.scope_asset_groups else []
-
-        asset_query = Asset.query.filter(Asset.deleted_at.is_(None))
-        # Chỉ lấy active/idle/paused
-        asset_query = asset_query.filter(Asset.status.in_(['active', 'idle', 'paused']))
-
-        if inv.scope_type == 'by_location' and scope_locations:
-            if hasattr(Asset, 'location_id'):
-                asset_query = asset_query.filter(Asset.location_id.in_(scope_locations))
-        if inv.scope_type == 'by_asset_group' and scope_asset_groups:
-            if hasattr(Asset, 'asset_type_id'):
-                asset_query = asset_query.filter(Asset.asset_type_id.in_(scope_asset_groups))
-
-        assets = asset_query.all()
-
-        created = 0
-        for asset in assets:
-            exists = InventoryResult.query.filter_by(inventory_id=inventory_id, asset_id=asset.id).first()
-            if exists:
-                continue
-            line = InventoryResult(
-                inventory_id=inventory_id,
-                asset_id=asset.id,
-                book_quantity=getattr(asset, 'quantity', 1) or 1,
-                book_value=asset.price or 0,
-                book_location_id=getattr(asset, 'location_id', None),
-                book_asset_type_id=getattr(asset, 'asset_type_id', None),
-                book_status=getattr(asset, 'status', None)
+        # Phạm vi lớn (hoặc yêu cầu chạy nền): sinh danh mục bằng tác vụ nền theo lô, tiếp tục được khi worker chết
+        data = request.get_json(silent=True) or {}
+        background = request.args.get('background') == '1' or data.get('background')
+        if background or count_scope_assets(inv) > app.config.get('INVENTORY_LINES_SYNC_LIMIT', 20000):
+            job = active_job(inv.id) or enqueue(
+                JOB_KIND, {'inventory_id': inv.id},
+                title=f'Sinh danh mục kiểm kê {inv.inventory_code}', user_id=session.get('user_id')
             )
-            db.session.add(line)
-            created += 1
-        inv.status = 'in_progress'
-        log_inventory_action(inv.id, 'generate_book_lines', session.get('user_id'))
+            return jsonify({
+                'success': True, 'background': True, 'job_id': job.id,
+                'job_url': url_for('job_detail', job_id=job.id), 'status_url': url_for('job_status', job_id=job.id)
+            }), 202
+
+        outcome = generate_book_lines(inv, session.get('user_id'))
         db.session.commit()
-        return jsonify({'success': True, 'created': created})
+        return jsonify({'success': True, 'created': outcome['created'], 'skipped': outcome['skipped']})
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'message': str(e)}), 400
@@ -4405,6 +3658,32 @@ def api_inventory_save_result(inventory_id):
         return jsonify({'success': False, 'message': str(e)}), 400
 
 
+@app.route('/api/inventories/<int:inventory_id>/results:batch', methods=['POST'])
+@login_required
+def api_inventory_save_results_batch(inventory_id):
+    """Nhập kết quả thực tế cho nhiều tài sản (máy quét mã vạch) trong một lần commit."""
+    inv = Inventory.query.get_or_404(inventory_id)
+    if not can_edit_inventory(inv):
+        return jsonify({'success': False, 'message': 'Đợt đã bị khóa/gửi duyệt hoặc bạn không có quyền'}), 400
+
+    data = request.get_json(silent=True) or {}
+    items = data.get('results') if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        return jsonify({'success': False, 'message': 'Thiếu danh sách results'}), 400
+    max_items = app.config.get('INVENTORY_RESULTS_BATCH_MAX', 5000)
+    if len(items) > max_items:
+        return jsonify({'success': False, 'message': f'Tối đa {max_items} kết quả mỗi lần gửi'}), 413
+
+    from utils.inventory_lines import apply_results_batch
+    try:
+        outcome = apply_results_batch(inv, items, session.get('user_id'))
+        db.session.commit()
+        return jsonify({'success': True, **outcome})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+
 @app.route('/api/inventories/<int:inventory_id>/surplus', methods=['POST'])
 @login_required
 def api_inventory_surplus(inventory_id):
@@ -4474,6 +3753,9 @@ def api_inventory_approve_lock(inventory_id):
         inv.locked_at = now_vn()
         inv.locked_by_id = session.get('user_id')
         log_inventory_action(inv.id, 'approve_lock', session.get('user_id'), from_status=from_status, to_status='approved_locked')
+        # Chốt số liệu đối chiếu cùng transaction khóa; báo cáo của đợt đã khóa đọc ảnh chụp này
+        from utils.inventory_reconcile import save_snapshot
+        save_snapshot(inv, session.get('user_id'))
         db.session.commit()
         return jsonify({'success': True})
     except Exception as e:
@@ -4500,6 +3782,8 @@ def api_inventory_unlock(inventory_id):
         inv.locked_at = None
         inv.locked_by_id = None
         log_inventory_action(inv.id, 'unlock', session.get('user_id'), from_status=from_status, to_status='in_progress', reason=reason)
+        from utils.inventory_reconcile import discard_snapshot
+        discard_snapshot(inv.id)
         db.session.commit()
         return jsonify({'success': True})
     except Exception as e:
@@ -4527,6 +3811,17 @@ def api_inventory_close(inventory_id):
         db.session.rollback()
         return jsonify({'success': False, 'message': str(e)}), 400
 
+
+@app.route('/api/inventories/<int:inventory_id>/reconciliation')
+@login_required
+def api_inventory_reconciliation(inventory_id):
+    """Đối chiếu sổ sách - thực tế của đợt (thiếu, thừa, chênh lệch theo loại/nơi dùng/tình trạng)."""
+    if not require_role_api('manager', 'accountant'):
+        return jsonify({'success': False, 'message': 'Không có quyền'}), 403
+    inv = Inventory.query.get_or_404(inventory_id)
+    from utils.inventory_reconcile import get_reconciliation
+    return jsonify({'success': True, 'data': get_reconciliation(inv)})
+
 @app.route('/assets/inventory', methods=['GET', 'POST'])
 @login_required
 def asset_inventory():
@@ -4837,18 +4132,7 @@ def asset_types_suggest():
     if len(term) < 2:
         return jsonify([])
 
-    search_lower = f"%{term.lower()}%"
-    query = AssetType.query.filter(
-        AssetType.deleted_at.is_(None),
-        db.func.lower(AssetType.name).like(search_lower)
-    ).order_by(AssetType.created_at.desc()).limit(10)
-
-    results = [{
-        "id": t.id,
-        "label": t.name,
-        "name": t.name
-    } for t in query]
-    return jsonify(results)
+    return jsonify(suggest_index.suggest('asset_types', term))
 
 @app.route('/asset-types/add', methods=['POST'])
 @manager_required
@@ -4864,14 +4148,9 @@ def add_asset_type():
         
         asset_type = AssetType(name=name, description=description)
         db.session.add(asset_type)
+        db.session.flush()
+        audit.record('asset_types', 'create', asset_type.id, f"name={name}")
         db.session.commit()
-        try:
-            uid = session.get('user_id')
-            if uid:
-                db.session.add(AuditLog(user_id=uid, module='asset_types', action='create', entity_id=asset_type.id, details=f"name={name}"))
-                db.session.commit()
-        except Exception:
-            db.session.rollback()
         
         return jsonify({
             'success': True, 
@@ -4908,14 +4187,8 @@ def edit_asset_type(id):
             return render_template('asset_types/edit.html', asset_type=asset_type)
         asset_type.name = name
         asset_type.description = description
+        audit.record('asset_types', 'update', id, f"name={asset_type.name}")
         db.session.commit()
-        try:
-            uid = session.get('user_id')
-            if uid:
-                db.session.add(AuditLog(user_id=uid, module='asset_types', action='update', entity_id=id, details=f"name={asset_type.name}"))
-                db.session.commit()
-        except Exception:
-            db.session.rollback()
         flash('Loại tài sản đã được cập nhật thành công!', 'success')
         return redirect(url_for('asset_types'))
     except Exception as e:
@@ -4940,14 +4213,8 @@ def delete_asset_type(id):
         if asset_type.deleted_at:
             return jsonify({'success': False, 'message': 'Loại tài sản đã nằm trong thùng rác!'})
         asset_type.soft_delete()
+        audit.record('asset_types', 'delete', id, f"name={asset_type.name}")
         db.session.commit()
-        try:
-            uid = session.get('user_id')
-            if uid:
-                db.session.add(AuditLog(user_id=uid, module='asset_types', action='delete', entity_id=id, details=f"name={asset_type.name}"))
-                db.session.commit()
-        except Exception:
-            db.session.rollback()
         
         return jsonify({'success': True, 'message': 'Loại tài sản đã được xóa thành công!'})
     except Exception as e:
@@ -5022,32 +4289,7 @@ def users_suggest():
     if len(term) < 2:
         return jsonify([])
 
-    search_lower = f"%{term.lower()}%"
-    query = User.query.filter(
-        User.deleted_at.is_(None),
-        (
-            db.func.lower(User.username).like(search_lower) |
-            db.func.lower(User.email).like(search_lower) |
-            db.func.lower(User.name).like(search_lower)
-        )
-    ).limit(10)
-
-    results = []
-    for u in query:
-        label = u.username
-        if u.email:
-            label += f" ({u.email})"
-        if u.name:
-            label += f" - {u.name}"
-            
-        results.append({
-            "id": u.id,
-            "label": label,
-            "username": u.username,
-            "email": u.email or "",
-            "name": u.name or ""
-        })
-    return jsonify(results)
+    return jsonify(suggest_index.suggest('users', term))
 
 @app.route('/users/edit/<int:id>', methods=['GET', 'POST'])
 @manager_required
@@ -5166,17 +4408,12 @@ def edit_user(id):
                             db.session.add(user_perm)
                         except (ValueError, TypeError):
                             continue
+                UserPermission.bump_version()
             if password:
                 user.set_password(password)
 
+            audit.record('users', 'update', id, f"username={user.username}")
             db.session.commit()
-            try:
-                uid = session.get('user_id')
-                if uid:
-                    db.session.add(AuditLog(user_id=uid, module='users', action='update', entity_id=id, details=f"username={user.username}"))
-                    db.session.commit()
-            except Exception:
-                db.session.rollback()
             flash('Người dùng đã được cập nhật!', 'success')
             return redirect(url_for('users'))
         except Exception as e:
@@ -5219,14 +4456,8 @@ def delete_user(id):
             flash('Người dùng đã nằm trong thùng rác.', 'info')
             return redirect(url_for('users'))
         user.soft_delete()
+        audit.record('users', 'delete', id, f"username={user.username}")
         db.session.commit()
-        try:
-            uid = session.get('user_id')
-            if uid:
-                db.session.add(AuditLog(user_id=uid, module='users', action='delete', entity_id=id, details=f"username={user.username}"))
-                db.session.commit()
-        except Exception:
-            db.session.rollback()
         flash('Đã xóa người dùng!', 'success')
     except Exception as e:
         db.session.rollback()
@@ -5333,23 +4564,11 @@ def api_user_permissions(user_id):
                     db.session.add(user_perm)
                 except (ValueError, TypeError):
                     continue
-            
-            db.session.commit()
+            UserPermission.bump_version()
             
             # Ghi audit log
-            try:
-                uid = session.get('user_id')
-                if uid:
-                    db.session.add(AuditLog(
-                        user_id=uid,
-                        module='users',
-                        action='update',
-                        entity_id=user.id,
-                        details=f"Updated permissions for user: {user.username}"
-                    ))
-                    db.session.commit()
-            except Exception:
-                db.session.rollback()
+            audit.record('users', 'update', user.id, f"Updated permissions for user: {user.username}")
+            db.session.commit()
             
             return jsonify({
                 'success': True,
@@ -5363,32 +4582,24 @@ def api_user_permissions(user_id):
 @app.route('/audit-logs')
 @manager_required
 def audit_logs():
-    page = request.args.get('page', 1, type=int)
-    search_user = request.args.get('user_id', type=int)
-    module = request.args.get('module', '', type=str)
+    """Nhật ký hệ thống: phân trang keyset (?after=), gồm cả nhật ký đã lưu trữ theo tháng"""
+    from utils.audit_log import AuditFilters, search_audit_logs
+    filters = AuditFilters.from_args(request.args)
+    page = search_audit_logs(filters, request.args.get('after'), request.args.get('per_page', type=int))
+    # Chỉ nạp người dùng đang lọc (ô chọn người dùng dùng gợi ý /users/suggest)
+    search_user = db.session.get(User, filters.user_id) if filters.user_id else None
+    modules = ['assets', 'asset_types', 'users']
     date_from = request.args.get('date_from', '', type=str)
     date_to = request.args.get('date_to', '', type=str)
-
-    query = AuditLog.query.order_by(AuditLog.created_at.desc())
-    if search_user:
-        query = query.filter(AuditLog.user_id == search_user)
-    if module:
-        query = query.filter(AuditLog.module == module)
-    try:
-        if date_from:
-            start = datetime.strptime(date_from, '%Y-%m-%d')
-            query = query.filter(AuditLog.created_at >= start)
-        if date_to:
-            end = datetime.strptime(date_to + ' 23:59:59', '%Y-%m-%d %H:%M:%S')
-            query = query.filter(AuditLog.created_at <= end)
-    except Exception:
-        pass
-
-    logs = query.paginate(page=page, per_page=10, error_out=False)
-    users = User.query.filter(User.deleted_at.is_(None)).all()
-    modules = ['assets', 'asset_types', 'users']
-    return render_template('audit_logs/list.html', logs=logs, users=users, modules=modules,
-                           search_user=search_user, module=module, date_from=date_from, date_to=date_to)
+    args = {k: v for k, v in {
+        'user_id': filters.user_id, 'module': filters.module, 'action': filters.action,
+        'date_from': date_from, 'date_to': date_to,
+    }.items() if v}
+    next_url = url_for('audit_logs', after=page['next_cursor'], **args) if page['next_cursor'] else None
+    return render_template('audit_logs/list.html', logs=page['items'], next_url=next_url,
+                           first_url=url_for('audit_logs', **args) if request.args.get('after') else None,
+                           search_user=search_user, module=filters.module, modules=modules,
+                           date_from=date_from, date_to=date_to)
 
 @app.route('/test-session')
 @login_required
@@ -5439,23 +4650,11 @@ def admin_permissions():
             for perm_id in permission_ids:
                 user_perm = UserPermission(user_id=user.id, permission_id=perm_id, granted=True)
                 db.session.add(user_perm)
-            
-            db.session.commit()
+            UserPermission.bump_version()
             
             # Ghi audit log
-            try:
-                uid = session.get('user_id')
-                if uid:
-                    db.session.add(AuditLog(
-                        user_id=uid,
-                        module='users',
-                        action='update',
-                        entity_id=user.id,
-                        details=f"Updated permissions for user: {user.username}"
-                    ))
-                    db.session.commit()
-            except Exception:
-                db.session.rollback()
+            audit.record('users', 'update', user.id, f"Updated permissions for user: {user.username}")
+            db.session.commit()
             
             flash(f'Đã cập nhật phân quyền cho {user.username}!', 'success')
             return redirect(url_for('admin_permissions'))
@@ -5708,15 +4907,9 @@ def add_user():
                         db.session.add(user_perm)
                     except: continue
 
-            db.session.commit()
-
             # Audit Log
-            try:
-                uid = session.get('user_id')
-                if uid:
-                    db.session.add(AuditLog(user_id=uid, module='users', action='create', entity_id=user.id, details=f"username={username}"))
-                    db.session.commit()
-            except: db.session.rollback()
+            audit.record('users', 'create', user.id, f"username={username}")
+            db.session.commit()
 
             flash('Người dùng đã được thêm thành công!', 'success')
             return redirect(url_for('users'))
@@ -5830,16 +5023,9 @@ def profile():
             
             # Cập nhật email
             user.email = new_email
+            audit.record('profile', 'update', user.id, f"email={new_email}")
             db.session.commit()
             
-            try:
-                uid = session.get('user_id')
-                if uid:
-                    db.session.add(AuditLog(user_id=uid, module='profile', action='update', entity_id=user.id, details=f"email={new_email}"))
-                    db.session.commit()
-            except Exception:
-                db.session.rollback()
-            
             flash('Đã cập nhật thông tin cá nhân thành công!', 'success')
             return redirect(url_for('profile'))
         except Exception as e:
@@ -5944,16 +5130,9 @@ def settings():
             
             # Cập nhật mật khẩu
             user.set_password(new_password)
+            audit.record('settings', 'change_password', user.id, 'Password changed')
             db.session.commit()
             
-            try:
-                uid = session.get('user_id')
-                if uid:
-                    db.session.add(AuditLog(user_id=uid, module='settings', action='change_password', entity_id=user.id, details='Password changed'))
-                    db.session.commit()
-            except Exception:
-                db.session.rollback()
-            
             flash('Đã đổi mật khẩu thành công!', 'success')
             return redirect(url_for('settings'))
         
@@ -6092,18 +5271,8 @@ def generate_transfer_code(seq_number: int) -> str:
     """
     return f"BG{seq_number}"
 
-def send_transfer_email(transfer):
-    """Gửi email xác nhận bàn giao nếu cấu hình cho phép."""
-    if not app.config.get('EMAIL_ENABLED'):
-        message = 'Chức năng email chưa được bật trong cấu hình.'
-        app.logger.info(f"{message} Bỏ qua gửi email cho {transfer.transfer_code}.")
-        return False, message
-    
-    if not transfer.to_user or not transfer.to_user.email:
-        message = 'Không tìm thấy email hợp lệ của người nhận.'
-        app.logger.warning(f"{message} transfer_id={transfer.id}")
-        return False, message
-    
+def transfer_email_message(transfer):
+    """Nội dung email xác nhận bàn giao (dict cho queue_email/queue_emails)."""
     # Tạo link xác nhận tuyệt đối
     try:
         confirm_url = url_for('transfer_confirm', token=transfer.confirmation_token, _external=True)
@@ -6137,19 +5306,28 @@ def send_transfer_email(transfer):
         f"<p>Trân trọng,<br>Hệ thống Quản lý tài sản</p>"
     )
     
-    success, message = send_email_from_config(
-        to_emails=[transfer.to_user.email],
-        subject=subject,
-        body_text=body_text,
-        body_html=body_html,
-        config=app.config
-    )
+    return {
+        'to_emails': [transfer.to_user.email], 'subject': subject, 'body_text': body_text, 'body_html': body_html,
+        'related_type': 'transfer', 'related_id': transfer.id,
+    }
+
+
+def send_transfer_email(transfer):
+    """Đưa email xác nhận bàn giao vào outbox (gửi nền) nếu cấu hình cho phép."""
+    from utils.email_outbox import queue_email
+    if not app.config.get('EMAIL_ENABLED'):
+        message = 'Chức năng email chưa được bật trong cấu hình.'
+        app.logger.info(f"{message} Bỏ qua gửi email cho {transfer.transfer_code}.")
+        return False, message
     
-    if success:
-        app.logger.info(f"Đã gửi email xác nhận bàn giao {transfer.transfer_code} tới {transfer.to_user.email}.")
-    else:
-        app.logger.error(f"Gửi email bàn giao {transfer.transfer_code} thất bại: {message}")
-    return success, message
+    if not transfer.to_user or not transfer.to_user.email:
+        message = 'Không tìm thấy email hợp lệ của người nhận.'
+        app.logger.warning(f"{message} transfer_id={transfer.id}")
+        return False, message
+    
+    queue_email(**transfer_email_message(transfer), user_id=session.get('user_id'))
+    app.logger.info(f"Đã đưa email xác nhận bàn giao {transfer.transfer_code} tới {transfer.to_user.email} vào hàng đợi.")
+    return True, 'Email xác nhận đang được gửi.'
 
 @app.route('/transfer/create', methods=['GET', 'POST'])
 @login_required
@@ -6232,6 +5410,7 @@ def transfer_create():
             transfer_code = transfer.transfer_code
             db.session.commit()
             
+            # Email chỉ được ghi vào outbox, worker gửi nền (không chờ SMTP trong request)
             email_success = False
             email_message = ''
             if send_email_requested:
@@ -6241,22 +5420,16 @@ def transfer_create():
                 f'✅ Đã tạo yêu cầu bàn giao {transfer_code}. Sao chép link xác nhận trong danh sách bàn giao và gửi cho {to_user.username}.'
             )
             if send_email_requested and email_success:
-                success_message += f' Email xác nhận đã được gửi tới {to_user.email}.'
+                success_message += f' Email xác nhận đang được gửi tới {to_user.email}.'
             flash(success_message, 'success')
             
             if send_email_requested and not email_success:
                 flash(f'Không thể gửi email tự động: {email_message}', 'warning')
             
-            app.logger.info(f"Bàn giao {transfer_code} tạo thành công. Email tự động: {'đã gửi' if email_success else 'không gửi'}.")
+            app.logger.info(f"Bàn giao {transfer_code} tạo thành công. Email tự động: {'đã đưa vào hàng đợi' if email_success else 'không gửi'}.")
             
-            # Ghi audit log
-            try:
-                uid = session.get('user_id')
-                if uid:
-                    db.session.add(AuditLog(user_id=uid, module='transfer', action='create', entity_id=transfer.id, details=f"transfer_code={transfer_code}"))
-                    db.session.commit()
-            except Exception:
-                db.session.rollback()
+            # Ghi audit log (ghi cùng lần commit cuối của request)
+            audit.record('transfer', 'create', transfer.id, f"transfer_code={transfer_code}")
             
             return redirect(url_for('transfer_list'))
         except Exception as e:
@@ -6334,22 +5507,9 @@ def transfer_clear_all():
         count = AssetTransfer.query.count()
         if count > 0:
             AssetTransfer.query.delete()
-            db.session.commit()
-            
             # Ghi nhật ký
-            try:
-                uid = session.get('user_id')
-                if uid:
-                    db.session.add(AuditLog(
-                        user_id=uid,
-                        module='transfer',
-                        action='clear_all',
-                        entity_id=None,
-                        details=f'cleared_all_transfers count={count}'
-                    ))
-                    db.session.commit()
-            except Exception:
-                db.session.rollback()
+            audit.record('transfer', 'clear_all', None, f'cleared_all_transfers count={count}')
+            db.session.commit()
             
             flash(f'Đã xóa {count} bản ghi bàn giao tài sản.', 'success')
         else:
@@ -6370,8 +5530,40 @@ def transfer_send_email():
 @app.route('/transfer/resend-email/<int:transfer_id>', methods=['POST'])
 @login_required
 def transfer_resend_email(transfer_id):
-    """Gửi lại email xác nhận cho bàn giao tài sản"""
-    flash('Chức năng gửi lại email đã bị vô hiệu hóa. Hãy chia sẻ liên kết xác nhận thủ công.', 'info')
+    """Gửi lại email xác nhận cho bàn giao tài sản (qua outbox)"""
+    if not app.config.get('EMAIL_ENABLED'):
+        flash('Chức năng gửi lại email đã bị vô hiệu hóa. Hãy chia sẻ liên kết xác nhận thủ công.', 'info')
+        return redirect(url_for('transfer_list'))
+    transfer = AssetTransfer.query.get_or_404(transfer_id)
+    if transfer.status != 'pending' or not transfer.is_token_valid():
+        flash('Chỉ gửi lại email cho bàn giao đang chờ xác nhận và còn hạn.', 'warning')
+        return redirect(url_for('transfer_list'))
+    success, message = send_transfer_email(transfer)
+    flash(message if success else f'Không thể gửi email tự động: {message}', 'success' if success else 'warning')
+    return redirect(url_for('transfer_list'))
+
+@app.route('/transfer/resend-email/pending', methods=['POST'])
+@manager_required
+def transfer_resend_pending_emails():
+    """Gửi lại email cho mọi bàn giao đang chờ xác nhận: chỉ ghi outbox, worker gửi theo lô"""
+    if not app.config.get('EMAIL_ENABLED'):
+        flash('Chức năng email chưa được bật trong cấu hình.', 'info')
+        return redirect(url_for('transfer_list'))
+    from sqlalchemy.orm import selectinload
+    from utils.email_outbox import queue_emails, queued_related_ids
+    transfers = AssetTransfer.query.options(
+        selectinload(AssetTransfer.to_user), selectinload(AssetTransfer.from_user), selectinload(AssetTransfer.asset)
+    ).filter_by(status='pending').all()
+    # Bàn giao đã có email đang chờ gửi thì bỏ qua (bấm gửi lại nhiều lần không tạo thư trùng)
+    waiting = queued_related_ids('transfer', [t.id for t in transfers])
+    messages = [
+        transfer_email_message(transfer) for transfer in transfers
+        if transfer.id not in waiting and transfer.is_token_valid() and transfer.to_user and transfer.to_user.email
+    ]
+    # Một lần commit và một lần hẹn tác vụ gửi cho cả lô
+    queue_emails(messages, user_id=session.get('user_id'))
+    skipped = f' Bỏ qua {len(waiting)} bàn giao đã có email đang chờ gửi.' if waiting else ''
+    flash(f'Đã đưa {len(messages)} email xác nhận vào hàng đợi gửi.{skipped}', 'success')
     return redirect(url_for('transfer_list'))
 
 @app.route('/transfer/confirm/<token>', methods=['GET', 'POST'])
@@ -6458,20 +5650,10 @@ def transfer_confirm(token):
                 transfer.status = 'pending'
                 flash(f'Đã xác nhận {transfer.confirmed_quantity}/{transfer.expected_quantity} thiết bị. Vui lòng xác nhận đầy đủ để hoàn tất bàn giao.', 'warning')
             
-            db.session.commit()
-            
             # Ghi audit log
-            try:
-                db.session.add(AuditLog(
-                    user_id=transfer.to_user_id,
-                    module='transfer',
-                    action='confirm',
-                    entity_id=transfer.id,
-                    details=f"confirmed_quantity={confirmed_quantity}"
-                ))
-                db.session.commit()
-            except Exception:
-                db.session.rollback()
+            audit.record('transfer', 'confirm', transfer.id, f"confirmed_quantity={confirmed_quantity}",
+                         user_id=transfer.to_user_id)
+            db.session.commit()
             
             # Nếu user đã đăng nhập, redirect về trang chính
             if session.get('user_id'):
@@ -6495,6 +5677,48 @@ try:
 except ImportError as e:
     print(f"Warning: Could not import ai_chat: {e}")
 
+@app.cli.command('rebuild-rollups')
+def rebuild_rollups_command():
+    """Tính lại toàn bộ bảng tổng hợp asset_type_rollup từ bảng asset"""
+    db.create_all()
+    rows = AssetTypeRollup.rebuild()
+    print(f"[Rollup] Đã tính lại {rows} dòng tổng hợp (loại tài sản × trạng thái)")
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """Dựng lại chỉ mục tìm kiếm không dấu (search_document) cho tài sản và bảo trì"""
+    from utils.search_index import rebuild_search_index
+    db.create_all()
+    rows = rebuild_search_index()
+    print(f"[Search] Đã dựng lại {rows} bản ghi chỉ mục tìm kiếm")
+
+@app.cli.command('worker')
+@click.option('--threads', type=int, default=None, help='Số thread xử lý (mặc định JOB_WORKER_THREADS)')
+def worker_command(threads):
+    """Chạy worker xử lý tác vụ nền (xuất file, import, khấu hao, email) cho tới khi Ctrl+C"""
+    db.create_all()
+    print(f"[Jobs] Worker started ({threads or app.config['JOB_WORKER_THREADS']} threads), Ctrl+C để dừng")
+    job_runner.serve_forever(threads)
+
+@app.cli.command('archive-audit-logs')
+@click.option('--keep-months', type=int, default=None, help='Số tháng gần nhất giữ lại trong bảng (mặc định AUDIT_ARCHIVE_KEEP_MONTHS)')
+def archive_audit_logs_command(keep_months):
+    """Chuyển nhật ký cũ sang tệp lưu trữ nén theo tháng (vẫn tra cứu được trên trang Nhật ký)"""
+    from utils.audit_log import archive_audit_logs
+    db.create_all()
+    archives = archive_audit_logs(keep_months)
+    for archive in archives:
+        print(f"[Audit] {archive.month} phần {archive.part}: {archive.row_count} dòng -> {archive.path}")
+    print(f"[Audit] Đã lưu trữ {sum(a.row_count for a in archives)} dòng nhật ký")
+
+@app.cli.command('purge-revoked-tokens')
+def purge_revoked_tokens_command():
+    """Xóa các JWT đã thu hồi nhưng đã hết hạn khỏi bảng revoked_token"""
+    from models import RevokedToken
+    db.create_all()
+    rows = RevokedToken.purge_expired()
+    print(f"[JWT] Đã xóa {rows} token thu hồi đã hết hạn")
+
 if __name__ == '__main__':
     with app.app_context():
         try:
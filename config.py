@@ -12,6 +12,15 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     DEBUG = os.getenv('FLASK_DEBUG', 'True').lower() in ('1', 'true', 'yes')  # Default to True for development
     EXPORT_DIR = os.getenv('EXPORT_DIR', 'instance/exports')
+    # Nhật ký hệ thống: tệp lưu trữ nén theo tháng (flask archive-audit-logs) và số tháng giữ trong bảng
+    AUDIT_ARCHIVE_DIR = os.getenv('AUDIT_ARCHIVE_DIR', 'instance/audit_archive')
+    AUDIT_ARCHIVE_KEEP_MONTHS = int(os.getenv('AUDIT_ARCHIVE_KEEP_MONTHS', 12))
+    # Ghi nhật ký: mặc định cùng transaction nghiệp vụ; AUDIT_ASYNC = spool ra tệp rồi chèn theo lô ở thread nền
+    AUDIT_ASYNC = os.getenv('AUDIT_ASYNC', 'false').lower() in ('1', 'true', 'yes')
+    AUDIT_FLUSH_INTERVAL_MS = int(os.getenv('AUDIT_FLUSH_INTERVAL_MS', 500))
+    AUDIT_BATCH_SIZE = int(os.getenv('AUDIT_BATCH_SIZE', 200))
+    AUDIT_SPOOL_DIR = os.getenv('AUDIT_SPOOL_DIR', 'instance/audit_spool')
+    AUDIT_SPOOL_FSYNC = os.getenv('AUDIT_SPOOL_FSYNC', 'false').lower() in ('1', 'true', 'yes')
     UPLOAD_FOLDER = os.getenv('UPLOAD_FOLDER', 'instance/uploads')
     MAX_UPLOAD_SIZE = int(os.getenv('MAX_UPLOAD_SIZE', 20971520))  # 20MB default
     ALLOWED_EXTENSIONS = {
@@ -19,6 +28,21 @@ class Config:
         'png', 'jpg', 'jpeg', 'gif', 'bmp', 'webp', 'svg', 'tif', 'tiff', 'ico', 'avif',
         'doc', 'docx', 'xls', 'xlsx'
     }
+    # Đếm truy vấn / truy vấn chậm theo request (header Server-Timing, /dev/diag/queries)
+    QUERY_PROFILER_ENABLED = os.getenv('QUERY_PROFILER_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+    QUERY_PROFILER_SLOW_MS = float(os.getenv('QUERY_PROFILER_SLOW_MS', 100))
+    QUERY_PROFILER_WARN_QUERIES = int(os.getenv('QUERY_PROFILER_WARN_QUERIES', 50))
+    # Cache SystemSetting trong tiến trình: TTL (giây) và chu kỳ kiểm tra phiên bản giữa các worker (0 = tắt)
+    SYSTEM_SETTING_CACHE_TTL = float(os.getenv('SYSTEM_SETTING_CACHE_TTL', 300))
+    SYSTEM_SETTING_VERSION_CHECK = float(os.getenv('SYSTEM_SETTING_VERSION_CHECK', 1))
+    # Snapshot báo cáo theo thông tư (dữ liệu trang + file XLSX trong EXPORT_DIR), làm mới theo data_version
+    REPORT_CACHE_ENABLED = os.getenv('REPORT_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    REPORT_CACHE_MAX_ENTRIES = int(os.getenv('REPORT_CACHE_MAX_ENTRIES', 256))
+    # Chỉ mục gợi ý trong bộ nhớ: dựng khi khởi động, kiểm tra phiên bản dữ liệu mỗi N giây
+    SUGGEST_INDEX_PRELOAD = os.getenv('SUGGEST_INDEX_PRELOAD', 'true').lower() in ('1', 'true', 'yes')
+    SUGGEST_INDEX_VERSION_CHECK = float(os.getenv('SUGGEST_INDEX_VERSION_CHECK', 1))
+    # Cache bitset phân quyền: chu kỳ (giây) đọc phiên bản phân quyền do worker khác ghi
+    PERMISSION_CACHE_VERSION_CHECK = float(os.getenv('PERMISSION_CACHE_VERSION_CHECK', 1))
     # Optional bootstrap config for first-run initialization
     INIT_TOKEN = os.getenv('INIT_TOKEN', '')
     ADMIN_USERNAME = os.getenv('ADMIN_USERNAME', 'admin')
@@ -35,6 +59,14 @@ class Config:
     MAIL_USERNAME = os.getenv('MAIL_USERNAME', '')
     MAIL_PASSWORD = os.getenv('MAIL_PASSWORD', '')
     MAIL_DEFAULT_SENDER = os.getenv('MAIL_DEFAULT_SENDER', MAIL_USERNAME)
+    # Outbox (utils/email_outbox.py): gửi theo lô qua một phiên SMTP, giới hạn tốc độ và thử lại
+    MAIL_TIMEOUT = float(os.getenv('MAIL_TIMEOUT', 30))
+    MAIL_BATCH_SIZE = int(os.getenv('MAIL_BATCH_SIZE', 50))
+    MAIL_MAX_PER_CONNECTION = int(os.getenv('MAIL_MAX_PER_CONNECTION', 100))  # Kết nối lại sau chừng này thư
+    MAIL_RATE_LIMIT = float(os.getenv('MAIL_RATE_LIMIT', 2))  # Số thư/giây, 0 = không giới hạn
+    MAIL_MAX_ATTEMPTS = int(os.getenv('MAIL_MAX_ATTEMPTS', 5))
+    MAIL_RETRY_BASE = float(os.getenv('MAIL_RETRY_BASE', 60))  # Giây chờ trước lần thử lại đầu, gấp đôi mỗi lần
+    MAIL_RETRY_MAX = float(os.getenv('MAIL_RETRY_MAX', 3600))
     
     # Application URL for general links
     APP_URL = os.getenv('APP_URL', 'http://localhost:5000')
@@ -42,4 +74,26 @@ class Config:
     # JWT Configuration
     JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', SECRET_KEY)  # Sử dụng SECRET_KEY nếu không có JWT_SECRET_KEY
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=24)  # Token hết hạn sau 24 giờ
-    JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=30)  # Refresh token hết hạn sau 30 ngày
\ No newline at end of file
+    JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=30)  # Refresh token hết hạn sau 30 ngày
+    # Danh sách token thu hồi: sức chứa bộ lọc Bloom và chu kỳ (giây) đọc thu hồi từ worker khác
+    JWT_REVOCATION_BLOOM_CAPACITY = int(os.getenv('JWT_REVOCATION_BLOOM_CAPACITY', 100000))
+    JWT_REVOCATION_VERSION_CHECK = float(os.getenv('JWT_REVOCATION_VERSION_CHECK', 1))
+    # Cache danh tính user cho API: TTL (giây) và số user tối đa
+    JWT_IDENTITY_CACHE_TTL = float(os.getenv('JWT_IDENTITY_CACHE_TTL', 30))
+    JWT_IDENTITY_CACHE_SIZE = int(os.getenv('JWT_IDENTITY_CACHE_SIZE', 1024))
+    # Tác vụ nền (utils/jobs.py): chạy ngay trong tiến trình web (luồng tạm) hoặc bằng `flask worker`
+    JOB_WORKER_EMBEDDED = os.getenv('JOB_WORKER_EMBEDDED', 'true').lower() == 'true'
+    JOB_WORKER_THREADS = int(os.getenv('JOB_WORKER_THREADS', 2))
+    JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', 2))
+    JOB_HEARTBEAT_INTERVAL = float(os.getenv('JOB_HEARTBEAT_INTERVAL', 30))
+    JOB_STALE_AFTER = int(os.getenv('JOB_STALE_AFTER', 600))  # Giây không có heartbeat thì đưa tác vụ về hàng chờ
+    # Chế độ nhúng: chu kỳ (giây) quét tác vụ mất heartbeat / tác vụ hẹn giờ tới hạn (0 = tắt, dùng `flask worker`)
+    JOB_SUPERVISE_INTERVAL = float(os.getenv('JOB_SUPERVISE_INTERVAL', 30))
+    JOB_DEPRECIATION_SYNC_LIMIT = int(os.getenv('JOB_DEPRECIATION_SYNC_LIMIT', 500))  # Nhiều hơn thì tính khấu hao nền
+    # Sinh danh mục kiểm kê: phạm vi lớn hơn giới hạn thì chạy nền, chèn theo lô id tài sản
+    INVENTORY_LINES_SYNC_LIMIT = int(os.getenv('INVENTORY_LINES_SYNC_LIMIT', 20000))
+    INVENTORY_LINES_CHUNK_SIZE = int(os.getenv('INVENTORY_LINES_CHUNK_SIZE', 5000))
+    INVENTORY_RESULTS_BATCH_MAX = int(os.getenv('INVENTORY_RESULTS_BATCH_MAX', 5000))  # Số kết quả tối đa mỗi lần gửi theo lô
+    # Đồng bộ offline dòng kiểm kê (/api/v1/inventory/inventories/<id>/sync): số dòng mỗi trang kéo về
+    INVENTORY_SYNC_PAGE_SIZE = int(os.getenv('INVENTORY_SYNC_PAGE_SIZE', 5000))
+    INVENTORY_SYNC_MAX_LIMIT = int(os.getenv('INVENTORY_SYNC_MAX_LIMIT', 20000))
@@ -7,6 +7,7 @@ Tạo file Excel từ danh sách người dùng và import vào hệ thống
 import pandas as pd
 from app import app
 from models import db, User, Role
+from utils.email_validator import MX_MISSING, validate_emails
 
 # Danh sách người dùng từ hình ảnh
 users_data = [
@@ -93,10 +94,18 @@ def create_excel_and_import():
         db.session.add(user_role)
         db.session.commit()
     
-    for user_info in excel_data:
+    # Xác thực email hàng loạt (các email chung vài tên miền: mỗi tên miền tra MX một lần)
+    email_checks = validate_emails([user_info['Email'] for user_info in excel_data])
+    
+    for user_info, check in zip(excel_data, email_checks):
         try:
             username = user_info['Username']
             email = user_info['Email']
+            if not check['syntax_valid'] or check['mx_status'] == MX_MISSING:
+                errors.append(f"{username}: Email khong hop le ({email})")
+                skipped += 1
+                print(f'  Bo qua (email khong hop le): {username} ({email})')
+                continue
             
             # Kiểm tra user đã tồn tại chưa
             existing_user = User.query.filter_by(username=username).first()
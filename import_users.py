@@ -18,6 +18,7 @@ import pandas as pd
 from app import app
 from models import db, User, Role
 from werkzeug.security import generate_password_hash
+from utils.email_validator import MX_MISSING, validate_emails
 
 def normalize_role(role_str):
     """Chuẩn hóa tên role"""
@@ -66,6 +67,10 @@ def import_users_from_excel(file_path):
         
         print(f"\n📋 Đang import {len(df)} người dùng...\n")
         
+        # Xác thực email hàng loạt: mỗi tên miền chỉ tra MX một lần, các tên miền tra song song
+        all_emails = list(dict.fromkeys(str(v).strip().lower() for v in df[email_col] if pd.notna(v)))
+        email_checks = dict(zip(all_emails, validate_emails(all_emails)))
+        
         for index, row in df.iterrows():
             try:
                 # Lấy thông tin từ các cột
@@ -88,9 +93,11 @@ def import_users_from_excel(file_path):
                 # Chuẩn hóa email
                 email = email.lower().strip()
                 
-                # Kiểm tra email hợp lệ
-                if '@' not in email:
-                    errors.append(f"Dòng {index + 2}: Email không hợp lệ: {email}")
+                # Kiểm tra email hợp lệ (lỗi tra DNS tạm thời không chặn import)
+                check = email_checks.get(email)
+                if check is None or not check['syntax_valid'] or check['mx_status'] == MX_MISSING:
+                    reason = check['messages'][-1] if check else 'không đúng định dạng'
+                    errors.append(f"Dòng {index + 2}: Email không hợp lệ: {email} ({reason})")
                     skipped += 1
                     continue
                 
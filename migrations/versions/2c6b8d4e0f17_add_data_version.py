@@ -0,0 +1,29 @@
+"""Add data_version counter for report snapshot invalidation
+
+Revision ID: 2c6b8d4e0f17
+Revises: 9e3a5f7c1d24
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2c6b8d4e0f17'
+down_revision = '9e3a5f7c1d24'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('data_version',
+    sa.Column('key', sa.String(length=50), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('key')
+    )
+
+
+def downgrade():
+    op.drop_table('data_version')
@@ -0,0 +1,37 @@
+"""Add asset_type_rollup summary table
+
+Revision ID: 3c8e1f6a9b20
+Revises: 499eed306f06
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c8e1f6a9b20'
+down_revision = '499eed306f06'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('asset_type_rollup',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('asset_type_id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('asset_count', sa.Integer(), nullable=False),
+    sa.Column('total_quantity', sa.Integer(), nullable=False),
+    sa.Column('total_value', sa.Float(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('asset_type_id', 'status', name='_asset_type_rollup_uc')
+    )
+    op.create_index(op.f('ix_asset_type_rollup_asset_type_id'), 'asset_type_rollup', ['asset_type_id'], unique=False)
+    # Dữ liệu được điền bằng lệnh `flask rebuild-rollups` (hoặc tự động ở lần đọc đầu tiên)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_asset_type_rollup_asset_type_id'), table_name='asset_type_rollup')
+    op.drop_table('asset_type_rollup')
@@ -0,0 +1,57 @@
+"""Add composite and partial indexes for soft-delete hot filters
+
+Revision ID: 7a4d2c91e5f3
+Revises: 3c8e1f6a9b20
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7a4d2c91e5f3'
+down_revision = '3c8e1f6a9b20'
+branch_labels = None
+depends_on = None
+
+# Partial index (PostgreSQL, SQLite): chỉ index các bản ghi chưa bị xóa mềm
+LIVE_ROWS = sa.text('deleted_at IS NULL')
+
+# (tên index, bảng, cột, chỉ bản ghi chưa xóa)
+INDEXES = [
+    ('ix_asset_live_type_status', 'asset', ['asset_type_id', 'status'], True),
+    ('ix_asset_live_status', 'asset', ['status'], True),
+    ('ix_asset_live_user', 'asset', ['user_id'], True),
+    ('ix_asset_live_created_at', 'asset', ['created_at'], True),
+    ('ix_asset_deleted_at', 'asset', ['deleted_at'], False),
+    ('ix_maintenance_record_asset_id', 'maintenance_record', ['asset_id'], False),
+    ('ix_maintenance_record_live_next_due', 'maintenance_record', ['next_due_date'], True),
+    ('ix_maintenance_record_live_date', 'maintenance_record', ['maintenance_date'], True),
+    ('ix_maintenance_record_live_status', 'maintenance_record', ['status'], True),
+    ('ix_maintenance_record_deleted_at', 'maintenance_record', ['deleted_at'], False),
+    ('ix_audit_log_created_at', 'audit_log', ['created_at', 'id'], False),
+    ('ix_audit_log_user_created', 'audit_log', ['user_id', 'created_at'], False),
+    ('ix_audit_log_module_created', 'audit_log', ['module', 'created_at'], False),
+    ('ix_audit_log_module_entity', 'audit_log', ['module', 'entity_id'], False),
+    ('ix_asset_depreciation_asset_period', 'asset_depreciation', ['asset_id', 'period_year', 'period_month'], False),
+    ('ix_asset_depreciation_period', 'asset_depreciation', ['period_year', 'period_month'], False),
+    ('ix_inventory_result_inventory_asset', 'inventory_result', ['inventory_id', 'asset_id'], False),
+    ('ix_inventory_result_asset', 'inventory_result', ['asset_id'], False),
+    ('ix_asset_transfer_status_created', 'asset_transfer', ['status', 'created_at'], False),
+    ('ix_asset_transfer_from_user', 'asset_transfer', ['from_user_id'], False),
+    ('ix_asset_transfer_to_user', 'asset_transfer', ['to_user_id'], False),
+    ('ix_asset_transfer_asset', 'asset_transfer', ['asset_id'], False),
+]
+
+
+def upgrade():
+    for name, table, columns, live_only in INDEXES:
+        where = {'postgresql_where': LIVE_ROWS, 'sqlite_where': LIVE_ROWS} if live_only else {}
+        # if_not_exists: CSDL tạo bằng db.create_all() đã có sẵn các index này
+        op.create_index(name, table, columns, unique=False, if_not_exists=True, **where)
+
+
+def downgrade():
+    for name, table, _columns, _live_only in reversed(INDEXES):
+        op.drop_index(name, table_name=table, if_exists=True)
@@ -0,0 +1,31 @@
+"""Replace ix_asset_live_created_at with (created_at, id) for keyset report pagination
+
+Revision ID: 9e3a5f7c1d24
+Revises: 5b7e0c3d8f41
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e3a5f7c1d24'
+down_revision = '5b7e0c3d8f41'
+branch_labels = None
+depends_on = None
+
+LIVE_ROWS = sa.text('deleted_at IS NULL')
+WHERE = {'postgresql_where': LIVE_ROWS, 'sqlite_where': LIVE_ROWS}
+
+
+def upgrade():
+    op.create_index('ix_asset_live_created_id', 'asset', ['created_at', 'id'], unique=False,
+                    if_not_exists=True, **WHERE)
+    op.drop_index('ix_asset_live_created_at', table_name='asset', if_exists=True)
+
+
+def downgrade():
+    op.create_index('ix_asset_live_created_at', 'asset', ['created_at'], unique=False,
+                    if_not_exists=True, **WHERE)
+    op.drop_index('ix_asset_live_created_id', table_name='asset', if_exists=True)
@@ -0,0 +1,36 @@
+"""Recreate search_fts with the trigram tokenizer (substring matching like LIKE '%term%')
+
+Revision ID: a1d4c7e9b052
+Revises: f9c3e8a2b471
+Create Date: 2026-10-18 16:00:00.000000
+
+Chỉ SQLite: tạo lại bảng FTS5 và dựng lại từ search_document (trigger đồng bộ giữ nguyên).
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a1d4c7e9b052'
+down_revision = 'f9c3e8a2b471'
+branch_labels = None
+depends_on = None
+
+
+def _recreate(tokenize):
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute('DROP TABLE IF EXISTS search_fts')
+    op.execute(
+        "CREATE VIRTUAL TABLE search_fts USING fts5("
+        f"content, content='search_document', content_rowid='id', tokenize='{tokenize}')"
+    )
+    op.execute("INSERT INTO search_fts(search_fts) VALUES ('rebuild')")
+
+
+def upgrade():
+    _recreate('trigram')
+
+
+def downgrade():
+    _recreate('unicode61 remove_diacritics 2')
@@ -0,0 +1,49 @@
+"""Add background_job table for the DB-backed job runner
+
+Revision ID: a4c7e2b9d015
+Revises: 8d2f4a6c1e93
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4c7e2b9d015'
+down_revision = '8d2f4a6c1e93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('background_job',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=50), nullable=False),
+    sa.Column('title', sa.String(length=255), nullable=True),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('params', sa.Text(), nullable=True),
+    sa.Column('progress_done', sa.Integer(), nullable=False),
+    sa.Column('progress_total', sa.Integer(), nullable=True),
+    sa.Column('message', sa.String(length=500), nullable=True),
+    sa.Column('result_path', sa.String(length=500), nullable=True),
+    sa.Column('result_name', sa.String(length=255), nullable=True),
+    sa.Column('result_mimetype', sa.String(length=150), nullable=True),
+    sa.Column('cancel_requested', sa.Boolean(), nullable=False),
+    sa.Column('worker', sa.String(length=100), nullable=True),
+    sa.Column('created_by_id', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('heartbeat_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['created_by_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_background_job_status_id', 'background_job', ['status', 'id'], unique=False)
+    op.create_index('ix_background_job_created_by', 'background_job', ['created_by_id', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_background_job_created_by', table_name='background_job')
+    op.drop_index('ix_background_job_status_id', table_name='background_job')
+    op.drop_table('background_job')
@@ -0,0 +1,31 @@
+"""Add ix_asset_live_created_id_desc (created_at DESC NULLS LAST, id DESC) for report ordering on PostgreSQL
+
+Revision ID: b6e1f0c9d427
+Revises: a1d4c7e9b052
+Create Date: 2026-10-18 18:00:00.000000
+
+Chỉ PostgreSQL: SQLite không cho NULLS LAST trong CREATE INDEX và đã đọc ngược ix_asset_live_created_id.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6e1f0c9d427'
+down_revision = 'a1d4c7e9b052'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.create_index('ix_asset_live_created_id_desc', 'asset',
+                    [sa.text('created_at DESC NULLS LAST'), sa.text('id DESC')], unique=False,
+                    if_not_exists=True, postgresql_where=sa.text('deleted_at IS NULL'))
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.drop_index('ix_asset_live_created_id_desc', table_name='asset', if_exists=True)
@@ -0,0 +1,36 @@
+"""Add audit_log_archive table for monthly audit log archives
+
+Revision ID: c6e9a4b1f237
+Revises: b5d8f3a0e126
+Create Date: 2026-10-18 23:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c6e9a4b1f237'
+down_revision = 'b5d8f3a0e126'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('audit_log_archive',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('month', sa.String(length=7), nullable=False),
+    sa.Column('part', sa.Integer(), nullable=False),
+    sa.Column('path', sa.String(length=500), nullable=False),
+    sa.Column('row_count', sa.Integer(), nullable=False),
+    sa.Column('min_created_at', sa.DateTime(), nullable=True),
+    sa.Column('max_created_at', sa.DateTime(), nullable=True),
+    sa.Column('max_log_id', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('month', 'part', name='uq_audit_log_archive_month_part')
+    )
+
+
+def downgrade():
+    op.drop_table('audit_log_archive')
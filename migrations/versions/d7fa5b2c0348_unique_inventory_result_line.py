@@ -0,0 +1,49 @@
+"""Make ix_inventory_result_inventory_asset unique (one book line per asset per inventory)
+
+Revision ID: d7fa5b2c0348
+Revises: c6e9a4b1f237
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7fa5b2c0348'
+down_revision = 'c6e9a4b1f237'
+branch_labels = None
+depends_on = None
+
+
+# Dòng được giữ trong nhóm trùng (inventory_id, asset_id) của dòng `{row}`: ưu tiên dòng đã có kết quả kiểm kê
+# (actual_*/checked_at), rồi dòng kiểm gần nhất, cuối cùng id nhỏ nhất
+KEEP_ID = (
+    'SELECT keep.id FROM inventory_result keep '
+    'WHERE keep.inventory_id = {row}.inventory_id AND keep.asset_id = {row}.asset_id '
+    'ORDER BY CASE WHEN keep.checked_at IS NOT NULL OR keep.actual_condition IS NOT NULL '
+    'OR keep.actual_quantity IS NOT NULL OR keep.actual_status IS NOT NULL THEN 0 ELSE 1 END, '
+    'CASE WHEN keep.checked_at IS NULL THEN 1 ELSE 0 END, keep.checked_at DESC, keep.id '
+    'LIMIT 1'
+)
+
+
+def upgrade():
+    # Dòng trùng (do sinh danh mục hai lần đồng thời): chuyển ảnh minh chứng sang dòng được giữ rồi xóa phần còn lại
+    op.execute(sa.text(
+        'UPDATE inventory_line_photo SET inventory_result_id = ('
+        f'SELECT ({KEEP_ID.format(row="dup")}) FROM inventory_result dup '
+        'WHERE dup.id = inventory_line_photo.inventory_result_id)'
+    ))
+    op.execute(sa.text(
+        f'DELETE FROM inventory_result WHERE id <> ({KEEP_ID.format(row="inventory_result")})'
+    ))
+    op.drop_index('ix_inventory_result_inventory_asset', table_name='inventory_result', if_exists=True)
+    op.create_index('ix_inventory_result_inventory_asset', 'inventory_result', ['inventory_id', 'asset_id'],
+                    unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_inventory_result_inventory_asset', table_name='inventory_result', if_exists=True)
+    op.create_index('ix_inventory_result_inventory_asset', 'inventory_result', ['inventory_id', 'asset_id'],
+                    unique=False)
@@ -0,0 +1,36 @@
+"""Add inventory.sync_seq and inventory_result row_version/change_seq for offline sync
+
+Revision ID: e8b2d7f1a360
+Revises: d7fa5b2c0348
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8b2d7f1a360'
+down_revision = 'd7fa5b2c0348'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('inventory', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('sync_seq', sa.Integer(), nullable=False, server_default='0'))
+
+    with op.batch_alter_table('inventory_result', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('row_version', sa.Integer(), nullable=False, server_default='1'))
+        batch_op.add_column(sa.Column('change_seq', sa.Integer(), nullable=False, server_default='0'))
+        batch_op.create_index('ix_inventory_result_inventory_seq', ['inventory_id', 'change_seq', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('inventory_result', schema=None) as batch_op:
+        batch_op.drop_index('ix_inventory_result_inventory_seq')
+        batch_op.drop_column('change_seq')
+        batch_op.drop_column('row_version')
+
+    with op.batch_alter_table('inventory', schema=None) as batch_op:
+        batch_op.drop_column('sync_seq')
@@ -0,0 +1,35 @@
+"""Add inventory_reconciliation snapshot table
+
+Revision ID: f9c3e8a2b471
+Revises: e8b2d7f1a360
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f9c3e8a2b471'
+down_revision = 'e8b2d7f1a360'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('inventory_reconciliation',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('inventory_id', sa.Integer(), nullable=False),
+    sa.Column('sync_seq', sa.Integer(), nullable=False),
+    sa.Column('summary', sa.Text(), nullable=False),
+    sa.Column('computed_at', sa.DateTime(), nullable=True),
+    sa.Column('computed_by_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['computed_by_id'], ['user.id'], ),
+    sa.ForeignKeyConstraint(['inventory_id'], ['inventory.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('inventory_id')
+    )
+
+
+def downgrade():
+    op.drop_table('inventory_reconciliation')
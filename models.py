@@ -1,10 +1,20 @@
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+from sqlalchemy.orm import Session as OrmSession
+import json
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
 from werkzeug.security import generate_password_hash, check_password_hash
-from utils.timezone import now_vn, today_vn
+from utils.timezone import now_vn, today_vn, from_timestamp_vn
+from utils.search_text import build_search_content
+from utils.sql_upsert import dialect_insert
 
 db = SQLAlchemy()
 
+# Điều kiện cho partial index: chỉ các bản ghi chưa bị xóa mềm
+LIVE_ROWS = db.text('deleted_at IS NULL')
+
 # Association table for many-to-many assignments between assets and users
 asset_user = db.Table(
     'asset_user',
@@ -60,13 +70,10 @@ class User(db.Model):
     permissions = db.relationship('UserPermission', backref='user', lazy=True, cascade='all, delete-orphan')
     
     def has_permission(self, module, action):
-        """Kiểm tra user có quyền thực hiện action trên module không"""
-        if self.role.name == 'admin':
-            return True
-        for perm in self.permissions:
-            if perm.permission.module == module and perm.permission.action == action:
-                return perm.granted
-        return False
+        """Kiểm tra user có quyền thực hiện action trên module không (tra bitset đã biên dịch, không truy vấn)"""
+        # identity không cần nạp lại thuộc tính đã hết hạn sau commit
+        identity = db.inspect(self).identity
+        return UserPermission.allows(identity[0] if identity else self.id, module, action)
     
     def soft_delete(self):
         """Soft delete user"""
@@ -106,9 +113,10 @@ class AssetType(db.Model):
 class Asset(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(200), nullable=False)
-    price = db.Column(db.Float, nullable=False)
-    quantity = db.Column(db.Integer, default=1)
-    status = db.Column(db.String(20), default='active')  # active, maintenance, disposed
+    # active_history: các cột ảnh hưởng tới AssetTypeRollup luôn giữ giá trị cũ khi cập nhật (kể cả khi chưa nạp)
+    price = db.column_property(db.Column(db.Float, nullable=False), active_history=True)
+    quantity = db.column_property(db.Column(db.Integer, default=1), active_history=True)
+    status = db.column_property(db.Column(db.String(20), default='active'), active_history=True)  # active, maintenance, disposed
     # New optional fields
     purchase_date = db.Column(db.Date, nullable=True)
     device_code = db.Column(db.String(100), nullable=True)
@@ -117,11 +125,11 @@ class Asset(db.Model):
     tinh_trang_danh_gia = db.Column(db.String(100), nullable=True)  # tình trạng đánh giá (legacy naming)
     usage_status = db.Column(db.String(50), nullable=True)  # tình trạng sử dụng
     display_order = db.Column(db.Integer, nullable=True)  # STT từ Excel để giữ nguyên thứ tự
-    asset_type_id = db.Column(db.Integer, db.ForeignKey('asset_type.id'), nullable=False)
+    asset_type_id = db.column_property(db.Column(db.Integer, db.ForeignKey('asset_type.id'), nullable=False), active_history=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)  # User who created/owns the asset
     user_text = db.Column(db.Text)  # User notes/description
     notes = db.Column(db.Text)  # Admin notes
-    deleted_at = db.Column(db.DateTime, nullable=True)  # Soft delete
+    deleted_at = db.column_property(db.Column(db.DateTime, nullable=True), active_history=True)  # Soft delete
     created_at = db.Column(db.DateTime, default=now_vn)
     updated_at = db.Column(db.DateTime, default=now_vn, onupdate=now_vn)
     
@@ -143,6 +151,17 @@ class Asset(db.Model):
         lazy='subquery'
     )
     
+    # Index cho các bộ lọc nóng (hầu hết truy vấn đều kèm deleted_at IS NULL)
+    __table_args__ = (
+        db.Index('ix_asset_live_type_status', 'asset_type_id', 'status', postgresql_where=LIVE_ROWS, sqlite_where=LIVE_ROWS),
+        db.Index('ix_asset_live_status', 'status', postgresql_where=LIVE_ROWS, sqlite_where=LIVE_ROWS),
+        db.Index('ix_asset_live_user', 'user_id', postgresql_where=LIVE_ROWS, sqlite_where=LIVE_ROWS),
+        # (created_at, id): thứ tự và điều kiện keyset của các báo cáo (utils/report_queries.py);
+        # SQLite đọc ngược index này cho created_at DESC (NULL xếp cuối), PostgreSQL dùng ix_asset_live_created_id_desc
+        db.Index('ix_asset_live_created_id', 'created_at', 'id', postgresql_where=LIVE_ROWS, sqlite_where=LIVE_ROWS),
+        db.Index('ix_asset_deleted_at', 'deleted_at'),
+    )
+    
     def soft_delete(self):
         """Soft delete asset"""
         self.deleted_at = now_vn()
@@ -179,6 +198,193 @@ class Asset(db.Model):
     def __repr__(self):
         return f'<Asset {self.name}>'
 
+
+# PostgreSQL xếp NULL đầu khi DESC: index riêng đúng thứ tự created_at DESC NULLS LAST, id DESC của báo cáo
+# (SQLite không cho NULLS LAST trong CREATE INDEX)
+db.Index(
+    'ix_asset_live_created_id_desc', Asset.created_at.desc().nulls_last(), Asset.id.desc(),
+    postgresql_where=LIVE_ROWS,
+).ddl_if(dialect='postgresql')
+
+class AssetTypeRollup(db.Model):
+    """Bảng tổng hợp tài sản theo (loại tài sản, trạng thái), cập nhật tăng dần qua event của Asset"""
+    __tablename__ = 'asset_type_rollup'
+
+    # Trạng thái NULL của Asset được lưu dưới dạng chuỗi rỗng để giữ unique constraint
+    NULL_STATUS = ''
+
+    id = db.Column(db.Integer, primary_key=True)
+    # Không dùng ForeignKey để xóa vĩnh viễn loại tài sản không bị chặn bởi dòng tổng hợp
+    asset_type_id = db.Column(db.Integer, nullable=False, index=True)
+    status = db.Column(db.String(20), nullable=False, default='')
+    asset_count = db.Column(db.Integer, nullable=False, default=0)  # Số bản ghi tài sản
+    total_quantity = db.Column(db.Integer, nullable=False, default=0)  # Tổng số lượng (NULL/0 tính là 1)
+    total_value = db.Column(db.Float, nullable=False, default=0.0)  # Tổng nguyên giá * số lượng
+    updated_at = db.Column(db.DateTime, default=now_vn, onupdate=now_vn)
+
+    __table_args__ = (db.UniqueConstraint('asset_type_id', 'status', name='_asset_type_rollup_uc'),)
+
+    def __repr__(self):
+        return f'<AssetTypeRollup type={self.asset_type_id} status={self.status!r} count={self.asset_count}>'
+
+    @staticmethod
+    def contribution(asset_type_id, status, quantity, price, deleted_at):
+        """Phần đóng góp của một tài sản vào bảng tổng hợp, None nếu tài sản đã xóa mềm"""
+        if deleted_at is not None or asset_type_id is None:
+            return None
+        qty = quantity or 1
+        return (asset_type_id, status or AssetTypeRollup.NULL_STATUS, 1, qty, (price or 0) * qty)
+
+    @staticmethod
+    def apply_delta(connection, asset_type_id, status, d_count, d_quantity, d_value):
+        """Cộng dồn delta vào dòng tổng hợp (INSERT ... ON CONFLICT DO UPDATE, không đua nhau khi chưa có dòng)"""
+        table = AssetTypeRollup.__table__
+        statement = dialect_insert(table, connection).values(
+            asset_type_id=asset_type_id,
+            status=status,
+            asset_count=d_count,
+            total_quantity=d_quantity,
+            total_value=d_value,
+            updated_at=now_vn(),
+        )
+        connection.execute(statement.on_conflict_do_update(
+            index_elements=[table.c.asset_type_id, table.c.status],
+            set_={
+                'asset_count': table.c.asset_count + statement.excluded.asset_count,
+                'total_quantity': table.c.total_quantity + statement.excluded.total_quantity,
+                'total_value': table.c.total_value + statement.excluded.total_value,
+                'updated_at': statement.excluded.updated_at,
+            },
+        ))
+
+    @staticmethod
+    def rebuild():
+        """Tính lại toàn bộ bảng tổng hợp từ bảng asset (dùng cho `flask rebuild-rollups`)"""
+        qty = db.func.coalesce(db.func.nullif(Asset.quantity, 0), 1)
+        rows = db.session.query(
+            Asset.asset_type_id,
+            db.func.coalesce(Asset.status, AssetTypeRollup.NULL_STATUS),
+            db.func.count(Asset.id),
+            db.func.sum(qty),
+            db.func.sum(db.func.coalesce(Asset.price, 0) * qty),
+        ).filter(
+            Asset.deleted_at.is_(None)
+        ).group_by(
+            Asset.asset_type_id, db.func.coalesce(Asset.status, AssetTypeRollup.NULL_STATUS)
+        ).all()
+        AssetTypeRollup.query.delete(synchronize_session=False)
+        now = now_vn()
+        db.session.bulk_insert_mappings(AssetTypeRollup, [{
+            'asset_type_id': type_id,
+            'status': status,
+            'asset_count': int(count or 0),
+            'total_quantity': int(quantity or 0),
+            'total_value': float(value or 0),
+            'updated_at': now,
+        } for type_id, status, count, quantity, value in rows])
+        db.session.commit()
+        return len(rows)
+
+    @staticmethod
+    def ensure_populated():
+        """Tự khởi tạo bảng tổng hợp nếu còn trống trong khi đã có tài sản (CSDL cũ trước khi có bảng này)"""
+        if db.session.query(AssetTypeRollup.id).first() is not None:
+            return
+        if db.session.query(Asset.id).filter(Asset.deleted_at.is_(None)).first() is None:
+            return
+        AssetTypeRollup.rebuild()
+
+
+# Các cột ảnh hưởng tới bảng tổng hợp (khai báo active_history=True trên Asset)
+_ROLLUP_ATTRS = ('asset_type_id', 'status', 'quantity', 'price', 'deleted_at')
+
+
+def _rollup_state(target, previous=False):
+    values = []
+    state = db.inspect(target)
+    for attr in _ROLLUP_ATTRS:
+        value = getattr(target, attr)
+        if previous:
+            history = state.attrs[attr].history
+            if history.deleted:
+                value = history.deleted[0]
+        values.append(value)
+    return AssetTypeRollup.contribution(*values)
+
+
+@db.event.listens_for(Asset, 'after_insert')
+def _asset_rollup_after_insert(mapper, connection, target):
+    new = _rollup_state(target)
+    if new:
+        AssetTypeRollup.apply_delta(connection, new[0], new[1], new[2], new[3], new[4])
+
+
+@db.event.listens_for(Asset, 'after_update')
+def _asset_rollup_after_update(mapper, connection, target):
+    old = _rollup_state(target, previous=True)
+    new = _rollup_state(target)
+    if old == new:
+        return
+    if old:
+        AssetTypeRollup.apply_delta(connection, old[0], old[1], -old[2], -old[3], -old[4])
+    if new:
+        AssetTypeRollup.apply_delta(connection, new[0], new[1], new[2], new[3], new[4])
+
+
+@db.event.listens_for(Asset, 'after_delete')
+def _asset_rollup_after_delete(mapper, connection, target):
+    old = _rollup_state(target, previous=True)
+    if old:
+        AssetTypeRollup.apply_delta(connection, old[0], old[1], -old[2], -old[3], -old[4])
+
+
+class DataVersion(db.Model):
+    """Bộ đếm phiên bản dữ liệu theo nhóm: tăng mỗi lần ghi để cache báo cáo biết dữ liệu đã đổi"""
+    __tablename__ = 'data_version'
+
+    # Tài sản, loại tài sản và người dùng (tên người sử dụng hiển thị trên báo cáo)
+    ASSETS = 'assets'
+    # Dữ liệu của các ô gợi ý (tài sản, loại tài sản, người dùng, bảo trì)
+    SUGGEST = 'suggest'
+    # Phân quyền (vai trò của user, quyền chi tiết) - cache bitset quyền
+    PERMISSIONS = 'permissions'
+    # Danh sách JWT đã thu hồi (bộ lọc Bloom trong tiến trình)
+    TOKENS = 'tokens'
+    # Danh tính user cho REST API (vai trò, trạng thái hoạt động)
+    IDENTITY = 'identity'
+
+    # Số lần tăng phiên bản do chính tiến trình này thực hiện (để đọc ngay thay đổi của mình)
+    _local_bumps = {}
+
+    key = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=now_vn, onupdate=now_vn)
+
+    def __repr__(self):
+        return f'<DataVersion {self.key}={self.version}>'
+
+    @staticmethod
+    def current(key=ASSETS):
+        """Phiên bản hiện tại (0 nếu chưa từng ghi)"""
+        return db.session.query(DataVersion.version).filter(DataVersion.key == key).scalar() or 0
+
+    @staticmethod
+    def bump(connection, key=ASSETS):
+        """Tăng phiên bản trong transaction hiện tại (INSERT ... ON CONFLICT DO UPDATE)"""
+        table = DataVersion.__table__
+        statement = dialect_insert(table, connection).values(key=key, version=1, updated_at=now_vn())
+        connection.execute(statement.on_conflict_do_update(
+            index_elements=[table.c.key],
+            set_={'version': table.c.version + 1, 'updated_at': statement.excluded.updated_at},
+        ))
+        DataVersion._local_bumps[key] = DataVersion._local_bumps.get(key, 0) + 1
+
+    @staticmethod
+    def local_serial(key=ASSETS):
+        """Bộ đếm trong tiến trình, đổi ngay khi tiến trình này ghi (không cần truy vấn)"""
+        return DataVersion._local_bumps.get(key, 0)
+
+
 # Audit log model
 class AuditLog(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -191,9 +397,38 @@ class AuditLog(db.Model):
 
     user = db.relationship('User', backref=db.backref('audit_logs', lazy=True))
 
+    __table_args__ = (
+        db.Index('ix_audit_log_created_at', 'created_at', 'id'),
+        db.Index('ix_audit_log_user_created', 'user_id', 'created_at'),
+        db.Index('ix_audit_log_module_created', 'module', 'created_at'),
+        db.Index('ix_audit_log_module_entity', 'module', 'entity_id'),
+    )
+
     def __repr__(self):
         return f'<AuditLog {self.module}:{self.action}#{self.entity_id}>'
 
+
+class AuditLogArchive(db.Model):
+    """Một tệp lưu trữ nhật ký (gzip JSON lines) của một tháng; tháng có thể có nhiều phần (part)"""
+    __tablename__ = 'audit_log_archive'
+
+    id = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.String(7), nullable=False)  # YYYY-MM
+    part = db.Column(db.Integer, nullable=False, default=1)
+    path = db.Column(db.String(500), nullable=False)  # Tương đối với AUDIT_ARCHIVE_DIR
+    row_count = db.Column(db.Integer, nullable=False, default=0)
+    min_created_at = db.Column(db.DateTime, nullable=True)
+    max_created_at = db.Column(db.DateTime, nullable=True)
+    max_log_id = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.DateTime, default=now_vn)
+
+    __table_args__ = (
+        db.UniqueConstraint('month', 'part', name='uq_audit_log_archive_month_part'),
+    )
+
+    def __repr__(self):
+        return f'<AuditLogArchive {self.month}#{self.part} rows={self.row_count}>'
+
 # IT Maintenance record
 class MaintenanceRecord(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -236,6 +471,14 @@ class MaintenanceRecord(db.Model):
 
     asset = db.relationship('Asset', backref=db.backref('maintenance_records', lazy=True))
     requested_by = db.relationship('User', foreign_keys=[requested_by_id], backref=db.backref('maintenance_record_requests', lazy=True))
+
+    __table_args__ = (
+        db.Index('ix_maintenance_record_asset_id', 'asset_id'),
+        db.Index('ix_maintenance_record_live_next_due', 'next_due_date', postgresql_where=LIVE_ROWS, sqlite_where=LIVE_ROWS),
+        db.Index('ix_maintenance_record_live_date', 'maintenance_date', postgresql_where=LIVE_ROWS, sqlite_where=LIVE_ROWS),
+        db.Index('ix_maintenance_record_live_status', 'status', postgresql_where=LIVE_ROWS, sqlite_where=LIVE_ROWS),
+        db.Index('ix_maintenance_record_deleted_at', 'deleted_at'),
+    )
     
     def soft_delete(self):
         """Soft delete maintenance record"""
@@ -249,6 +492,152 @@ class MaintenanceRecord(db.Model):
         return f'<Maintenance #{self.id} asset={self.asset_id}>'
 
 
+class SearchDocument(db.Model):
+    """
+    Nội dung tìm kiếm đã chuẩn hóa (bỏ dấu, chữ thường) của tài sản và bản ghi bảo trì,
+    cập nhật qua event của model. Chỉ mục theo CSDL: FTS5 (SQLite) hoặc pg_trgm GIN (PostgreSQL).
+    """
+    __tablename__ = 'search_document'
+
+    ASSET = 'asset'
+    MAINTENANCE = 'maintenance'
+
+    # Bảng FTS5 external-content đồng bộ bằng trigger (SQLite); trigram để khớp chuỗi con như LIKE '%x%'
+    SQLITE_DDL = (
+        "CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5("
+        "content, content='search_document', content_rowid='id', tokenize='trigram')",
+        "CREATE TRIGGER IF NOT EXISTS search_document_ai AFTER INSERT ON search_document BEGIN "
+        "INSERT INTO search_fts(rowid, content) VALUES (new.id, new.content); END",
+        "CREATE TRIGGER IF NOT EXISTS search_document_ad AFTER DELETE ON search_document BEGIN "
+        "INSERT INTO search_fts(search_fts, rowid, content) VALUES ('delete', old.id, old.content); END",
+        "CREATE TRIGGER IF NOT EXISTS search_document_au AFTER UPDATE ON search_document BEGIN "
+        "INSERT INTO search_fts(search_fts, rowid, content) VALUES ('delete', old.id, old.content); "
+        "INSERT INTO search_fts(rowid, content) VALUES (new.id, new.content); END",
+    )
+    POSTGRESQL_DDL = (
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        "CREATE INDEX IF NOT EXISTS ix_search_document_content_trgm "
+        "ON search_document USING gin (content gin_trgm_ops)",
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    entity = db.Column(db.String(20), nullable=False)  # asset, maintenance
+    entity_id = db.Column(db.Integer, nullable=False)
+    content = db.Column(db.Text, nullable=False, default='')
+    updated_at = db.Column(db.DateTime, default=now_vn, onupdate=now_vn)
+
+    __table_args__ = (db.UniqueConstraint('entity', 'entity_id', name='_search_document_entity_uc'),)
+
+    def __repr__(self):
+        return f'<SearchDocument {self.entity}#{self.entity_id}>'
+
+    @staticmethod
+    def asset_content(name, device_code):
+        return build_search_content((name, device_code))
+
+    @staticmethod
+    def maintenance_content(description, vendor, person_in_charge, asset_name, asset_device_code):
+        return build_search_content((description, vendor, person_in_charge, asset_name, asset_device_code))
+
+    @staticmethod
+    def upsert(connection, entity, entity_id, content):
+        """Ghi nội dung tìm kiếm của một bản ghi (INSERT ... ON CONFLICT DO UPDATE)"""
+        table = SearchDocument.__table__
+        statement = dialect_insert(table, connection).values(
+            entity=entity, entity_id=entity_id, content=content, updated_at=now_vn()
+        )
+        connection.execute(statement.on_conflict_do_update(
+            index_elements=[table.c.entity, table.c.entity_id],
+            set_={'content': statement.excluded.content, 'updated_at': statement.excluded.updated_at},
+        ))
+
+    @staticmethod
+    def remove(connection, entity, entity_id):
+        table = SearchDocument.__table__
+        connection.execute(table.delete().where(table.c.entity == entity, table.c.entity_id == entity_id))
+
+    @staticmethod
+    def refresh_maintenance_for_asset(connection, asset_id, asset_name, asset_device_code):
+        """Tên/mã tài sản đổi thì nội dung tìm kiếm của các bản ghi bảo trì liên quan cũng đổi"""
+        table = MaintenanceRecord.__table__
+        rows = connection.execute(
+            db.select(table.c.id, table.c.description, table.c.vendor, table.c.person_in_charge)
+            .where(table.c.asset_id == asset_id)
+        ).all()
+        for record_id, description, vendor, person_in_charge in rows:
+            SearchDocument.upsert(connection, SearchDocument.MAINTENANCE, record_id, SearchDocument.maintenance_content(
+                description, vendor, person_in_charge, asset_name, asset_device_code
+            ))
+
+
+@db.event.listens_for(SearchDocument.__table__, 'after_create')
+def _create_search_backend(target, connection, **kw):
+    """Tạo FTS5/pg_trgm cùng bảng (db.create_all); CSDL có sẵn dùng migration"""
+    ddl = {'sqlite': SearchDocument.SQLITE_DDL, 'postgresql': SearchDocument.POSTGRESQL_DDL}
+    for statement in ddl.get(connection.dialect.name, ()):
+        connection.exec_driver_sql(statement)
+
+
+@db.event.listens_for(SearchDocument.__table__, 'before_drop')
+def _drop_search_backend(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        connection.exec_driver_sql('DROP TABLE IF EXISTS search_fts')
+
+
+def _text_changed(target, attrs):
+    state = db.inspect(target)
+    return any(state.attrs[attr].history.has_changes() for attr in attrs)
+
+
+@db.event.listens_for(Asset, 'after_insert')
+def _asset_search_after_insert(mapper, connection, target):
+    SearchDocument.upsert(connection, SearchDocument.ASSET, target.id,
+                          SearchDocument.asset_content(target.name, target.device_code))
+
+
+@db.event.listens_for(Asset, 'after_update')
+def _asset_search_after_update(mapper, connection, target):
+    if not _text_changed(target, ('name', 'device_code')):
+        return
+    SearchDocument.upsert(connection, SearchDocument.ASSET, target.id,
+                          SearchDocument.asset_content(target.name, target.device_code))
+    SearchDocument.refresh_maintenance_for_asset(connection, target.id, target.name, target.device_code)
+
+
+@db.event.listens_for(Asset, 'after_delete')
+def _asset_search_after_delete(mapper, connection, target):
+    SearchDocument.remove(connection, SearchDocument.ASSET, target.id)
+
+
+def _maintenance_search_content(connection, target):
+    table = Asset.__table__
+    asset = connection.execute(
+        db.select(table.c.name, table.c.device_code).where(table.c.id == target.asset_id)
+    ).first()
+    return SearchDocument.maintenance_content(
+        target.description, target.vendor, target.person_in_charge,
+        asset[0] if asset else None, asset[1] if asset else None
+    )
+
+
+@db.event.listens_for(MaintenanceRecord, 'after_insert')
+def _maintenance_search_after_insert(mapper, connection, target):
+    SearchDocument.upsert(connection, SearchDocument.MAINTENANCE, target.id,
+                          _maintenance_search_content(connection, target))
+
+
+@db.event.listens_for(MaintenanceRecord, 'after_update')
+def _maintenance_search_after_update(mapper, connection, target):
+    if _text_changed(target, ('description', 'vendor', 'person_in_charge', 'asset_id')):
+        SearchDocument.upsert(connection, SearchDocument.MAINTENANCE, target.id,
+                              _maintenance_search_content(connection, target))
+
+
+@db.event.listens_for(MaintenanceRecord, 'after_delete')
+def _maintenance_search_after_delete(mapper, connection, target):
+    SearchDocument.remove(connection, SearchDocument.MAINTENANCE, target.id)
+
+
 class MaintenanceRequest(db.Model):
     __tablename__ = 'maintenance_request'
 
@@ -530,6 +919,11 @@ class AssetDepreciation(db.Model):
     created_at = db.Column(db.DateTime, default=now_vn)
     
     asset = db.relationship('Asset', backref='depreciations')
+
+    __table_args__ = (
+        db.Index('ix_asset_depreciation_asset_period', 'asset_id', 'period_year', 'period_month'),
+        db.Index('ix_asset_depreciation_period', 'period_year', 'period_month'),
+    )
     
     def __repr__(self):
         return f'<AssetDepreciation asset={self.asset_id} {self.period_year}/{self.period_month or 0}>'
@@ -594,6 +988,8 @@ class Inventory(db.Model):
     created_by_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=now_vn)
     updated_at = db.Column(db.DateTime, default=now_vn, onupdate=now_vn)
+    # Bộ đếm thay đổi các dòng kiểm kê (đồng bộ offline): mỗi transaction ghi dòng tăng 1 lần
+    sync_seq = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     created_by = db.relationship('User', foreign_keys=[created_by_id], backref='inventories')
     locked_by = db.relationship('User', foreign_keys=[locked_by_id], backref='inventories_locked')
@@ -604,6 +1000,16 @@ class Inventory(db.Model):
     def __repr__(self):
         return f'<Inventory {self.inventory_code}>'
 
+    @staticmethod
+    def next_sync_seq(connection, inventory_id):
+        """
+        Tăng và trả về sync_seq của đợt trong transaction hiện tại. UPDATE giữ khóa dòng tới khi commit,
+        nên các transaction ghi cùng đợt commit đúng thứ tự số thứ tự - client kéo thay đổi không bỏ sót.
+        """
+        table = Inventory.__table__
+        connection.execute(table.update().where(table.c.id == inventory_id).values(sync_seq=table.c.sync_seq + 1))
+        return connection.execute(db.select(table.c.sync_seq).where(table.c.id == inventory_id)).scalar() or 0
+
 class InventoryResult(db.Model):
     """Kết quả kiểm kê từng tài sản (theo sổ)"""
     __tablename__ = 'inventory_result'
@@ -633,9 +1039,20 @@ class InventoryResult(db.Model):
 
     checked_by_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
     checked_at = db.Column(db.DateTime, nullable=True)
+
+    # Đồng bộ offline: phiên bản dòng (phát hiện xung đột khi đẩy lên) và sync_seq của lần ghi cuối
+    row_version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    change_seq = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     asset = db.relationship('Asset', backref='inventory_results')
     checked_by = db.relationship('User', backref='inventory_checks')
+
+    __table_args__ = (
+        # Mỗi tài sản chỉ có một dòng sổ trong một đợt kiểm kê
+        db.Index('ix_inventory_result_inventory_asset', 'inventory_id', 'asset_id', unique=True),
+        db.Index('ix_inventory_result_asset', 'asset_id'),
+        db.Index('ix_inventory_result_inventory_seq', 'inventory_id', 'change_seq', 'id'),
+    )
     
     def __repr__(self):
         return f'<InventoryResult inventory={self.inventory_id} asset={self.asset_id}>'
@@ -729,6 +1146,24 @@ class InventoryLog(db.Model):
     inventory = db.relationship('Inventory', backref='logs')
     actor = db.relationship('User', backref='inventory_logs')
 
+
+class InventoryReconciliation(db.Model):
+    """Ảnh chụp kết quả đối chiếu kiểm kê (thiếu/thừa/chênh lệch) lưu khi đợt được duyệt & khóa"""
+    __tablename__ = 'inventory_reconciliation'
+
+    id = db.Column(db.Integer, primary_key=True)
+    inventory_id = db.Column(db.Integer, db.ForeignKey('inventory.id'), nullable=False, unique=True)
+    sync_seq = db.Column(db.Integer, nullable=False, default=0)  # Inventory.sync_seq của dữ liệu đã đối chiếu
+    summary = db.Column(db.Text, nullable=False)  # JSON tổng hợp (utils/inventory_reconcile.py)
+    computed_at = db.Column(db.DateTime, default=now_vn)
+    computed_by_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+
+    inventory = db.relationship('Inventory', backref=db.backref('reconciliation', uselist=False))
+
+    @property
+    def summary_dict(self):
+        return json.loads(self.summary) if self.summary else {}
+
 class AssetTransfer(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     transfer_code = db.Column(db.String(50), unique=True, nullable=False)  # Mã bàn giao
@@ -754,6 +1189,13 @@ class AssetTransfer(db.Model):
     from_user = db.relationship('User', foreign_keys=[from_user_id], backref='transfers_sent')
     to_user = db.relationship('User', foreign_keys=[to_user_id], backref='transfers_received')
     asset = db.relationship('Asset', backref='transfers')
+
+    __table_args__ = (
+        db.Index('ix_asset_transfer_status_created', 'status', 'created_at'),
+        db.Index('ix_asset_transfer_from_user', 'from_user_id'),
+        db.Index('ix_asset_transfer_to_user', 'to_user_id'),
+        db.Index('ix_asset_transfer_asset', 'asset_id'),
+    )
     
     def is_token_valid(self):
         """Kiểm tra token còn hiệu lực không"""
@@ -949,9 +1391,26 @@ class Permission(db.Model):
     # Relationship
     user_permissions = db.relationship('UserPermission', backref='permission', lazy=True, cascade='all, delete-orphan')
     
+    # Mỗi cặp (module, action) một bit trong bitset quyền của user; cặp lạ được cấp bit tiếp theo
+    _bits = {}
+    _bits_lock = threading.Lock()
+    
     def __repr__(self):
         return f'<Permission {self.module}.{self.action}>'
     
+    @staticmethod
+    def bit(module, action):
+        """Mặt nạ bit của quyền (module, action)"""
+        bits = Permission._bits
+        index = bits.get((module, action))
+        if index is None:
+            with Permission._bits_lock:
+                if not bits:
+                    for perm in Permission.get_default_permissions():
+                        bits.setdefault((perm['module'], perm['action']), len(bits))
+                index = bits.setdefault((module, action), len(bits))
+        return 1 << index
+    
     @staticmethod
     def get_default_permissions():
         """Trả về danh sách quyền mặc định của hệ thống"""
@@ -1008,8 +1467,192 @@ class UserPermission(db.Model):
     # Unique constraint để mỗi user chỉ có 1 record cho mỗi permission
     __table_args__ = (db.UniqueConstraint('user_id', 'permission_id', name='_user_permission_uc'),)
     
+    # Cache trong tiến trình: user_id -> (là admin, bitset quyền được cấp)
+    _cache = {'users': {}, 'version': None, 'serial': None, 'checked_at': 0.0}
+    _cache_lock = threading.Lock()
+    
     def __repr__(self):
         return f'<UserPermission user_id={self.user_id} permission_id={self.permission_id} granted={self.granted}>'
+    
+    @staticmethod
+    def _version_check():
+        """Chu kỳ (giây) đọc phiên bản phân quyền để thấy thay đổi của worker khác; 0 = mỗi lần tra"""
+        try:
+            from flask import current_app
+            return float(current_app.config.get('PERMISSION_CACHE_VERSION_CHECK', 1))
+        except RuntimeError:
+            return 0.0
+    
+    @staticmethod
+    def _compile(user_id):
+        """Một truy vấn: tên vai trò + các quyền của user -> (là admin, bitset)"""
+        rows = db.session.query(
+            Role.name, Permission.module, Permission.action, UserPermission.granted
+        ).select_from(User).join(Role, Role.id == User.role_id).outerjoin(
+            UserPermission, UserPermission.user_id == User.id
+        ).outerjoin(
+            Permission, Permission.id == UserPermission.permission_id
+        ).filter(User.id == user_id).order_by(UserPermission.id).all()
+        if not rows:
+            return False, 0
+        if rows[0][0] == 'admin':
+            return True, 0
+        granted_mask = seen = 0
+        for _, module, action, granted in rows:
+            if module is None:
+                continue
+            bit = Permission.bit(module, action)
+            # Như cách duyệt cũ: bản ghi đầu tiên của cặp (module, action) quyết định
+            if not seen & bit:
+                seen |= bit
+                if granted:
+                    granted_mask |= bit
+        return False, granted_mask
+    
+    @staticmethod
+    def compiled(user_id):
+        """(là admin, bitset) của user từ cache; bỏ cache khi phiên bản phân quyền đổi"""
+        cache = UserPermission._cache
+        now = time.monotonic()
+        serial = DataVersion.local_serial(DataVersion.PERMISSIONS)
+        if serial != cache['serial'] or now - cache['checked_at'] >= UserPermission._version_check():
+            version = DataVersion.current(DataVersion.PERMISSIONS)
+            with UserPermission._cache_lock:
+                if version != cache['version'] or serial != cache['serial']:
+                    cache['users'] = {}
+                cache.update(version=version, serial=serial, checked_at=now)
+        users = cache['users']
+        result = users.get(user_id)
+        if result is None:
+            result = UserPermission._compile(user_id)
+            users[user_id] = result
+        return result
+    
+    @staticmethod
+    def allows(user_id, module, action):
+        """User có quyền (module, action) không - admin luôn có"""
+        is_admin, granted_mask = UserPermission.compiled(user_id)
+        return is_admin or bool(granted_mask & Permission.bit(module, action))
+    
+    @staticmethod
+    def bump_version():
+        """Đổi phiên bản phân quyền (chưa commit) - gọi khi ghi quyền bằng bulk delete/update bỏ qua ORM"""
+        DataVersion.bump(db.session.connection(), DataVersion.PERMISSIONS)
+    
+    @staticmethod
+    def invalidate_cache():
+        """Xóa cache phân quyền của tiến trình hiện tại"""
+        with UserPermission._cache_lock:
+            UserPermission._cache.update(users={}, version=None, serial=None, checked_at=0.0)
+
+
+class RevokedToken(db.Model):
+    """JWT đã thu hồi (đăng xuất, refresh token đã dùng) - bị chặn theo jti cho tới khi hết hạn"""
+    __tablename__ = 'revoked_token'
+
+    id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.String(64), nullable=False, unique=True)
+    token_type = db.Column(db.String(10), nullable=False, default='access')  # access, refresh
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=True)  # Giờ VN; sau mốc này token tự hết hiệu lực
+    revoked_at = db.Column(db.DateTime, default=now_vn)
+
+    __table_args__ = (
+        db.Index('ix_revoked_token_expires_at', 'expires_at'),
+    )
+
+    def __repr__(self):
+        return f'<RevokedToken {self.token_type} {self.jti}>'
+
+    @staticmethod
+    def from_payload(jwt_payload):
+        """Bản ghi thu hồi từ payload JWT đã giải mã (chưa add/commit)"""
+        expires_at = None
+        if jwt_payload.get('exp'):
+            expires_at = from_timestamp_vn(jwt_payload['exp'])
+        user_id = jwt_payload.get('sub')
+        return RevokedToken(
+            jti=jwt_payload['jti'],
+            token_type=jwt_payload.get('type', 'access'),
+            user_id=int(user_id) if str(user_id or '').isdigit() else None,
+            expires_at=expires_at,
+        )
+
+    @staticmethod
+    def purge_expired():
+        """Xóa các bản ghi của token đã hết hạn (không cần chặn nữa), trả về số dòng đã xóa"""
+        deleted = RevokedToken.query.filter(RevokedToken.expires_at < now_vn()).delete(synchronize_session=False)
+        db.session.commit()
+        return deleted
+
+
+# Nhóm dữ liệu -> {model: các cột cần theo dõi (None = mọi cột)}; thêm/xóa bản ghi luôn được tính
+_DATA_VERSION_WATCH = {
+    DataVersion.ASSETS: {
+        Asset: None,
+        AssetType: None,
+        # Người dùng: chỉ tên đăng nhập xuất hiện trên báo cáo (bỏ qua last_login, mật khẩu...)
+        User: ('username',),
+    },
+    DataVersion.SUGGEST: {
+        Asset: ('name', 'device_code', 'user_id', 'deleted_at'),
+        AssetType: ('name', 'deleted_at'),
+        User: ('username', 'email', 'name', 'deleted_at'),
+        MaintenanceRecord: ('description', 'vendor', 'person_in_charge', 'asset_id', 'maintenance_date', 'deleted_at'),
+    },
+    DataVersion.PERMISSIONS: {
+        User: ('role_id',),
+        Role: ('name',),
+        Permission: ('module', 'action'),
+        UserPermission: None,
+    },
+    DataVersion.TOKENS: {
+        RevokedToken: None,
+    },
+    DataVersion.IDENTITY: {
+        User: ('username', 'role_id', 'is_active', 'deleted_at'),
+        Role: ('name',),
+    },
+}
+
+
+def _changes_watched_data(session, obj, watch):
+    attrs = next((cols for model, cols in watch.items() if isinstance(obj, model)), False)
+    if attrs is False:
+        return False
+    if obj in session.new or obj in session.deleted:
+        return True
+    if attrs is None:
+        return session.is_modified(obj, include_collections=False)
+    state = db.inspect(obj)
+    return any(state.attrs[attr].history.has_changes() for attr in attrs)
+
+
+@db.event.listens_for(OrmSession, 'after_flush')
+def _bump_data_version_after_flush(session, flush_context):
+    """Mỗi nhóm dữ liệu tăng phiên bản tối đa một lần cho mỗi lần flush có ghi dữ liệu của nhóm"""
+    changed = list(session.new) + list(session.deleted) + list(session.dirty)
+    for key, watch in _DATA_VERSION_WATCH.items():
+        if any(_changes_watched_data(session, obj, watch) for obj in changed):
+            DataVersion.bump(session.connection(), key)
+
+
+@db.event.listens_for(OrmSession, 'before_flush')
+def _stamp_inventory_results_before_flush(session, flush_context, instances):
+    """Dòng kiểm kê thêm/sửa qua ORM: tăng row_version và gắn sync_seq mới của đợt (một lần cho mỗi đợt)"""
+    seqs = {}
+    for obj in list(session.new) + list(session.dirty):
+        if not isinstance(obj, InventoryResult) or obj.inventory_id is None:
+            continue
+        is_new = obj in session.new
+        if not is_new and not session.is_modified(obj, include_collections=False):
+            continue
+        if obj.inventory_id not in seqs:
+            seqs[obj.inventory_id] = Inventory.next_sync_seq(session.connection(), obj.inventory_id)
+        obj.change_seq = seqs[obj.inventory_id]
+        if not is_new:
+            obj.row_version = (obj.row_version or 0) + 1
+
 
 class SystemSetting(db.Model):
     """Cấu hình hệ thống"""
@@ -1022,15 +1665,76 @@ class SystemSetting(db.Model):
     created_at = db.Column(db.DateTime, default=now_vn)
     updated_at = db.Column(db.DateTime, default=now_vn, onupdate=now_vn)
     
+    # Key đặc biệt lưu "phiên bản" cấu hình: đổi mỗi lần ghi để các worker khác biết cần nạp lại
+    VERSION_KEY = '_settings_version'
+    # Cache trong tiến trình: toàn bộ key được nạp bằng một truy vấn
+    _cache = {'values': None, 'version': None, 'loaded_at': 0.0, 'checked_at': 0.0}
+    _cache_lock = threading.Lock()
+    
     def __repr__(self):
         return f'<SystemSetting key={self.key} value={self.value}>'
     
+    @staticmethod
+    def _cache_config():
+        """(TTL, chu kỳ kiểm tra phiên bản) tính bằng giây; chu kỳ 0 = tắt kiểm tra giữa các worker"""
+        try:
+            from flask import current_app
+            config = current_app.config
+        except RuntimeError:
+            config = {}
+        return (float(config.get('SYSTEM_SETTING_CACHE_TTL', 300)),
+                float(config.get('SYSTEM_SETTING_VERSION_CHECK', 1)))
+    
+    @staticmethod
+    def _current_version():
+        return db.session.query(SystemSetting.value).filter(
+            SystemSetting.key == SystemSetting.VERSION_KEY
+        ).scalar()
+    
+    @staticmethod
+    def all_settings():
+        """Toàn bộ cấu hình {key: value} từ cache (nạp lại khi hết TTL hoặc worker khác đã ghi)"""
+        cache = SystemSetting._cache
+        ttl, version_check = SystemSetting._cache_config()
+        now = time.monotonic()
+        values = cache['values']
+        if values is not None and now - cache['loaded_at'] < ttl:
+            if not version_check or now - cache['checked_at'] < version_check:
+                return values
+            version = SystemSetting._current_version()
+            cache['checked_at'] = now
+            if version == cache['version']:
+                return values
+        
+        with SystemSetting._cache_lock:
+            rows = db.session.query(SystemSetting.key, SystemSetting.value).all()
+            values = {key: value for key, value in rows if key != SystemSetting.VERSION_KEY}
+            version = next((value for key, value in rows if key == SystemSetting.VERSION_KEY), None)
+            now = time.monotonic()
+            cache.update(values=values, version=version, loaded_at=now, checked_at=now)
+        return values
+    
+    @staticmethod
+    def invalidate_cache():
+        """Xóa cache của tiến trình hiện tại (lần đọc sau sẽ nạp lại toàn bộ)"""
+        with SystemSetting._cache_lock:
+            SystemSetting._cache.update(values=None, version=None, loaded_at=0.0, checked_at=0.0)
+    
+    @staticmethod
+    def bump_version():
+        """Đổi phiên bản cấu hình để các worker khác nạp lại (chưa commit)"""
+        stamp = SystemSetting.query.filter_by(key=SystemSetting.VERSION_KEY).first()
+        if not stamp:
+            stamp = SystemSetting(key=SystemSetting.VERSION_KEY, description='Phiên bản cấu hình (tự động)')
+            db.session.add(stamp)
+        stamp.value = uuid.uuid4().hex
+    
     @staticmethod
     def get_setting(key, default=None):
         """Lấy giá trị cấu hình"""
-        setting = SystemSetting.query.filter_by(key=key).first()
-        if setting:
-            return setting.value
+        values = SystemSetting.all_settings()
+        if key in values:
+            return values[key]
         return default
     
     @staticmethod
@@ -1045,5 +1749,244 @@ class SystemSetting(db.Model):
         else:
             setting = SystemSetting(key=key, value=value, description=description)
             db.session.add(setting)
+        SystemSetting.bump_version()
         db.session.commit()
-        return setting
\ No newline at end of file
+        SystemSetting.invalidate_cache()
+        return setting
+
+class AssetImportJob(db.Model):
+    """Tiến trình import tài sản từ Excel chạy nền (theo dõi tiến độ và báo cáo lỗi từng dòng)"""
+    __tablename__ = 'asset_import_job'
+
+    id = db.Column(db.Integer, primary_key=True)
+    filename = db.Column(db.String(255), nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, running, completed, failed
+    total_rows = db.Column(db.Integer, nullable=True)  # Ước lượng số dòng dữ liệu (theo kích thước sheet)
+    processed_rows = db.Column(db.Integer, nullable=False, default=0)
+    success_count = db.Column(db.Integer, nullable=False, default=0)
+    error_count = db.Column(db.Integer, nullable=False, default=0)
+    error_report = db.Column(db.Text, nullable=True)  # CSV: Dòng, Tên tài sản, Lỗi
+    message = db.Column(db.String(500), nullable=True)
+    created_by_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=now_vn)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    created_by = db.relationship('User', foreign_keys=[created_by_id])
+
+    def __repr__(self):
+        return f'<AssetImportJob {self.id} {self.status} {self.processed_rows}/{self.total_rows}>'
+
+    @property
+    def is_finished(self):
+        return self.status in ('completed', 'failed')
+
+    def progress_dict(self):
+        """Trạng thái tiến trình dạng JSON cho trang theo dõi import"""
+        percent = None
+        if self.total_rows:
+            percent = min(100, round(self.processed_rows * 100.0 / self.total_rows, 1))
+        if self.status == 'completed':
+            percent = 100
+        return {
+            'id': self.id,
+            'filename': self.filename,
+            'status': self.status,
+            'total_rows': self.total_rows,
+            'processed_rows': self.processed_rows,
+            'success_count': self.success_count,
+            'error_count': self.error_count,
+            'percent': percent,
+            'message': self.message,
+            'has_error_report': bool(self.error_report),
+            'finished': self.is_finished,
+        }
+
+
+class BackgroundJob(db.Model):
+    """Tác vụ nền (xuất file, import, tính khấu hao, gửi email) - chạy bởi worker trong tiến trình web hoặc `flask worker`"""
+    __tablename__ = 'background_job'
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    COMPLETED = 'completed'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+    FINISHED_STATUSES = (COMPLETED, FAILED, CANCELLED)
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)  # Tên handler trong utils/jobs.py
+    title = db.Column(db.String(255), nullable=True)
+    status = db.Column(db.String(20), nullable=False, default=QUEUED)
+    params = db.Column(db.Text, nullable=True)  # JSON tham số của handler
+    progress_done = db.Column(db.Integer, nullable=False, default=0)
+    progress_total = db.Column(db.Integer, nullable=True)
+    message = db.Column(db.String(500), nullable=True)
+    result_path = db.Column(db.String(500), nullable=True)  # File kết quả, tương đối với EXPORT_DIR
+    result_name = db.Column(db.String(255), nullable=True)  # Tên file khi tải về
+    result_mimetype = db.Column(db.String(150), nullable=True)
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+    worker = db.Column(db.String(100), nullable=True)  # host:pid:thread đang chạy
+    created_by_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=now_vn)
+    started_at = db.Column(db.DateTime, nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    run_after = db.Column(db.DateTime, nullable=True)  # Chưa tới giờ thì worker bỏ qua (tác vụ hẹn giờ / thử lại)
+
+    created_by = db.relationship('User', foreign_keys=[created_by_id])
+
+    __table_args__ = (
+        db.Index('ix_background_job_status_id', 'status', 'id'),
+        db.Index('ix_background_job_created_by', 'created_by_id', 'id'),
+    )
+
+    def __repr__(self):
+        return f'<BackgroundJob {self.id} {self.kind} {self.status}>'
+
+    @property
+    def is_finished(self):
+        return self.status in self.FINISHED_STATUSES
+
+    @property
+    def params_dict(self):
+        return json.loads(self.params) if self.params else {}
+
+    def progress_dict(self):
+        """Trạng thái tác vụ dạng JSON cho trang /jobs (hỏi định kỳ)"""
+        percent = None
+        if self.progress_total:
+            percent = min(100, round(self.progress_done * 100.0 / self.progress_total, 1))
+        if self.status == self.COMPLETED:
+            percent = 100
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'title': self.title,
+            'status': self.status,
+            'progress_done': self.progress_done,
+            'progress_total': self.progress_total,
+            'percent': percent,
+            'message': self.message,
+            'has_result': bool(self.result_path),
+            'cancel_requested': self.cancel_requested,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'finished': self.is_finished,
+        }
+
+    @staticmethod
+    def claim_next(worker):
+        """Nhận tác vụ đang chờ lâu nhất (UPDATE có điều kiện nên hai worker không nhận trùng); None nếu hết"""
+        table = BackgroundJob.__table__
+        while True:
+            now = now_vn()
+            job_id = db.session.query(BackgroundJob.id).filter(
+                BackgroundJob.status == BackgroundJob.QUEUED,
+                db.or_(BackgroundJob.run_after.is_(None), BackgroundJob.run_after <= now)
+            ).order_by(BackgroundJob.id).limit(1).scalar()
+            if job_id is None:
+                db.session.rollback()
+                return None
+            claimed = db.session.execute(table.update().where(
+                table.c.id == job_id, table.c.status == BackgroundJob.QUEUED
+            ).values(status=BackgroundJob.RUNNING, worker=worker, started_at=now, heartbeat_at=now)).rowcount
+            db.session.commit()
+            if claimed:
+                return job_id
+
+    @staticmethod
+    def has_due():
+        """Có tác vụ đang chờ đã tới hạn chạy (run_after rỗng hoặc đã qua)"""
+        return db.session.query(BackgroundJob.id).filter(
+            BackgroundJob.status == BackgroundJob.QUEUED,
+            db.or_(BackgroundJob.run_after.is_(None), BackgroundJob.run_after <= now_vn())
+        ).first() is not None
+
+    @staticmethod
+    def requeue_stale(stale_after_seconds):
+        """Đưa lại vào hàng đợi các tác vụ `running` không còn heartbeat (worker chết giữa chừng)"""
+        cutoff = now_vn() - timedelta(seconds=stale_after_seconds)
+        count = BackgroundJob.query.filter(
+            BackgroundJob.status == BackgroundJob.RUNNING,
+            db.or_(BackgroundJob.heartbeat_at.is_(None), BackgroundJob.heartbeat_at < cutoff)
+        ).update({'status': BackgroundJob.QUEUED, 'worker': None}, synchronize_session=False)
+        db.session.commit()
+        return count
+
+
+class EmailOutbox(db.Model):
+    """Hàng đợi email: request chỉ ghi vào đây, utils/email_outbox.py gửi theo lô qua một phiên SMTP"""
+    __tablename__ = 'email_outbox'
+
+    PENDING = 'pending'
+    SENDING = 'sending'
+    SENT = 'sent'
+    FAILED = 'failed'
+
+    id = db.Column(db.Integer, primary_key=True)
+    to_emails = db.Column(db.Text, nullable=False)  # Danh sách người nhận, phân tách bằng dấu phẩy
+    subject = db.Column(db.String(255), nullable=False)
+    body_text = db.Column(db.Text, nullable=True)
+    body_html = db.Column(db.Text, nullable=True)
+    status = db.Column(db.String(20), nullable=False, default=PENDING)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.String(500), nullable=True)
+    locked_by = db.Column(db.String(100), nullable=True)  # Worker đang gửi
+    locked_at = db.Column(db.DateTime, nullable=True)
+    related_type = db.Column(db.String(50), nullable=True)  # Ví dụ: 'transfer'
+    related_id = db.Column(db.Integer, nullable=True)
+    created_by_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=now_vn)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_email_outbox_status_next', 'status', 'next_attempt_at'),
+        db.Index('ix_email_outbox_related', 'related_type', 'related_id'),
+    )
+
+    def __repr__(self):
+        return f'<EmailOutbox {self.id} {self.status}>'
+
+    @property
+    def recipients(self):
+        return [email.strip() for email in (self.to_emails or '').split(',') if email.strip()]
+
+    @staticmethod
+    def claim_batch(worker, limit):
+        """Nhận tối đa `limit` email đến hạn gửi (UPDATE có điều kiện, hai worker không gửi trùng)"""
+        table = EmailOutbox.__table__
+        now = now_vn()
+        ids = [row[0] for row in db.session.query(EmailOutbox.id).filter(
+            EmailOutbox.status == EmailOutbox.PENDING,
+            db.or_(EmailOutbox.next_attempt_at.is_(None), EmailOutbox.next_attempt_at <= now)
+        ).order_by(EmailOutbox.id).limit(limit)]
+        if not ids:
+            db.session.rollback()
+            return []
+        db.session.execute(table.update().where(
+            table.c.id.in_(ids), table.c.status == EmailOutbox.PENDING
+        ).values(status=EmailOutbox.SENDING, locked_by=worker, locked_at=now))
+        db.session.commit()
+        return EmailOutbox.query.filter(
+            EmailOutbox.id.in_(ids), EmailOutbox.status == EmailOutbox.SENDING, EmailOutbox.locked_by == worker
+        ).order_by(EmailOutbox.id).all()
+
+    @staticmethod
+    def next_due_at():
+        """Thời điểm lần thử gửi sớm nhất còn chờ (None nếu outbox trống)"""
+        return db.session.query(db.func.min(db.func.coalesce(EmailOutbox.next_attempt_at, EmailOutbox.created_at))).filter(
+            EmailOutbox.status == EmailOutbox.PENDING
+        ).scalar()
+
+    @staticmethod
+    def release_stale(stale_after_seconds):
+        """Trả về hàng chờ các email kẹt ở `sending` (worker chết giữa lô)"""
+        cutoff = now_vn() - timedelta(seconds=stale_after_seconds)
+        count = EmailOutbox.query.filter(
+            EmailOutbox.status == EmailOutbox.SENDING,
+            db.or_(EmailOutbox.locked_at.is_(None), EmailOutbox.locked_at < cutoff)
+        ).update({'status': EmailOutbox.PENDING, 'locked_by': None}, synchronize_session=False)
+        db.session.commit()
+        return count
+
@@ -7,11 +7,12 @@ from flask import Blueprint, request, jsonify, send_file, current_app
 from flask_restx import Api, Resource, fields, Namespace
 from flask_jwt_extended import (
     JWTManager, jwt_required, create_access_token,
-    get_jwt_identity, get_jwt, create_refresh_token
+    get_jwt_identity, get_jwt, create_refresh_token, decode_token
 )
 from functools import wraps
 from datetime import datetime, timedelta
 from sqlalchemy import or_
+from sqlalchemy.orm import aliased
 from sqlalchemy.exc import IntegrityError
 from werkzeug.utils import secure_filename
 from models import (
@@ -28,11 +29,16 @@ from models import (
     AssetUsageStatusLog,
     InventoryBatch,
     InventoryItem,
+    Inventory,
     DisposalRequest,
     AssetChangeLog,
     AssetTransfer,
+    SearchDocument,
 )
 from utils.timezone import now_vn, today_vn
+from utils.auth_cache import identity_cache, revocation_store
+from utils.query_profiles import with_profile, paginate_rows
+from utils.search_index import apply_search
 from data_integrity_improvements import (
     validate_asset_data, validate_user_data, validate_maintenance_data,
     safe_db_operation, validate_status, validate_maintenance_type, validate_maintenance_status
@@ -59,9 +65,8 @@ jwt = JWTManager()
 # ========== JWT Configuration ==========
 @jwt.token_in_blocklist_loader
 def check_if_token_revoked(jwt_header, jwt_payload):
-    """Kiểm tra token có bị revoke không"""
-    # Có thể implement blacklist nếu cần
-    return False
+    """Kiểm tra token có bị revoke không (bộ lọc Bloom trong bộ nhớ, chỉ truy vấn khi nghi trùng)"""
+    return revocation_store.is_revoked(jwt_payload.get('jti'))
 
 @jwt.expired_token_loader
 def expired_token_callback(jwt_header, jwt_payload):
@@ -97,6 +102,8 @@ usage_ns = Namespace('asset-usage', description='Tình trạng sử dụng tài
 inventory_ns = Namespace('inventory', description='Kiểm kê tài sản')
 disposal_ns = Namespace('disposals', description='Thanh lý tài sản')
 changelog_ns = Namespace('asset-changes', description='Lịch sử biến động tài sản')
+dashboard_ns = Namespace('dashboard', description='Thống kê Dashboard')
+audit_ns = Namespace('audit-logs', description='Nhật ký hệ thống')
 
 api.add_namespace(auth_ns)
 api.add_namespace(assets_ns)
@@ -110,6 +117,8 @@ api.add_namespace(usage_ns)
 api.add_namespace(inventory_ns)
 api.add_namespace(disposal_ns)
 api.add_namespace(changelog_ns)
+api.add_namespace(dashboard_ns)
+api.add_namespace(audit_ns)
 
 # ========== Helper Functions ==========
 def admin_required(f):
@@ -117,19 +126,17 @@ def admin_required(f):
     @wraps(f)
     @jwt_required()
     def decorated_function(*args, **kwargs):
-        current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
+        user = get_current_user()
         if not user or not user.is_active:
             return {'message': 'Người dùng không hợp lệ'}, 403
-        if user.role.name != 'admin':
+        if user.role_name != 'admin':
             return {'message': 'Yêu cầu quyền quản trị'}, 403
         return f(*args, **kwargs)
     return decorated_function
 
 def get_current_user():
-    """Lấy user hiện tại từ JWT token"""
-    user_id = get_jwt_identity()
-    return User.query.get(user_id)
+    """Danh tính user hiện tại từ JWT token (id, username, role_name, is_active) - lấy từ cache"""
+    return identity_cache.get(get_jwt_identity())
 
 # ========== API Models (Schemas) ==========
 
@@ -448,11 +455,12 @@ class Login(Resource):
             return {'message': 'Tài khoản đã bị vô hiệu hóa'}, 403
         
         # Tạo JWT token
+        # PyJWT yêu cầu "sub" là chuỗi
         access_token = create_access_token(
-            identity=user.id,
+            identity=str(user.id),
             expires_delta=timedelta(hours=24)
         )
-        refresh_token = create_refresh_token(identity=user.id)
+        refresh_token = create_refresh_token(identity=str(user.id))
         
         # Cập nhật last_login
         user.last_login = now_vn()
@@ -471,18 +479,44 @@ class Refresh(Resource):
     @auth_ns.doc('refresh_token')
     @auth_ns.marshal_with(token_model)
     def post(self):
-        """Làm mới access token"""
+        """Làm mới access token (refresh token cũ bị thu hồi, trả về refresh token mới)"""
+        user = get_current_user()
+        if not user or not user.is_active:
+            return {'message': 'Tài khoản đã bị vô hiệu hóa'}, 403
         current_user_id = get_jwt_identity()
         access_token = create_access_token(
             identity=current_user_id,
             expires_delta=timedelta(hours=24)
         )
+        refresh_token = create_refresh_token(identity=current_user_id)
+        revocation_store.revoke(get_jwt())
+        db.session.commit()
         return {
             'access_token': access_token,
+            'refresh_token': refresh_token,
             'token_type': 'Bearer',
             'expires_in': 86400
         }, 200
 
+@auth_ns.route('/logout')
+class Logout(Resource):
+    @jwt_required(verify_type=False)
+    @auth_ns.doc('logout')
+    def post(self):
+        """Đăng xuất: thu hồi token đang dùng và refresh token gửi kèm (nếu có)"""
+        revocation_store.revoke(get_jwt())
+        data = request.get_json(silent=True) or {}
+        if data.get('refresh_token'):
+            try:
+                payload = decode_token(data['refresh_token'])
+            except Exception:
+                return {'message': 'Refresh token không hợp lệ'}, 400
+            if str(payload.get('sub')) != str(get_jwt_identity()):
+                return {'message': 'Refresh token không thuộc người dùng hiện tại'}, 400
+            revocation_store.revoke(payload)
+        db.session.commit()
+        return {'message': 'Đã đăng xuất'}, 200
+
 # ========== Hồ sơ pháp lý ==========
 @legal_ns.route('')
 class LegalDocList(Resource):
@@ -760,6 +794,51 @@ class InventoryItemDetail(Resource):
         db.session.commit()
         return {'message': 'Deleted'}, 200
 
+@inventory_ns.route('/inventories/<int:inventory_id>/sync')
+class InventorySync(Resource):
+    @jwt_required()
+    @inventory_ns.doc('pull_inventory_lines', params={
+        'cursor': 'Cursor của lần kéo trước (bỏ trống = ảnh chụp đầy đủ)',
+        'limit': 'Số dòng tối đa mỗi trang',
+    })
+    def get(self, inventory_id):
+        """Kéo các dòng kiểm kê đã đổi sau cursor (mảng theo `fields`, nén gzip nếu được)"""
+        from utils.inventory_sync import can_sync, pull_changes, sync_response
+        inv = Inventory.query.get_or_404(inventory_id)
+        if not can_sync(get_current_user(), inv):
+            return {'message': 'Không có quyền đồng bộ đợt kiểm kê này'}, 403
+        try:
+            payload = pull_changes(inv, request.args.get('cursor'), request.args.get('limit', type=int))
+        except ValueError:
+            return {'message': 'Cursor không hợp lệ'}, 400
+        return sync_response(payload)
+
+    @jwt_required()
+    @inventory_ns.doc('push_inventory_lines')
+    def post(self, inventory_id):
+        """Đẩy kết quả kiểm kê từ máy tính bảng: {"changes": [{asset_id, row_version, actual_...}]}"""
+        from utils.inventory_sync import EDITABLE_STATUSES, can_sync, push_changes, sync_response
+        inv = Inventory.query.get_or_404(inventory_id)
+        user = get_current_user()
+        if not can_sync(user, inv):
+            return {'message': 'Không có quyền đồng bộ đợt kiểm kê này'}, 403
+        if inv.status not in EDITABLE_STATUSES:
+            return {'message': 'Đợt đã bị khóa/gửi duyệt'}, 409
+        data = request.get_json(silent=True) or {}
+        changes = data.get('changes') if isinstance(data, dict) else None
+        if not isinstance(changes, list) or not changes:
+            return {'message': 'Thiếu danh sách changes'}, 400
+        max_items = current_app.config.get('INVENTORY_RESULTS_BATCH_MAX', 5000)
+        if len(changes) > max_items:
+            return {'message': f'Tối đa {max_items} thay đổi mỗi lần gửi'}, 413
+        try:
+            outcome = push_changes(inv, user.id, changes)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            return {'message': str(e)}, 400
+        return sync_response(outcome)
+
 # ========== Thanh lý ==========
 @disposal_ns.route('')
 class DisposalList(Resource):
@@ -812,6 +891,41 @@ class ChangeLogList(Resource):
             query = query.filter_by(asset_id=asset_id)
         return query.order_by(AssetChangeLog.created_at.desc()).all(), 200
 
+# ========== Dashboard ==========
+@dashboard_ns.route('/stats')
+class DashboardStats(Resource):
+    @jwt_required()
+    @dashboard_ns.doc('dashboard_stats')
+    def get(self):
+        """Thống kê tổng quan (cùng dữ liệu với trang Dashboard)"""
+        from utils.dashboard_stats import compute_dashboard_stats
+        return compute_dashboard_stats(), 200
+
+# ========== Nhật ký hệ thống ==========
+@audit_ns.route('')
+class AuditLogList(Resource):
+    @jwt_required()
+    @audit_ns.doc('list_audit_logs', params={
+        'user_id': 'Lọc theo người dùng', 'module': 'Phân hệ', 'action': 'Thao tác',
+        'date_from': 'Từ ngày (YYYY-MM-DD)', 'date_to': 'Đến ngày (YYYY-MM-DD)',
+        'after': 'Cursor trang sau (next_cursor của trang trước)', 'per_page': 'Số dòng mỗi trang (tối đa 200)',
+    })
+    def get(self):
+        """Nhật ký hệ thống, phân trang keyset (gồm cả nhật ký đã lưu trữ) - Admin/Manager"""
+        from utils.audit_log import AuditFilters, entry_to_dict, search_audit_logs
+        user = get_current_user()
+        if not user or not user.is_active:
+            return {'message': 'Người dùng không hợp lệ'}, 403
+        if user.role_name not in ('admin', 'manager'):
+            return {'message': 'Yêu cầu quyền quản lý'}, 403
+        page = search_audit_logs(AuditFilters.from_args(request.args), request.args.get('after'),
+                                 request.args.get('per_page', type=int))
+        return {
+            'items': [entry_to_dict(entry) for entry in page['items']],
+            'next_cursor': page['next_cursor'],
+            'per_page': page['per_page'],
+        }, 200
+
 @auth_ns.route('/me')
 class CurrentUser(Resource):
     @jwt_required()
@@ -912,8 +1026,7 @@ class AssetTypeDetail(Resource):
 
 # ========== Asset Endpoints ==========
 
-def asset_to_dict(asset):
-    """Chuyển Asset object thành dictionary"""
+def _asset_dict(asset, asset_type_name):
     return {
         'id': asset.id,
         'name': asset.name,
@@ -925,7 +1038,7 @@ def asset_to_dict(asset):
         'tinh_trang_danh_gia': asset.tinh_trang_danh_gia,
         'usage_status': asset.usage_status,
         'asset_type_id': asset.asset_type_id,
-        'asset_type_name': asset.asset_type.name if asset.asset_type else None,
+        'asset_type_name': asset_type_name,
         'user_id': asset.user_id,
         'user_text': asset.user_text,
         'notes': asset.notes,
@@ -936,6 +1049,27 @@ def asset_to_dict(asset):
         'updated_at': asset.updated_at.isoformat() if asset.updated_at else None
     }
 
+def asset_to_dict(asset):
+    """Chuyển Asset object thành dictionary"""
+    return _asset_dict(asset, asset.asset_type.name if asset.asset_type else None)
+
+# Các cột cho serializer chiếu cột (tên label trùng thuộc tính của Asset)
+ASSET_LIST_COLUMNS = (
+    Asset.id, Asset.name, Asset.price, Asset.quantity, Asset.status, Asset.purchase_date,
+    Asset.device_code, Asset.tinh_trang_danh_gia, Asset.usage_status, Asset.asset_type_id,
+    Asset.user_id, Asset.user_text, Asset.notes, Asset.warranty_start_date, Asset.warranty_end_date,
+    Asset.warranty_period_months, Asset.created_at, Asset.updated_at,
+    AssetType.name.label('asset_type_name'),
+)
+
+def asset_projection(query):
+    """Chuyển truy vấn Asset thành truy vấn chiếu cột (một câu SELECT kèm tên loại tài sản)"""
+    return query.outerjoin(AssetType, AssetType.id == Asset.asset_type_id).with_entities(*ASSET_LIST_COLUMNS)
+
+def asset_row_to_dict(row):
+    """Serializer cho dòng của asset_projection (cùng định dạng với asset_to_dict)"""
+    return _asset_dict(row, row.asset_type_name)
+
 @assets_ns.route('')
 class AssetList(Resource):
     @jwt_required()
@@ -961,21 +1095,20 @@ class AssetList(Resource):
         if asset_type_id:
             query = query.filter(Asset.asset_type_id == asset_type_id)
         if search:
-            query = query.filter(or_(
-                Asset.name.contains(search),
-                Asset.device_code.contains(search)
-            ))
+            query = apply_search(query, SearchDocument.ASSET, Asset.id, search)
         
-        # Pagination
-        pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+        # Pagination - chiếu cột: COUNT + một câu SELECT cho cả trang
+        rows, total, pages = paginate_rows(
+            asset_projection(query).order_by(Asset.id.asc()), page, per_page
+        )
         
         return {
-            'items': [asset_to_dict(asset) for asset in pagination.items],
+            'items': [asset_row_to_dict(row) for row in rows],
             'pagination': {
                 'page': page,
                 'per_page': per_page,
-                'total': pagination.total,
-                'pages': pagination.pages
+                'total': total,
+                'pages': pages
             }
         }, 200
     
@@ -1048,7 +1181,7 @@ class AssetDetail(Resource):
     @assets_ns.doc('get_asset')
     def get(self, id):
         """Lấy thông tin asset theo ID"""
-        asset = Asset.query.filter_by(id=id, deleted_at=None).first_or_404()
+        asset = with_profile(Asset.query, 'asset_detail').filter_by(id=id, deleted_at=None).first_or_404()
         return asset_to_dict(asset), 200
     
     @jwt_required()
@@ -1245,7 +1378,7 @@ class UserDetail(Resource):
         """Lấy thông tin user theo ID"""
         current_user = get_current_user()
         # User chỉ có thể xem thông tin của chính mình, admin có thể xem tất cả
-        if current_user.id != id and current_user.role.name != 'admin':
+        if current_user.id != id and current_user.role_name != 'admin':
             return {'message': 'Không có quyền truy cập'}, 403
         
         user = User.query.filter_by(id=id, deleted_at=None).first_or_404()
@@ -1260,13 +1393,13 @@ class UserDetail(Resource):
         user = User.query.filter_by(id=id, deleted_at=None).first_or_404()
         
         # User chỉ có thể cập nhật thông tin của chính mình (một số trường), admin có thể cập nhật tất cả
-        if current_user.id != id and current_user.role.name != 'admin':
+        if current_user.id != id and current_user.role_name != 'admin':
             return {'message': 'Không có quyền cập nhật'}, 403
         
         data = request.get_json()
         
         # Chỉ admin mới có thể thay đổi role và is_active
-        if current_user.role.name != 'admin':
+        if current_user.role_name != 'admin':
             if 'role_id' in data or 'is_active' in data:
                 return {'message': 'Không có quyền thay đổi role hoặc trạng thái'}, 403
         
@@ -1298,7 +1431,7 @@ class UserDetail(Resource):
         
         # Không cho phép xóa chính mình
         current_user_id = get_jwt_identity()
-        if user.id == current_user_id:
+        if str(user.id) == str(current_user_id):
             return {'message': 'Không thể xóa chính mình'}, 400
         
         user.soft_delete()
@@ -1307,20 +1440,18 @@ class UserDetail(Resource):
 
 # ========== Maintenance Record Endpoints ==========
 
-def maintenance_to_dict(record):
-    """Chuyển MaintenanceRecord object thành dictionary"""
-    asset = record.asset
+def _maintenance_dict(record, related):
     return {
         'id': record.id,
         'asset_id': record.asset_id,
-        'asset_name': asset.name if asset else None,
-        'asset_code': asset.device_code if asset else None,
-        'asset_type_name': asset.asset_type.name if asset and asset.asset_type else None,
-        'asset_user': asset.user.username if asset and asset.user else (asset.user_text if asset else None),
-        'asset_status': asset.status if asset else None,
+        'asset_name': related['asset_name'],
+        'asset_code': related['asset_code'],
+        'asset_type_name': related['asset_type_name'],
+        'asset_user': related['asset_user'],
+        'asset_status': related['asset_status'],
         'request_date': record.request_date.isoformat() if record.request_date else None,
         'requested_by_id': record.requested_by_id,
-        'requested_by_name': record.requested_by.username if record.requested_by else None,
+        'requested_by_name': related['requested_by_name'],
         'maintenance_reason': record.maintenance_reason,
         'condition_before': record.condition_before,
         'damage_level': record.damage_level,
@@ -1346,6 +1477,67 @@ def maintenance_to_dict(record):
         'updated_at': record.updated_at.isoformat() if record.updated_at else None
     }
 
+def maintenance_to_dict(record):
+    """Chuyển MaintenanceRecord object thành dictionary"""
+    asset = record.asset
+    return _maintenance_dict(record, {
+        'asset_name': asset.name if asset else None,
+        'asset_code': asset.device_code if asset else None,
+        'asset_type_name': asset.asset_type.name if asset and asset.asset_type else None,
+        'asset_user': asset.user.username if asset and asset.user else (asset.user_text if asset else None),
+        'asset_status': asset.status if asset else None,
+        'requested_by_name': record.requested_by.username if record.requested_by else None,
+    })
+
+_AssetUser = aliased(User)
+_RequestedBy = aliased(User)
+
+MAINTENANCE_LIST_COLUMNS = tuple(
+    getattr(MaintenanceRecord, name) for name in (
+        'id', 'asset_id', 'request_date', 'requested_by_id', 'maintenance_reason', 'condition_before',
+        'damage_level', 'maintenance_date', 'type', 'description', 'vendor', 'person_in_charge',
+        'vendor_phone', 'estimated_cost', 'cost', 'completed_date', 'replaced_parts', 'result_status',
+        'result_notes', 'invoice_file', 'acceptance_file', 'before_image', 'after_image', 'next_due_date',
+        'status', 'created_at', 'updated_at',
+    )
+) + (
+    Asset.name.label('asset_name'),
+    Asset.device_code.label('asset_code'),
+    Asset.status.label('asset_status'),
+    Asset.user_text.label('asset_user_text'),
+    AssetType.name.label('asset_type_name'),
+    _AssetUser.username.label('asset_username'),
+    _RequestedBy.username.label('requested_by_name'),
+)
+
+def maintenance_base_query():
+    """MaintenanceRecord đã outer join Asset một lần (bộ lọc theo tài sản dùng lại join này)"""
+    return MaintenanceRecord.query.outerjoin(Asset, Asset.id == MaintenanceRecord.asset_id).filter(
+        MaintenanceRecord.deleted_at.is_(None)
+    )
+
+def maintenance_projection(query):
+    """Chuyển truy vấn từ maintenance_base_query thành truy vấn chiếu cột (một câu SELECT)"""
+    return query.outerjoin(
+        AssetType, AssetType.id == Asset.asset_type_id
+    ).outerjoin(
+        _AssetUser, _AssetUser.id == Asset.user_id
+    ).outerjoin(
+        _RequestedBy, _RequestedBy.id == MaintenanceRecord.requested_by_id
+    ).with_entities(*MAINTENANCE_LIST_COLUMNS)
+
+def maintenance_row_to_dict(row):
+    """Serializer cho dòng của maintenance_projection (cùng định dạng với maintenance_to_dict)"""
+    has_asset = row.asset_name is not None
+    return _maintenance_dict(row, {
+        'asset_name': row.asset_name,
+        'asset_code': row.asset_code,
+        'asset_type_name': row.asset_type_name,
+        'asset_user': row.asset_username or (row.asset_user_text if has_asset else None),
+        'asset_status': row.asset_status,
+        'requested_by_name': row.requested_by_name,
+    })
+
 @maintenance_ns.route('')
 class MaintenanceList(Resource):
     @jwt_required()
@@ -1373,13 +1565,13 @@ class MaintenanceList(Resource):
         date_to = request.args.get('date_to')
         search = request.args.get('search')
         
-        query = MaintenanceRecord.query.filter(MaintenanceRecord.deleted_at.is_(None))
+        query = maintenance_base_query()
         
         # Filters
         if asset_id:
             query = query.filter(MaintenanceRecord.asset_id == asset_id)
         if asset_type_id:
-            query = query.join(Asset).filter(Asset.asset_type_id == asset_type_id)
+            query = query.filter(Asset.asset_type_id == asset_type_id)
         if status:
             query = query.filter(MaintenanceRecord.status == status)
         if type_filter:
@@ -1399,23 +1591,24 @@ class MaintenanceList(Resource):
             except ValueError:
                 return {'message': 'Ngày kết thúc không đúng định dạng (YYYY-MM-DD)'}, 400
         if search:
-            query = query.join(Asset).filter(or_(
-                Asset.name.contains(search),
-                Asset.device_code.contains(search)
-            ))
-        
-        # Pagination
-        pagination = query.order_by(MaintenanceRecord.request_date.desc()).paginate(
-            page=page, per_page=per_page, error_out=False
+            # Tìm theo tên/mã tài sản (không dấu) qua chỉ mục của tài sản
+            query = apply_search(query, SearchDocument.ASSET, Asset.id, search)
+        
+        # Pagination - chiếu cột: COUNT + một câu SELECT cho cả trang
+        rows, total, pages = paginate_rows(
+            maintenance_projection(query).order_by(
+                MaintenanceRecord.request_date.desc(), MaintenanceRecord.id.desc()
+            ),
+            page, per_page
         )
         
         return {
-            'items': [maintenance_to_dict(record) for record in pagination.items],
+            'items': [maintenance_row_to_dict(row) for row in rows],
             'pagination': {
                 'page': page,
                 'per_page': per_page,
-                'total': pagination.total,
-                'pages': pagination.pages
+                'total': total,
+                'pages': pages
             }
         }, 200
     
@@ -1494,7 +1687,9 @@ class MaintenanceDetail(Resource):
     @maintenance_ns.doc('get_maintenance')
     def get(self, id):
         """Lấy thông tin maintenance record theo ID"""
-        record = MaintenanceRecord.query.filter_by(id=id, deleted_at=None).first_or_404()
+        record = with_profile(MaintenanceRecord.query, 'maintenance_detail').filter_by(
+            id=id, deleted_at=None
+        ).first_or_404()
         return maintenance_to_dict(record), 200
     
     @jwt_required()
@@ -1644,7 +1839,9 @@ class MaintenanceExport(Resource):
         date_from = request.args.get('date_from')
         date_to = request.args.get('date_to')
         
-        query = MaintenanceRecord.query.filter(MaintenanceRecord.deleted_at.is_(None))
+        query = with_profile(MaintenanceRecord.query, 'maintenance_batch').filter(
+            MaintenanceRecord.deleted_at.is_(None)
+        )
         
         # Apply filters (same as list endpoint)
         if asset_id:
@@ -6,6 +6,8 @@ from models import (
 )
 from utils.voucher import generate_voucher_code, generate_inventory_code, generate_process_request_code
 from utils.timezone import now_vn, today_vn
+from utils.depreciation import calculate_depreciation
+from utils.amortization import calculate_amortization, project_amortization
 from datetime import datetime
 
 api_misa_bp = Blueprint('api_misa', __name__, url_prefix='/api/misa')
@@ -299,84 +301,14 @@ def api_asset_depreciation_calculate():
         method = data.get('method', 'straight_line')
         asset_ids = data.get('asset_ids', [])
         
-        results = []
-        for asset_id in asset_ids:
-            asset = Asset.query.get(asset_id)
-            if not asset or asset.deleted_at:
-                continue
-            
-            original_value = asset.price or 0
-            if original_value <= 0:
-                continue
-            
-            # Thời gian sử dụng chuẩn (năm) mặc định 5 nếu không có dữ liệu khác
-            useful_life_years = getattr(asset, 'useful_life_years', None) or 5
-            depreciation_rate = 1.0 / useful_life_years  # Tỷ lệ khấu hao năm (dạng thập phân)
-            
-            # Tìm lũy kế trước kỳ tính
-            prev_query = AssetDepreciation.query.filter(AssetDepreciation.asset_id == asset_id)
-            if period_month:
-                prev_query = prev_query.filter(
-                    db.or_(
-                        AssetDepreciation.period_year < period_year,
-                        db.and_(
-                            AssetDepreciation.period_year == period_year,
-                            AssetDepreciation.period_month < period_month
-                        )
-                    )
-                )
-            else:
-                prev_query = prev_query.filter(AssetDepreciation.period_year < period_year)
-            prev_deps = prev_query.all()
-            prev_accumulated = sum(d.depreciation_amount or 0 for d in prev_deps)
-            
-            # Công thức đường thẳng: khấu hao năm = Nguyên giá / Thời gian sử dụng; tháng = năm / 12
-            if method == 'straight_line':
-                annual_amount = original_value / useful_life_years
-                depreciation_amount = annual_amount / 12 if period_month else annual_amount
-            else:
-                # Số dư giảm dần: áp dụng hệ số 2 trên giá trị còn lại
-                remaining_value_before = original_value - prev_accumulated
-                annual_amount = remaining_value_before * depreciation_rate * 2
-                depreciation_amount = annual_amount / 12 if period_month else annual_amount
-            
-            accumulated = prev_accumulated + depreciation_amount
-            remaining_value = original_value - accumulated
-            
-            existing = AssetDepreciation.query.filter(
-                AssetDepreciation.asset_id == asset_id,
-                AssetDepreciation.period_year == period_year,
-                AssetDepreciation.period_month == period_month
-            ).first()
-            
-            if existing:
-                existing.depreciation_amount = depreciation_amount
-                existing.accumulated_depreciation = accumulated
-                existing.remaining_value = remaining_value
-                existing.depreciation_rate = depreciation_rate * 100
-            else:
-                depreciation = AssetDepreciation(
-                    asset_id=asset_id,
-                    period_year=period_year,
-                    period_month=period_month,
-                    original_value=original_value,
-                    depreciation_amount=depreciation_amount,
-                    accumulated_depreciation=accumulated,
-                    remaining_value=remaining_value,
-                    method=method,
-                    depreciation_rate=depreciation_rate * 100
-                )
-                db.session.add(depreciation)
-            
-            results.append({
-                'asset_id': asset_id,
-                'depreciation_amount': depreciation_amount,
-                'accumulated': accumulated,
-                'remaining_value': remaining_value
-            })
-        
-        db.session.commit()
-        return jsonify({'success': True, 'message': 'Đã tính khấu hao thành công', 'data': results})
+        # Dùng chung engine với trang /assets/depreciation
+        outcome = calculate_depreciation(asset_ids, period_year, period_month, method)
+        return jsonify({
+            'success': True,
+            'message': 'Đã tính khấu hao thành công',
+            'data': outcome['results'],
+            'skipped': outcome['skipped']
+        })
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'message': str(e)}), 400
@@ -390,72 +322,32 @@ def api_asset_amortization_calculate():
         period_year = int(data.get('year'))
         asset_data = data.get('assets', [])  # [{asset_id, usage_years, condition_score}]
         
-        results = []
-        for item in asset_data:
-            asset_id = item.get('asset_id')
-            asset = Asset.query.get(asset_id)
-            if not asset or asset.deleted_at:
-                continue
-            
-            original_value = asset.price or 0
-            if original_value <= 0:
-                continue
-            
-            usage_years = int(item.get('usage_years') or 0)
-            if usage_years <= 0:
-                usage_years = getattr(asset, 'useful_life_years', None) or 5
-            
-            # Hao mòn đường thẳng theo năm: giá trị hao mòn năm = Nguyên giá / Số năm sử dụng
-            annual_amort = original_value / usage_years
-            
-            # Lũy kế trước năm tính
-            prev_amort = AssetAmortization.query.filter(
-                AssetAmortization.asset_id == asset_id,
-                AssetAmortization.period_year < period_year
-            ).order_by(AssetAmortization.period_year.desc()).first()
-            prev_remaining = prev_amort.remaining_value if prev_amort else original_value
-            
-            amortization_amount = annual_amort
-            remaining_value = prev_remaining - amortization_amount
-            
-            amortization_rate = (1.0 / usage_years) * 100
-            
-            existing = AssetAmortization.query.filter(
-                AssetAmortization.asset_id == asset_id,
-                AssetAmortization.period_year == period_year
-            ).first()
-            
-            if existing:
-                existing.amortization_rate = amortization_rate
-                existing.amortization_amount = amortization_amount
-                existing.remaining_value = remaining_value
-                existing.usage_years = usage_years
-                existing.condition_score = item.get('condition_score')
-            else:
-                amortization = AssetAmortization(
-                    asset_id=asset_id,
-                    period_year=period_year,
-                    original_value=original_value,
-                    amortization_rate=amortization_rate,
-                    amortization_amount=amortization_amount,
-                    remaining_value=remaining_value,
-                    usage_years=usage_years,
-                    condition_score=item.get('condition_score')
-                )
-                db.session.add(amortization)
-            
-            results.append({
-                'asset_id': asset_id,
-                'amortization_amount': amortization_amount,
-                'remaining_value': remaining_value
-            })
-        
-        db.session.commit()
+        results = calculate_amortization(asset_data, period_year)
         return jsonify({'success': True, 'message': 'Đã tính hao mòn thành công', 'data': results})
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'message': str(e)}), 400
 
+@api_misa_bp.route('/assets/amortization/projection', methods=['POST'])
+@login_required_api
+def api_asset_amortization_projection():
+    """API dự báo lịch hao mòn nhiều năm (tới khi giá trị còn lại bằng 0)"""
+    try:
+        data = request.get_json()
+        start_year = int(data.get('year') or today_vn().year)
+        asset_data = data.get('assets', [])  # [{asset_id, usage_years, condition_score}]
+        save = bool(data.get('save', False))
+        
+        projections = project_amortization(asset_data, start_year, save=save)
+        return jsonify({
+            'success': True,
+            'message': 'Đã lưu lịch hao mòn' if save else 'Đã dự báo lịch hao mòn',
+            'data': projections
+        })
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 400
+
 @api_misa_bp.route('/inventory', methods=['POST'])
 @login_required_api
 def api_inventory_create():
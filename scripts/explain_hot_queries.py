@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+In EXPLAIN plan cho các truy vấn nóng của những route chính (SQLite và PostgreSQL)
+để phát hiện sớm khi một truy vấn quay lại quét toàn bảng.
+
+Cách dùng (từ thư mục gốc dự án):
+
+    python scripts/explain_hot_queries.py            # tất cả truy vấn
+    python scripts/explain_hot_queries.py assets     # chỉ các truy vấn có tên chứa "assets"
+    python scripts/explain_hot_queries.py --analyze  # PostgreSQL: EXPLAIN ANALYZE (chạy thật truy vấn)
+
+Mã thoát = 1 nếu có truy vấn quét toàn bảng trên các bảng đã được index
+(SQLite: "SCAN <bảng>" không kèm index, PostgreSQL: "Seq Scan on <bảng>").
+"""
+import os
+import re
+import sys
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func, text
+
+from app import app
+from models import (
+    db, Asset, AuditLog, MaintenanceRecord, AssetDepreciation, InventoryResult, AssetTransfer
+)
+from utils.report_queries import KEYSET_ORDER, keyset_after, keyset_null_tail
+
+# Các bảng đã có index cho bộ lọc nóng - quét toàn bảng ở đây được coi là hồi quy
+INDEXED_TABLES = (
+    'asset', 'maintenance_record', 'audit_log', 'asset_depreciation', 'inventory_result', 'asset_transfer'
+)
+
+
+def hot_queries():
+    """(tên, route, truy vấn) cho các đường truy cập chính"""
+    today = date.today()
+    live_asset = Asset.deleted_at.is_(None)
+    live_maint = MaintenanceRecord.deleted_at.is_(None)
+    return [
+        ('dashboard_recent_assets', '/',
+         Asset.query.filter(live_asset).order_by(Asset.created_at.desc()).limit(10)),
+        ('dashboard_maintenance_due', '/',
+         MaintenanceRecord.query.filter(
+             live_maint,
+             MaintenanceRecord.next_due_date.isnot(None),
+             MaintenanceRecord.next_due_date <= today + timedelta(days=30),
+         ).order_by(MaintenanceRecord.next_due_date.asc()).limit(10)),
+        ('report_first_page', '/reports/tt24',
+         Asset.query.filter(live_asset).order_by(*KEYSET_ORDER).limit(101)),
+        ('report_keyset_page', '/reports/tt24?after=',
+         Asset.query.filter(live_asset, keyset_after(datetime(today.year, 1, 1), 1000)).order_by(*KEYSET_ORDER).limit(101)),
+        ('report_keyset_null_tail', '/reports/tt24?after= (created_at NULL)',
+         Asset.query.filter(live_asset, keyset_null_tail(1000)).order_by(Asset.id.desc()).limit(101)),
+        ('assets_by_status', '/assets?status=active',
+         Asset.query.filter(live_asset, Asset.status == 'active').order_by(Asset.created_at.desc()).limit(20)),
+        ('assets_by_type_status', '/api/v1/assets?asset_type_id=1&status=active',
+         Asset.query.filter(live_asset, Asset.asset_type_id == 1, Asset.status == 'active').limit(20)),
+        ('assets_by_user', '/assets (role user)',
+         Asset.query.filter(live_asset, Asset.user_id == 1).order_by(Asset.created_at.desc()).limit(20)),
+        ('trash_assets', '/trash',
+         Asset.query.filter(Asset.deleted_at.isnot(None)).order_by(Asset.deleted_at.desc()).limit(20)),
+        ('maintenance_by_date', '/maintenance',
+         MaintenanceRecord.query.filter(
+             live_maint, MaintenanceRecord.maintenance_date >= today - timedelta(days=30)
+         ).order_by(MaintenanceRecord.maintenance_date.desc()).limit(20)),
+        ('maintenance_by_asset', '/api/v1/maintenance?asset_id=1',
+         MaintenanceRecord.query.filter(live_maint, MaintenanceRecord.asset_id == 1)),
+        ('audit_logs_page', '/audit-logs',
+         AuditLog.query.order_by(AuditLog.created_at.desc(), AuditLog.id.desc()).limit(10)),
+        ('audit_logs_by_user', '/audit-logs?user_id=1',
+         AuditLog.query.filter(AuditLog.user_id == 1).order_by(AuditLog.created_at.desc()).limit(10)),
+        ('audit_logs_by_module', '/audit-logs?module=assets',
+         AuditLog.query.filter(
+             AuditLog.module == 'assets', AuditLog.created_at >= datetime(today.year, 1, 1)
+         ).order_by(AuditLog.created_at.desc()).limit(10)),
+        ('ai_chat_asset_history', '/api/ai_chat',
+         AuditLog.query.filter(AuditLog.module == 'assets', AuditLog.entity_id == 1)
+         .order_by(AuditLog.created_at.desc()).limit(3)),
+        ('depreciation_prior_period', '/assets/depreciation',
+         db.session.query(func.sum(AssetDepreciation.depreciation_amount)).filter(
+             AssetDepreciation.asset_id == 1, AssetDepreciation.period_year < today.year
+         )),
+        ('depreciation_by_period', '/assets/depreciation?year=',
+         AssetDepreciation.query.filter(AssetDepreciation.period_year == today.year)),
+        ('inventory_line_lookup', '/api/inventories/<id>/result',
+         InventoryResult.query.filter_by(inventory_id=1, asset_id=1)),
+        ('transfer_list', '/transfer?status=pending',
+         AssetTransfer.query.filter(AssetTransfer.status == 'pending').order_by(AssetTransfer.created_at.desc())),
+        ('transfer_by_user', '/users/view/<id>',
+         AssetTransfer.query.filter(
+             (AssetTransfer.from_user_id == 1) | (AssetTransfer.to_user_id == 1)
+         ).order_by(AssetTransfer.created_at.desc()).limit(10)),
+    ]
+
+
+def explain(query, dialect_name, analyze=False):
+    """Trả về danh sách dòng kế hoạch thực thi cho một truy vấn ORM"""
+    statement = query.statement if hasattr(query, 'statement') else query
+    sql = str(statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True}))
+    if dialect_name == 'sqlite':
+        rows = db.session.execute(text('EXPLAIN QUERY PLAN ' + sql)).fetchall()
+        return [row[-1] for row in rows]
+    prefix = 'EXPLAIN (ANALYZE, BUFFERS) ' if analyze else 'EXPLAIN '
+    rows = db.session.execute(text(prefix + sql)).fetchall()
+    return [row[0] for row in rows]
+
+
+def full_scans(plan_lines, dialect_name):
+    """Tìm các bước quét toàn bảng trên những bảng đã được index"""
+    found = []
+    for line in plan_lines:
+        if dialect_name == 'sqlite':
+            match = re.search(r'\bSCAN (\w+)', line)
+            if match and 'USING' not in line:
+                found.append(match.group(1))
+        else:
+            match = re.search(r'Seq Scan on (\w+)', line)
+            if match:
+                found.append(match.group(1))
+    return [table for table in found if table in INDEXED_TABLES]
+
+
+def main(argv):
+    analyze = '--analyze' in argv
+    name_filter = [arg for arg in argv if not arg.startswith('--')]
+    regressions = []
+    with app.app_context():
+        dialect_name = db.engine.dialect.name
+        print("=" * 70)
+        print(f"EXPLAIN các truy vấn nóng - backend: {dialect_name}")
+        print("=" * 70)
+        for name, route, query in hot_queries():
+            if name_filter and not any(f in name for f in name_filter):
+                continue
+            print(f"\n[{name}]  route: {route}")
+            try:
+                plan = explain(query, dialect_name, analyze=analyze)
+            except Exception as e:
+                db.session.rollback()
+                print(f"  ! Không thể EXPLAIN: {e}")
+                continue
+            for line in plan:
+                print(f"  {line}")
+            scans = full_scans(plan, dialect_name)
+            if scans:
+                regressions.append((name, scans))
+                print(f"  !! Quét toàn bảng: {', '.join(scans)}")
+    print("\n" + "=" * 70)
+    if regressions:
+        print(f"Có {len(regressions)} truy vấn quét toàn bảng:")
+        for name, scans in regressions:
+            print(f"  - {name}: {', '.join(scans)}")
+        return 1
+    print("Không phát hiện quét toàn bảng trên các bảng đã index.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
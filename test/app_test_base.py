@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Lớp cơ sở cho test: dùng CSDL SQLite tạm (không đụng vào instance/app.db)
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+
+# CSDL test phải được cấu hình trước khi import app (Config đọc biến môi trường khi import)
+TEST_DB_PATH = os.path.join(tempfile.gettempdir(), 'qlts_test.db')
+os.environ['DATABASE_URL'] = 'sqlite:///' + TEST_DB_PATH
+
+# Thêm thư mục gốc vào Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, db
+from models import Role, User, AssetType, Asset, SystemSetting, UserPermission
+from utils.auth_cache import identity_cache, revocation_store
+from utils.report_cache import report_cache
+from utils.search_index import ensure_search_index, reset_backend_cache, search_backend
+from utils.suggest_index import suggest_index
+
+# Thread giám sát tác vụ nền (chế độ nhúng) không quét CSDL test; test tự gọi supervise_once()
+app.config['JOB_SUPERVISE_INTERVAL'] = 0
+
+
+class AppTestCase(unittest.TestCase):
+    """Tạo lại toàn bộ bảng cho mỗi test, kèm admin và một loại tài sản mẫu"""
+
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.drop_all()
+        db.create_all()
+        SystemSetting.invalidate_cache()
+        UserPermission.invalidate_cache()
+        report_cache.clear()
+        suggest_index.reset()
+        revocation_store.reset()
+        identity_cache.reset()
+        # Dò backend tìm kiếm (FTS5) một lần cho CSDL vừa tạo, không tính vào số truy vấn của test
+        reset_backend_cache()
+        search_backend()
+        ensure_search_index()
+        self.admin_role = Role(name='admin', description='Quản trị')
+        self.user_role = Role(name='user', description='Nhân viên')
+        db.session.add_all([self.admin_role, self.user_role])
+        db.session.flush()
+        self.admin = self.create_user('admin', self.admin_role)
+        self.asset_type = AssetType(name='Máy tính')
+        db.session.add(self.asset_type)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def create_user(self, username, role):
+        user = User(username=username, email=f'{username}@example.com', role_id=role.id, is_active=True)
+        user.set_password('secret')
+        db.session.add(user)
+        db.session.flush()
+        return user
+
+    def create_asset(self, name, price=1000000, **kwargs):
+        kwargs.setdefault('asset_type_id', self.asset_type.id)
+        asset = Asset(name=name, price=price, **kwargs)
+        db.session.add(asset)
+        db.session.flush()
+        return asset
+
+    def client_for(self, user):
+        """Test client đã đăng nhập (session) với user cho trước"""
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = user.id
+            sess['username'] = user.username
+            sess['role'] = user.role.name
+        return client
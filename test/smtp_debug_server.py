@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Máy chủ SMTP giả lập tối giản (không cần aiosmtpd) cho test và chạy thử outbox ở máy local.
+
+    python test/smtp_debug_server.py --port 1025     # in email nhận được ra màn hình
+    MAIL_SERVER=localhost MAIL_PORT=1025 MAIL_USE_TLS=false EMAIL_ENABLED=true flask worker
+
+Người nhận bắt đầu bằng `reject` bị từ chối vĩnh viễn (550), bằng `busy` bị từ chối tạm thời (451).
+"""
+
+import argparse
+import socketserver
+import threading
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def _reply(self, line):
+        self.wfile.write((line + '\r\n').encode('ascii'))
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        self._reply('220 localhost SMTP debug server')
+        sender, recipients = None, []
+        while True:
+            raw = self.rfile.readline()
+            if not raw:
+                return
+            line = raw.decode('utf-8', 'replace').rstrip('\r\n')
+            command = line.split(' ', 1)[0].upper()
+            argument = line[len(command):].strip()
+            if command in ('EHLO', 'HELO'):
+                self._reply('250 localhost')
+            elif command == 'MAIL':
+                sender, recipients = argument.split(':', 1)[-1].strip('<> '), []
+                self._reply('250 OK')
+            elif command == 'RCPT':
+                address = argument.split(':', 1)[-1].strip('<> ')
+                if address.startswith('reject'):
+                    self._reply('550 Mailbox unavailable')
+                elif address.startswith('busy'):
+                    self._reply('451 Try again later')
+                else:
+                    recipients.append(address)
+                    self._reply('250 OK')
+            elif command == 'DATA':
+                if not recipients:
+                    self._reply('503 No valid recipients')
+                    continue
+                self._reply('354 End data with <CR><LF>.<CR><LF>')
+                lines = []
+                while True:
+                    data = self.rfile.readline()
+                    if not data or data in (b'.\r\n', b'.\n'):
+                        break
+                    lines.append(data[1:] if data.startswith(b'..') else data)
+                with server.lock:
+                    server.messages.append((sender, list(recipients), b''.join(lines).decode('utf-8', 'replace')))
+                if server.verbose:
+                    print(f'--- {sender} -> {", ".join(recipients)}\n{b"".join(lines).decode("utf-8", "replace")}')
+                self._reply('250 OK queued')
+            elif command in ('RSET', 'NOOP'):
+                if command == 'RSET':
+                    sender, recipients = None, []
+                self._reply('250 OK')
+            elif command == 'QUIT':
+                self._reply('221 Bye')
+                return
+            else:
+                self._reply('502 Command not implemented')
+
+
+class DebugSMTPServer(socketserver.ThreadingTCPServer):
+    """SMTP trong thread nền: `messages` = [(from, [to], nội dung)], `connections` = số kết nối đã mở"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=0, verbose=False):
+        super().__init__((host, port), _Handler)
+        self.lock = threading.Lock()
+        self.messages = []
+        self.connections = 0
+        self.verbose = verbose
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='SMTP debug server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=1025)
+    args = parser.parse_args()
+    server = DebugSMTPServer(args.host, args.port, verbose=True)
+    print(f'SMTP debug server listening on {args.host}:{server.port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
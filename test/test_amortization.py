@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Test tính hao mòn theo lô và dự báo nhiều năm (utils/amortization.py)
+"""
+
+import unittest
+
+from app_test_base import AppTestCase
+from app import db
+from models import AssetAmortization
+
+
+class TestAmortization(AppTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.a = self.create_asset('Xe ô tô', price=100000000)
+        self.b = self.create_asset('Bàn họp', price=9000000)
+        db.session.commit()
+        self.client = self.client_for(self.admin)
+
+    def test_calculate_uses_previous_year_remaining(self):
+        assets = [{'asset_id': self.a.id, 'usage_years': 4}, {'asset_id': self.b.id}]
+        self.client.post('/api/misa/assets/amortization/calculate', json={'year': 2024, 'assets': assets})
+        response = self.client.post('/api/misa/assets/amortization/calculate', json={'year': 2025, 'assets': assets})
+        data = {row['asset_id']: row for row in response.get_json()['data']}
+        self.assertEqual(data[self.a.id]['remaining_value'], 50000000)
+        self.assertEqual(data[self.b.id]['amortization_amount'], 1800000)
+        # Tính lại cùng năm: cập nhật, không tạo bản ghi trùng
+        self.client.post('/api/misa/assets/amortization/calculate', json={'year': 2025, 'assets': assets})
+        self.assertEqual(AssetAmortization.query.count(), 4)
+
+    def test_projection_runs_until_zero(self):
+        self.client.post('/api/misa/assets/amortization/calculate', json={
+            'year': 2024, 'assets': [{'asset_id': self.a.id, 'usage_years': 3}]
+        })
+        response = self.client.post('/api/misa/assets/amortization/projection', json={
+            'year': 2025, 'assets': [{'asset_id': self.a.id, 'usage_years': 3}, {'asset_id': self.b.id}]
+        })
+        data = {row['asset_id']: row for row in response.get_json()['data']}
+        schedule_a = data[self.a.id]['schedule']
+        self.assertEqual([entry['year'] for entry in schedule_a], [2025, 2026])
+        self.assertAlmostEqual(schedule_a[-1]['remaining_value'], 0)
+        self.assertEqual(len(data[self.b.id]['schedule']), 5)
+        self.assertEqual(AssetAmortization.query.count(), 1)
+
+        self.client.post('/api/misa/assets/amortization/projection', json={
+            'year': 2025, 'assets': [{'asset_id': self.b.id}], 'save': True
+        })
+        years = [row.period_year for row in AssetAmortization.query.filter_by(asset_id=self.b.id)]
+        self.assertEqual(sorted(years), [2025, 2026, 2027, 2028, 2029])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Test số truy vấn cố định cho các endpoint danh sách REST (không N+1 lazy load)
+"""
+
+import unittest
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event
+
+from app_test_base import AppTestCase
+from app import app, db
+from models import Asset, AssetType, MaintenanceRecord
+from routes_api import asset_to_dict, maintenance_to_dict
+from utils.auth_cache import revocation_store
+
+
+class TestApiQueryCount(AppTestCase):
+
+    def setUp(self):
+        super().setUp()
+        other_type = AssetType(name='Máy in')
+        db.session.add(other_type)
+        db.session.flush()
+        staff = self.create_user('staff', self.user_role)
+        for i in range(60):
+            asset = self.create_asset(
+                f'Tài sản {i}', price=1000 + i,
+                asset_type_id=(self.asset_type.id if i % 2 else other_type.id),
+                user_id=(staff.id if i % 3 == 0 else None),
+                user_text=('Phòng kế toán' if i % 3 == 1 else None),
+            )
+            db.session.add(MaintenanceRecord(
+                asset_id=asset.id,
+                request_date=date(2025, 1, 1) + timedelta(days=i),
+                requested_by_id=(self.admin.id if i % 2 else None),
+                type='maintenance',
+                description=f'Bảo trì {i}',
+            ))
+        db.session.commit()
+        self.type_id = self.asset_type.id
+        self.headers = {'Authorization': f'Bearer {create_access_token(identity=str(self.admin.id))}'}
+        self.client = app.test_client()
+        # Danh sách token thu hồi: nạp Bloom trước, không đọc lại phiên bản giữa các request của test
+        app.config['JWT_REVOCATION_VERSION_CHECK'] = 3600
+        revocation_store.is_revoked('warm-up')
+
+    def tearDown(self):
+        app.config['JWT_REVOCATION_VERSION_CHECK'] = 1
+        super().tearDown()
+
+    @contextmanager
+    def count_queries(self):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+    def _get(self, url):
+        db.session.expunge_all()
+        with self.count_queries() as statements:
+            response = self.client.get(url, headers=self.headers)
+        self.assertEqual(response.status_code, 200, response.get_data(as_text=True))
+        return response.get_json(), len(statements)
+
+    def test_asset_list_query_count_is_constant(self):
+        small, small_count = self._get('/api/v1/assets?per_page=5')
+        large, large_count = self._get('/api/v1/assets?per_page=60')
+        self.assertEqual(len(large['items']), 60)
+        self.assertEqual(small_count, large_count)
+        self.assertLessEqual(large_count, 3)
+
+    def test_maintenance_list_query_count_is_constant(self):
+        _, small_count = self._get('/api/v1/maintenance?per_page=5')
+        large, large_count = self._get('/api/v1/maintenance?per_page=60&search=T')
+        self.assertEqual(len(large['items']), 60)
+        self.assertEqual(small_count, large_count)
+        self.assertLessEqual(large_count, 3)
+        # Lọc theo loại và tìm kiếm cùng lúc (trước đây join Asset hai lần)
+        filtered, _ = self._get(f'/api/v1/maintenance?per_page=60&asset_type_id={self.type_id}&search=Tài')
+        self.assertEqual(filtered['pagination']['total'], 30)
+
+    def test_projection_matches_object_serializers(self):
+        assets, _ = self._get('/api/v1/assets?per_page=60')
+        records, _ = self._get('/api/v1/maintenance?per_page=60')
+        expected_assets = [asset_to_dict(a) for a in Asset.query.order_by(Asset.id).all()]
+        self.assertEqual(assets['items'], expected_assets)
+        by_id = {r.id: maintenance_to_dict(r) for r in MaintenanceRecord.query.all()}
+        self.assertEqual(records['items'], [by_id[item['id']] for item in records['items']])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Test xuất tài sản theo luồng (utils/asset_export.py)
+"""
+
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import date
+
+from openpyxl import load_workbook
+
+from app_test_base import AppTestCase
+from app import app, db
+
+
+class TestAssetExport(AppTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.export_dir = tempfile.mkdtemp()
+        app.config['EXPORT_DIR'] = self.export_dir
+        for i in range(1203):
+            self.create_asset(f'Tài sản {i}', price=1000 + i, quantity=1,
+                              user_id=self.admin.id if i % 2 else None,
+                              purchase_date=date(2024, 1, 2) if i == 0 else None)
+        deleted = self.create_asset('Đã xóa')
+        deleted.soft_delete()
+        db.session.commit()
+        self.client = self.client_for(self.admin)
+
+    def tearDown(self):
+        shutil.rmtree(self.export_dir, ignore_errors=True)
+        super().tearDown()
+
+    def _export(self, fmt):
+        response = self.client.get(f'/assets/export/{fmt}')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_streamed or fmt in ('docx', 'pdf'))
+        data = response.get_data()
+        archived = os.listdir(self.export_dir)
+        self.assertEqual(len(archived), 1)
+        with open(os.path.join(self.export_dir, archived[0]), 'rb') as f:
+            self.assertEqual(f.read(), data)
+        return data
+
+    def test_csv(self):
+        rows = list(csv.reader(io.StringIO(self._export('csv').decode('utf-8-sig'))))
+        self.assertEqual(rows[0][:2], ['ID', 'Tên tài sản'])
+        self.assertEqual(len(rows), 1204)
+        self.assertEqual(rows[1][5], '02/01/2024')
+        self.assertEqual(rows[2][7], 'admin')
+
+    def test_json_and_ndjson(self):
+        array = json.loads(self._export('json'))
+        self.assertEqual(len(array), 1203)
+        shutil.rmtree(self.export_dir)
+        lines = self._export('ndjson').decode('utf-8').splitlines()
+        self.assertEqual([json.loads(line) for line in lines], array)
+        self.assertEqual(array[0]['asset_type'], 'Máy tính')
+
+    def test_xlsx(self):
+        sheet = load_workbook(io.BytesIO(self._export('xlsx')), read_only=True).active
+        rows = list(sheet.iter_rows(values_only=True))
+        self.assertEqual(len(rows), 1204)
+        self.assertEqual(rows[-1][1], 'Tài sản 1202')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Test import tài sản từ Excel chạy nền (utils/asset_import.py)
+"""
+
+import io
+import time
+import unittest
+from datetime import date
+
+from openpyxl import Workbook
+
+from app_test_base import AppTestCase
+from app import db
+from models import Asset, AssetImportJob, AssetTypeRollup, AuditLog
+from utils.asset_import import run_import
+
+HEADER = ['Tên tài sản', 'Giá tiền', 'Số lượng', 'Loại tài sản', 'Trạng thái', 'Ngày mua', 'Mã thiết bị']
+
+
+def build_workbook(rows):
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(HEADER)
+    for row in rows:
+        sheet.append(row)
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+class TestAssetImport(AppTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.create_asset('Máy in cũ', device_code='MI-01')
+        db.session.commit()
+
+    def _run(self, rows, chunk_size=2):
+        job = AssetImportJob(filename='assets.xlsx', created_by_id=self.admin.id)
+        db.session.add(job)
+        db.session.commit()
+        return run_import(job.id, build_workbook(rows), chunk_size=chunk_size)
+
+    def test_import_validates_rows_and_reports_errors(self):
+        job = self._run([
+            ['Laptop A', 1500000, 2, 'Máy tính', 'Đang sử dụng', '15/03/2023', 'LT-01'],
+            ['Máy in cũ', 100, 1, 'Máy tính', None, None, None],      # trùng tên có sẵn
+            ['', 100, 1, 'Máy tính', None, None, None],               # thiếu tên
+            ['Laptop B', 'abc', 1, 'Máy tính', None, None, None],     # giá sai
+            ['Laptop C', 100, 0, 'Máy tính', None, None, None],       # số lượng < 1
+            ['Laptop A', 100, 1, 'Máy tính', None, None, None],       # trùng trong file
+            ['Laptop D', 100, 1, 'Máy tính', None, None, 'MI-01'],    # trùng mã thiết bị
+            ['Bàn họp', 2000000, 1, 'Nội thất', 'Bảo trì', None, None],
+        ])
+        self.assertEqual(job.status, 'completed')
+        self.assertEqual((job.processed_rows, job.success_count, job.error_count), (8, 2, 6))
+        self.assertIn('Dòng,Tên tài sản,Lỗi', job.error_report)
+        self.assertIn("3,Máy in cũ,Tên tài sản 'Máy in cũ' đã tồn tại", job.error_report)
+        self.assertIn("8,Laptop D,Mã thiết bị 'MI-01' đã tồn tại", job.error_report)
+
+        laptop = Asset.query.filter_by(name='Laptop A').one()
+        self.assertEqual((laptop.quantity, laptop.status, laptop.device_code), (2, 'active', 'LT-01'))
+        self.assertEqual(laptop.purchase_date, date(2023, 3, 15))
+        self.assertEqual(Asset.query.filter_by(name='Bàn họp').one().asset_type.name, 'Nội thất')
+        self.assertEqual(AuditLog.query.filter_by(module='assets', action='create').count(), 2)
+
+        # Bulk insert không qua event của Asset: bảng tổng hợp vẫn phải khớp khi tính lại
+        snapshot = sorted((r.asset_type_id, r.status, r.asset_count, r.total_quantity, r.total_value)
+                          for r in AssetTypeRollup.query.filter(AssetTypeRollup.asset_count > 0))
+        AssetTypeRollup.rebuild()
+        rebuilt = sorted((r.asset_type_id, r.status, r.asset_count, r.total_quantity, r.total_value)
+                         for r in AssetTypeRollup.query)
+        self.assertEqual(snapshot, rebuilt)
+
+    def test_out_of_range_quantity_reported_per_row(self):
+        job = self._run([
+            ['Máy chiếu', 100, 'inf', 'Máy tính', None, None, None],
+            ['Loa', 100, 1e30, 'Máy tính', None, None, None],
+            ['Micro', 'inf', 1, 'Máy tính', None, None, None],
+            ['Bảng', 100, 0.5, 'Máy tính', None, None, None],
+            ['Tủ', 100, 3, 'Nội thất', None, None, None],
+        ])
+        self.assertEqual(job.status, 'completed')
+        self.assertEqual((job.processed_rows, job.success_count, job.error_count), (5, 1, 4))
+        self.assertIn('2,Máy chiếu,Số lượng không hợp lệ', job.error_report)
+        self.assertIn('3,Loa,Số lượng không hợp lệ', job.error_report)
+        self.assertIn('4,Micro,Giá tiền không hợp lệ', job.error_report)
+        self.assertIn('5,Bảng,Số lượng phải >= 1', job.error_report)
+
+    def test_rerun_resets_progress(self):
+        rows = [['Router', 900000, 1, 'Thiết bị mạng', None, None, None],
+                ['Switch', 500000, 2, 'Thiết bị mạng', None, None, None]]
+        job = self._run(rows)
+        # Tác vụ được đưa lại hàng đợi chạy lại từ dòng 2: tiến độ không vượt quá tổng số dòng
+        job = run_import(job.id, build_workbook(rows))
+        self.assertEqual((job.processed_rows, job.success_count, job.error_count), (2, 0, 2))
+
+    def test_upload_runs_in_background(self):
+        client = self.client_for(self.admin)
+        data = build_workbook([['Router', 900000, 1, 'Thiết bị mạng', None, None, None]])
+        response = client.post('/assets/import', data={
+            'excel_file': (io.BytesIO(data), 'assets.xlsx')
+        }, content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 302)
+        job_id = AssetImportJob.query.one().id
+
+        progress = {}
+        for _ in range(50):
+            progress = client.get(f'/assets/import/jobs/{job_id}').get_json()
+            if progress['finished']:
+                break
+            time.sleep(0.1)
+        self.assertEqual(progress['status'], 'completed')
+        self.assertEqual(progress['success_count'], 1)
+
+    def test_missing_columns_rejected_before_queueing(self):
+        client = self.client_for(self.admin)
+        workbook = Workbook()
+        workbook.active.append(['Tên tài sản', 'Giá tiền'])
+        buffer = io.BytesIO()
+        workbook.save(buffer)
+        client.post('/assets/import', data={
+            'excel_file': (io.BytesIO(buffer.getvalue()), 'assets.xlsx')
+        }, content_type='multipart/form-data')
+        self.assertEqual(AssetImportJob.query.count(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
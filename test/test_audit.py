@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Test ghi nhật ký theo lô (utils/audit.py): cùng transaction nghiệp vụ và chế độ spool bất đồng bộ
+"""
+
+import json
+import os
+import shutil
+import socket
+import tempfile
+import time
+import unittest
+
+from sqlalchemy import event
+
+from app_test_base import AppTestCase
+from app import app, db
+from models import Asset, AuditLog
+from utils.audit import audit
+
+
+class TestAuditRecorder(AppTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client = self.client_for(self.admin)
+
+    def _count_commits(self):
+        commits = []
+        listener = lambda conn: commits.append(1)
+        event.listen(db.engine, 'commit', listener)
+        self.addCleanup(event.remove, db.engine, 'commit', listener)
+        return commits
+
+    def test_logged_in_same_commit_as_change(self):
+        asset = self.create_asset('Máy in')
+        db.session.commit()
+        commits = self._count_commits()
+        response = self.client.post(f'/assets/delete/{asset.id}')
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(commits), 1)
+        log = AuditLog.query.filter_by(module='assets', action='delete').one()
+        self.assertEqual((log.user_id, log.entity_id, log.details), (self.admin.id, asset.id, 'name=Máy in'))
+        self.assertIsNotNone(db.session.get(Asset, asset.id).deleted_at)
+
+    def test_rollback_discards_entries(self):
+        with app.test_request_context():
+            audit.record('assets', 'update', 1, 'bỏ', user_id=self.admin.id)
+            db.session.rollback()
+            audit.record('assets', 'update', 2, 'giữ', user_id=self.admin.id)
+            db.session.commit()
+        self.assertEqual([log.entity_id for log in AuditLog.query.all()], [2])
+
+    def test_entries_after_last_commit_written_after_request(self):
+        response = self.client.post('/asset-types/add', data={'name': 'Máy chiếu'})
+        self.assertTrue(response.get_json()['success'])
+        log = AuditLog.query.filter_by(module='asset_types', action='create').one()
+        self.assertEqual(log.details, 'name=Máy chiếu')
+
+    def test_anonymous_request_not_logged(self):
+        with app.test_request_context():
+            audit.record('assets', 'update', 1)
+            db.session.commit()
+        self.assertEqual(AuditLog.query.count(), 0)
+
+
+class TestAuditAsync(AppTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.spool_dir = tempfile.mkdtemp()
+        self.saved = {key: app.config[key] for key in ('AUDIT_ASYNC', 'AUDIT_SPOOL_DIR', 'AUDIT_FLUSH_INTERVAL_MS', 'AUDIT_BATCH_SIZE')}
+        app.config.update(AUDIT_ASYNC=True, AUDIT_SPOOL_DIR=self.spool_dir, AUDIT_FLUSH_INTERVAL_MS=60000)
+
+    def tearDown(self):
+        audit.stop()
+        app.config.update(self.saved)
+        shutil.rmtree(self.spool_dir, ignore_errors=True)
+        super().tearDown()
+
+    def test_batched_after_commit(self):
+        admin_id = self.admin.id
+        for i in range(3):
+            audit.record('assets', 'update', i, user_id=admin_id)
+        db.session.commit()
+        audit.flush()
+        self.assertEqual(sorted(log.entity_id for log in AuditLog.query.all()), [0, 1, 2])
+        self.assertEqual([name for name in os.listdir(self.spool_dir) if name.endswith('.flushing')], [])
+
+    def test_writer_flushes_full_batch(self):
+        app.config['AUDIT_BATCH_SIZE'] = 2
+        audit.record('assets', 'update', 1, user_id=self.admin.id)
+        audit.record('assets', 'update', 2, user_id=self.admin.id)
+        db.session.commit()
+        # Khoảng chờ 60 giây: chỉ có thể là thread nền ghi vì đủ lô
+        deadline = time.monotonic() + 5
+        while AuditLog.query.count() < 2 and time.monotonic() < deadline:
+            db.session.rollback()
+            time.sleep(0.05)
+        self.assertEqual(AuditLog.query.count(), 2)
+
+    def test_replays_spool_of_dead_process(self):
+        row = {'user_id': self.admin.id, 'module': 'users', 'action': 'update', 'entity_id': 7,
+               'details': None, 'created_at': '2025-03-01T08:00:00'}
+        orphan = os.path.join(self.spool_dir, f'audit-{socket.gethostname()}-999999999.jsonl')
+        with open(orphan, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(row) + '\n')
+        with open(orphan + '.3.flushing', 'w', encoding='utf-8') as f:
+            f.write(json.dumps(dict(row, entity_id=8)) + '\n')
+        db.session.commit()
+
+        audit.record('users', 'update', 9, user_id=self.admin.id)
+        db.session.commit()
+        audit.flush()
+        self.assertEqual(sorted(log.entity_id for log in AuditLog.query.all()), [7, 8, 9])
+        self.assertEqual(os.listdir(self.spool_dir), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Test nhật ký hệ thống: phân trang keyset và lưu trữ theo tháng (tra cứu liền mạch qua tệp lưu trữ)
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from flask_jwt_extended import create_access_token
+
+from app_test_base import AppTestCase
+from app import app, db
+from models import AuditLog, AuditLogArchive
+from utils.audit_log import AuditFilters, archive_audit_logs, search_audit_logs
+
+
+class TestAuditLog(AppTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.archive_dir = tempfile.mkdtemp()
+        self._saved_dir = app.config.get('AUDIT_ARCHIVE_DIR')
+        app.config['AUDIT_ARCHIVE_DIR'] = self.archive_dir
+        self.staff = self.create_user('nhanvien', self.user_role)
+        # 3 tháng x 10 dòng, cùng thời điểm theo cặp để kiểm tra thứ tự phụ theo id
+        for month in (1, 2, 3):
+            for i in range(10):
+                db.session.add(AuditLog(
+                    user_id=self.admin.id if i % 2 else self.staff.id,
+                    module='assets' if i % 3 else 'users', action='update', entity_id=i,
+                    details=f'm{month}-{i}', created_at=datetime(2025, month, 5, 8, 0, 0) + timedelta(minutes=i // 2),
+                ))
+        db.session.commit()
+
+    def tearDown(self):
+        app.config['AUDIT_ARCHIVE_DIR'] = self._saved_dir
+        shutil.rmtree(self.archive_dir, ignore_errors=True)
+        super().tearDown()
+
+    def _walk(self, filters, per_page=7):
+        details, after = [], None
+        while True:
+            page = search_audit_logs(filters, after, per_page)
+            details.extend(entry.details for entry in page['items'])
+            after = page['next_cursor']
+            if not after:
+                return details
+
+    def test_keyset_pages_are_complete_and_ordered(self):
+        expected = [log.details for log in AuditLog.query.order_by(AuditLog.created_at.desc(), AuditLog.id.desc())]
+        self.assertEqual(self._walk(AuditFilters()), expected)
+
+    def test_archived_months_stay_searchable(self):
+        before_all = self._walk(AuditFilters())
+        before_staff_users = self._walk(AuditFilters(user_id=self.staff.id, module='users'))
+
+        archives = archive_audit_logs(keep_months=1, now=datetime(2025, 4, 15))
+        self.assertEqual([(a.month, a.row_count) for a in archives], [('2025-01', 10), ('2025-02', 10)])
+        self.assertTrue(all(os.path.exists(os.path.join(self.archive_dir, a.path)) for a in archives))
+        self.assertEqual(AuditLog.query.count(), 10)
+
+        # Cùng bộ lọc, cùng thứ tự dù dữ liệu nằm trong bảng hay tệp lưu trữ
+        self.assertEqual(self._walk(AuditFilters()), before_all)
+        self.assertEqual(self._walk(AuditFilters(user_id=self.staff.id, module='users')), before_staff_users)
+        january = self._walk(AuditFilters(date_from=datetime(2025, 1, 1).date(), date_to=datetime(2025, 1, 31).date()))
+        self.assertEqual(len(january), 10)
+
+        # Dòng ghi muộn vào tháng đã lưu trữ thành phần mới của tháng đó
+        db.session.add(AuditLog(user_id=self.admin.id, module='assets', action='create',
+                                details='late', created_at=datetime(2025, 1, 20)))
+        db.session.commit()
+        self.assertEqual(self._walk(AuditFilters())[20], 'late')
+        archive_audit_logs(keep_months=1, now=datetime(2025, 4, 15))
+        self.assertEqual(AuditLogArchive.query.filter_by(month='2025-01').count(), 2)
+        self.assertEqual(self._walk(AuditFilters())[20], 'late')
+
+    def test_page_and_api(self):
+        archive_audit_logs(keep_months=1, now=datetime(2025, 4, 15))
+        client = self.client_for(self.admin)
+        response = client.get(f'/audit-logs?user_id={self.staff.id}')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Cũ hơn'.encode('utf-8'), response.data)
+
+        token = create_access_token(identity=str(self.admin.id))
+        api = app.test_client()
+        response = api.get('/api/v1/audit-logs?per_page=25', headers={'Authorization': f'Bearer {token}'})
+        data = response.get_json()
+        self.assertEqual(len(data['items']), 25)
+        self.assertTrue(data['items'][-1]['archived'])
+        response = api.get(f"/api/v1/audit-logs?per_page=25&after={data['next_cursor']}",
+                           headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(len(response.get_json()['items']), 5)
+        self.assertIsNone(response.get_json()['next_cursor'])
+
+        staff_token = create_access_token(identity=str(self.staff.id))
+        self.assertEqual(api.get('/api/v1/audit-logs', headers={'Authorization': f'Bearer {staff_token}'}).status_code, 403)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Test thu hồi JWT (revoked_token + bộ lọc Bloom) và cache danh tính user của REST API
+"""
+
+import unittest
+
+from flask_jwt_extended import create_access_token, decode_token
+from sqlalchemy import event
+
+from app_test_base import AppTestCase
+from app import app, db
+from models import DataVersion, RevokedToken
+from utils.timezone import now_vn
+from utils.auth_cache import BloomFilter, identity_cache, revocation_store
+
+
+class TestBloomFilter(unittest.TestCase):
+
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(1000, 0.01)
+        keys = [f'jti-{i}' for i in range(1000)]
+        for key in keys:
+            bloom.add(key)
+        self.assertTrue(all(key in bloom for key in keys))
+        false_positives = sum(f'other-{i}' in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+
+class TestAuthCache(AppTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.staff = self.create_user('nhanvien', self.user_role)
+        db.session.commit()
+        self.client = app.test_client()
+
+    def tearDown(self):
+        app.config['JWT_REVOCATION_VERSION_CHECK'] = 1
+        super().tearDown()
+
+    def _count_queries(self, fn):
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            result = fn()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+        return result, statements
+
+    def _login(self, username):
+        response = self.client.post('/api/v1/auth/login', json={'username': username, 'password': 'secret'})
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()
+
+    def _get(self, url, token):
+        return self.client.get(url, headers={'Authorization': f'Bearer {token}'})
+
+    def test_logout_revokes_tokens(self):
+        tokens = self._login('nhanvien')
+        self.assertEqual(self._get(f'/api/v1/users/{self.staff.id}', tokens['access_token']).status_code, 200)
+
+        # Token hợp lệ: kiểm tra thu hồi + danh tính không cần truy vấn khi cache đã nóng
+        _, statements = self._count_queries(lambda: self._get(f'/api/v1/users/{self.staff.id}', tokens['access_token']))
+        self.assertFalse([s for s in statements if 'revoked_token' in s or 'JOIN role' in s])
+
+        response = self.client.post('/api/v1/auth/logout', json={'refresh_token': tokens['refresh_token']},
+                                    headers={'Authorization': f"Bearer {tokens['access_token']}"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(RevokedToken.query.count(), 2)
+        self.assertEqual(self._get(f'/api/v1/users/{self.staff.id}', tokens['access_token']).status_code, 401)
+        response = self.client.post('/api/v1/auth/refresh',
+                                    headers={'Authorization': f"Bearer {tokens['refresh_token']}"})
+        self.assertEqual(response.status_code, 401)
+
+    def test_refresh_rotates_refresh_token(self):
+        tokens = self._login('nhanvien')
+        headers = {'Authorization': f"Bearer {tokens['refresh_token']}"}
+        response = self.client.post('/api/v1/auth/refresh', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        rotated = response.get_json()
+        self.assertNotEqual(rotated['refresh_token'], tokens['refresh_token'])
+        self.assertEqual(self.client.post('/api/v1/auth/refresh', headers=headers).status_code, 401)
+        self.assertEqual(self._get(f'/api/v1/users/{self.staff.id}', rotated['access_token']).status_code, 200)
+
+    def test_revocation_from_other_worker(self):
+        token = create_access_token(identity=str(self.staff.id))
+        payload = decode_token(token)
+        self.assertFalse(revocation_store.is_revoked(payload['jti']))
+        # Worker khác thu hồi: ghi thẳng bảng + tăng phiên bản (không qua tiến trình này)
+        db.session.execute(RevokedToken.__table__.insert().values(
+            jti=payload['jti'], token_type='access', user_id=self.staff.id, revoked_at=now_vn()))
+        db.session.execute(DataVersion.__table__.insert().values(key=DataVersion.TOKENS, version=99))
+        db.session.commit()
+        app.config['JWT_REVOCATION_VERSION_CHECK'] = 0
+        self.assertTrue(revocation_store.is_revoked(payload['jti']))
+        self.assertEqual(self._get(f'/api/v1/users/{self.staff.id}', token).status_code, 401)
+
+    def test_identity_cache_follows_user_changes(self):
+        admin_token = create_access_token(identity=str(self.admin.id))
+        self.assertEqual(self._get('/api/v1/users', admin_token).status_code, 200)
+        identity, statements = self._count_queries(lambda: identity_cache.get(self.admin.id))
+        self.assertEqual((identity.role_name, identity.is_active, statements), ('admin', True, []))
+
+        self.admin.role_id = self.user_role.id
+        db.session.commit()
+        self.assertEqual(self._get('/api/v1/users', admin_token).status_code, 403)
+
+        self.staff.soft_delete()
+        db.session.commit()
+        self.assertFalse(identity_cache.get(self.staff.id).is_active)
+        self.assertIsNone(identity_cache.get(12345))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Test bảng tổng hợp asset_type_rollup: cập nhật tăng dần qua event của Asset phải khớp với rebuild()
+"""
+
+import unittest
+
+from sqlalchemy import event
+
+from app_test_base import AppTestCase
+from app import db
+from models import Asset, AssetType, AssetTypeRollup
+from utils.timezone import now_vn
+
+
+class TestDashboardRollup(AppTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.medical = AssetType(name='Thiết bị y tế')
+        db.session.add(self.medical)
+        db.session.flush()
+        self.laptop = self.create_asset('Laptop', price=1000, quantity=2)
+        self.printer = self.create_asset('Máy in', price=500, quantity=None, status='maintenance')
+        self.monitor = self.create_asset('Màn hình', price=300, asset_type_id=self.medical.id)
+        db.session.commit()
+
+    def _rows(self):
+        rows = db.session.query(
+            AssetTypeRollup.asset_type_id, AssetTypeRollup.status, AssetTypeRollup.asset_count,
+            AssetTypeRollup.total_quantity, AssetTypeRollup.total_value,
+        ).filter(AssetTypeRollup.asset_count != 0).order_by(AssetTypeRollup.asset_type_id, AssetTypeRollup.status)
+        return [tuple(row) for row in rows]
+
+    def assertMatchesRebuild(self):
+        incremental = self._rows()
+        AssetTypeRollup.rebuild()
+        self.assertEqual(incremental, self._rows())
+        return incremental
+
+    def test_insert(self):
+        rows = self.assertMatchesRebuild()
+        self.assertIn((self.asset_type.id, 'active', 1, 2, 2000.0), rows)
+        self.assertIn((self.asset_type.id, 'maintenance', 1, 1, 500.0), rows)
+
+    def test_type_status_and_price_changes(self):
+        self.laptop.asset_type_id = self.medical.id
+        self.printer.status = 'active'
+        self.monitor.price = 450
+        self.monitor.quantity = 3
+        db.session.commit()
+        rows = self.assertMatchesRebuild()
+        self.assertIn((self.medical.id, 'active', 2, 5, 3350.0), rows)
+
+    def test_soft_and_hard_delete(self):
+        self.laptop.deleted_at = now_vn()
+        db.session.delete(self.printer)
+        db.session.commit()
+        self.assertEqual(self.assertMatchesRebuild(), [(self.medical.id, 'active', 1, 1, 300.0)])
+
+        # Khôi phục tài sản đã xóa mềm
+        self.laptop.deleted_at = None
+        db.session.commit()
+        self.assertMatchesRebuild()
+
+    def test_update_expired_instance(self):
+        # Sau commit thuộc tính đã hết hạn: giá trị cũ vẫn được nạp (active_history) trước khi ghi đè
+        db.session.expire(self.laptop)
+        self.laptop.status = 'maintenance'
+        self.laptop.price = 2000
+        db.session.commit()
+        rows = self.assertMatchesRebuild()
+        self.assertIn((self.asset_type.id, 'maintenance', 2, 3, 4500.0), rows)
+
+        asset = db.session.get(Asset, self.monitor.id)
+        db.session.expire(asset)
+        asset.asset_type_id = self.asset_type.id
+        db.session.commit()
+        self.assertNotIn(self.medical.id, [row[0] for row in self.assertMatchesRebuild()])
+
+
+    def test_apply_delta_is_single_upsert(self):
+        # Một câu lệnh INSERT ... ON CONFLICT: hai transaction cùng tạo dòng mới không đụng unique constraint
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        type_id = self.medical.id
+        connection = db.session.connection()
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            AssetTypeRollup.apply_delta(connection, type_id, 'lost', 1, 2, 50.0)
+            AssetTypeRollup.apply_delta(connection, type_id, 'lost', 1, 1, 25.0)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+        db.session.commit()
+        self.assertEqual(len(statements), 2)
+        self.assertTrue(all('ON CONFLICT' in statement for statement in statements))
+        self.assertIn((type_id, 'lost', 2, 3, 75.0), self._rows())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Test KPI Dashboard (utils/dashboard_stats.py): số liệu khớp cách đếm từng tài sản trước đây, số truy vấn cố định
+"""
+
+import unittest
+from contextlib import contextmanager
+from datetime import date
+
+from sqlalchemy import event
+
+from app_test_base import AppTestCase
+from app import db
+from models import AssetType, MaintenanceRecord
+from utils.dashboard_stats import compute_dashboard_stats
+from utils.timezone import now_vn
+
+TODAY = date(2025, 6, 15)
+
+
+class TestDashboardStats(AppTestCase):
+
+    def setUp(self):
+        super().setUp()
+        furniture = AssetType(name='Bàn ghế')
+        retired_type = AssetType(name='Loại cũ', deleted_at=now_vn())
+        db.session.add_all([furniture, retired_type])
+        db.session.flush()
+        self.furniture_id = furniture.id
+        laptop = self.create_asset('Laptop', price=1000, quantity=2, status='active')
+        old = self.create_asset('Máy cũ', price=500, status='inactive')
+        self.create_asset('Máy đang sửa', price=100, quantity=3, status='maintenance')
+        self.create_asset('Máy thanh lý', price=9999, status='disposed')
+        unclassified = self.create_asset('Chưa phân loại', price=50)
+        # Giá trị mặc định chỉ áp dụng khi chèn: đặt NULL sau đó (dữ liệu cũ/nhập Excel)
+        old.quantity = None
+        unclassified.status = None
+        self.create_asset('Đã xóa', price=1000, quantity=5, status='active', deleted_at=now_vn())
+        self.create_asset('Bàn họp', price=250, quantity=4, status='active', asset_type_id=furniture.id)
+        self.create_asset('Ghế thất lạc', price=10, status='lost', asset_type_id=furniture.id)
+        self.create_user('staff', self.user_role)
+        removed = self.create_user('removed', self.user_role)
+        removed.deleted_at = now_vn()
+
+        self.records = {}
+        for key, due, cost, deleted in (
+            ('overdue', date(2025, 6, 10), 100, False),
+            ('today', date(2025, 6, 15), 50, False),
+            ('horizon', date(2025, 7, 15), 0, False),
+            ('later', date(2025, 7, 16), 0, False),
+            ('no_due', None, 25, False),
+            ('deleted', date(2025, 6, 12), 1000, True),
+        ):
+            record = MaintenanceRecord(asset_id=laptop.id, request_date=date(2025, 1, 1), next_due_date=due,
+                                       cost=cost, deleted_at=now_vn() if deleted else None)
+            db.session.add(record)
+            db.session.flush()
+            self.records[key] = record.id
+        db.session.commit()
+
+    @contextmanager
+    def count_queries(self):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+    def test_asset_kpis(self):
+        stats = compute_dashboard_stats(today=TODAY)
+        # Đếm theo số lượng (NULL = 1), không tính tài sản xóa mềm; NULL/trạng thái lạ vào "khác"
+        self.assertEqual(stats['active_assets'], 6)
+        self.assertEqual(stats['inactive_assets'], 1)
+        self.assertEqual(stats['maintenance_assets'], 3)
+        self.assertEqual(stats['disposed_assets'], 1)
+        self.assertEqual(stats['other_assets'], 2)
+        self.assertEqual(stats['total_assets'], 12)
+        self.assertEqual(stats['total_value'], 3860)
+        self.assertEqual(stats['total_asset_types'], 2)
+        self.assertEqual(stats['total_users'], 2)
+        self.assertEqual(stats['asset_type_stats'], [
+            {'type_id': self.asset_type.id, 'type_name': 'Máy tính', 'total_count': 3, 'active_count': 1,
+             'inactive_count': 1, 'maintenance_count': 1, 'icon': 'fa-desktop'},
+            {'type_id': self.furniture_id, 'type_name': 'Bàn ghế', 'total_count': 2, 'active_count': 1,
+             'inactive_count': 0, 'maintenance_count': 0, 'icon': 'fa-couch'},
+        ])
+
+    def test_maintenance_kpis(self):
+        stats = compute_dashboard_stats(today=TODAY)
+        self.assertEqual(stats['maintenance_count'], 5)
+        self.assertEqual(stats['total_maintenance_cost'], 175)
+        self.assertEqual((stats['overdue_maintenance'], stats['due_soon_maintenance']), (1, 2))
+        self.assertEqual([r['id'] for r in stats['due_records']],
+                         [self.records['overdue'], self.records['today'], self.records['horizon']])
+        self.assertEqual([r['is_overdue'] for r in stats['due_records']], [True, False, False])
+        self.assertEqual(stats['due_records'][0]['asset_name'], 'Laptop')
+
+        # Danh sách bị giới hạn nhưng số đếm vẫn tính đủ
+        stats = compute_dashboard_stats(today=TODAY, due_limit=1)
+        self.assertEqual(len(stats['due_records']), 1)
+        self.assertEqual((stats['overdue_maintenance'], stats['due_soon_maintenance']), (1, 2))
+
+    def test_constant_query_count(self):
+        compute_dashboard_stats(today=TODAY)
+        with self.count_queries() as before:
+            compute_dashboard_stats(today=TODAY)
+        for i in range(30):
+            asset = self.create_asset(f'Tài sản {i}', status=('active', 'inactive', 'maintenance')[i % 3],
+                                      asset_type_id=(self.furniture_id if i % 2 else self.asset_type.id))
+            db.session.add(MaintenanceRecord(asset_id=asset.id, request_date=date(2025, 1, 1),
+                                             next_due_date=date(2025, 6, i % 28 + 1)))
+        db.session.commit()
+        with self.count_queries() as after:
+            stats = compute_dashboard_stats(today=TODAY)
+        self.assertEqual(len(after), len(before))
+        self.assertLessEqual(len(after), 8)
+        self.assertEqual(stats['total_assets'], 42)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Test engine tính khấu hao theo lô (utils/depreciation.py)
+"""
+
+import unittest
+from datetime import date
+
+from app_test_base import AppTestCase
+from app import db
+from models import AssetDepreciation
+
+
+class TestBatchDepreciation(AppTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.big = self.create_asset('Máy chủ', price=60000000, purchase_date=date(2022, 3, 15))
+        self.declining = self.create_asset('Máy phát', price=100000000, purchase_date=date(2021, 1, 1))
+        self.cheap = self.create_asset('Chuột', price=200000, purchase_date=date(2020, 1, 1))
+        self.new = self.create_asset('Laptop', price=40000000, purchase_date=date(2024, 6, 10))
+        db.session.commit()
+
+    def _rows(self):
+        return sorted(
+            (d.asset_id, d.period_year, d.period_month, round(d.depreciation_amount, 4),
+             round(d.accumulated_depreciation, 4), round(d.remaining_value, 4), d.method)
+            for d in AssetDepreciation.query.all()
+        )
+
+    def test_straight_line_accumulates_previous_periods(self):
+        client = self.client_for(self.admin)
+        ids = [self.big.id, self.cheap.id, self.new.id]
+        for year in (2023, 2024):
+            client.post('/assets/depreciation', data={'year': year, 'method': 'straight_line', 'asset_ids': ids})
+        rows = {(r.asset_id, r.period_year): r for r in AssetDepreciation.query.all()}
+        self.assertEqual(rows[(self.big.id, 2023)].depreciation_amount, 12000000)
+        self.assertEqual(rows[(self.big.id, 2024)].accumulated_depreciation, 24000000)
+        self.assertEqual(rows[(self.big.id, 2024)].remaining_value, 36000000)
+        # Nguyên giá < 30 triệu hoặc chưa đủ 12 tháng: không tính
+        self.assertNotIn((self.cheap.id, 2024), rows)
+        self.assertNotIn((self.new.id, 2024), rows)
+
+    def test_web_and_api_produce_same_rows(self):
+        client = self.client_for(self.admin)
+        ids = [self.big.id, self.declining.id, self.cheap.id, self.new.id]
+        periods = [(2023, None, 'straight_line'), (2024, 3, 'declining_balance'), (2024, 4, 'declining_balance')]
+
+        for year, month, method in periods:
+            response = client.post('/api/misa/assets/depreciation/calculate', json={
+                'year': year, 'month': month, 'method': method, 'asset_ids': ids
+            })
+            self.assertTrue(response.get_json()['success'])
+        api_rows = self._rows()
+
+        AssetDepreciation.query.delete()
+        db.session.commit()
+        for year, month, method in periods:
+            client.post('/assets/depreciation', data={
+                'year': year, 'month': month or '', 'method': method, 'asset_ids': ids
+            })
+        self.assertEqual(api_rows, self._rows())
+        self.assertEqual(len(api_rows), 6)
+
+    def test_recalculation_updates_existing_row(self):
+        client = self.client_for(self.admin)
+        payload = {'year': 2023, 'method': 'straight_line', 'asset_ids': [self.big.id]}
+        client.post('/api/misa/assets/depreciation/calculate', json=payload)
+        payload['method'] = 'declining_balance'
+        client.post('/api/misa/assets/depreciation/calculate', json=payload)
+        rows = AssetDepreciation.query.filter_by(asset_id=self.big.id).all()
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0].method, 'declining_balance')
+        self.assertEqual(rows[0].depreciation_amount, 60000000 * 0.2 * 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Test outbox email: request chỉ ghi hàng đợi, worker gửi theo lô qua một phiên SMTP, thử lại có giãn cách
+"""
+
+import unittest
+from datetime import timedelta
+from email import message_from_string
+from email.header import decode_header, make_header
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app_test_base import AppTestCase
+from smtp_debug_server import DebugSMTPServer
+from app import app, db
+from models import AssetTransfer, BackgroundJob, EmailOutbox
+from utils.email_outbox import queue_email
+from utils.jobs import job_runner
+from utils.timezone import now_vn
+
+MAIL_CONFIG_KEYS = (
+    'EMAIL_ENABLED', 'MAIL_SERVER', 'MAIL_PORT', 'MAIL_USE_TLS', 'MAIL_USE_SSL', 'MAIL_USERNAME',
+    'MAIL_DEFAULT_SENDER', 'MAIL_RATE_LIMIT', 'MAIL_MAX_PER_CONNECTION', 'JOB_WORKER_EMBEDDED',
+)
+
+
+class TestEmailOutbox(AppTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.smtp = DebugSMTPServer().start()
+        self._saved = {key: app.config.get(key) for key in MAIL_CONFIG_KEYS}
+        app.config.update({
+            'EMAIL_ENABLED': True, 'MAIL_SERVER': '127.0.0.1', 'MAIL_PORT': self.smtp.port,
+            'MAIL_USE_TLS': False, 'MAIL_USE_SSL': False, 'MAIL_USERNAME': '',
+            'MAIL_DEFAULT_SENDER': 'qlts@example.com', 'MAIL_RATE_LIMIT': 0, 'MAIL_MAX_PER_CONNECTION': 100,
+            # Gửi thủ công bằng run_pending() để test không phụ thuộc thread nền
+            'JOB_WORKER_EMBEDDED': False,
+        })
+
+    def tearDown(self):
+        app.config.update(self._saved)
+        self.smtp.stop()
+        super().tearDown()
+
+    def _outbox_jobs(self):
+        return BackgroundJob.query.filter_by(kind='email_outbox', status=BackgroundJob.QUEUED).all()
+
+    def test_batch_reuses_one_connection(self):
+        for i in range(5):
+            queue_email([f'user{i}@example.com'], f'Thư {i}', body_text='Xin chào')
+        # Nhiều email chỉ sinh một tác vụ gửi
+        self.assertEqual(len(self._outbox_jobs()), 1)
+        self.assertEqual(job_runner.run_pending(), 1)
+
+        self.assertEqual(len(self.smtp.messages), 5)
+        self.assertEqual(self.smtp.connections, 1)
+        self.assertEqual(EmailOutbox.query.filter_by(status=EmailOutbox.SENT).count(), 5)
+        self.assertEqual(self._outbox_jobs(), [])
+
+        # Giới hạn số thư mỗi phiên: kết nối lại sau mỗi 2 thư
+        app.config['MAIL_MAX_PER_CONNECTION'] = 2
+        for i in range(5):
+            queue_email([f'next{i}@example.com'], f'Thư {i}', body_text='Xin chào')
+        job_runner.run_pending()
+        self.assertEqual(self.smtp.connections, 1 + 3)
+
+    def test_transient_failures_retry_with_backoff(self):
+        queue_email(['ok@example.com'], 'Thư 1', body_text='a')
+        busy = queue_email(['busy@example.com'], 'Thư 2', body_text='b')
+        rejected = queue_email(['reject@example.com'], 'Thư 3', body_text='c')
+        job_runner.run_pending()
+
+        self.assertEqual([m[1] for m in self.smtp.messages], [['ok@example.com']])
+        db.session.refresh(busy)
+        db.session.refresh(rejected)
+        self.assertEqual(rejected.status, EmailOutbox.FAILED)
+        self.assertEqual((busy.status, busy.attempts), (EmailOutbox.PENDING, 1))
+        self.assertGreater(busy.next_attempt_at, now_vn())
+
+        # Tác vụ gửi kế tiếp được hẹn đúng lúc email tới hạn thử lại, chưa chạy trước giờ
+        job = self._outbox_jobs()[0]
+        self.assertEqual(job.run_after, busy.next_attempt_at)
+        self.assertEqual(job_runner.run_pending(), 0)
+
+        past = now_vn() - timedelta(seconds=1)
+        busy.next_attempt_at = past
+        job.run_after = past
+        db.session.commit()
+        self.assertEqual(job_runner.run_pending(), 1)
+        db.session.refresh(busy)
+        self.assertEqual(busy.attempts, 2)
+
+    def test_transfer_email_is_queued_not_sent_in_request(self):
+        receiver = self.create_user('nguoinhan', self.admin_role)
+        asset = self.create_asset('Máy chiếu', quantity=2)
+        db.session.commit()
+        client = self.client_for(self.admin)
+        response = client.post('/transfer/create', data={
+            'asset_id': asset.id, 'to_user_id': receiver.id, 'quantity': 1, 'send_email': '1'
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.smtp.messages, [])
+        transfer = AssetTransfer.query.one()
+        email = EmailOutbox.query.one()
+        self.assertEqual((email.related_type, email.related_id, email.recipients),
+                         ('transfer', transfer.id, ['nguoinhan@example.com']))
+
+        client.post(f'/transfer/resend-email/{transfer.id}')
+        self.assertEqual(EmailOutbox.query.count(), 2)
+        job_runner.run_pending()
+        self.assertEqual(len(self.smtp.messages), 2)
+        subject = str(make_header(decode_header(message_from_string(self.smtp.messages[0][2])['Subject'])))
+        self.assertIn(transfer.transfer_code, subject)
+
+    def test_bulk_resend_queues_once_without_duplicates(self):
+        receiver = self.create_user('nguoinhan', self.admin_role)
+        transfers = []
+        for i in range(3):
+            transfer = AssetTransfer(
+                transfer_code=f'BG-{i}', from_user_id=self.admin.id, to_user_id=receiver.id,
+                asset_id=self.create_asset(f'Tài sản {i}').id, quantity=1, expected_quantity=1,
+                confirmation_token=f'token-{i}', token_expires_at=now_vn() + timedelta(days=1),
+            )
+            db.session.add(transfer)
+            transfers.append(transfer)
+        db.session.commit()
+        # Bàn giao đầu đã có email đang chờ: không xếp thêm
+        queue_email(['nguoinhan@example.com'], 'Thư cũ', related_type='transfer', related_id=transfers[0].id)
+
+        client = self.client_for(self.admin)
+        commits = []
+
+        def after_commit(session):
+            commits.append(session)
+
+        event.listen(Session, 'after_commit', after_commit)
+        try:
+            client.post('/transfer/resend-email/pending')
+        finally:
+            event.remove(Session, 'after_commit', after_commit)
+        related = sorted(email.related_id for email in EmailOutbox.query.filter_by(related_type='transfer'))
+        self.assertEqual(related, sorted([transfers[0].id, transfers[1].id, transfers[2].id]))
+        self.assertEqual(len(commits), 1)
+        self.assertEqual(len(self._outbox_jobs()), 1)
+
+        # Bấm lần nữa khi các email còn chờ gửi: không tạo thư trùng
+        client.post('/transfer/resend-email/pending')
+        self.assertEqual(EmailOutbox.query.count(), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
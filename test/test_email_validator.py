@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Test xác thực email hàng loạt: cache MX theo tên miền và tra song song (resolver giả, không cần mạng)
+"""
+
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dns.resolver
+
+from utils import email_validator
+from utils.email_validator import MX_ERROR, MX_FOUND, MX_MISSING, check_mx_record, mx_cache, set_mx_resolver, validate_emails
+
+
+class FakeResolver:
+    """Trả MX theo bảng cho trước, đếm số lần gọi và số lời gọi chạy đồng thời"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, domain):
+        with self._lock:
+            self.calls.append(domain)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.delay)
+            if domain.startswith('nx'):
+                raise dns.resolver.NXDOMAIN()
+            if domain.startswith('slow'):
+                raise dns.resolver.Timeout()
+            return [{'priority': 10, 'exchange': f'mx.{domain}.'}]
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+class TestEmailValidator(unittest.TestCase):
+
+    def setUp(self):
+        self.resolver = FakeResolver()
+        set_mx_resolver(self.resolver)
+
+    def tearDown(self):
+        set_mx_resolver(None)
+        mx_cache.negative_ttl = email_validator.MX_NEGATIVE_TTL
+
+    def test_bulk_validation_dedupes_domains(self):
+        emails = [f'user{i}@mhsolution.vn' for i in range(50)] + [f'u{i}@Gmail.com' for i in range(30)]
+        emails += ['sai-dinh-dang', 'ai@nx-khong-ton-tai.vn']
+        results = validate_emails(emails)
+
+        self.assertEqual(sorted(self.resolver.calls), ['gmail.com', 'mhsolution.vn', 'nx-khong-ton-tai.vn'])
+        self.assertTrue(all(r['valid'] for r in results[:80]))
+        self.assertEqual(results[0]['mx_records'], [{'priority': 10, 'exchange': 'mx.mhsolution.vn.'}])
+        self.assertFalse(results[80]['syntax_valid'])
+        self.assertEqual((results[81]['valid'], results[81]['mx_status']), (False, MX_MISSING))
+
+        # Lần sau dùng cache, không tra lại
+        validate_emails(['khac@mhsolution.vn'])
+        self.assertEqual(len(self.resolver.calls), 3)
+
+    def test_domains_resolved_concurrently(self):
+        self.resolver.delay = 0.2
+        started = time.monotonic()
+        results = validate_emails([f'a@domain{i}.vn' for i in range(4)] * 3, max_workers=4)
+        elapsed = time.monotonic() - started
+        self.assertEqual(len(self.resolver.calls), 4)
+        self.assertGreater(self.resolver.max_active, 1)
+        self.assertLess(elapsed, 0.6)
+        self.assertTrue(all(r['mx_status'] == MX_FOUND for r in results))
+
+    def test_negative_and_error_results_expire(self):
+        mx_cache.negative_ttl = 0
+        self.assertFalse(check_mx_record('nx.vn')[0])
+        self.assertFalse(check_mx_record('nx.vn')[0])
+        self.assertEqual(self.resolver.calls, ['nx.vn', 'nx.vn'])
+
+        result = validate_emails(['a@slow.vn'])[0]
+        self.assertEqual((result['valid'], result['mx_status']), (False, MX_ERROR))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Test sinh danh mục kiểm kê bằng INSERT ... SELECT (đồng bộ và tác vụ nền theo lô, chạy tiếp được)
+"""
+
+import json
+import unittest
+from unittest import mock
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from app_test_base import AppTestCase
+from app import app, db
+from models import BackgroundJob, Inventory, InventoryLog, InventoryResult
+from utils.inventory_lines import _insert_lines
+from utils.jobs import job_runner
+
+
+class TestInventoryLines(AppTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self._saved = {key: app.config.get(key) for key in (
+            'JOB_WORKER_EMBEDDED', 'INVENTORY_LINES_SYNC_LIMIT', 'INVENTORY_LINES_CHUNK_SIZE')}
+        app.config['JOB_WORKER_EMBEDDED'] = False
+        self.assets = [self.create_asset(f'Tài sản {i}', price=100 * i, quantity=i % 3) for i in range(1, 8)]
+        self.create_asset('Đã thanh lý', status='disposed')
+        self.inv = Inventory(inventory_code='KK-01', inventory_name='Kiểm kê cuối năm', created_by_id=self.admin.id,
+                             scope_type='all_ward', status='draft')
+        db.session.add(self.inv)
+        db.session.commit()
+        self.client = self.client_for(self.admin)
+
+    def tearDown(self):
+        app.config.update(self._saved)
+        super().tearDown()
+
+    def _generate(self, **kwargs):
+        return self.client.post(f'/api/inventories/{self.inv.id}/generate-lines', **kwargs)
+
+    def test_sync_generation_skips_existing_lines(self):
+        db.session.add(InventoryResult(inventory_id=self.inv.id, asset_id=self.assets[0].id, book_value=1))
+        db.session.commit()
+        data = self._generate().get_json()
+        self.assertEqual((data['created'], data['skipped']), (6, 1))
+        self.assertEqual(self._generate().get_json()['created'], 0)
+
+        line = InventoryResult.query.filter_by(inventory_id=self.inv.id, asset_id=self.assets[2].id).one()
+        # Số lượng 0 trong sổ được tính là 1 như trước
+        self.assertEqual((line.book_quantity, line.book_value, line.book_status), (1, 300, 'active'))
+        self.assertEqual(InventoryResult.query.count(), 7)
+        self.assertEqual(db.session.get(Inventory, self.inv.id).status, 'in_progress')
+
+    def test_unique_line_per_asset(self):
+        db.session.add(InventoryResult(inventory_id=self.inv.id, asset_id=self.assets[0].id, book_value=1))
+        db.session.commit()
+        db.session.add(InventoryResult(inventory_id=self.inv.id, asset_id=self.assets[0].id, book_value=1))
+        with self.assertRaises(IntegrityError):
+            db.session.commit()
+        db.session.rollback()
+
+    def test_racing_generation_skips_conflicts(self):
+        # Lần sinh khác vừa chèn dòng sau khi NOT EXISTS đã được kiểm: dòng trùng bị bỏ qua, không lỗi
+        db.session.add(InventoryResult(inventory_id=self.inv.id, asset_id=self.assets[0].id, book_value=1))
+        db.session.commit()
+        passed_check = mock.Mock()
+        passed_check.where.return_value = select(InventoryResult.id).where(db.false()).exists()
+        with mock.patch('utils.inventory_lines.exists', return_value=passed_check):
+            self.assertEqual(_insert_lines(self.inv), 6)
+        db.session.commit()
+        self.assertEqual(InventoryResult.query.filter_by(inventory_id=self.inv.id).count(), 7)
+
+    def test_background_generation_resumes_from_cursor(self):
+        app.config.update(INVENTORY_LINES_SYNC_LIMIT=5, INVENTORY_LINES_CHUNK_SIZE=3)
+        response = self._generate()
+        self.assertEqual(response.status_code, 202)
+        job_id = response.get_json()['job_id']
+        # Gọi lại khi tác vụ còn trong hàng đợi: dùng lại tác vụ cũ
+        self.assertEqual(self._generate().get_json()['job_id'], job_id)
+
+        # Giả lập worker đã làm xong lô đầu rồi chết: lô đó đã có dòng, con trỏ nằm trong tham số tác vụ
+        first = sorted(asset.id for asset in self.assets)[:3]
+        for asset_id in first:
+            db.session.add(InventoryResult(inventory_id=self.inv.id, asset_id=asset_id, book_value=0))
+        job = db.session.get(BackgroundJob, job_id)
+        job.params = json.dumps({'inventory_id': self.inv.id, 'after_asset_id': first[-1], 'created': 3})
+        db.session.commit()
+
+        self.assertEqual(job_runner.run_pending(), 1)
+        db.session.expire_all()
+        job = db.session.get(BackgroundJob, job_id)
+        self.assertEqual(job.status, BackgroundJob.COMPLETED, job.message)
+        self.assertEqual((job.progress_done, job.progress_total), (7, 7))
+        self.assertEqual(job.params_dict['created'], 7)
+        self.assertEqual(InventoryResult.query.filter_by(inventory_id=self.inv.id).count(), 7)
+        log = InventoryLog.query.filter_by(action='generate_book_lines').one()
+        self.assertEqual(json.loads(log.payload), {'created': 7, 'skipped': 0})
+
+    def test_results_batch(self):
+        self._generate()
+        other = self.create_asset('Ngoài phạm vi', status='disposed')
+        db.session.commit()
+        a, b, c = self.assets[:3]
+        payload = {'results': [
+            {'asset_id': a.id, 'actual_quantity': 1, 'actual_condition': 'in_use', 'actual_value': 50},
+            {'asset_id': b.id, 'actual_condition': 'missing', 'actual_quantity': 0},
+            {'asset_id': other.id, 'actual_condition': 'in_use'},
+            {'asset_id': c.id, 'actual_condition': 'broken'},
+            {'actual_condition': 'in_use'},
+            {'asset_id': b.id, 'actual_condition': 'minor_damage', 'notes': 'Quét lại'},
+        ]}
+        response = self.client.post(f'/api/inventories/{self.inv.id}/results:batch', json=payload)
+        data = response.get_json()
+        self.assertTrue(data['success'])
+        self.assertEqual((data['updated'], data['failed']), (2, 3))
+        self.assertEqual([e['index'] for e in data['errors']], [2, 3, 4])
+
+        lines = {line.asset_id: line for line in InventoryResult.query.filter_by(inventory_id=self.inv.id)}
+        self.assertEqual((lines[a.id].actual_condition, lines[a.id].difference), ('in_use', 50 - 100))
+        self.assertEqual(lines[a.id].checked_by_id, self.admin.id)
+        self.assertEqual((lines[b.id].actual_condition, lines[b.id].notes), ('minor_damage', 'Quét lại'))
+        self.assertIsNone(lines[c.id].actual_condition)
+        log = InventoryLog.query.filter_by(action='input_result_batch').one()
+        self.assertEqual(json.loads(log.payload), {'updated': 2, 'failed': 3})
+
+    def test_results_batch_limits(self):
+        url = f'/api/inventories/{self.inv.id}/results:batch'
+        self.assertEqual(self.client.post(url, json={'results': []}).status_code, 400)
+        app.config['INVENTORY_RESULTS_BATCH_MAX'] = 1
+        try:
+            response = self.client.post(url, json={'results': [{'asset_id': 1}, {'asset_id': 2}]})
+            self.assertEqual(response.status_code, 413)
+        finally:
+            app.config['INVENTORY_RESULTS_BATCH_MAX'] = 5000
+
+
+if __name__ == '__main__':
+    unittest.main()
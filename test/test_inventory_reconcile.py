@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Test đối chiếu kiểm kê: tổng hợp thiếu/thừa/chênh lệch bằng pandas và ảnh chụp lưu khi duyệt & khóa
+"""
+
+import json
+import unittest
+
+from app_test_base import AppTestCase
+from app import db
+from models import AssetType, Inventory, InventoryReconciliation, InventoryResult, InventorySurplusAsset
+from utils.inventory_lines import apply_results_batch, generate_book_lines
+from utils.inventory_reconcile import get_reconciliation, reconcile
+
+
+class TestInventoryReconcile(AppTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.other_type = AssetType(name='Máy tính')
+        db.session.add(self.other_type)
+        db.session.flush()
+        self.assets = [self.create_asset(f'Bàn {i}') for i in range(4)]
+        self.other = self.create_asset('Laptop', price=500000, asset_type_id=self.other_type.id)
+        self.inv = Inventory(inventory_code='KK-03', inventory_name='Kiểm kê cuối năm', created_by_id=self.admin.id,
+                             scope_type='all_ward', status='draft')
+        db.session.add(self.inv)
+        db.session.flush()
+        generate_book_lines(self.inv, self.admin.id)
+        apply_results_batch(self.inv, [
+            {'asset_id': self.assets[0].id, 'actual_condition': 'in_use'},
+            {'asset_id': self.assets[1].id, 'actual_condition': 'missing'},
+            {'asset_id': self.assets[2].id, 'actual_condition': 'minor_damage', 'actual_value': 800000},
+        ], self.admin.id)
+        db.session.add(InventorySurplusAsset(inventory_id=self.inv.id, name='Ghế thừa', quantity=2,
+                                             asset_type_id=self.asset_type.id))
+        db.session.commit()
+
+    def test_totals_and_breakdown(self):
+        data = reconcile(self.inv)
+        totals = data['totals']
+        self.assertEqual((totals['lines'], totals['checked'], totals['unchecked'], totals['missing']), (5, 3, 2, 1))
+        self.assertEqual(totals['book_value'], 4500000)
+        self.assertEqual(totals['value_difference'], -1200000)
+        self.assertEqual(totals['missing_value'], 1000000)
+        self.assertEqual(data['conditions'], {'unchecked': 2, 'in_use': 1, 'missing': 1, 'minor_damage': 1})
+
+        by_type = {record['group']: record for record in data['by_type']}
+        self.assertEqual(by_type[self.asset_type.id]['lines'], 4)
+        self.assertEqual(by_type[self.asset_type.id]['conditions'],
+                         {'in_use': 1, 'minor_damage': 1, 'missing': 1, 'unchecked': 1})
+        self.assertEqual(by_type[self.other_type.id]['name'], 'Máy tính')
+        self.assertEqual(by_type[self.other_type.id]['conditions'], {'unchecked': 1})
+        self.assertEqual([record['group'] for record in data['by_location']], [None])
+        self.assertEqual((data['surplus']['items'], data['surplus']['quantity']), (1, 2))
+        self.assertEqual(data['surplus']['by_type'], [{'group': self.asset_type.id, 'items': 1, 'quantity': 2}])
+
+    def test_approve_lock_saves_snapshot_and_reads_it(self):
+        self.inv.status = 'submitted'
+        db.session.commit()
+        client = self.client_for(self.admin)
+        response = client.post(f'/api/inventories/{self.inv.id}/approve-lock')
+        self.assertEqual(response.status_code, 200, response.data)
+        snapshot = InventoryReconciliation.query.filter_by(inventory_id=self.inv.id).one()
+        self.assertEqual(snapshot.summary_dict['totals']['missing'], 1)
+
+        # Đợt đã khóa: đọc ảnh chụp, không tính lại từ inventory_result
+        stored = snapshot.summary_dict
+        stored['totals']['missing'] = 99
+        snapshot.summary = json.dumps(stored)
+        db.session.commit()
+        response = client.get(f'/api/inventories/{self.inv.id}/reconciliation')
+        self.assertEqual(response.status_code, 200, response.data)
+        data = response.get_json()['data']
+        self.assertEqual((data['status'], data['totals']['missing']), ('approved_locked', 99))
+
+        # Dòng bị ghi sau khi chụp (sync_seq lệch) thì tính lại và lưu đè
+        line = InventoryResult.query.filter_by(inventory_id=self.inv.id, asset_id=self.assets[3].id).one()
+        line.actual_condition = 'missing'
+        db.session.commit()
+        self.assertEqual(get_reconciliation(self.inv)['totals']['missing'], 2)
+        self.assertEqual(InventoryReconciliation.query.filter_by(inventory_id=self.inv.id).one()
+                         .summary_dict['totals']['missing'], 2)
+
+    def test_unlock_discards_snapshot(self):
+        self.inv.status = 'submitted'
+        db.session.commit()
+        self.client_for(self.admin).post(f'/api/inventories/{self.inv.id}/approve-lock')
+        super_admin = self.create_user('sa', self.admin_role)
+        client = self.client_for(super_admin)
+        with client.session_transaction() as sess:
+            sess['role'] = 'super_admin'
+        response = client.post(f'/api/inventories/{self.inv.id}/unlock', json={'reason': 'Sửa kết quả'})
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(InventoryReconciliation.query.filter_by(inventory_id=self.inv.id).count(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
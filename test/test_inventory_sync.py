@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Test đồng bộ offline dòng kiểm kê: ảnh chụp + kéo thay đổi theo cursor, đẩy lên có phát hiện xung đột
+"""
+
+import gzip
+import json
+import unittest
+from unittest import mock
+
+from flask_jwt_extended import create_access_token
+
+from app_test_base import AppTestCase
+from app import app, db
+from models import Inventory, InventoryResult, InventoryTeam, InventoryTeamMember
+from utils import inventory_sync
+from utils.inventory_lines import generate_book_lines
+
+SYNC_URL = '/api/v1/inventory/inventories/{}/sync'
+
+
+class TestInventorySync(AppTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.assets = [self.create_asset(f'Tài sản {i}', device_code=f'TS-{i}') for i in range(5)]
+        self.inv = Inventory(inventory_code='KK-02', inventory_name='Kiểm kê kho', created_by_id=self.admin.id,
+                             scope_type='all_ward', status='draft')
+        db.session.add(self.inv)
+        db.session.flush()
+        generate_book_lines(self.inv, self.admin.id)
+        self.member = self.create_user('kiemke', self.user_role)
+        self.outsider = self.create_user('khac', self.user_role)
+        team = InventoryTeam(inventory_id=self.inv.id, name='Tổ 1', leader_id=self.admin.id)
+        db.session.add(team)
+        db.session.flush()
+        db.session.add(InventoryTeamMember(team_id=team.id, user_id=self.member.id, role='member'))
+        db.session.commit()
+        self.client = app.test_client()
+        self.url = SYNC_URL.format(self.inv.id)
+
+    def _headers(self, user, **extra):
+        return {'Authorization': f'Bearer {create_access_token(identity=str(user.id))}', **extra}
+
+    def _pull(self, cursor=None, limit=None, user=None):
+        params = {k: v for k, v in (('cursor', cursor), ('limit', limit)) if v is not None}
+        response = self.client.get(self.url, query_string=params, headers=self._headers(user or self.member))
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.get_json()
+
+    def _pull_all(self, cursor=None, limit=2):
+        rows = []
+        while True:
+            page = self._pull(cursor, limit)
+            rows.extend(page['rows'])
+            cursor = page['cursor']
+            if not page['has_more']:
+                return rows, cursor, page['fields']
+
+    def _push(self, changes):
+        response = self.client.post(self.url, json={'changes': changes}, headers=self._headers(self.member))
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.get_json()
+
+    def test_snapshot_then_delta(self):
+        rows, cursor, fields = self._pull_all()
+        self.assertEqual(len(rows), 5)
+        by_asset = {row[fields.index('asset_id')]: dict(zip(fields, row)) for row in rows}
+        self.assertEqual(by_asset[self.assets[0].id]['device_code'], 'TS-0')
+        self.assertEqual(self._pull(cursor)['rows'], [])
+
+        # Sửa qua ORM (như nhập từng tài sản): dòng trả về trong lần kéo kế tiếp, row_version tăng
+        line = InventoryResult.query.filter_by(inventory_id=self.inv.id, asset_id=self.assets[3].id).one()
+        line.actual_condition = 'in_use'
+        db.session.commit()
+        page = self._pull(cursor)
+        self.assertEqual(len(page['rows']), 1)
+        changed = dict(zip(fields, page['rows'][0]))
+        self.assertEqual((changed['actual_condition'], changed['row_version']), ('in_use', 2))
+        self.assertEqual(self._pull(page['cursor'])['rows'], [])
+
+    def test_push_detects_conflicts(self):
+        rows, cursor, fields = self._pull_all()
+        asset_a, asset_b = self.assets[0].id, self.assets[1].id
+        outcome = self._push([
+            {'asset_id': asset_a, 'row_version': 1, 'actual_condition': 'in_use', 'actual_quantity': 1},
+            {'asset_id': asset_b, 'actual_condition': 'in_use'},
+        ])
+        self.assertEqual((outcome['updated'], outcome['failed'], outcome['conflicts']), (1, 1, 0))
+        self.assertEqual(outcome['applied'], [{'asset_id': asset_a, 'row_version': 2}])
+
+        # Máy khác đẩy dựa trên phiên bản cũ: xung đột, không ghi đè
+        outcome = self._push([{'asset_id': asset_a, 'row_version': 1, 'actual_condition': 'missing'}])
+        self.assertEqual(outcome['conflicts'], 1)
+        self.assertEqual(outcome['errors'][0]['row_version'], 2)
+        line = InventoryResult.query.filter_by(inventory_id=self.inv.id, asset_id=asset_a).one()
+        self.assertEqual(line.actual_condition, 'in_use')
+
+        page = self._pull(cursor)
+        self.assertEqual([row[fields.index('asset_id')] for row in page['rows']], [asset_a])
+
+    def test_concurrent_pushes_from_same_version(self):
+        asset_id = self.assets[2].id
+        table = InventoryResult.__table__
+        next_sync_seq = Inventory.next_sync_seq
+        other_pushed = []
+
+        def other_tablet_commits_first(connection, inventory_id):
+            # Máy khác đẩy cùng dòng từ phiên bản 1 và commit trong lúc lần đẩy này chờ khóa đợt
+            if not other_pushed:
+                other_pushed.append(True)
+                connection.execute(table.update().where(
+                    table.c.inventory_id == inventory_id, table.c.asset_id == asset_id
+                ).values(actual_condition='missing', row_version=2))
+            return next_sync_seq(connection, inventory_id)
+
+        with mock.patch.object(Inventory, 'next_sync_seq', staticmethod(other_tablet_commits_first)):
+            outcome = self._push([{'asset_id': asset_id, 'row_version': 1, 'actual_condition': 'in_use'}])
+        self.assertEqual((outcome['updated'], outcome['conflicts']), (0, 1))
+        self.assertEqual(outcome['errors'][0]['row_version'], 2)
+        line = InventoryResult.query.filter_by(inventory_id=self.inv.id, asset_id=asset_id).one()
+        self.assertEqual((line.actual_condition, line.row_version), ('missing', 2))
+
+    def test_access_and_gzip(self):
+        response = self.client.get(self.url, headers=self._headers(self.outsider))
+        self.assertEqual(response.status_code, 403)
+        response = self.client.get(self.url, query_string={'cursor': 'x'}, headers=self._headers(self.member))
+        self.assertEqual(response.status_code, 400)
+
+        with mock.patch.object(inventory_sync, 'GZIP_MIN_SIZE', 0):
+            response = self.client.get(self.url, headers=self._headers(self.member, **{'Accept-Encoding': 'gzip'}))
+        self.assertEqual(response.headers.get('Content-Encoding'), 'gzip')
+        self.assertEqual(len(json.loads(gzip.decompress(response.data))['rows']), 5)
+
+        self.inv.status = 'submitted'
+        db.session.commit()
+        response = self.client.post(self.url, json={'changes': [{'asset_id': 1, 'row_version': 1}]},
+                                    headers=self._headers(self.member))
+        self.assertEqual(response.status_code, 409)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Test hàng đợi tác vụ nền (background_job): xuất file nền, hủy, nhận tác vụ và chạy lại khi worker chết
+"""
+
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from datetime import timedelta
+
+from app_test_base import AppTestCase
+from app import app, db
+from models import BackgroundJob
+from utils.jobs import enqueue, job_handler, job_runner
+from utils.timezone import now_vn
+
+_calls = []
+
+
+@job_handler('test_echo')
+def _echo_job(ctx):
+    ctx.progress(1, 2, 'Nửa chặng')
+    _calls.append(ctx.params['value'])
+    ctx.progress(2, 2)
+    return 'Xong'
+
+
+class TestBackgroundJobs(AppTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # Chạy tác vụ thủ công bằng run_pending() để test không phụ thuộc thread nền
+        self.export_dir = tempfile.mkdtemp()
+        self._saved = {key: app.config.get(key) for key in ('JOB_WORKER_EMBEDDED', 'EXPORT_DIR')}
+        app.config['JOB_WORKER_EMBEDDED'] = False
+        app.config['EXPORT_DIR'] = self.export_dir
+        _calls.clear()
+        self.create_asset('Máy tính xách tay', device_code='TS-001')
+        db.session.commit()
+        self.client = self.client_for(self.admin)
+
+    def tearDown(self):
+        app.config.update(self._saved)
+        shutil.rmtree(self.export_dir, ignore_errors=True)
+        super().tearDown()
+
+    def test_export_in_background(self):
+        response = self.client.get('/assets/export/csv?background=1')
+        self.assertEqual(response.status_code, 302)
+        job = BackgroundJob.query.one()
+        self.assertIn(f'/jobs/{job.id}', response.headers['Location'])
+        self.assertEqual(job.status, BackgroundJob.QUEUED)
+
+        self.assertEqual(job_runner.run_pending(), 1)
+        status = self.client.get(f'/jobs/{job.id}/status').get_json()
+        self.assertEqual(status['status'], BackgroundJob.COMPLETED, status['message'])
+        self.assertTrue(status['has_result'])
+
+        response = self.client.get(f'/jobs/{job.id}/download')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('attachment', response.headers['Content-Disposition'])
+        self.assertIn('TS-001', response.get_data().decode('utf-8-sig'))
+        response.close()
+
+        # Người khác không thấy tác vụ của admin
+        other = self.create_user('nhanvien', self.user_role)
+        db.session.commit()
+        self.assertEqual(self.client_for(other).get(f'/jobs/{job.id}').status_code, 404)
+
+    def test_export_params_keep_only_identity(self):
+        with self.client.session_transaction() as sess:
+            sess['csrf_secret'] = 'bí mật'
+        self.client.get('/assets/export/csv?background=1')
+        job = BackgroundJob.query.one()
+        self.assertNotIn('session', job.params_dict)
+        self.assertNotIn('bí mật', job.params)
+        self.assertEqual((job.params_dict['user_id'], job.params_dict['role']), (self.admin.id, 'admin'))
+
+        # Vai trò bị hạ sau khi xếp hàng: tác vụ không chạy với quyền cũ
+        self.admin.role_id = self.user_role.id
+        db.session.commit()
+        job_runner.run_pending()
+        db.session.refresh(job)
+        self.assertEqual(job.status, BackgroundJob.FAILED)
+        self.assertIn('Vai trò', job.message)
+
+    def test_cancel_queued_job(self):
+        job = enqueue('test_echo', {'value': 1}, user_id=self.admin.id)
+        self.client.post(f'/jobs/{job.id}/cancel')
+        self.assertEqual(job_runner.run_pending(), 0)
+        db.session.refresh(job)
+        self.assertEqual(job.status, BackgroundJob.CANCELLED)
+        self.assertEqual(_calls, [])
+
+    def test_claim_is_exclusive_and_stale_jobs_requeue(self):
+        job = enqueue('test_echo', {'value': 7})
+        self.assertEqual(BackgroundJob.claim_next('worker-a'), job.id)
+        self.assertIsNone(BackgroundJob.claim_next('worker-b'))
+
+        # Worker chết: heartbeat cũ hơn JOB_STALE_AFTER -> tác vụ về hàng chờ và chạy lại
+        BackgroundJob.query.filter_by(id=job.id).update({'heartbeat_at': now_vn() - timedelta(hours=1)})
+        db.session.commit()
+        self.assertEqual(BackgroundJob.requeue_stale(600), 1)
+        self.assertEqual(job_runner.run_pending(), 1)
+        db.session.refresh(job)
+        self.assertEqual(job.status, BackgroundJob.COMPLETED)
+        self.assertEqual((job.progress_done, job.progress_total, job.message), (2, 2, 'Xong'))
+        self.assertEqual(_calls, [7])
+
+    def test_supervisor_recovers_after_restart(self):
+        # Tiến trình web khởi động lại giữa chừng: tác vụ RUNNING mất heartbeat, Timer hẹn giờ đã mất
+        running = enqueue('test_echo', {'value': 1})
+        BackgroundJob.claim_next('web-1')
+        BackgroundJob.query.filter_by(id=running.id).update({'heartbeat_at': now_vn() - timedelta(hours=1)})
+        scheduled = enqueue('test_echo', {'value': 2}, run_after=now_vn() + timedelta(minutes=5))
+        db.session.commit()
+        with mock.patch.object(job_runner, 'kick') as kick:
+            self.assertEqual(job_runner.supervise_once(), 1)
+            kick.assert_called_once_with()
+
+        # Chỉ còn tác vụ hẹn giờ chưa tới hạn: không đánh thức worker
+        self.assertEqual(job_runner.run_pending(), 1)
+        with mock.patch.object(job_runner, 'kick') as kick:
+            self.assertEqual(job_runner.supervise_once(), 0)
+            kick.assert_not_called()
+
+        BackgroundJob.query.filter_by(id=scheduled.id).update({'run_after': now_vn() - timedelta(seconds=1)})
+        db.session.commit()
+        with mock.patch.object(job_runner, 'kick') as kick:
+            job_runner.supervise_once()
+            kick.assert_called_once_with()
+        self.assertEqual(job_runner.run_pending(), 1)
+        self.assertEqual(sorted(_calls), [1, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
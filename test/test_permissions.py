@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Test cache bitset phân quyền (User.has_permission)
+"""
+
+import unittest
+
+from sqlalchemy import event
+
+from app_test_base import AppTestCase
+from app import app, db
+from models import DataVersion, Permission, UserPermission
+
+
+class TestPermissionCache(AppTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for perm in Permission.get_default_permissions():
+            db.session.add(Permission(**perm))
+        db.session.flush()
+        self.perms = {(p.module, p.action): p for p in Permission.query.all()}
+        self.staff = self.create_user('nhanvien', self.user_role)
+        db.session.add_all([
+            UserPermission(user_id=self.staff.id, permission_id=self.perms[('assets', 'view')].id, granted=True),
+            UserPermission(user_id=self.staff.id, permission_id=self.perms[('assets', 'delete')].id, granted=False),
+        ])
+        db.session.commit()
+
+    def tearDown(self):
+        app.config['PERMISSION_CACHE_VERSION_CHECK'] = 1
+        super().tearDown()
+
+    def _count_queries(self, fn):
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            fn()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+        return len(statements)
+
+    def test_checks_are_served_from_cache(self):
+        self.assertTrue(self.staff.has_permission('assets', 'view'))
+        self.assertFalse(self.staff.has_permission('assets', 'delete'))
+        self.assertFalse(self.staff.has_permission('users', 'view'))
+        self.assertFalse(self.staff.has_permission('custom', 'approve'))
+        self.assertTrue(self.admin.has_permission('users', 'delete'))
+        count = self._count_queries(lambda: [
+            self.staff.has_permission(module, action)
+            for module in ('assets', 'users', 'maintenance') for action in ('add', 'view', 'edit', 'delete')
+        ] + [self.admin.has_permission('reports', 'export')])
+        self.assertEqual(count, 0)
+
+    def test_permission_api_invalidates_cache(self):
+        self.assertTrue(self.staff.has_permission('assets', 'view'))
+        client = self.client_for(self.admin)
+        # Chỉ có bulk delete (không thêm quyền mới) vẫn phải làm mới cache
+        response = client.post(f'/api/permissions/user/{self.staff.id}', json={'permissions': []})
+        self.assertTrue(response.get_json()['success'])
+        self.assertFalse(self.staff.has_permission('assets', 'view'))
+
+        response = client.post(f'/api/permissions/user/{self.staff.id}',
+                               json={'permissions': [self.perms[('users', 'view')].id]})
+        self.assertTrue(response.get_json()['success'])
+        self.assertTrue(self.staff.has_permission('users', 'view'))
+
+        # Đổi vai trò qua ORM: hook after_flush tăng phiên bản
+        self.staff.role_id = self.admin_role.id
+        db.session.commit()
+        self.assertTrue(self.staff.has_permission('transfer', 'delete'))
+
+    def test_changes_from_other_workers(self):
+        self.assertFalse(self.staff.has_permission('reports', 'view'))
+        db.session.execute(UserPermission.__table__.insert().values(
+            user_id=self.staff.id, permission_id=self.perms[('reports', 'view')].id, granted=True))
+        db.session.execute(DataVersion.__table__.update().where(
+            DataVersion.key == DataVersion.PERMISSIONS).values(version=DataVersion.version + 1))
+        db.session.commit()
+        app.config['PERMISSION_CACHE_VERSION_CHECK'] = 3600
+        self.assertFalse(self.staff.has_permission('reports', 'view'))
+        app.config['PERMISSION_CACHE_VERSION_CHECK'] = 0
+        self.assertTrue(self.staff.has_permission('reports', 'view'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Test đếm truy vấn theo request (utils/query_profiler.py)
+"""
+
+import unittest
+
+from flask import g
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from app_test_base import AppTestCase
+from app import app, db
+from utils.query_profiler import query_profiler
+
+
+class TestQueryProfiler(AppTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for i in range(3):
+            self.create_asset(f'Tài sản {i}')
+        db.session.commit()
+        query_profiler.reset()
+        self.client = self.client_for(self.admin)
+
+    def tearDown(self):
+        app.config['QUERY_PROFILER_ENABLED'] = False
+        super().tearDown()
+
+    def test_disabled_by_default(self):
+        response = self.client.get('/healthz')
+        self.assertNotIn('Server-Timing', response.headers)
+        self.assertEqual(query_profiler.snapshot(), [])
+
+    def test_server_timing_and_admin_snapshot(self):
+        app.config['QUERY_PROFILER_ENABLED'] = True
+        response = self.client.get('/dev/diag')
+        self.assertRegex(response.headers['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries", app;dur=[\d.]+$')
+
+        data = self.client.get('/dev/diag/queries').get_json()
+        self.assertTrue(data['enabled'])
+        diag = next(item for item in data['endpoints'] if item['endpoint'] == 'dev_diag')
+        self.assertEqual(diag['requests'], 1)
+        self.assertGreaterEqual(diag['max_queries'], 5)
+        self.assertTrue(diag['slowest'][0]['call_site'].startswith('app.py:'))
+
+        data = self.client.post('/dev/diag/queries').get_json()
+        self.assertEqual([item['endpoint'] for item in data['endpoints']], [])
+
+    def test_failed_statement_leaves_no_start_time(self):
+        app.config['QUERY_PROFILER_ENABLED'] = True
+        with app.test_request_context('/dev/diag'):
+            query_profiler._start_request()
+            connection = db.session.connection()
+            with self.assertRaises(OperationalError):
+                connection.execute(text('SELECT * FROM bang_khong_ton_tai'))
+            db.session.rollback()
+            connection = db.session.connection()
+            connection.execute(text('SELECT 1'))
+            profile = g._query_profile
+            self.assertEqual(profile['count'], 1)
+            self.assertEqual(connection.info.get('_query_profiler_start', []), [])
+            g.pop('_query_profile')
+
+    def test_snapshot_requires_admin(self):
+        staff = self.create_user('staff', self.user_role)
+        db.session.commit()
+        response = self.client_for(staff).get('/dev/diag/queries')
+        self.assertEqual(response.status_code, 302)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Test snapshot cache báo cáo: bộ đếm data_version và file XLSX trong EXPORT_DIR
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from app_test_base import AppTestCase
+from app import app, db
+from models import Asset, DataVersion
+from utils.report_cache import SNAPSHOT_SUBDIR, report_cache
+from utils.timezone import now_vn
+
+
+class TestReportCache(AppTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.export_dir = tempfile.mkdtemp()
+        self._old_export_dir = app.config.get('EXPORT_DIR')
+        app.config['EXPORT_DIR'] = self.export_dir
+        for i in range(3):
+            self.create_asset(f'Máy tính {i}', price=1000, status='active')
+        db.session.commit()
+        self.client = self.client_for(self.admin)
+
+    def tearDown(self):
+        app.config['EXPORT_DIR'] = self._old_export_dir
+        shutil.rmtree(self.export_dir, ignore_errors=True)
+        super().tearDown()
+
+    def _snapshots(self):
+        directory = os.path.join(self.export_dir, SNAPSHOT_SUBDIR)
+        return sorted(f for f in os.listdir(directory) if f.endswith('.xlsx')) if os.path.isdir(directory) else []
+
+    def test_version_bumps_only_for_report_data(self):
+        version = DataVersion.current()
+        self.admin.last_login = now_vn()
+        db.session.commit()
+        self.assertEqual(DataVersion.current(), version)
+
+        self.asset_type.name = 'Máy tính để bàn'
+        db.session.commit()
+        self.assertEqual(DataVersion.current(), version + 1)
+
+        self.admin.username = 'quantri'
+        db.session.commit()
+        self.assertEqual(DataVersion.current(), version + 2)
+
+    def test_screen_snapshot_is_refreshed_after_write(self):
+        html = self.client.get('/reports/tt24').get_data(as_text=True)
+        self.assertIn('Máy tính 0', html)
+
+        # Cùng phiên bản: snapshot cũ được dùng lại (kể cả khi đổi trực tiếp trong CSDL, bỏ qua ORM)
+        db.session.execute(Asset.__table__.update().values(name='Đổi ngầm'))
+        db.session.commit()
+        self.assertIn('Máy tính 0', self.client.get('/reports/tt24').get_data(as_text=True))
+
+        asset = Asset.query.filter_by(name='Đổi ngầm').first()
+        asset.name = 'Máy chiếu'
+        db.session.commit()
+        html = self.client.get('/reports/tt24').get_data(as_text=True)
+        self.assertIn('Máy chiếu', html)
+        self.assertNotIn('Máy tính 0', html)
+
+    def test_export_served_from_snapshot_file(self):
+        first = self.client.get('/reports/tt24/export?year=2025&status=active')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(len(self._snapshots()), 1)
+        second = self.client.get('/reports/tt24/export?status=active&year=2025')
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(first.data, second.data)
+        self.assertIn('Bao_cao_Tai_san_CCDC_TT24_2025.xlsx', second.headers['Content-Disposition'])
+        second.close()
+
+        self.create_asset('Máy in', price=500, status='active')
+        db.session.commit()
+        third = self.client.get('/reports/tt24/export?year=2025&status=active')
+        self.assertNotEqual(first.data, third.data)
+        # Phiên bản cũ đã được dọn
+        snapshots = self._snapshots()
+        self.assertEqual(len(snapshots), 1)
+        self.assertTrue(snapshots[0].endswith(f'_v{DataVersion.current()}.xlsx'))
+
+
+    def test_relative_export_dir_resolves_against_app_root(self):
+        # Cùng thư mục với file tác vụ nền (utils.jobs.export_root), không phụ thuộc thư mục làm việc
+        app.config['EXPORT_DIR'] = os.path.join('instance', 'exports')
+        self.assertEqual(report_cache.snapshot_dir(),
+                         os.path.join(app.root_path, 'instance', 'exports', SNAPSHOT_SUBDIR))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Test lớp truy vấn báo cáo: phân trang keyset và tổng hợp SQL
+"""
+
+import unittest
+from datetime import datetime, timedelta
+
+from werkzeug.datastructures import MultiDict
+
+from app_test_base import AppTestCase
+from app import db
+from models import Asset, AssetType
+from utils.report_queries import decode_cursor, keyset_page, report_assets, report_query, report_subtotals
+
+
+class TestReportQueries(AppTestCase):
+
+    def setUp(self):
+        super().setUp()
+        medical = AssetType(name='Thiết bị y tế')
+        db.session.add(medical)
+        db.session.flush()
+        base = datetime(2025, 3, 1, 8, 0, 0)
+        for i in range(25):
+            self.create_asset(
+                f'Tài sản {i}', price=100,
+                quantity=(2 if i % 5 == 0 else None),
+                status=('active' if i % 2 else 'maintenance'),
+                asset_type_id=(medical.id if i % 4 == 0 else self.asset_type.id),
+                # Nhiều tài sản trùng created_at: thứ tự phải ổn định nhờ id
+                created_at=base + timedelta(hours=i // 3),
+            )
+        db.session.commit()
+        self.medical_id = medical.id
+
+    def _walk(self, args, per_page):
+        query = report_query('tt24', MultiDict(args))
+        ids, starts, after = [], [], None
+        while True:
+            page = keyset_page(query, after, per_page)
+            ids.extend(a.id for a in page['items'])
+            starts.append(page['start'])
+            after = page['next_cursor']
+            if not after:
+                return ids, starts
+
+    def test_keyset_walk_matches_full_ordering(self):
+        ids, starts = self._walk({}, per_page=7)
+        self.assertEqual(len(ids), 25)
+        self.assertEqual(len(set(ids)), 25)
+        self.assertEqual(starts, [1, 8, 15, 22])
+        created = {a.id: a.created_at for a in report_query('tt24', MultiDict()).all()}
+        self.assertEqual(ids, sorted(created, key=lambda i: (created[i], i), reverse=True))
+
+    def test_keyset_walk_with_null_created_at(self):
+        # Dữ liệu cũ không có created_at: xếp cuối, trang có thể gồm cả dòng có và không có created_at
+        for asset in Asset.query.order_by(Asset.id).limit(5):
+            asset.created_at = None
+        db.session.commit()
+        expected = [a.id for a in report_assets('tt24', MultiDict())]
+        for per_page in (4, 7, 25):
+            ids, _ = self._walk({}, per_page=per_page)
+            self.assertEqual(ids, expected)
+        self.assertEqual(len(expected), 25)
+        self.assertEqual(expected[-5:], sorted(expected[-5:], reverse=True))
+
+    def test_invalid_cursor_restarts_from_first_page(self):
+        self.assertIsNone(decode_cursor('not-a-cursor'))
+        page = keyset_page(report_query('tt24', MultiDict()), 'not-a-cursor', 5)
+        self.assertEqual(page['start'], 1)
+        self.assertEqual(len(page['items']), 5)
+
+    def test_subtotals(self):
+        totals = report_subtotals(report_query('tt24', MultiDict({'status': 'active'})))
+        # 12 tài sản active (i lẻ), i = 5, 15 có số lượng 2
+        self.assertEqual(totals['total'], {'count': 12, 'quantity': 14, 'value': 1400.0})
+        self.assertEqual([row['status'] for row in totals['by_status']], ['active'])
+        by_type = {row['asset_type_id']: row for row in totals['by_type']}
+        self.assertEqual(sum(row['count'] for row in by_type.values()), 12)
+
+        special = report_subtotals(report_query('special', MultiDict({'report_type': 'medical'})))
+        self.assertEqual(special['total']['count'], 7)
+        self.assertEqual([row['asset_type_id'] for row in special['by_type']], [self.medical_id])
+
+    def test_report_screen_renders_page_and_subtotals(self):
+        client = self.client_for(self.admin)
+        response = client.get('/reports/tt24?per_page=10&status=active')
+        self.assertEqual(response.status_code, 200)
+        html = response.get_data(as_text=True)
+        self.assertIn('Trang sau', html)
+        self.assertIn('Tổng cộng', html)
+
+
+if __name__ == '__main__':
+    unittest.main()
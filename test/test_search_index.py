@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Test tìm kiếm không dấu (search_document + FTS5) cho tài sản và bảo trì
+"""
+
+import unittest
+from datetime import date
+
+from app_test_base import AppTestCase
+from app import db
+from models import Asset, MaintenanceRecord, SearchDocument
+from utils import search_index
+from utils.search_index import apply_search, rebuild_search_index
+from utils.search_text import normalize_search_text
+
+
+class TestSearchIndex(AppTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.long_name = self.create_asset('Bàn đặt máy tính văn phòng tầng hai', device_code='BAN-02')
+        self.laptop = self.create_asset('Máy tính xách tay', device_code='TS-001')
+        self.printer = self.create_asset('Máy in laser', device_code='IN-7')
+        db.session.add(MaintenanceRecord(
+            asset_id=self.laptop.id, request_date=date(2025, 1, 1),
+            description='Thay bàn phím', vendor='Công ty Đức Anh', person_in_charge='Nguyễn Văn Hùng',
+        ))
+        db.session.commit()
+        self.client = self.client_for(self.admin)
+
+    def _asset_ids(self, term, ranked=False):
+        query = apply_search(Asset.query.filter(Asset.deleted_at.is_(None)), SearchDocument.ASSET, Asset.id, term, ranked)
+        return [a.id for a in query.all()]
+
+    def test_normalize(self):
+        self.assertEqual(normalize_search_text('Máy tính  Đồng-Nai'), 'may tinh dong nai')
+        self.assertEqual(normalize_search_text(None), '')
+
+    def test_accent_insensitive_prefix_search(self):
+        self.assertEqual(self._asset_ids('may tinh xach'), [self.laptop.id])
+        self.assertEqual(sorted(self._asset_ids('MÁY')), sorted([self.long_name.id, self.laptop.id, self.printer.id]))
+        self.assertEqual(self._asset_ids('ts-001'), [self.laptop.id])
+        self.assertEqual(self._asset_ids('máy chiếu'), [])
+
+    def test_substring_search(self):
+        # Khớp chuỗi con như LIKE '%...%' (kể cả giữa mã thiết bị và giữa từ), token ngắn lọc bằng LIKE
+        pc = self.create_asset('Máy bộ', device_code='PC-001234')
+        db.session.commit()
+        self.assertEqual(search_index.search_backend(), 'fts5')
+        self.assertEqual(self._asset_ids('1234'), [pc.id])
+        self.assertEqual(sorted(self._asset_ids('001')), sorted([self.laptop.id, pc.id]))
+        self.assertEqual(self._asset_ids('aser'), [self.printer.id])
+        self.assertEqual(self._asset_ids('may 7'), [self.printer.id])
+        self.assertEqual(self._asset_ids('ts 01'), [self.laptop.id])
+
+    def test_ranked_search(self):
+        # bm25: tài liệu ngắn hơn (tên khớp sát hơn) đứng trước, không phụ thuộc thứ tự tạo
+        self.assertEqual(self._asset_ids('may tinh', ranked=True), [self.laptop.id, self.long_name.id])
+        self.long_name.name = 'Máy tính'
+        db.session.commit()
+        self.assertEqual(self._asset_ids('may tinh', ranked=True), [self.long_name.id, self.laptop.id])
+
+    def test_index_follows_model_changes(self):
+        self.laptop.name = 'Máy chiếu Epson'
+        db.session.commit()
+        self.assertEqual(self._asset_ids('xach tay'), [])
+        self.assertEqual(self._asset_ids('may chieu'), [self.laptop.id])
+
+        # Bản ghi bảo trì: nội dung riêng + tên tài sản (được làm mới khi đổi tên tài sản)
+        response = self.client.get('/maintenance/suggest?term=duc anh')
+        self.assertEqual(len(response.get_json()), 1)
+        response = self.client.get('/maintenance/suggest?term=epson')
+        self.assertEqual(len(response.get_json()), 1)
+
+        db.session.delete(self.printer)
+        db.session.commit()
+        self.assertEqual(SearchDocument.query.filter_by(entity=SearchDocument.ASSET).count(), 2)
+
+    def test_rebuild_and_like_fallback(self):
+        self.assertEqual(rebuild_search_index(), 4)
+        self.assertEqual(self._asset_ids('in laser'), [self.printer.id])
+        key = str(db.engine.url)
+        search_index._backend_cache[key] = 'like'
+        try:
+            self.assertEqual(self._asset_ids('tinh xach'), [self.laptop.id])
+            self.assertEqual(self._asset_ids('may tinh', ranked=True), [self.laptop.id, self.long_name.id])
+        finally:
+            search_index.reset_backend_cache()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Test chỉ mục gợi ý trong bộ nhớ (utils/suggest_index.py)
+"""
+
+import unittest
+from contextlib import contextmanager
+from datetime import date
+
+from sqlalchemy import event
+
+from app_test_base import AppTestCase
+from app import app, db
+from models import Asset, DataVersion, MaintenanceRecord, now_vn
+from utils.suggest_index import PrefixIndex, _Entry, suggest_index
+
+
+class TestPrefixIndex(unittest.TestCase):
+
+    def test_prefix_search_and_incremental_updates(self):
+        index = PrefixIndex.build([
+            (1, _Entry(('may', 'tinh', 'dell'), (3,), None, 'dell')),
+            (2, _Entry(('may', 'in', 'hp'), (2,), 7, 'hp')),
+            (3, _Entry(('may', 'tinh', 'bang'), (1,), 7, 'tablet')),
+        ])
+        self.assertEqual(index.search(['ma', 'ti'], 10), ['tablet', 'dell'])
+        self.assertEqual(index.search(['may'], 2), ['tablet', 'hp'])
+        self.assertEqual(index.search(['may'], 10, owner=7), ['tablet', 'hp'])
+        self.assertEqual(index.search(['tinhx'], 10), [])
+
+        # Bản mới sau khi trộn thay đổi; bản cũ (đang được tra cứu) giữ nguyên
+        merged = index.merged({2: _Entry(('may', 'tinh', 'hp'), (2,), 7, 'hp laptop'), 3: None})
+        self.assertEqual(merged.search(['tinh'], 10), ['hp laptop', 'dell'])
+        self.assertEqual(merged.keys, sorted(merged.keys))
+        self.assertEqual(len(merged.keys), 6)
+        self.assertEqual(index.search(['ma', 'ti'], 10), ['tablet', 'dell'])
+
+
+class TestSuggestEndpoints(AppTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.staff = self.create_user('nhanvien', self.user_role)
+        self.own = self.create_asset('Máy tính của tôi', device_code='TS-001', user_id=self.staff.id)
+        self.other = self.create_asset('Máy tính phòng họp', device_code='TS-002')
+        db.session.add(MaintenanceRecord(asset_id=self.own.id, request_date=date(2025, 1, 1),
+                                         maintenance_date=date(2025, 1, 2), vendor='Điện máy Xanh'))
+        db.session.add(MaintenanceRecord(asset_id=self.other.id, request_date=date(2025, 1, 1),
+                                         maintenance_date=date(2025, 1, 3), vendor='Điện máy Xanh'))
+        db.session.commit()
+        self.admin_client = self.client_for(self.admin)
+        self.staff_client = self.client_for(self.staff)
+
+    @contextmanager
+    def count_queries(self):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+    def _names(self, client, url, field='name'):
+        return [item[field] for item in client.get(url).get_json()]
+
+    def test_role_scoping(self):
+        self.assertEqual(len(self._names(self.admin_client, '/assets/suggest?term=may tinh')), 2)
+        self.assertEqual(self._names(self.staff_client, '/assets/suggest?term=may tinh'), ['Máy tính của tôi'])
+        staff_records = self.staff_client.get('/maintenance/suggest?term=dien may').get_json()
+        self.assertEqual(len(staff_records), 1)
+        self.assertIn('Máy tính của tôi', staff_records[0]['label'])
+        self.assertEqual(len(self.admin_client.get('/maintenance/suggest?term=xanh').get_json()), 2)
+        self.assertEqual(self._names(self.admin_client, '/users/suggest?term=nhan', 'username'), ['nhanvien'])
+        self.assertEqual(self._names(self.admin_client, '/asset-types/suggest?term=may'), ['Máy tính'])
+
+    def test_lookup_without_database_and_remote_changes(self):
+        self.admin_client.get('/assets/suggest?term=may')
+        with self.count_queries() as statements:
+            suggest_index.suggest('assets', 'may tinh')
+        self.assertEqual(statements, [])
+
+        # Worker khác đổi dữ liệu (không qua ORM của tiến trình này): thấy sau lần kiểm tra phiên bản
+        db.session.execute(Asset.__table__.update().where(Asset.id == self.other.id).values(
+            name='Máy chiếu', updated_at=now_vn()
+        ))
+        db.session.execute(DataVersion.__table__.update().where(
+            DataVersion.key == DataVersion.SUGGEST).values(version=DataVersion.version + 1))
+        db.session.commit()
+        old_interval = app.config['SUGGEST_INDEX_VERSION_CHECK']
+        app.config['SUGGEST_INDEX_VERSION_CHECK'] = 0
+        try:
+            self.assertEqual([e['name'] for e in suggest_index.suggest('assets', 'may chieu')], ['Máy chiếu'])
+        finally:
+            app.config['SUGGEST_INDEX_VERSION_CHECK'] = old_interval
+
+    def test_unchanged_rows_do_not_rebuild(self):
+        suggest_index.suggest('assets', 'may')
+        before = suggest_index._indexes['assets']
+        # Dòng trong khoảng chồng mốc được nạp lại nhưng không đổi: giữ nguyên bản chỉ mục đang dùng
+        DataVersion.bump(db.session.connection(), DataVersion.SUGGEST)
+        db.session.commit()
+        suggest_index.suggest('assets', 'may')
+        self.assertIs(suggest_index._indexes['assets'], before)
+
+        self.other.name = 'Máy chiếu'
+        db.session.commit()
+        self.assertEqual([e['name'] for e in suggest_index.suggest('assets', 'chieu')], ['Máy chiếu'])
+        self.assertIsNot(suggest_index._indexes['assets'], before)
+        self.assertEqual(len(before.search(['chieu'], 10)), 0)
+
+    def test_local_writes_are_visible_immediately(self):
+        self.admin_client.get('/assets/suggest?term=may')
+        self.other.name = 'Máy in màu'
+        db.session.commit()
+        self.assertEqual(self._names(self.admin_client, '/assets/suggest?term=may in'), ['Máy in màu'])
+        self.own.soft_delete()
+        db.session.commit()
+        self.assertEqual(self._names(self.admin_client, '/assets/suggest?term=may tinh'), [])
+
+        # Xóa vĩnh viễn không có updated_at: phát hiện qua số lượng và dựng lại
+        record = MaintenanceRecord.query.filter_by(asset_id=self.other.id).first()
+        db.session.delete(record)
+        db.session.commit()
+        self.assertEqual(len(self.admin_client.get('/maintenance/suggest?term=xanh').get_json()), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Test cache cấu hình hệ thống (SystemSetting)
+"""
+
+import time
+import unittest
+
+from sqlalchemy import event
+
+from app_test_base import AppTestCase
+from app import app, db
+from models import SystemSetting
+
+
+class TestSystemSettingCache(AppTestCase):
+
+    def setUp(self):
+        super().setUp()
+        SystemSetting.set_setting('org_name', 'Phường 1')
+        SystemSetting.set_setting('browser_title', 'QLTS')
+
+    def tearDown(self):
+        app.config['SYSTEM_SETTING_VERSION_CHECK'] = 1
+        super().tearDown()
+
+    def _count_queries(self, fn):
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            fn()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+        return len(statements)
+
+    def test_lookups_are_served_from_cache(self):
+        self.assertEqual(SystemSetting.get_setting('org_name'), 'Phường 1')
+        count = self._count_queries(lambda: [
+            SystemSetting.get_setting('org_name'),
+            SystemSetting.get_setting('browser_title'),
+            SystemSetting.get_setting('logo_path', ''),
+        ])
+        self.assertEqual(count, 0)
+        self.assertEqual(SystemSetting.get_setting('logo_path', 'default.png'), 'default.png')
+
+    def test_set_setting_invalidates(self):
+        SystemSetting.get_setting('org_name')
+        SystemSetting.set_setting('org_name', 'Phường 2')
+        self.assertEqual(SystemSetting.get_setting('org_name'), 'Phường 2')
+
+    def test_other_worker_write_seen_after_version_check(self):
+        app.config['SYSTEM_SETTING_VERSION_CHECK'] = 0.05
+        SystemSetting.get_setting('org_name')
+        # Mô phỏng worker khác: ghi thẳng vào bảng và đổi phiên bản, không đụng cache của tiến trình này
+        db.session.execute(SystemSetting.__table__.update().where(
+            SystemSetting.__table__.c.key == 'org_name').values(value='Phường 3'))
+        SystemSetting.bump_version()
+        db.session.commit()
+        self.assertEqual(SystemSetting.get_setting('org_name'), 'Phường 1')
+        time.sleep(0.06)
+        self.assertEqual(SystemSetting.get_setting('org_name'), 'Phường 3')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,229 @@
+"""
+Tính hao mòn tài sản theo lô (API MISA /assets/amortization/*).
+
+- `calculate_amortization`: hao mòn một năm cho hàng nghìn tài sản, đọc/ghi theo lô.
+- `project_amortization`: lịch hao mòn còn lại (mọi năm cho tới khi giá trị còn lại = 0)
+  tính trong một lượt bằng ma trận NumPy (tài sản × năm).
+"""
+from typing import Any, Dict, Iterable, List, Tuple
+
+import numpy as np
+from sqlalchemy import func
+
+from models import db, Asset, AssetAmortization
+from utils.db_batch import chunked
+from utils.timezone import now_vn
+
+# Số năm sử dụng mặc định khi request và tài sản đều không có dữ liệu
+DEFAULT_USAGE_YEARS = 5
+# Giới hạn số năm của lịch dự báo (tránh ma trận quá lớn khi số năm sử dụng bất thường)
+MAX_PROJECTION_YEARS = 100
+
+
+def _normalize_items(items: Iterable[Dict[str, Any]]) -> Dict[int, Dict[str, Any]]:
+    """{asset_id: item} - asset_id trùng thì dòng sau ghi đè dòng trước, bỏ dòng lỗi"""
+    normalized = {}
+    for item in items or []:
+        try:
+            asset_id = int(item.get('asset_id'))
+        except (TypeError, ValueError, AttributeError):
+            continue
+        try:
+            usage_years = int(item.get('usage_years') or 0)
+        except (TypeError, ValueError):
+            usage_years = 0
+        normalized[asset_id] = {'usage_years': usage_years, 'condition_score': item.get('condition_score')}
+    return normalized
+
+
+def _load_assets(asset_ids: List[int]) -> Dict[int, float]:
+    """{asset_id: nguyên giá} của các tài sản chưa xóa có nguyên giá > 0"""
+    prices = {}
+    for chunk in chunked(asset_ids):
+        rows = db.session.query(Asset.id, Asset.price).filter(
+            Asset.id.in_(chunk), Asset.deleted_at.is_(None), Asset.price > 0
+        ).all()
+        prices.update({asset_id: float(price) for asset_id, price in rows})
+    return prices
+
+
+def _load_prior_remaining(asset_ids: List[int], period_year: int) -> Dict[int, float]:
+    """Giá trị còn lại của năm gần nhất trước `period_year` (một truy vấn mỗi lô)"""
+    remaining = {}
+    for chunk in chunked(asset_ids):
+        latest = db.session.query(
+            AssetAmortization.asset_id.label('asset_id'),
+            func.max(AssetAmortization.period_year).label('period_year'),
+        ).filter(
+            AssetAmortization.asset_id.in_(chunk),
+            AssetAmortization.period_year < period_year
+        ).group_by(AssetAmortization.asset_id).subquery()
+        rows = db.session.query(
+            AssetAmortization.asset_id, func.min(AssetAmortization.remaining_value)
+        ).join(
+            latest,
+            db.and_(
+                AssetAmortization.asset_id == latest.c.asset_id,
+                AssetAmortization.period_year == latest.c.period_year
+            )
+        ).group_by(AssetAmortization.asset_id).all()
+        remaining.update({asset_id: float(value) for asset_id, value in rows})
+    return remaining
+
+
+def _load_existing_ids(asset_ids: List[int], first_year: int, last_year: int) -> Dict[Tuple[int, int], int]:
+    """{(asset_id, năm): id bản ghi} của các bản ghi hao mòn đã có trong khoảng năm"""
+    existing = {}
+    for chunk in chunked(asset_ids):
+        rows = db.session.query(
+            AssetAmortization.asset_id, AssetAmortization.period_year, func.min(AssetAmortization.id)
+        ).filter(
+            AssetAmortization.asset_id.in_(chunk),
+            AssetAmortization.period_year.between(first_year, last_year)
+        ).group_by(AssetAmortization.asset_id, AssetAmortization.period_year).all()
+        existing.update({(asset_id, year): row_id for asset_id, year, row_id in rows})
+    return existing
+
+
+def _prepare(items, period_year: int):
+    """Nạp dữ liệu và dựng các mảng đầu vào (asset_ids, nguyên giá, còn lại đầu kỳ, số năm sử dụng)"""
+    normalized = _normalize_items(items)
+    prices = _load_assets(list(normalized))
+    asset_ids = [asset_id for asset_id in normalized if asset_id in prices]
+    prior = _load_prior_remaining(asset_ids, period_year) if asset_ids else {}
+    original = np.array([prices[i] for i in asset_ids], dtype=float)
+    opening = np.array([prior.get(i, prices[i]) for i in asset_ids], dtype=float)
+    usage_years = np.array([
+        normalized[i]['usage_years'] if normalized[i]['usage_years'] > 0 else DEFAULT_USAGE_YEARS
+        for i in asset_ids
+    ], dtype=int)
+    return normalized, asset_ids, original, opening, usage_years
+
+
+def _save_rows(rows: List[Dict[str, Any]]):
+    """Ghi (insert/update) các dòng hao mòn theo khóa (asset_id, period_year)"""
+    if not rows:
+        return
+    asset_ids = sorted({row['asset_id'] for row in rows})
+    years = [row['period_year'] for row in rows]
+    existing = _load_existing_ids(asset_ids, min(years), max(years))
+    now = now_vn()
+    inserts, updates = [], []
+    for row in rows:
+        row_id = existing.get((row['asset_id'], row['period_year']))
+        if row_id:
+            updates.append({
+                'id': row_id,
+                'amortization_rate': row['amortization_rate'],
+                'amortization_amount': row['amortization_amount'],
+                'remaining_value': row['remaining_value'],
+                'usage_years': row['usage_years'],
+                'condition_score': row['condition_score'],
+            })
+        else:
+            inserts.append(dict(row, created_at=now))
+    if updates:
+        db.session.bulk_update_mappings(AssetAmortization, updates)
+    if inserts:
+        db.session.bulk_insert_mappings(AssetAmortization, inserts)
+
+
+def calculate_amortization(items, period_year: int, commit: bool = True) -> List[Dict[str, Any]]:
+    """
+    Tính và lưu hao mòn năm `period_year` cho danh sách [{asset_id, usage_years, condition_score}].
+
+    Hao mòn đường thẳng: giá trị hao mòn năm = Nguyên giá / Số năm sử dụng,
+    không vượt quá giá trị còn lại của năm trước.
+    """
+    normalized, asset_ids, original, opening, usage_years = _prepare(items, period_year)
+    annual = original / usage_years
+    amounts = np.clip(annual, 0.0, np.maximum(opening, 0.0))
+    remaining = opening - amounts
+    rates = 100.0 / usage_years
+
+    rows, results = [], []
+    for idx, asset_id in enumerate(asset_ids):
+        rows.append({
+            'asset_id': asset_id,
+            'period_year': period_year,
+            'original_value': float(original[idx]),
+            'amortization_rate': float(rates[idx]),
+            'amortization_amount': float(amounts[idx]),
+            'remaining_value': float(remaining[idx]),
+            'usage_years': int(usage_years[idx]),
+            'condition_score': normalized[asset_id]['condition_score'],
+        })
+        results.append({
+            'asset_id': asset_id,
+            'amortization_amount': float(amounts[idx]),
+            'remaining_value': float(remaining[idx]),
+        })
+    _save_rows(rows)
+    if commit:
+        db.session.commit()
+    return results
+
+
+def amortization_schedule(opening: np.ndarray, annual: np.ndarray,
+                          max_years: int = MAX_PROJECTION_YEARS) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Lịch hao mòn dạng ma trận (tài sản × năm).
+
+    Trả về (amounts, remaining): remaining[i, k] = max(còn lại đầu kỳ - hao mòn năm × (k+1), 0),
+    amounts[i, k] = phần giảm của năm k (bằng 0 khi tài sản đã hết giá trị).
+    """
+    opening = np.maximum(opening, 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Trừ sai số làm tròn để 66.666.666,67 / 33.333.333,33 vẫn là 2 năm
+        years_needed = np.where(annual > 0, np.ceil(opening / annual - 1e-9), 0)
+    horizon = int(min(max(years_needed.max(initial=0), 0), max_years))
+    steps = np.arange(1, horizon + 1, dtype=float)
+    remaining = np.maximum(opening[:, None] - annual[:, None] * steps[None, :], 0.0)
+    remaining[steps[None, :] >= years_needed[:, None]] = 0.0
+    previous = np.hstack([opening[:, None], remaining[:, :-1]]) if horizon else remaining
+    return previous - remaining, remaining
+
+
+def project_amortization(items, start_year: int, save: bool = False,
+                         max_years: int = MAX_PROJECTION_YEARS) -> List[Dict[str, Any]]:
+    """
+    Dự báo lịch hao mòn từ `start_year` tới khi giá trị còn lại bằng 0.
+
+    Điểm xuất phát là giá trị còn lại của năm gần nhất trước `start_year` (hoặc nguyên giá).
+    `save=True` ghi toàn bộ lịch vào asset_amortization (insert/update theo lô).
+    """
+    normalized, asset_ids, original, opening, usage_years = _prepare(items, start_year)
+    annual = original / usage_years
+    amounts, remaining = amortization_schedule(opening, annual, max_years)
+    rates = 100.0 / usage_years
+
+    projections, rows = [], []
+    for idx, asset_id in enumerate(asset_ids):
+        active = np.nonzero(amounts[idx] > 0)[0]
+        schedule = [{
+            'year': start_year + int(k),
+            'amortization_amount': float(amounts[idx, k]),
+            'remaining_value': float(remaining[idx, k]),
+        } for k in active]
+        projections.append({
+            'asset_id': asset_id,
+            'original_value': float(original[idx]),
+            'opening_value': float(opening[idx]),
+            'usage_years': int(usage_years[idx]),
+            'schedule': schedule,
+        })
+        if save:
+            rows.extend({
+                'asset_id': asset_id,
+                'period_year': entry['year'],
+                'original_value': float(original[idx]),
+                'amortization_rate': float(rates[idx]),
+                'amortization_amount': entry['amortization_amount'],
+                'remaining_value': entry['remaining_value'],
+                'usage_years': int(usage_years[idx]),
+                'condition_score': normalized[asset_id]['condition_score'] if entry['year'] == start_year else None,
+            } for entry in schedule)
+    if save:
+        _save_rows(rows)
+        db.session.commit()
+    return projections
@@ -0,0 +1,203 @@
+"""
+Xuất danh sách tài sản theo luồng (CSV / NDJSON / JSON / XLSX) không nạp cả bảng vào bộ nhớ.
+
+Tài sản được đọc bằng yield_per (server-side cursor) kèm joinedload loại tài sản và người dùng;
+mỗi khối dữ liệu gửi cho client đồng thời được ghi vào bản lưu trữ trong EXPORT_DIR.
+"""
+import csv
+import io
+import json
+import os
+import tempfile
+from typing import Any, Dict, Iterator, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload, lazyload
+
+from models import db, Asset, User
+from utils.timezone import now_vn
+
+HEADERS_VI = {
+    'id': 'ID',
+    'name': 'Tên tài sản',
+    'asset_type': 'Loại',
+    'price': 'Giá',
+    'quantity': 'Số lượng',
+    'purchase_date': 'Ngày mua',
+    'device_code': 'Mã thiết bị',
+    'user': 'Người sử dụng',
+    'condition': 'Tình trạng',
+    'status': 'Trạng thái',
+    'notes': 'Ghi chú'
+}
+ORDERED_FIELDS = list(HEADERS_VI.keys())
+
+# Số tài sản mỗi lần lấy từ cursor
+YIELD_PER = 1000
+# Gom khoảng này dòng rồi mới gửi một khối cho client
+ROWS_PER_CHUNK = 500
+# Kích thước khối khi đọc lại file tạm (XLSX)
+FILE_CHUNK_SIZE = 64 * 1024
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+    'json': 'application/json; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+def live_asset_query():
+    return Asset.query.filter(Asset.deleted_at.is_(None))
+
+
+def iter_asset_rows(batch_size: int = YIELD_PER) -> Iterator[Dict[str, Any]]:
+    """Từng tài sản chưa xóa (theo id tăng dần) dưới dạng dict đã chuẩn hóa"""
+    # assigned_users / assigned_assets mặc định nạp kiểu subquery (không dùng được với yield_per và
+    # cũng không cần cho file xuất) nên chuyển về lazyload
+    stmt = select(Asset).where(Asset.deleted_at.is_(None)).options(
+        joinedload(Asset.asset_type),
+        joinedload(Asset.user).lazyload(User.assigned_assets),
+        lazyload(Asset.assigned_users),
+    ).order_by(Asset.id.asc()).execution_options(yield_per=batch_size)
+    for a in db.session.execute(stmt).scalars():
+        yield {
+            'id': a.id,
+            'name': a.name,
+            'asset_type': a.asset_type.name if a.asset_type else '',
+            'price': float(a.price or 0),
+            'quantity': int(a.quantity or 0),
+            'purchase_date': a.purchase_date.strftime('%d/%m/%Y') if a.purchase_date else '',
+            'device_code': a.device_code or '',
+            'user': a.user.username if a.user else '',
+            'condition': a.condition_label or '',
+            'status': a.status or '',
+            'notes': a.notes or ''
+        }
+
+
+def _csv_chunks(rows: Iterator[Dict[str, Any]]) -> Iterator[bytes]:
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow([HEADERS_VI[f] for f in ORDERED_FIELDS])
+    yield output.getvalue().encode('utf-8-sig')
+    output.seek(0)
+    output.truncate()
+    for count, r in enumerate(rows, 1):
+        writer.writerow([r[f] for f in ORDERED_FIELDS])
+        if count % ROWS_PER_CHUNK == 0:
+            yield output.getvalue().encode('utf-8')
+            output.seek(0)
+            output.truncate()
+    if output.tell():
+        yield output.getvalue().encode('utf-8')
+
+
+def _ndjson_chunks(rows: Iterator[Dict[str, Any]]) -> Iterator[bytes]:
+    lines = []
+    for r in rows:
+        lines.append(json.dumps(r, ensure_ascii=False))
+        if len(lines) >= ROWS_PER_CHUNK:
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+            lines = []
+    if lines:
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def _json_array_chunks(rows: Iterator[Dict[str, Any]]) -> Iterator[bytes]:
+    """Mảng JSON như định dạng cũ nhưng ghi dần từng khối"""
+    yield b'['
+    separator = ''
+    parts = []
+    for r in rows:
+        parts.append(separator + json.dumps(r, ensure_ascii=False))
+        separator = ', '
+        if len(parts) >= ROWS_PER_CHUNK:
+            yield ''.join(parts).encode('utf-8')
+            parts = []
+    if parts:
+        yield ''.join(parts).encode('utf-8')
+    yield b']'
+
+
+def _xlsx_chunks(rows: Iterator[Dict[str, Any]]) -> Iterator[bytes]:
+    """Ghi workbook write-only (bộ nhớ cố định) ra file tạm rồi đọc lại theo khối"""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('TaiSan')
+    sheet.append([HEADERS_VI[f] for f in ORDERED_FIELDS])
+    for r in rows:
+        sheet.append([r[f] for f in ORDERED_FIELDS])
+    with tempfile.TemporaryFile(suffix='.xlsx') as tmp:
+        workbook.save(tmp)
+        tmp.seek(0)
+        while True:
+            block = tmp.read(FILE_CHUNK_SIZE)
+            if not block:
+                break
+            yield block
+
+
+FORMAT_WRITERS = {
+    'csv': _csv_chunks,
+    'ndjson': _ndjson_chunks,
+    'json': _json_array_chunks,
+    'xlsx': _xlsx_chunks,
+}
+
+
+def archive_path(export_dir: str, filename: str) -> str:
+    """Đường dẫn bản lưu trữ: <tên>_<thời gian><đuôi> trong EXPORT_DIR"""
+    os.makedirs(export_dir, exist_ok=True)
+    ts = now_vn().strftime('%Y%m%d_%H%M%S')
+    base, ext = os.path.splitext(filename)
+    return os.path.join(export_dir, f"{base}_{ts}{ext}")
+
+
+def tee_to_archive(chunks: Iterator[bytes], path: Optional[str]) -> Iterator[bytes]:
+    """
+    Chuyển tiếp từng khối cho client và ghi cùng khối đó vào bản lưu trữ.
+    Lỗi ghi đĩa không làm hỏng lượt tải; client ngắt giữa chừng thì xóa bản lưu dở.
+    """
+    def _discard(f):
+        f.close()
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    archive = None
+    if path:
+        try:
+            archive = open(path, 'wb')
+        except OSError:
+            print('[Export] Failed to persist exported file to disk.')
+    completed = False
+    try:
+        for chunk in chunks:
+            if archive is not None:
+                try:
+                    archive.write(chunk)
+                except OSError:
+                    print('[Export] Failed to persist exported file to disk.')
+                    _discard(archive)
+                    archive = None
+            yield chunk
+        completed = True
+    finally:
+        if archive is not None:
+            if completed:
+                archive.close()
+            else:
+                _discard(archive)
+
+
+def stream_assets(fmt: str, archive: Optional[str] = None, batch_size: int = YIELD_PER) -> Iterator[bytes]:
+    """Sinh nội dung file xuất `fmt` theo từng khối bytes"""
+    return tee_to_archive(FORMAT_WRITERS[fmt](iter_asset_rows(batch_size)), archive)
+
+
+def collect_asset_rows() -> List[Dict[str, Any]]:
+    """Toàn bộ dòng (cho DOCX/PDF, vốn cần dựng cả tài liệu trong bộ nhớ)"""
+    return list(iter_asset_rows())
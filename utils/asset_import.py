@@ -0,0 +1,376 @@
+"""
+Import tài sản từ Excel theo luồng (streaming) và theo lô, chạy nền.
+
+- Đọc từng dòng bằng openpyxl read-only (file .xls cũ dùng pandas), không nạp cả workbook.
+- Kiểm tra dữ liệu theo lô bằng pandas; trùng tên / mã thiết bị so với tập đã nạp sẵn một lần.
+- Ghi bằng bulk_insert_mappings, cập nhật bảng tổng hợp asset_type_rollup và tiến độ sau mỗi lô.
+- Lỗi từng dòng được lưu thành báo cáo CSV tải về được.
+- Chạy bằng tác vụ nền `asset_import` (utils/jobs.py); file upload được lưu tạm trong EXPORT_DIR/jobs/uploads.
+"""
+import csv
+import io
+import os
+from datetime import date, datetime
+from itertools import islice
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from models import db, Asset, AssetType, AssetTypeRollup, AssetImportJob, AuditLog, DataVersion, Role, SearchDocument, User
+from utils.jobs import JOBS_SUBDIR, JobCancelled, JobContext, export_root, job_handler
+from utils.timezone import now_vn
+
+MAX_QUANTITY = 2 ** 31 - 1  # Giới hạn cột Integer (PostgreSQL)
+
+REQUIRED_COLUMNS = ['Tên tài sản', 'Giá tiền', 'Số lượng', 'Loại tài sản']
+OPTIONAL_COLUMNS = ['Trạng thái', 'Người sử dụng', 'Ngày mua', 'Mã thiết bị', 'Tình trạng', 'Ghi chú']
+
+# Số dòng mỗi lô (kiểm tra + ghi + cập nhật tiến độ)
+CHUNK_SIZE = 1000
+
+# Mapping trạng thái linh hoạt
+STATUS_MAP = {
+    'đang sử dụng': 'active',
+    'bảo trì': 'maintenance',
+    'đã thanh lý': 'disposed',
+    'active': 'active',
+    'maintenance': 'maintenance',
+    'disposed': 'disposed',
+    'sẵn sàng': 'active',
+    'đang dùng': 'active'
+}
+
+DATE_FORMATS = ['%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%Y/%m/%d']
+
+
+class ImportFileError(Exception):
+    """File Excel không đọc được hoặc thiếu cột bắt buộc"""
+
+
+def _open_rows(data: bytes, filename: str) -> Tuple[List[str], Iterator[tuple], Optional[int]]:
+    """(header, iterator các dòng dữ liệu, ước lượng số dòng) - .xlsx đọc read-only theo luồng"""
+    if filename.lower().endswith('.xls'):
+        df = pd.read_excel(io.BytesIO(data), dtype=object)
+        header = [str(col).strip() for col in df.columns]
+        return header, df.itertuples(index=False, name=None), len(df)
+
+    from openpyxl import load_workbook
+    try:
+        workbook = load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    except Exception as e:
+        raise ImportFileError(f'Không đọc được file Excel: {e}')
+    sheet = workbook.active
+    rows = sheet.iter_rows(values_only=True)
+    try:
+        header_row = next(rows)
+    except StopIteration:
+        return [], iter(()), 0
+    header = ['' if cell is None else str(cell).strip() for cell in header_row]
+    total = sheet.max_row - 1 if sheet.max_row else None
+    return header, rows, total
+
+
+def preflight(data: bytes, filename: str) -> Optional[int]:
+    """Kiểm tra nhanh trước khi đưa vào hàng đợi: đọc được file và đủ cột bắt buộc. Trả về ước lượng số dòng."""
+    header, _, total = _open_rows(data, filename)
+    missing = [col for col in REQUIRED_COLUMNS if col not in header]
+    if missing:
+        raise ImportFileError(f'File Excel thiếu các cột bắt buộc: {", ".join(missing)}')
+    return total
+
+
+def _text(series: pd.Series) -> pd.Series:
+    """Chuẩn hóa cột về chuỗi đã strip, ô trống / NaN thành ''"""
+    return series.astype('string').str.strip().fillna('')
+
+
+def _parse_date(value) -> Optional[date]:
+    """Ngày mua: nhận ô kiểu ngày hoặc chuỗi nhiều định dạng; bỏ qua ngày tương lai"""
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return None
+    parsed = None
+    if isinstance(value, datetime):
+        parsed = value.date()
+    elif isinstance(value, date):
+        parsed = value
+    else:
+        text = str(value).strip()
+        if not text or text == 'nan':
+            return None
+        for fmt in DATE_FORMATS:
+            try:
+                parsed = datetime.strptime(text, fmt).date()
+                break
+            except ValueError:
+                continue
+    if parsed and parsed > date.today():
+        return None
+    return parsed
+
+
+class _ImportContext:
+    """Dữ liệu tra cứu nạp một lần cho cả file (loại tài sản, người dùng, tên / mã đã tồn tại)"""
+
+    def __init__(self, user_id: Optional[int]):
+        self.user_id = user_id
+        self.asset_types = {name: type_id for type_id, name in db.session.query(AssetType.id, AssetType.name)
+                            .filter(AssetType.deleted_at.is_(None))}
+        self.users = {}
+        self.users_by_email = {}
+        for uid, username, email in db.session.query(User.id, User.username, User.email).filter(
+                User.deleted_at.is_(None)):
+            self.users[username] = uid
+            self.users_by_email[email] = uid
+        self.names = {name for (name,) in db.session.query(Asset.name).filter(Asset.deleted_at.is_(None))}
+        self.device_codes = {code for (code,) in db.session.query(Asset.device_code).filter(
+            Asset.deleted_at.is_(None), Asset.device_code.isnot(None))}
+        self._user_role_id = None
+
+    def ensure_asset_types(self, names):
+        """Tự động tạo các loại tài sản chưa có (một lần flush cho cả lô)"""
+        created = []
+        for name in names:
+            if name not in self.asset_types:
+                asset_type = AssetType(name=name, description='Tạo tự động từ file import')
+                db.session.add(asset_type)
+                created.append(asset_type)
+        if created:
+            db.session.flush()
+            self.asset_types.update({asset_type.name: asset_type.id for asset_type in created})
+
+    def ensure_users(self, values):
+        """Tự động tạo người dùng chưa có (mật khẩu mặc định, email tạm thời)"""
+        missing = [v for v in values if v not in self.users and v not in self.users_by_email]
+        if not missing:
+            return
+        if self._user_role_id is None:
+            user_role = Role.query.filter_by(name='user').first()
+            if not user_role:
+                user_role = Role(name='user', description='Người dùng thông thường')
+                db.session.add(user_role)
+                db.session.flush()
+            self._user_role_id = user_role.id
+        created = []
+        for value in missing:
+            new_user = User(
+                username=value,
+                email=f"{value}@hethong.local",  # Email tạm thời
+                role_id=self._user_role_id,
+                is_active=True
+            )
+            new_user.set_password("123456")  # Mật khẩu mặc định
+            db.session.add(new_user)
+            created.append(new_user)
+        db.session.flush()
+        self.users.update({user.username: user.id for user in created})
+
+    def resolve_user(self, value: str) -> Optional[int]:
+        if not value:
+            return None
+        return self.users.get(value) or self.users_by_email.get(value)
+
+
+def _validate_chunk(frame: pd.DataFrame, first_row: int, ctx: _ImportContext):
+    """
+    Kiểm tra một lô dòng. Trả về (danh sách mapping hợp lệ, danh sách lỗi (dòng, tên, lỗi)).
+    Các phép kiểm tra giá trị chạy theo cột; chỉ bước chống trùng cần đi theo thứ tự dòng.
+    """
+    names = _text(frame['Tên tài sản'])
+    type_names = _text(frame['Loại tài sản'])
+    price = pd.to_numeric(frame['Giá tiền'], errors='coerce').astype('float64')
+    quantity = pd.to_numeric(frame['Số lượng'], errors='coerce').astype('float64')
+    device_codes = _text(frame['Mã thiết bị']) if 'Mã thiết bị' in frame else pd.Series('', index=frame.index)
+
+    # Lỗi giá trị theo đúng thứ tự ưu tiên cũ (sau kiểm tra tên trống / trùng tên)
+    value_error = pd.Series('', index=frame.index, dtype=object)
+    checks = [
+        (~np.isfinite(price), 'Giá tiền không hợp lệ'),
+        (price < 0, 'Giá tiền không được nhỏ hơn 0'),
+        (~np.isfinite(quantity) | (quantity > MAX_QUANTITY), 'Số lượng không hợp lệ'),
+        # So sánh trên số thực (phần lẻ bị cắt như int() trước đây), không ép kiểu cả cột
+        (quantity < 1, 'Số lượng phải >= 1'),
+        (type_names == '', 'Loại tài sản không được để trống'),
+    ]
+    for mask, message in checks:
+        value_error = value_error.mask((value_error == '') & mask.fillna(False), message)
+
+    accepted, errors = [], []
+    for pos, (name, code, err) in enumerate(zip(names, device_codes, value_error)):
+        row_no = first_row + pos
+        if not name:
+            errors.append((row_no, name, 'Tên tài sản không được để trống'))
+        elif name in ctx.names:
+            errors.append((row_no, name, f"Tên tài sản '{name}' đã tồn tại"))
+        elif err:
+            errors.append((row_no, name, err))
+        elif code and code in ctx.device_codes:
+            errors.append((row_no, name, f"Mã thiết bị '{code}' đã tồn tại"))
+        else:
+            ctx.names.add(name)
+            if code:
+                ctx.device_codes.add(code)
+            accepted.append(pos)
+    if not accepted:
+        return [], errors
+
+    rows = frame.iloc[accepted]
+    ctx.ensure_asset_types(type_names.iloc[accepted].unique())
+    statuses = (_text(rows['Trạng thái']).str.lower().map(STATUS_MAP).fillna('active')
+                if 'Trạng thái' in rows else pd.Series('active', index=rows.index))
+    user_values = _text(rows['Người sử dụng']) if 'Người sử dụng' in rows else pd.Series('', index=rows.index)
+    ctx.ensure_users([v for v in user_values.unique() if v])
+    purchase_dates = [_parse_date(v) for v in rows['Ngày mua']] if 'Ngày mua' in rows else [None] * len(accepted)
+    conditions = _text(rows['Tình trạng']) if 'Tình trạng' in rows else pd.Series('', index=rows.index)
+    notes = _text(rows['Ghi chú']) if 'Ghi chú' in rows else pd.Series('', index=rows.index)
+
+    mappings = []
+    for i, pos in enumerate(accepted):
+        mappings.append({
+            'name': names.iat[pos],
+            'price': float(price.iat[pos]),
+            'quantity': int(quantity.iat[pos]),
+            'asset_type_id': ctx.asset_types[type_names.iat[pos]],
+            'user_id': ctx.resolve_user(user_values.iat[i]),
+            'notes': notes.iat[i] or None,
+            'status': statuses.iat[i],
+            'purchase_date': purchase_dates[i],
+            'device_code': device_codes.iat[pos] or None,
+            'condition_label': conditions.iat[i] or None,
+        })
+    return mappings, errors
+
+
+def _write_chunk(mappings: List[Dict[str, Any]], ctx: _ImportContext):
+    """Bulk insert tài sản + audit log, rồi cộng dồn bảng tổng hợp và chỉ mục tìm kiếm (bulk insert bỏ qua event của Asset)"""
+    if not mappings:
+        return
+    db.session.bulk_insert_mappings(Asset, mappings, return_defaults=True)
+    if ctx.user_id:
+        db.session.bulk_insert_mappings(AuditLog, [{
+            'user_id': ctx.user_id,
+            'module': 'assets',
+            'action': 'create',
+            'entity_id': m['id'],
+            'details': f"name={m['name']} (imported)",
+        } for m in mappings])
+
+    deltas: Dict[tuple, List[float]] = {}
+    for m in mappings:
+        contribution = AssetTypeRollup.contribution(m['asset_type_id'], m['status'], m['quantity'], m['price'], None)
+        bucket = deltas.setdefault(contribution[:2], [0, 0, 0.0])
+        bucket[0] += contribution[2]
+        bucket[1] += contribution[3]
+        bucket[2] += contribution[4]
+    connection = db.session.connection()
+    for (type_id, status), (d_count, d_quantity, d_value) in deltas.items():
+        AssetTypeRollup.apply_delta(connection, type_id, status, d_count, d_quantity, d_value)
+    connection.execute(SearchDocument.__table__.insert(), [{
+        'entity': SearchDocument.ASSET,
+        'entity_id': m['id'],
+        'content': SearchDocument.asset_content(m['name'], m['device_code']),
+    } for m in mappings])
+    DataVersion.bump(connection, DataVersion.ASSETS)
+    DataVersion.bump(connection, DataVersion.SUGGEST)
+
+
+def _error_report(errors: List[Tuple[int, str, str]]) -> Optional[str]:
+    if not errors:
+        return None
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(['Dòng', 'Tên tài sản', 'Lỗi'])
+    writer.writerows(errors)
+    return buffer.getvalue()
+
+
+def run_import(job_id: int, data: bytes, chunk_size: int = CHUNK_SIZE,
+               progress: Optional[Callable[[int, Optional[int]], None]] = None):
+    """
+    Chạy import cho một AssetImportJob (cần app context). Mỗi lô được commit cùng tiến độ;
+    `progress(đã xử lý, tổng)` được gọi sau mỗi lô (tác vụ nền dùng để báo tiến độ / dừng khi bị hủy).
+    """
+    job = db.session.get(AssetImportJob, job_id)
+    job.status = 'running'
+    job.started_at = now_vn()
+    db.session.commit()
+
+    errors: List[Tuple[int, str, str]] = []
+    cancelled = None
+    try:
+        header, rows, total = _open_rows(data, job.filename or '')
+        missing = [col for col in REQUIRED_COLUMNS if col not in header]
+        if missing:
+            raise ImportFileError(f'File Excel thiếu các cột bắt buộc: {", ".join(missing)}')
+        columns = [col for col in header if col in REQUIRED_COLUMNS or col in OPTIONAL_COLUMNS]
+        indexes = [header.index(col) for col in columns]
+        if total is not None:
+            job.total_rows = total
+
+        # Tác vụ được đưa lại hàng đợi chạy lại từ đầu: tính lại tiến độ
+        job.processed_rows = job.success_count = job.error_count = 0
+        ctx = _ImportContext(job.created_by_id)
+        first_row = 2  # Dòng 1 là tiêu đề
+        while True:
+            batch = [tuple(row[i] if i < len(row) else None for i in indexes)
+                     for row in islice(rows, chunk_size)]
+            if not batch:
+                break
+            frame = pd.DataFrame(batch, columns=columns, dtype=object)
+            mappings, chunk_errors = _validate_chunk(frame, first_row, ctx)
+            _write_chunk(mappings, ctx)
+            errors.extend(chunk_errors)
+            first_row += len(batch)
+            job.processed_rows += len(batch)
+            job.success_count += len(mappings)
+            job.error_count = len(errors)
+            db.session.commit()
+            if progress:
+                progress(job.processed_rows, job.total_rows)
+
+        job.status = 'completed'
+        job.message = f'Import thành công {job.success_count} tài sản, {job.error_count} dòng lỗi.'
+    except Exception as e:
+        db.session.rollback()
+        job = db.session.get(AssetImportJob, job_id)
+        job.status = 'failed'
+        if isinstance(e, JobCancelled):
+            job.message = 'Đã hủy import; các lô đã xử lý trước đó vẫn được giữ lại.'
+            cancelled = e
+        else:
+            job.message = str(e)[:500]
+    job.error_count = len(errors)
+    job.error_report = _error_report(errors)
+    job.finished_at = now_vn()
+    db.session.commit()
+    if cancelled:
+        raise cancelled
+    return job
+
+
+def save_upload(job_id: int, data: bytes) -> str:
+    """Lưu file upload để worker (có thể ở tiến trình khác) đọc lại; trả về đường dẫn tương đối với EXPORT_DIR"""
+    relative = os.path.join(JOBS_SUBDIR, 'uploads', f'asset_import_{job_id}.xlsx')
+    path = os.path.join(export_root(), relative)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return relative
+
+
+@job_handler('asset_import')
+def run_import_job(ctx: JobContext) -> str:
+    """Tác vụ nền: import file đã lưu bởi save_upload, tiến độ theo từng lô"""
+    path = os.path.join(export_root(), ctx.params['upload'])
+    with open(path, 'rb') as f:
+        data = f.read()
+    try:
+        job = run_import(ctx.params['import_job_id'], data, progress=ctx.progress)
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    if job.status == 'failed':
+        raise RuntimeError(job.message)
+    return job.message
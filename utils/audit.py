@@ -0,0 +1,279 @@
+"""
+Ghi nhật ký hệ thống (audit_log) theo lô: `audit.record(module, action, entity_id, details)`.
+
+- Mặc định (đồng bộ): bản ghi được giữ trong session hiện tại và chèn một lần (executemany) ngay trước
+  khi session commit, tức là cùng transaction với thay đổi nghiệp vụ - không còn commit thứ hai chỉ
+  để ghi log. Session rollback thì bỏ luôn các bản ghi đang chờ. Bản ghi phát sinh sau lần commit cuối
+  của request được ghi ở after_request.
+- AUDIT_ASYNC = True: sau khi transaction nghiệp vụ commit, bản ghi được nối vào tệp spool của tiến
+  trình (AUDIT_SPOOL_DIR) rồi một thread nền chèn theo lô mỗi AUDIT_FLUSH_INTERVAL_MS mili giây hoặc
+  khi đủ AUDIT_BATCH_SIZE dòng. Tiến trình chết giữa chừng thì tệp spool còn lại được nạp ở lần khởi
+  động sau (ghi ít nhất một lần: có thể trùng dòng nếu chết đúng lúc vừa commit lô).
+"""
+import atexit
+import glob
+import json
+import os
+import socket
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from flask import has_request_context, session
+from sqlalchemy import event
+from sqlalchemy.orm import Session as OrmSession
+
+from models import db, AuditLog
+from utils.timezone import now_vn
+
+_PENDING_KEY = 'audit_pending'
+# Mặc định user_id = người dùng đăng nhập của request
+_SESSION_USER = object()
+
+
+def _pending(orm_session, create: bool = False) -> Optional[List[Dict[str, Any]]]:
+    if create:
+        return orm_session.info.setdefault(_PENDING_KEY, [])
+    return orm_session.info.get(_PENDING_KEY)
+
+
+def _insert_rows(orm_session, rows: List[Dict[str, Any]]):
+    orm_session.execute(AuditLog.__table__.insert(), rows)
+
+
+class _SpoolWriter:
+    """Thread nền của chế độ bất đồng bộ: spool ra tệp, chèn vào CSDL theo lô"""
+
+    def __init__(self, recorder: 'AuditRecorder', app):
+        self.recorder = recorder
+        self.app = app
+        self.directory = recorder.spool_dir(app)
+        self.spool_path = os.path.join(self.directory, f'audit-{socket.gethostname()}-{os.getpid()}.jsonl')
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()
+        self._orphans_claimed = False
+        self._pending = 0
+        # Tiếp nối số thứ tự lô nếu tiến trình trước cùng pid còn để lại tệp (pid được dùng lại)
+        self._serial = max((_flushing_serial(p) for p in glob.glob(f'{self.spool_path}.*.flushing')), default=0)
+        self._stopped = False
+        os.makedirs(self.directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def submit(self, rows: List[Dict[str, Any]]):
+        lines = ''.join(json.dumps(row, ensure_ascii=False, default=str) + '\n' for row in rows)
+        with self._lock:
+            with open(self.spool_path, 'a', encoding='utf-8') as f:
+                f.write(lines)
+                f.flush()
+                if self.app.config.get('AUDIT_SPOOL_FSYNC', False):
+                    os.fsync(f.fileno())
+            self._pending += len(rows)
+            if self._pending >= int(self.app.config.get('AUDIT_BATCH_SIZE', 200)):
+                self._wakeup.notify()
+
+    def _rotate(self):
+        """Chốt tệp spool hiện tại thành một lô (.flushing); dòng mới đi vào tệp spool mới"""
+        with self._lock:
+            self._pending = 0
+            if os.path.exists(self.spool_path):
+                self._serial += 1
+                os.replace(self.spool_path, f'{self.spool_path}.{self._serial}.flushing')
+
+    def _claim_orphans(self):
+        """Tệp spool của tiến trình đã chết (không còn pid) được nhận về để nạp lại"""
+        self._orphans_claimed = True
+        own = os.path.basename(self.spool_path)
+        for path in glob.glob(os.path.join(self.directory, 'audit-*.jsonl*')):
+            name = os.path.basename(path)
+            # Cả tệp spool lẫn lô .flushing chưa ghi xong của tiến trình cũ
+            base = name[:name.index('.jsonl') + len('.jsonl')]
+            if base == own:
+                continue
+            host, _, pid = base[len('audit-'):-len('.jsonl')].rpartition('-')
+            if host == socket.gethostname() and pid.isdigit() and _pid_alive(int(pid)):
+                continue
+            try:
+                self._serial += 1
+                os.replace(path, f'{self.spool_path}.{self._serial}.flushing')
+            except FileNotFoundError:
+                pass  # Tiến trình khác vừa nhận tệp này
+
+    def flush(self) -> int:
+        """Chèn mọi lô đang chờ (kể cả lô còn sót lại do lỗi trước đó); trả về số dòng đã ghi"""
+        with self._flush_lock:
+            if not self._orphans_claimed:
+                self._claim_orphans()
+            self._rotate()
+            return self._write_segments()
+
+    def _write_segments(self) -> int:
+        written = 0
+        with self.app.app_context():
+            try:
+                for path in sorted(glob.glob(f'{self.spool_path}.*.flushing'), key=_flushing_serial):
+                    with open(path, encoding='utf-8') as f:
+                        rows = [_row_from_json(line) for line in f if line.strip()]
+                    if rows:
+                        _insert_rows(db.session, rows)
+                        db.session.commit()
+                    os.remove(path)
+                    written += len(rows)
+            except Exception as e:
+                db.session.rollback()
+                self.app.logger.error(f"[Audit] Ghi lô nhật ký thất bại, sẽ thử lại: {e}")
+            finally:
+                db.session.remove()
+        return written
+
+    def _run(self):
+        self.flush()
+        while True:
+            interval = float(self.app.config.get('AUDIT_FLUSH_INTERVAL_MS', 500)) / 1000.0
+            with self._lock:
+                if not self._stopped and self._pending < int(self.app.config.get('AUDIT_BATCH_SIZE', 200)):
+                    self._wakeup.wait(interval)
+                stopped = self._stopped
+            self.flush()
+            if stopped:
+                return
+
+    def stop(self):
+        with self._lock:
+            if self._stopped:
+                return
+            self._stopped = True
+            self._wakeup.notify()
+        self._thread.join(timeout=10)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True
+    return True
+
+
+def _flushing_serial(path: str) -> int:
+    try:
+        return int(path.rsplit('.', 2)[-2])
+    except (IndexError, ValueError):
+        return 0
+
+
+def _row_from_json(line: str) -> Dict[str, Any]:
+    row = json.loads(line)
+    if row.get('created_at'):
+        row['created_at'] = datetime.fromisoformat(row['created_at'])
+    return row
+
+
+class AuditRecorder:
+    """Extension Flask: `audit.init_app(app)`; ghi bằng `audit.record(...)`"""
+
+    def __init__(self):
+        self.app = None
+        self._writer = None
+        self._writer_lock = threading.Lock()
+
+    def init_app(self, app):
+        app.config.setdefault('AUDIT_ASYNC', False)
+        app.config.setdefault('AUDIT_FLUSH_INTERVAL_MS', 500)
+        app.config.setdefault('AUDIT_BATCH_SIZE', 200)
+        app.config.setdefault('AUDIT_SPOOL_DIR', 'instance/audit_spool')
+        app.config.setdefault('AUDIT_SPOOL_FSYNC', False)
+        app.extensions['audit'] = self
+        app.after_request(self._after_request)
+        self.app = app
+
+    @staticmethod
+    def spool_dir(app) -> str:
+        directory = app.config.get('AUDIT_SPOOL_DIR', 'instance/audit_spool')
+        return directory if os.path.isabs(directory) else os.path.join(app.root_path, directory)
+
+    @property
+    def is_async(self) -> bool:
+        return bool(self.app is not None and self.app.config.get('AUDIT_ASYNC', False))
+
+    def record(self, module: str, action: str, entity_id: Optional[int] = None, details: Optional[str] = None,
+               user_id: Any = _SESSION_USER):
+        """
+        Ghi một dòng nhật ký cùng transaction đang mở của db.session (ghi khi session commit).
+        `user_id` mặc định là người dùng đăng nhập; request không có người dùng thì bỏ qua.
+        """
+        if user_id is _SESSION_USER:
+            user_id = session.get('user_id') if has_request_context() else None
+            if user_id is None and has_request_context():
+                return
+        _pending(db.session(), create=True).append({
+            'user_id': user_id,
+            'module': module,
+            'action': action,
+            'entity_id': entity_id,
+            'details': details,
+            'created_at': now_vn(),
+        })
+
+    def _writer_for_app(self) -> _SpoolWriter:
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = _SpoolWriter(self, self.app)
+            return self._writer
+
+    def dispatch(self, rows: List[Dict[str, Any]]):
+        """Chế độ bất đồng bộ: đưa các dòng đã commit nghiệp vụ vào spool"""
+        if rows:
+            self._writer_for_app().submit(rows)
+
+    def flush(self) -> int:
+        """Ghi ngay các lô đang chờ của chế độ bất đồng bộ (dùng khi tắt tiến trình / trong test)"""
+        return self._writer.flush() if self._writer is not None else 0
+
+    def stop(self):
+        with self._writer_lock:
+            writer, self._writer = self._writer, None
+        if writer is not None:
+            writer.stop()
+
+    def _after_request(self, response):
+        """Bản ghi phát sinh sau lần commit cuối của request: ghi bằng một lần commit"""
+        orm_session = db.session()
+        if _pending(orm_session):
+            try:
+                if self.is_async:
+                    self.dispatch(orm_session.info.pop(_PENDING_KEY))
+                else:
+                    orm_session.commit()
+            except Exception as e:
+                orm_session.rollback()
+                self.app.logger.error(f"[Audit] Không ghi được nhật ký: {e}")
+        return response
+
+
+audit = AuditRecorder()
+
+
+@event.listens_for(OrmSession, 'before_commit')
+def _write_pending_audit(orm_session):
+    rows = _pending(orm_session)
+    if rows and not audit.is_async:
+        orm_session.info.pop(_PENDING_KEY)
+        _insert_rows(orm_session, rows)
+
+
+@event.listens_for(OrmSession, 'after_commit')
+def _dispatch_pending_audit(orm_session):
+    if audit.is_async and _pending(orm_session):
+        audit.dispatch(orm_session.info.pop(_PENDING_KEY))
+
+
+@event.listens_for(OrmSession, 'after_soft_rollback')
+def _discard_pending_audit(orm_session, previous_transaction):
+    # Nghiệp vụ không thành công thì nhật ký của nó cũng không được ghi
+    if previous_transaction.parent is None:
+        orm_session.info.pop(_PENDING_KEY, None)
@@ -0,0 +1,301 @@
+"""
+Tra cứu và lưu trữ nhật ký hệ thống (audit_log).
+
+- Phân trang keyset theo (created_at DESC, id DESC) thay cho paginate(): không COUNT(*), không OFFSET,
+  trang sâu tốn như trang đầu. Cursor mờ truyền qua ?after=.
+- `archive_audit_logs(keep_months)` chuyển các dòng cũ hơn N tháng sang tệp gzip JSON lines theo tháng
+  (AUDIT_ARCHIVE_DIR/audit_log_YYYY_MM_pN.jsonl.gz, sắp sẵn theo thứ tự trang) rồi xóa khỏi bảng.
+- `search_audit_logs` dùng chung bộ lọc cho bảng đang dùng và các tệp lưu trữ: hết dòng trong bảng
+  thì đọc tiếp tệp của tháng cũ hơn, nên người dùng lật trang liền mạch.
+"""
+import base64
+import binascii
+import gzip
+import json
+import os
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from flask import current_app
+from sqlalchemy import and_, or_
+
+from models import db, AuditLog, AuditLogArchive, User
+from utils.timezone import now_vn
+
+DEFAULT_PAGE_SIZE = 10
+MAX_PAGE_SIZE = 200
+ARCHIVE_READ_CHUNK = 2000
+
+AuditEntry = namedtuple('AuditEntry', 'id created_at user_id username module action entity_id details archived')
+
+
+# ---------- Bộ lọc ----------
+
+class AuditFilters:
+    """Bộ lọc nhật ký dùng chung cho trang web, API và tệp lưu trữ"""
+
+    def __init__(self, user_id: Optional[int] = None, module: str = '', action: str = '',
+                 date_from: Optional[date] = None, date_to: Optional[date] = None):
+        self.user_id = user_id
+        self.module = module or ''
+        self.action = action or ''
+        self.date_from = date_from
+        self.date_to = date_to
+
+    @classmethod
+    def from_args(cls, args) -> 'AuditFilters':
+        def parse_date(value):
+            try:
+                return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+            except ValueError:
+                return None
+        return cls(
+            user_id=args.get('user_id', type=int),
+            module=args.get('module', '', type=str).strip(),
+            action=args.get('action', '', type=str).strip(),
+            date_from=parse_date(args.get('date_from', '', type=str)),
+            date_to=parse_date(args.get('date_to', '', type=str)),
+        )
+
+    @property
+    def start(self) -> Optional[datetime]:
+        return datetime.combine(self.date_from, datetime.min.time()) if self.date_from else None
+
+    @property
+    def end(self) -> Optional[datetime]:
+        """Cận trên loại trừ (00:00 ngày sau date_to)"""
+        return datetime.combine(self.date_to + timedelta(days=1), datetime.min.time()) if self.date_to else None
+
+    def apply(self, query):
+        if self.user_id:
+            query = query.filter(AuditLog.user_id == self.user_id)
+        if self.module:
+            query = query.filter(AuditLog.module == self.module)
+        if self.action:
+            query = query.filter(AuditLog.action == self.action)
+        if self.start:
+            query = query.filter(AuditLog.created_at >= self.start)
+        if self.end:
+            query = query.filter(AuditLog.created_at < self.end)
+        return query
+
+    def matches(self, entry: AuditEntry) -> bool:
+        """Cùng điều kiện với `apply` cho dòng đọc từ tệp lưu trữ"""
+        if self.user_id and entry.user_id != self.user_id:
+            return False
+        if self.module and entry.module != self.module:
+            return False
+        if self.action and entry.action != self.action:
+            return False
+        if self.start and entry.created_at < self.start:
+            return False
+        if self.end and entry.created_at >= self.end:
+            return False
+        return True
+
+    def overlaps(self, archive: AuditLogArchive) -> bool:
+        if self.start and archive.max_created_at and archive.max_created_at < self.start:
+            return False
+        if self.end and archive.min_created_at and archive.min_created_at >= self.end:
+            return False
+        return True
+
+
+# ---------- Cursor ----------
+
+def encode_cursor(created_at: datetime, log_id: int) -> str:
+    payload = json.dumps([created_at.isoformat(), log_id])
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[datetime, int]]:
+    """Giải mã cursor, None nếu rỗng hoặc không hợp lệ (quay về trang đầu)"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, log_id = json.loads(raw.decode('utf-8'))
+        return datetime.fromisoformat(created_at), int(log_id)
+    except (binascii.Error, ValueError, TypeError, UnicodeDecodeError):
+        return None
+
+
+def _sort_key(entry: AuditEntry):
+    return entry.created_at, entry.id
+
+
+# ---------- Bảng đang dùng ----------
+
+def _live_entries(filters: AuditFilters, cursor: Optional[Tuple[datetime, int]], limit: int) -> List[AuditEntry]:
+    query = db.session.query(
+        AuditLog.id, AuditLog.created_at, AuditLog.user_id, User.username,
+        AuditLog.module, AuditLog.action, AuditLog.entity_id, AuditLog.details,
+    ).outerjoin(User, User.id == AuditLog.user_id).filter(AuditLog.created_at.isnot(None))
+    query = filters.apply(query)
+    if cursor:
+        created_at, log_id = cursor
+        query = query.filter(or_(
+            AuditLog.created_at < created_at,
+            and_(AuditLog.created_at == created_at, AuditLog.id < log_id),
+        ))
+    rows = query.order_by(AuditLog.created_at.desc(), AuditLog.id.desc()).limit(limit).all()
+    return [AuditEntry(*row, archived=False) for row in rows]
+
+
+# ---------- Tệp lưu trữ ----------
+
+def archive_root(app=None) -> str:
+    app = app or current_app
+    root = app.config.get('AUDIT_ARCHIVE_DIR', 'instance/audit_archive')
+    if not os.path.isabs(root):
+        root = os.path.join(app.root_path, root)
+    return root
+
+
+def _entry_to_json(entry: AuditEntry) -> str:
+    data = entry._asdict()
+    data.pop('archived')
+    data['created_at'] = entry.created_at.isoformat()
+    return json.dumps(data, ensure_ascii=False)
+
+
+def _entry_from_json(line: str) -> AuditEntry:
+    data = json.loads(line)
+    data['created_at'] = datetime.fromisoformat(data['created_at'])
+    return AuditEntry(archived=True, **data)
+
+
+def read_archive(archive: AuditLogArchive):
+    """Đọc tuần tự các dòng của một tệp lưu trữ (đã theo thứ tự created_at DESC, id DESC)"""
+    with gzip.open(os.path.join(archive_root(), archive.path), 'rt', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield _entry_from_json(line)
+
+
+def _archived_entries(filters: AuditFilters, cursor: Optional[Tuple[datetime, int]], limit: int) -> List[AuditEntry]:
+    """Tối đa `limit` dòng sau cursor từ các tệp lưu trữ, đọc từ tháng mới về tháng cũ"""
+    query = AuditLogArchive.query
+    if cursor:
+        query = query.filter(or_(AuditLogArchive.min_created_at.is_(None), AuditLogArchive.min_created_at <= cursor[0]))
+    archives = [a for a in query.order_by(AuditLogArchive.month.desc(), AuditLogArchive.part).all() if filters.overlaps(a)]
+
+    collected: List[AuditEntry] = []
+    month_entries: List[AuditEntry] = []
+    for index, archive in enumerate(archives):
+        for entry in read_archive(archive):
+            if cursor and _sort_key(entry) >= cursor:
+                continue
+            if filters.matches(entry):
+                month_entries.append(entry)
+        # Các phần của cùng một tháng có thể đan xen thời gian: gộp đủ cả tháng rồi mới sắp xếp
+        last_of_month = index + 1 == len(archives) or archives[index + 1].month != archive.month
+        if last_of_month:
+            collected.extend(sorted(month_entries, key=_sort_key, reverse=True))
+            month_entries = []
+            if len(collected) >= limit:
+                break
+    return collected[:limit]
+
+
+def search_audit_logs(filters: AuditFilters, after: Optional[str] = None,
+                      per_page: int = DEFAULT_PAGE_SIZE) -> Dict[str, Any]:
+    """
+    Một trang nhật ký sau cursor `after` (bảng đang dùng + tệp lưu trữ).
+    Trả về {'items', 'next_cursor', 'per_page'}; `next_cursor` là None ở trang cuối.
+    """
+    per_page = min(max(per_page or DEFAULT_PAGE_SIZE, 1), MAX_PAGE_SIZE)
+    cursor = decode_cursor(after)
+    entries = _live_entries(filters, cursor, per_page + 1)
+    archived_until = db.session.query(db.func.max(AuditLogArchive.max_created_at)).scalar()
+    if archived_until is not None and (len(entries) <= per_page or entries[-1].created_at <= archived_until):
+        # Trang chạm tới khoảng thời gian đã lưu trữ: gộp với dòng từ tệp (dòng ghi muộn vào tháng cũ vẫn nằm trong bảng)
+        entries = sorted(entries + _archived_entries(filters, cursor, per_page + 1), key=_sort_key, reverse=True)
+    items = entries[:per_page]
+    next_cursor = None
+    if len(entries) > per_page:
+        last = items[-1]
+        next_cursor = encode_cursor(last.created_at, last.id)
+    return {'items': items, 'next_cursor': next_cursor, 'per_page': per_page}
+
+
+def entry_to_dict(entry: AuditEntry) -> Dict[str, Any]:
+    data = entry._asdict()
+    data['created_at'] = entry.created_at.isoformat()
+    return data
+
+
+# ---------- Lưu trữ theo tháng ----------
+
+def _month_start(value: datetime) -> datetime:
+    return datetime(value.year, value.month, 1)
+
+
+def _add_months(value: datetime, months: int) -> datetime:
+    index = value.year * 12 + value.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def _archive_month(month_start: datetime, month_end: datetime) -> Optional[AuditLogArchive]:
+    month = month_start.strftime('%Y-%m')
+    max_id = db.session.query(db.func.max(AuditLog.id)).filter(
+        AuditLog.created_at >= month_start, AuditLog.created_at < month_end
+    ).scalar()
+    if max_id is None:
+        return None
+    part = (db.session.query(db.func.max(AuditLogArchive.part)).filter(AuditLogArchive.month == month).scalar() or 0) + 1
+    relative = f"audit_log_{month.replace('-', '_')}_p{part}.jsonl.gz"
+    path = os.path.join(archive_root(), relative)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    in_month = and_(AuditLog.created_at >= month_start, AuditLog.created_at < month_end, AuditLog.id <= max_id)
+    query = db.session.query(
+        AuditLog.id, AuditLog.created_at, AuditLog.user_id, User.username,
+        AuditLog.module, AuditLog.action, AuditLog.entity_id, AuditLog.details,
+    ).outerjoin(User, User.id == AuditLog.user_id).filter(in_month).order_by(
+        AuditLog.created_at.desc(), AuditLog.id.desc()
+    )
+    archive = AuditLogArchive(month=month, part=part, path=relative, row_count=0, max_log_id=max_id)
+    tmp_path = path + '.tmp'
+    try:
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            for row in query.yield_per(ARCHIVE_READ_CHUNK):
+                entry = AuditEntry(*row, archived=True)
+                f.write(_entry_to_json(entry) + '\n')
+                archive.row_count += 1
+                if archive.max_created_at is None:
+                    archive.max_created_at = entry.created_at
+                archive.min_created_at = entry.created_at
+        os.replace(tmp_path, path)
+        db.session.add(archive)
+        AuditLog.query.filter(in_month).delete(synchronize_session=False)
+        db.session.commit()
+    except BaseException:
+        db.session.rollback()
+        for leftover in (tmp_path, path):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        raise
+    return archive
+
+
+def archive_audit_logs(keep_months: Optional[int] = None, now: Optional[datetime] = None) -> List[AuditLogArchive]:
+    """
+    Chuyển nhật ký của các tháng trọn vẹn cũ hơn `keep_months` tháng (mặc định AUDIT_ARCHIVE_KEEP_MONTHS)
+    sang tệp lưu trữ, mỗi tháng một tệp; chạy lại an toàn (dòng ghi muộn vào tháng đã lưu thành phần mới).
+    """
+    if keep_months is None:
+        keep_months = int(current_app.config.get('AUDIT_ARCHIVE_KEEP_MONTHS', 12))
+    cutoff = _add_months(_month_start(now or now_vn()), -max(int(keep_months), 0))
+    archives = []
+    while True:
+        oldest = db.session.query(db.func.min(AuditLog.created_at)).filter(AuditLog.created_at < cutoff).scalar()
+        if oldest is None:
+            break
+        month_start = _month_start(oldest)
+        archive = _archive_month(month_start, min(_add_months(month_start, 1), cutoff))
+        if archive is None:
+            break
+        archives.append(archive)
+    return archives
@@ -0,0 +1,202 @@
+"""
+Cache xác thực cho REST API (JWT).
+
+- `revocation_store`: danh sách token đã thu hồi (bảng revoked_token) với bộ lọc Bloom trong
+  tiến trình phía trước. Token chưa từng bị thu hồi (gần như mọi request) được trả lời ngay,
+  không truy vấn; chỉ khi Bloom báo "có thể" mới xác nhận bằng CSDL. Bản ghi mới được nạp tăng
+  dần khi phiên bản `DataVersion.TOKENS` đổi (kiểm tra mỗi JWT_REVOCATION_VERSION_CHECK giây,
+  ngay lập tức nếu chính tiến trình này vừa thu hồi).
+- `identity_cache`: (id, username, vai trò, còn hoạt động) của user theo id, LRU có TTL ngắn;
+  bỏ cache ngay khi tiến trình này sửa/xóa user (`DataVersion.IDENTITY`), worker khác thấy
+  thay đổi sau tối đa JWT_IDENTITY_CACHE_TTL giây.
+"""
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import timedelta
+
+from flask import current_app
+from sqlalchemy import or_
+
+from models import db, DataVersion, RevokedToken, Role, User
+from utils.timezone import now_vn
+
+# Nạp lại cả các dòng thu hồi ngay trước mốc (transaction commit muộn hơn revoked_at của nó)
+WATERMARK_OVERLAP = timedelta(minutes=5)
+
+CachedIdentity = namedtuple('CachedIdentity', 'id username role_name is_active')
+
+
+def _config(key, default):
+    try:
+        return current_app.config.get(key, default)
+    except RuntimeError:
+        return default
+
+
+class BloomFilter:
+    """Bộ lọc Bloom trên bytearray: không có âm tính giả, dương tính giả ~ error_rate"""
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        capacity = max(int(capacity), 1)
+        self.capacity = capacity
+        self.size = max(int(-capacity * math.log(error_rate) / (math.log(2) ** 2)), 8)
+        self.hashes = max(int(round(self.size / capacity * math.log(2))), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, key: str):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class RevocationStore:
+    """Danh sách JWT đã thu hồi: Bloom trong bộ nhớ + bảng revoked_token"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._bloom = None
+            self._confirmed = set()
+            self._watermark = None
+            self._version = None
+            self._serial = None
+            self._checked_at = 0.0
+
+    def _load(self, since):
+        query = db.session.query(RevokedToken.jti, RevokedToken.revoked_at).filter(
+            or_(RevokedToken.expires_at.is_(None), RevokedToken.expires_at >= now_vn())
+        )
+        if since is not None:
+            query = query.filter(RevokedToken.revoked_at >= since - WATERMARK_OVERLAP)
+        for jti, revoked_at in query:
+            self._bloom.add(jti)
+            if revoked_at and (self._watermark is None or revoked_at > self._watermark):
+                self._watermark = revoked_at
+
+    def _rebuild(self):
+        live = db.session.query(db.func.count(RevokedToken.id)).filter(
+            or_(RevokedToken.expires_at.is_(None), RevokedToken.expires_at >= now_vn())
+        ).scalar() or 0
+        capacity = max(int(_config('JWT_REVOCATION_BLOOM_CAPACITY', 100000)), live * 2)
+        self._bloom = BloomFilter(capacity)
+        self._confirmed = set()
+        self._watermark = None
+        self._load(None)
+
+    def _sync(self):
+        now = time.monotonic()
+        serial = DataVersion.local_serial(DataVersion.TOKENS)
+        interval = float(_config('JWT_REVOCATION_VERSION_CHECK', 1))
+        if self._bloom is not None and serial == self._serial and now - self._checked_at < interval:
+            return
+        with self._lock:
+            version = DataVersion.current(DataVersion.TOKENS)
+            self._checked_at = now
+            self._serial = serial
+            if self._bloom is not None and version == self._version:
+                return
+            if self._bloom is None:
+                self._rebuild()
+            else:
+                self._load(self._watermark)
+                # Đầy quá sức chứa thì tỉ lệ dương tính giả tăng: dựng lại lớn hơn (bỏ luôn token đã hết hạn)
+                if self._bloom.count > self._bloom.capacity:
+                    self._rebuild()
+            self._version = version
+
+    def is_revoked(self, jti: str) -> bool:
+        """Token (theo jti) đã bị thu hồi chưa - không truy vấn khi Bloom trả lời "không" """
+        if not jti:
+            return False
+        self._sync()
+        if jti not in self._bloom:
+            return False
+        if jti in self._confirmed:
+            return True
+        revoked = db.session.query(RevokedToken.id).filter(RevokedToken.jti == jti).first() is not None
+        if revoked:
+            with self._lock:
+                self._confirmed.add(jti)
+        return revoked
+
+    def revoke(self, jwt_payload):
+        """Thu hồi token từ payload đã giải mã (thêm vào session, người gọi commit)"""
+        jti = jwt_payload.get('jti')
+        if not jti:
+            return
+        if db.session.query(RevokedToken.id).filter(RevokedToken.jti == jti).first() is None:
+            db.session.add(RevokedToken.from_payload(jwt_payload))
+        with self._lock:
+            if self._bloom is not None:
+                self._bloom.add(jti)
+
+
+class IdentityCache:
+    """LRU (id user -> CachedIdentity) có TTL; None = user không tồn tại"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._entries = OrderedDict()
+            self._serial = None
+
+    def get(self, user_id):
+        try:
+            user_id = int(user_id)
+        except (TypeError, ValueError):
+            return None
+        now = time.monotonic()
+        serial = DataVersion.local_serial(DataVersion.IDENTITY)
+        with self._lock:
+            if serial != self._serial:
+                self._entries.clear()
+                self._serial = serial
+            cached = self._entries.get(user_id)
+            if cached is not None and now - cached[1] < float(_config('JWT_IDENTITY_CACHE_TTL', 30)):
+                self._entries.move_to_end(user_id)
+                return cached[0]
+
+        row = db.session.query(
+            User.id, User.username, Role.name, User.is_active, User.deleted_at
+        ).join(Role, Role.id == User.role_id).filter(User.id == user_id).first()
+        identity = None
+        if row:
+            identity = CachedIdentity(row[0], row[1], row[2], bool(row[3]) and row[4] is None)
+
+        with self._lock:
+            self._entries[user_id] = (identity, now)
+            self._entries.move_to_end(user_id)
+            max_entries = int(_config('JWT_IDENTITY_CACHE_SIZE', 1024))
+            while len(self._entries) > max_entries:
+                self._entries.popitem(last=False)
+        return identity
+
+    def invalidate(self, user_id=None):
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(int(user_id), None)
+
+
+revocation_store = RevocationStore()
+identity_cache = IdentityCache()
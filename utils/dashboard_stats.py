@@ -0,0 +1,234 @@
+"""Thống kê Dashboard tính bằng truy vấn GROUP BY (không nạp toàn bộ tài sản vào Python)"""
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import case, func
+
+from models import db, Asset, AssetType, AssetTypeRollup, MaintenanceRecord, User
+
+# Các trạng thái được thống kê riêng trên Dashboard
+KNOWN_STATUSES = ('active', 'inactive', 'maintenance', 'disposed')
+
+# (từ khóa trong tên loại, icon Font Awesome) - khớp theo thứ tự, từ khóa dài đặt trước
+ASSET_TYPE_ICON_MAP = [
+    ('thiết bị văn phòng', 'fa-print'),
+    ('thiết bị điện tử', 'fa-microchip'),
+    ('thiết bị mạng', 'fa-network-wired'),
+    ('thiết bị điện', 'fa-plug'),
+    ('thiết bị an ninh', 'fa-shield-alt'),
+    ('cây máy tính', 'fa-desktop'),
+    ('bàn ghế', 'fa-couch'),
+    ('air conditioner', 'fa-snowflake'),
+    ('cơ sở dữ liệu', 'fa-database'),
+    ('máy chủ', 'fa-server'),
+    ('sao lưu', 'fa-hdd'),
+    ('máy tính', 'fa-desktop'),
+    ('computer', 'fa-desktop'),
+    ('pc', 'fa-desktop'),
+    ('laptop', 'fa-laptop'),
+    ('office', 'fa-print'),
+    ('máy in', 'fa-print'),
+    ('printer', 'fa-print'),
+    ('nội thất', 'fa-couch'),
+    ('furniture', 'fa-couch'),
+    ('bàn', 'fa-table'),
+    ('ghế', 'fa-chair'),
+    ('tủ', 'fa-archive'),
+    ('kệ', 'fa-archive'),
+    ('network', 'fa-network-wired'),
+    ('router', 'fa-network-wired'),
+    ('switch', 'fa-network-wired'),
+    ('wifi', 'fa-wifi'),
+    ('điện', 'fa-plug'),
+    ('electrical', 'fa-plug'),
+    ('điện tử', 'fa-microchip'),
+    ('electronic', 'fa-microchip'),
+    ('điện thoại', 'fa-mobile-alt'),
+    ('phone', 'fa-mobile-alt'),
+    ('smartphone', 'fa-mobile-alt'),
+    ('phần mềm', 'fa-code'),
+    ('software', 'fa-code'),
+    ('app', 'fa-code'),
+    ('security', 'fa-shield-alt'),
+    ('camera', 'fa-video'),
+    ('dụng cụ', 'fa-tools'),
+    ('tool', 'fa-tools'),
+    ('tools', 'fa-tools'),
+    ('máy chiếu', 'fa-video'),
+    ('projector', 'fa-video'),
+    ('màn hình', 'fa-tv'),
+    ('monitor', 'fa-tv'),
+    ('screen', 'fa-tv'),
+    ('máy lạnh', 'fa-snowflake'),
+    ('ac', 'fa-snowflake'),
+    ('quạt', 'fa-wind'),
+    ('fan', 'fa-wind'),
+    ('server', 'fa-server'),
+    ('database', 'fa-database'),
+    ('backup', 'fa-hdd'),
+    ('khác', 'fa-box'),
+    ('other', 'fa-box'),
+]
+
+
+def asset_type_icon(type_name: Optional[str]) -> str:
+    """Trả về icon phù hợp với loại thiết bị"""
+    if not type_name:
+        return 'fa-box'
+    type_name_lower = type_name.lower().strip()
+    for key, icon in ASSET_TYPE_ICON_MAP:
+        if key in type_name_lower:
+            return icon
+    return 'fa-box'
+
+
+def _status_type_matrix():
+    """Ma trận (loại tài sản × trạng thái) đọc từ bảng tổng hợp asset_type_rollup - O(#loại) dòng"""
+    AssetTypeRollup.ensure_populated()
+    rows = db.session.query(
+        AssetTypeRollup.asset_type_id,
+        AssetTypeRollup.status,
+        AssetTypeRollup.asset_count,
+        AssetTypeRollup.total_quantity,
+        AssetTypeRollup.total_value,
+    ).filter(AssetTypeRollup.asset_count > 0).all()
+    return [
+        (type_id, None if status == AssetTypeRollup.NULL_STATUS else status, count, quantity, value)
+        for type_id, status, count, quantity, value in rows
+    ]
+
+
+def asset_value_by_type() -> Dict[int, Dict[str, float]]:
+    """Tổng số lượng và giá trị theo loại tài sản (không tính tài sản đã thanh lý)"""
+    AssetTypeRollup.ensure_populated()
+    rows = db.session.query(
+        AssetTypeRollup.asset_type_id,
+        func.sum(AssetTypeRollup.total_quantity),
+        func.sum(AssetTypeRollup.total_value),
+    ).filter(
+        AssetTypeRollup.status.notin_(('disposed', AssetTypeRollup.NULL_STATUS))
+    ).group_by(AssetTypeRollup.asset_type_id).all()
+    return {
+        type_id: {'total_count': int(quantity or 0), 'total_value': float(value or 0)}
+        for type_id, quantity, value in rows
+    }
+
+
+def _maintenance_due(today: date, horizon_days: int, limit: int) -> Dict[str, Any]:
+    """Đếm bảo trì quá hạn / sắp đến hạn và lấy danh sách gần nhất"""
+    horizon = today + timedelta(days=horizon_days)
+    base_filter = (
+        MaintenanceRecord.deleted_at.is_(None),
+        MaintenanceRecord.next_due_date.isnot(None),
+        MaintenanceRecord.next_due_date <= horizon,
+    )
+    overdue, due_soon = db.session.query(
+        func.coalesce(func.sum(case((MaintenanceRecord.next_due_date < today, 1), else_=0)), 0),
+        func.coalesce(func.sum(case((MaintenanceRecord.next_due_date >= today, 1), else_=0)), 0),
+    ).filter(*base_filter).one()
+
+    rows = db.session.query(
+        MaintenanceRecord.id,
+        MaintenanceRecord.asset_id,
+        Asset.name,
+        MaintenanceRecord.type,
+        MaintenanceRecord.status,
+        MaintenanceRecord.next_due_date,
+    ).join(
+        Asset, Asset.id == MaintenanceRecord.asset_id
+    ).filter(*base_filter).order_by(
+        MaintenanceRecord.next_due_date.asc(), MaintenanceRecord.id.asc()
+    ).limit(limit).all()
+
+    due_records = [{
+        'id': r[0],
+        'asset_id': r[1],
+        'asset_name': r[2],
+        'type': r[3],
+        'status': r[4],
+        'next_due_date': r[5].isoformat() if r[5] else None,
+        'is_overdue': bool(r[5] and r[5] < today),
+    } for r in rows]
+    return {'overdue': int(overdue or 0), 'due_soon': int(due_soon or 0), 'due_records': due_records}
+
+
+def compute_dashboard_stats(today: Optional[date] = None, due_horizon_days: int = 30,
+                            due_limit: int = 10) -> Dict[str, Any]:
+    """
+    Tính toàn bộ KPI của Dashboard bằng một số ít truy vấn tổng hợp.
+
+    Kết quả là dict thuần (chỉ chứa số, chuỗi, list/dict) để dùng chung cho
+    template `index.html` và REST API.
+    """
+    today = today or date.today()
+
+    asset_types = db.session.query(AssetType.id, AssetType.name).filter(
+        AssetType.deleted_at.is_(None)
+    ).all()
+
+    per_type: Dict[int, Dict[str, int]] = {}
+    qty_by_status = {status: 0 for status in KNOWN_STATUSES}
+    other_qty = 0
+    total_value = 0.0
+    for type_id, status, row_count, qty_sum, value_sum in _status_type_matrix():
+        qty_sum = int(qty_sum or 0)
+        if status in qty_by_status:
+            qty_by_status[status] += qty_sum
+        else:
+            other_qty += qty_sum
+        if status != 'disposed':
+            total_value += float(value_sum or 0)
+
+        bucket = per_type.setdefault(type_id, {'total': 0, 'active': 0, 'inactive': 0, 'maintenance': 0})
+        # Giữ ngữ nghĩa SQL cũ (status != 'disposed'): trạng thái NULL không được đếm
+        if status is not None and status != 'disposed':
+            bucket['total'] += row_count
+        if status in bucket:
+            bucket[status] += row_count
+
+    asset_type_stats: List[Dict[str, Any]] = []
+    for type_id, type_name in asset_types:
+        if not type_name:
+            continue
+        bucket = per_type.get(type_id, {})
+        asset_type_stats.append({
+            'type_id': type_id,
+            'type_name': type_name,
+            'total_count': bucket.get('total', 0),
+            'active_count': bucket.get('active', 0),
+            'inactive_count': bucket.get('inactive', 0),
+            'maintenance_count': bucket.get('maintenance', 0),
+            'icon': asset_type_icon(type_name),
+        })
+    asset_type_stats.sort(key=lambda x: x['total_count'], reverse=True)
+
+    maintenance_record_count, total_maintenance_cost = db.session.query(
+        func.count(MaintenanceRecord.id),
+        func.coalesce(func.sum(MaintenanceRecord.cost), 0),
+    ).filter(MaintenanceRecord.deleted_at.is_(None)).one()
+
+    total_users = db.session.query(func.count(User.id)).filter(User.deleted_at.is_(None)).scalar() or 0
+
+    due = _maintenance_due(today, due_horizon_days, due_limit)
+
+    active_count = qty_by_status['active']
+    inactive_count = qty_by_status['inactive']
+    maintenance_count = qty_by_status['maintenance']
+
+    return {
+        'total_assets': active_count + inactive_count + maintenance_count + other_qty,
+        'active_assets': active_count,
+        'inactive_assets': inactive_count,
+        'maintenance_assets': maintenance_count,
+        'disposed_assets': qty_by_status['disposed'],
+        'other_assets': other_qty,
+        'total_asset_types': len(asset_types),
+        'total_users': int(total_users),
+        'maintenance_count': int(maintenance_record_count or 0),
+        'total_value': total_value,
+        'total_maintenance_cost': float(total_maintenance_cost or 0),
+        'asset_type_stats': asset_type_stats,
+        'overdue_maintenance': due['overdue'],
+        'due_soon_maintenance': due['due_soon'],
+        'due_records': due['due_records'],
+    }
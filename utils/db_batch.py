@@ -0,0 +1,28 @@
+"""Tiện ích xử lý dữ liệu theo lô (chia nhỏ danh sách id cho mệnh đề IN, ...)"""
+from typing import Iterable, Iterator, List, Sequence, TypeVar
+
+T = TypeVar('T')
+
+# Giữ dưới giới hạn biến của SQLite (999 ở các bản cũ) cho mệnh đề IN
+IN_CLAUSE_CHUNK = 500
+
+
+def chunked(items: Sequence[T], size: int = IN_CLAUSE_CHUNK) -> Iterator[Sequence[T]]:
+    """Chia danh sách thành các lô có kích thước tối đa `size`"""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def unique_int_ids(values: Iterable) -> List[int]:
+    """Chuyển danh sách id (chuỗi/số) thành list int duy nhất, giữ nguyên thứ tự, bỏ giá trị lỗi"""
+    seen = set()
+    result = []
+    for value in values or []:
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            continue
+        if value not in seen:
+            seen.add(value)
+            result.append(value)
+    return result
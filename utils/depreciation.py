@@ -0,0 +1,224 @@
+"""
+Tính khấu hao tài sản theo lô (dùng chung cho /assets/depreciation và API MISA).
+
+Toàn bộ tài sản và lũy kế các kỳ trước được nạp bằng vài truy vấn theo lô,
+số khấu hao được tính bằng mảng NumPy, kết quả ghi bằng bulk insert/update.
+"""
+from calendar import monthrange
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import func
+
+from models import db, Asset, AssetDepreciation
+from utils.db_batch import chunked, unique_int_ids
+from utils.jobs import JobContext, job_handler
+from utils.timezone import now_vn
+
+# Chỉ tính khấu hao cho tài sản có nguyên giá từ 30 triệu VNĐ
+MIN_DEPRECIABLE_VALUE = 30000000
+# Tài sản phải sử dụng đủ 12 tháng (tính đến cuối năm tính khấu hao)
+MIN_MONTHS_IN_USE = 12
+# Thời gian sử dụng chuẩn (năm) khi tài sản không có dữ liệu riêng
+DEFAULT_USEFUL_LIFE_YEARS = 5
+
+METHODS = ('straight_line', 'declining_balance')
+
+
+def _load_assets(asset_ids: Sequence[int]) -> Dict[int, tuple]:
+    """Nạp (tên, nguyên giá, ngày mua) của các tài sản chưa xóa"""
+    assets = {}
+    for chunk in chunked(asset_ids):
+        rows = db.session.query(Asset.id, Asset.name, Asset.price, Asset.purchase_date).filter(
+            Asset.id.in_(chunk), Asset.deleted_at.is_(None)
+        ).all()
+        for asset_id, name, price, purchase_date in rows:
+            assets[asset_id] = (name, price or 0, purchase_date)
+    return assets
+
+
+def _prior_period_filter(period_year: int, period_month: Optional[int]):
+    if period_month:
+        return db.or_(
+            AssetDepreciation.period_year < period_year,
+            db.and_(
+                AssetDepreciation.period_year == period_year,
+                AssetDepreciation.period_month < period_month
+            )
+        )
+    return AssetDepreciation.period_year < period_year
+
+
+def _load_prior_accumulated(asset_ids: Sequence[int], period_year: int, period_month: Optional[int]) -> Dict[int, float]:
+    """Lũy kế khấu hao trước kỳ tính = tổng số khấu hao các kỳ trước (một truy vấn GROUP BY mỗi lô)"""
+    prior = {}
+    for chunk in chunked(asset_ids):
+        rows = db.session.query(
+            AssetDepreciation.asset_id, func.sum(AssetDepreciation.depreciation_amount)
+        ).filter(
+            AssetDepreciation.asset_id.in_(chunk),
+            _prior_period_filter(period_year, period_month)
+        ).group_by(AssetDepreciation.asset_id).all()
+        prior.update({asset_id: float(total or 0) for asset_id, total in rows})
+    return prior
+
+
+def _load_existing_ids(asset_ids: Sequence[int], period_year: int, period_month: Optional[int]) -> Dict[int, int]:
+    """Id bản ghi khấu hao đã có của kỳ đang tính, theo asset_id"""
+    existing = {}
+    month_filter = (AssetDepreciation.period_month == period_month) if period_month \
+        else AssetDepreciation.period_month.is_(None)
+    for chunk in chunked(asset_ids):
+        rows = db.session.query(AssetDepreciation.asset_id, func.min(AssetDepreciation.id)).filter(
+            AssetDepreciation.asset_id.in_(chunk),
+            AssetDepreciation.period_year == period_year,
+            month_filter
+        ).group_by(AssetDepreciation.asset_id).all()
+        existing.update(dict(rows))
+    return existing
+
+
+def months_in_use(purchase_years: np.ndarray, purchase_months: np.ndarray, period_year: int) -> np.ndarray:
+    """Số tháng từ tháng mua đến hết năm tính khấu hao (tính cả tháng mua)"""
+    return (period_year - purchase_years) * 12 + 13 - purchase_months
+
+
+def compute_amounts(original: np.ndarray, prior: np.ndarray, purchase_in_period: np.ndarray,
+                    days_used_ratio: np.ndarray, method: str, period_month: Optional[int],
+                    useful_life_years: int = DEFAULT_USEFUL_LIFE_YEARS) -> np.ndarray:
+    """
+    Số khấu hao của kỳ cho một mảng tài sản.
+
+    - Đường thẳng: năm = Nguyên giá / Thời gian sử dụng
+    - Số dư giảm dần: năm = (Nguyên giá - Lũy kế) * tỷ lệ * 2
+    - Theo tháng: năm / 12, tháng mua tính theo số ngày sử dụng thực tế
+    Kết quả không vượt quá giá trị còn lại và không âm.
+    """
+    rate = 1.0 / useful_life_years
+    if method == 'straight_line':
+        annual = original / useful_life_years
+    else:
+        annual = (original - prior) * rate * 2
+    if period_month:
+        amount = annual / 12
+        amount = np.where(purchase_in_period, amount * days_used_ratio, amount)
+    else:
+        amount = annual
+    amount = np.minimum(amount, original - prior)
+    return np.maximum(amount, 0.0)
+
+
+def calculate_depreciation(asset_ids, period_year: int, period_month: Optional[int] = None,
+                           method: str = 'straight_line', commit: bool = True) -> Dict[str, Any]:
+    """
+    Tính và lưu khấu hao kỳ (năm hoặc tháng) cho danh sách tài sản.
+
+    Trả về dict: `results` (asset_id, depreciation_amount, accumulated, remaining_value),
+    `skipped` (tài sản chưa đủ điều kiện: nguyên giá < 30 triệu hoặc chưa đủ 12 tháng).
+    """
+    if method not in METHODS:
+        method = 'declining_balance' if method else 'straight_line'
+    period_month = period_month or None
+    ids = unique_int_ids(asset_ids)
+    assets = _load_assets(ids)
+
+    eligible: List[int] = []
+    skipped: List[Dict[str, Any]] = []
+    candidate_ids = [asset_id for asset_id in ids if asset_id in assets and assets[asset_id][1] > 0]
+    if candidate_ids:
+        prices = np.array([assets[i][1] for i in candidate_ids], dtype=float)
+        has_date = np.array([assets[i][2] is not None for i in candidate_ids])
+        p_years = np.array([assets[i][2].year if assets[i][2] else period_year for i in candidate_ids])
+        p_months = np.array([assets[i][2].month if assets[i][2] else 1 for i in candidate_ids])
+
+        too_cheap = prices < MIN_DEPRECIABLE_VALUE
+        future = has_date & (p_years > period_year)
+        too_new = has_date & ~future & (months_in_use(p_years, p_months, period_year) < MIN_MONTHS_IN_USE)
+        for idx, asset_id in enumerate(candidate_ids):
+            if future[idx] and not too_cheap[idx]:
+                continue  # Năm mua sau năm tính: bỏ qua
+            if too_cheap[idx] or too_new[idx]:
+                skipped.append({
+                    'asset_id': asset_id,
+                    'name': assets[asset_id][0],
+                    'reason': 'min_value' if too_cheap[idx] else 'min_months',
+                })
+            else:
+                eligible.append(asset_id)
+
+    results: List[Dict[str, Any]] = []
+    if eligible:
+        prior_map = _load_prior_accumulated(eligible, period_year, period_month)
+        original = np.array([assets[i][1] for i in eligible], dtype=float)
+        prior = np.array([prior_map.get(i, 0.0) for i in eligible], dtype=float)
+        purchase_in_period = np.zeros(len(eligible), dtype=bool)
+        days_used_ratio = np.ones(len(eligible), dtype=float)
+        if period_month:
+            days_in_month = monthrange(period_year, period_month)[1]
+            dates = [assets[i][2] for i in eligible]
+            purchase_in_period = np.array([
+                d is not None and d.year == period_year and d.month == period_month for d in dates
+            ], dtype=bool)
+            purchase_days = np.array([d.day if d is not None else 1 for d in dates], dtype=float)
+            days_used_ratio = (days_in_month - purchase_days + 1) / days_in_month
+
+        amounts = compute_amounts(original, prior, purchase_in_period, days_used_ratio, method, period_month)
+        accumulated = prior + amounts
+        remaining = original - accumulated
+        rate_percent = 100.0 / DEFAULT_USEFUL_LIFE_YEARS
+
+        existing = _load_existing_ids(eligible, period_year, period_month)
+        now = now_vn()
+        inserts, updates = [], []
+        for idx, asset_id in enumerate(eligible):
+            values = {
+                'depreciation_amount': float(amounts[idx]),
+                'accumulated_depreciation': float(accumulated[idx]),
+                'remaining_value': float(remaining[idx]),
+                'method': method,
+                'depreciation_rate': rate_percent,
+            }
+            if asset_id in existing:
+                updates.append(dict(values, id=existing[asset_id]))
+            else:
+                inserts.append(dict(
+                    values,
+                    asset_id=asset_id,
+                    period_year=period_year,
+                    period_month=period_month,
+                    original_value=float(original[idx]),
+                    created_at=now,
+                ))
+            results.append({
+                'asset_id': asset_id,
+                'depreciation_amount': values['depreciation_amount'],
+                'accumulated': values['accumulated_depreciation'],
+                'remaining_value': values['remaining_value'],
+            })
+        if updates:
+            db.session.bulk_update_mappings(AssetDepreciation, updates)
+        if inserts:
+            db.session.bulk_insert_mappings(AssetDepreciation, inserts)
+
+    if commit:
+        db.session.commit()
+    return {'results': results, 'skipped': skipped}
+
+
+# Số tài sản mỗi lô khi tính khấu hao bằng tác vụ nền (báo tiến độ / kiểm tra hủy sau mỗi lô)
+JOB_CHUNK_SIZE = 500
+
+
+@job_handler('depreciation')
+def run_depreciation_job(ctx: JobContext) -> str:
+    """Tác vụ nền: tính khấu hao cho danh sách tài sản lớn, commit theo từng lô"""
+    params = ctx.params
+    ids = unique_int_ids(params.get('asset_ids') or [])
+    calculated = skipped = 0
+    for start in range(0, len(ids), JOB_CHUNK_SIZE):
+        outcome = calculate_depreciation(ids[start:start + JOB_CHUNK_SIZE], params['year'],
+                                         params.get('month'), params.get('method', 'straight_line'))
+        calculated += len(outcome['results'])
+        skipped += len(outcome['skipped'])
+        ctx.progress(min(start + JOB_CHUNK_SIZE, len(ids)), len(ids))
+    return f'Đã tính khấu hao/hao mòn cho {calculated} tài sản; {skipped} tài sản không đủ điều kiện.'
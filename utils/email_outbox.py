@@ -0,0 +1,185 @@
+"""
+Outbox email: request chỉ ghi email vào bảng email_outbox (`queue_email`), việc gửi do tác vụ nền
+'email_outbox' (utils/jobs.py) đảm nhận.
+
+- Một lần chạy nhận email đến hạn theo lô (MAIL_BATCH_SIZE) và gửi qua cùng một phiên SMTP đã đăng
+  nhập (`SMTPSession`): kết nối lại sau MAIL_MAX_PER_CONNECTION thư, giãn cách theo MAIL_RATE_LIMIT.
+- Lỗi tạm thời (mất kết nối, 4xx) được thử lại với thời gian chờ tăng gấp đôi từ MAIL_RETRY_BASE
+  giây, tối đa MAIL_MAX_ATTEMPTS lần; lỗi vĩnh viễn (người nhận bị từ chối, 5xx) đánh dấu failed ngay.
+- Mỗi thời điểm chỉ có một tác vụ 'email_outbox' đang chờ: còn email chờ thử lại thì tác vụ tự hẹn
+  giờ lần chạy kế tiếp (`run_after`).
+"""
+import smtplib
+from datetime import datetime, timedelta
+from typing import List, Optional, Set
+
+from flask import current_app
+
+from models import db, BackgroundJob, EmailOutbox
+from utils.email_sender import SMTPSession, build_message
+from utils.jobs import JobContext, enqueue, job_handler, job_runner
+from utils.timezone import now_vn
+
+JOB_KIND = 'email_outbox'
+
+
+def _config(key, default):
+    return current_app.config.get(key, default)
+
+
+def delivery_enabled() -> bool:
+    """Email được bật và có máy chủ SMTP (ngược lại email nằm chờ trong outbox)"""
+    return bool(_config('EMAIL_ENABLED', False) and _config('MAIL_SERVER', ''))
+
+
+def queue_email(to_emails: List[str], subject: str, body_text: Optional[str] = None,
+                body_html: Optional[str] = None, related_type: Optional[str] = None,
+                related_id: Optional[int] = None, user_id: Optional[int] = None) -> EmailOutbox:
+    """Ghi email vào outbox (commit) và hẹn tác vụ gửi; trả về ngay, không chờ SMTP"""
+    return queue_emails([{
+        'to_emails': to_emails, 'subject': subject, 'body_text': body_text, 'body_html': body_html,
+        'related_type': related_type, 'related_id': related_id,
+    }], user_id=user_id)[0]
+
+
+def queue_emails(messages: List[dict], user_id: Optional[int] = None) -> List[EmailOutbox]:
+    """
+    Ghi nhiều email vào outbox trong một lần commit và hẹn tác vụ gửi một lần. Mỗi mục là dict có
+    to_emails, subject và tùy chọn body_text, body_html, related_type, related_id.
+    """
+    emails = [EmailOutbox(
+        to_emails=', '.join(message['to_emails']), subject=message['subject'][:255],
+        body_text=message.get('body_text'), body_html=message.get('body_html'),
+        related_type=message.get('related_type'), related_id=message.get('related_id'), created_by_id=user_id,
+    ) for message in messages]
+    if not emails:
+        return []
+    db.session.add_all(emails)
+    db.session.commit()
+    schedule_delivery()
+    return emails
+
+
+def queued_related_ids(related_type: str, related_ids: List[int]) -> Set[int]:
+    """Các related_id đã có email đang chờ/đang gửi (tránh xếp hàng trùng khi gửi lại hàng loạt)"""
+    if not related_ids:
+        return set()
+    rows = db.session.query(EmailOutbox.related_id).filter(
+        EmailOutbox.related_type == related_type,
+        EmailOutbox.related_id.in_(related_ids),
+        EmailOutbox.status.in_((EmailOutbox.PENDING, EmailOutbox.SENDING)),
+    ).distinct()
+    return {related_id for related_id, in rows}
+
+
+def schedule_delivery(at: Optional[datetime] = None) -> BackgroundJob:
+    """Bảo đảm có (đúng một) tác vụ gửi outbox đang chờ, chạy không muộn hơn `at`"""
+    job = BackgroundJob.query.filter(
+        BackgroundJob.kind == JOB_KIND, BackgroundJob.status == BackgroundJob.QUEUED
+    ).order_by(BackgroundJob.id).first()
+    if job is None:
+        return enqueue(JOB_KIND, title='Gửi email trong hàng đợi', run_after=at)
+    if job.run_after is not None and (at is None or at < job.run_after):
+        job.run_after = at
+        db.session.commit()
+        job_runner.kick(at)
+    return job
+
+
+def _is_permanent(error: Exception) -> bool:
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        # Mọi người nhận bị từ chối; chỉ coi là vĩnh viễn khi không có mã 4xx (hộp thư tạm bận)
+        return all(code >= 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPAuthenticationError):
+        return False
+    code = getattr(error, 'smtp_code', None)
+    return isinstance(code, int) and code >= 500
+
+
+def _is_connection_error(error: Exception) -> bool:
+    """Lỗi của cả phiên SMTP (không riêng email này): dừng lô, gửi tiếp ở lần sau"""
+    if isinstance(error, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, smtplib.SMTPAuthenticationError)):
+        return True
+    return isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+
+
+def _retry_delay(attempts: int) -> timedelta:
+    base = float(_config('MAIL_RETRY_BASE', 60))
+    return timedelta(seconds=min(base * (2 ** max(attempts - 1, 0)), float(_config('MAIL_RETRY_MAX', 3600))))
+
+
+def _mark_failed_attempt(email: EmailOutbox, error: Exception):
+    email.attempts += 1
+    email.last_error = (str(error) or error.__class__.__name__)[:500]
+    email.locked_by = None
+    if _is_permanent(error) or email.attempts >= int(_config('MAIL_MAX_ATTEMPTS', 5)):
+        email.status = EmailOutbox.FAILED
+    else:
+        email.status = EmailOutbox.PENDING
+        email.next_attempt_at = now_vn() + _retry_delay(email.attempts)
+
+
+def _release(emails: List[EmailOutbox], at: Optional[datetime] = None):
+    for email in emails:
+        if email.status == EmailOutbox.SENDING:
+            email.status, email.locked_by, email.next_attempt_at = EmailOutbox.PENDING, None, at
+
+
+def deliver_pending(ctx: Optional[JobContext] = None) -> dict:
+    """Gửi các email đến hạn qua một phiên SMTP; trả về số email đã gửi / thất bại / hoãn"""
+    config = current_app.config
+    stats = {'sent': 0, 'failed': 0, 'deferred': 0}
+    if not delivery_enabled():
+        return stats
+    from_email = config.get('MAIL_DEFAULT_SENDER') or config.get('MAIL_USERNAME', '')
+    batch_size = int(config.get('MAIL_BATCH_SIZE', 50))
+    EmailOutbox.release_stale(float(config.get('JOB_STALE_AFTER', 600)))
+
+    with SMTPSession.from_config(config) as smtp:
+        while True:
+            batch = EmailOutbox.claim_batch(job_runner.worker_name(), batch_size)
+            if not batch:
+                break
+            try:
+                for email in batch:
+                    if ctx is not None:
+                        ctx.check_cancelled()
+                    message = build_message(from_email, email.recipients, email.subject, email.body_text, email.body_html)
+                    try:
+                        smtp.send(from_email, email.recipients, message.as_string())
+                    except Exception as e:
+                        _mark_failed_attempt(email, e)
+                        stats['failed' if email.status == EmailOutbox.FAILED else 'deferred'] += 1
+                        current_app.logger.warning(f"[Outbox] Email {email.id} chưa gửi được ({email.attempts} lần): {e}")
+                        if _is_connection_error(e):
+                            # Máy chủ SMTP không dùng được: phần còn lại của lô chờ cùng lúc, không tính lần thử
+                            _release(batch, email.next_attempt_at or now_vn() + _retry_delay(1))
+                            db.session.commit()
+                            return stats
+                    else:
+                        email.status = EmailOutbox.SENT
+                        email.sent_at = now_vn()
+                        email.locked_by = None
+                        email.last_error = None
+                        stats['sent'] += 1
+                    # Ghi từng email để lỗi giữa lô không làm gửi lại thư đã đi
+                    db.session.commit()
+            except BaseException:
+                db.session.rollback()
+                _release(batch)
+                db.session.commit()
+                raise
+            if ctx is not None:
+                ctx.progress(stats['sent'] + stats['failed'] + stats['deferred'],
+                             message=f"Đã gửi {stats['sent']} email")
+    return stats
+
+
+@job_handler(JOB_KIND)
+def deliver_outbox_job(ctx: JobContext) -> str:
+    """Tác vụ nền: gửi outbox, còn email chờ thử lại thì hẹn lần chạy tiếp theo"""
+    stats = deliver_pending(ctx)
+    next_due = EmailOutbox.next_due_at() if delivery_enabled() else None
+    if next_due is not None:
+        schedule_delivery(max(next_due, now_vn()))
+    return f"Đã gửi {stats['sent']} email, thất bại {stats['failed']}, chờ thử lại {stats['deferred']}"
@@ -8,12 +8,64 @@ from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
 from email import encoders
 import os
+import time
 from typing import List, Optional, Tuple
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+def build_message(
+    from_email: str,
+    to_emails: List[str],
+    subject: str,
+    body_text: Optional[str] = None,
+    body_html: Optional[str] = None,
+    attachments: Optional[List[str]] = None
+) -> MIMEMultipart:
+    """Tạo email (text/HTML/đính kèm) sẵn sàng cho `sendmail`"""
+    # Tạo message
+    msg = MIMEMultipart('alternative')
+    msg['From'] = from_email
+    msg['To'] = ', '.join(to_emails)
+    msg['Subject'] = subject
+    
+    # Thêm nội dung text
+    if body_text:
+        part_text = MIMEText(body_text, 'plain', 'utf-8')
+        msg.attach(part_text)
+    
+    # Thêm nội dung HTML
+    if body_html:
+        part_html = MIMEText(body_html, 'html', 'utf-8')
+        msg.attach(part_html)
+    
+    # Nếu không có nội dung nào, thêm nội dung mặc định
+    if not body_text and not body_html:
+        part_text = MIMEText('', 'plain', 'utf-8')
+        msg.attach(part_text)
+    
+    # Thêm file đính kèm
+    if attachments:
+        for file_path in attachments:
+            if os.path.isfile(file_path):
+                try:
+                    with open(file_path, 'rb') as f:
+                        part = MIMEBase('application', 'octet-stream')
+                        part.set_payload(f.read())
+                        encoders.encode_base64(part)
+                        
+                        filename = os.path.basename(file_path)
+                        part.add_header(
+                            'Content-Disposition',
+                            f'attachment; filename= {filename}'
+                        )
+                        msg.attach(part)
+                except Exception as e:
+                    logger.warning(f"Không thể đính kèm file {file_path}: {e}")
+    return msg
+
+
 def send_email(
     smtp_server: str,
     smtp_port: int,
@@ -49,45 +101,7 @@ def send_email(
         tuple: (success: bool, message: str)
     """
     try:
-        # Tạo message
-        msg = MIMEMultipart('alternative')
-        msg['From'] = from_email
-        msg['To'] = ', '.join(to_emails)
-        msg['Subject'] = subject
-        
-        # Thêm nội dung text
-        if body_text:
-            part_text = MIMEText(body_text, 'plain', 'utf-8')
-            msg.attach(part_text)
-        
-        # Thêm nội dung HTML
-        if body_html:
-            part_html = MIMEText(body_html, 'html', 'utf-8')
-            msg.attach(part_html)
-        
-        # Nếu không có nội dung nào, thêm nội dung mặc định
-        if not body_text and not body_html:
-            part_text = MIMEText('', 'plain', 'utf-8')
-            msg.attach(part_text)
-        
-        # Thêm file đính kèm
-        if attachments:
-            for file_path in attachments:
-                if os.path.isfile(file_path):
-                    try:
-                        with open(file_path, 'rb') as f:
-                            part = MIMEBase('application', 'octet-stream')
-                            part.set_payload(f.read())
-                            encoders.encode_base64(part)
-                            
-                            filename = os.path.basename(file_path)
-                            part.add_header(
-                                'Content-Disposition',
-                                f'attachment; filename= {filename}'
-                            )
-                            msg.attach(part)
-                    except Exception as e:
-                        logger.warning(f"Không thể đính kèm file {file_path}: {e}")
+        msg = build_message(from_email, to_emails, subject, body_text, body_html, attachments)
         
         # Kết nối và gửi email
         if use_ssl:
@@ -189,3 +203,102 @@ def send_email_from_config(
         use_ssl=use_ssl
     )
 
+
+class SMTPSession:
+    """
+    Một kết nối SMTP đã đăng nhập dùng cho nhiều email liên tiếp (outbox gửi theo lô).
+
+    - Kết nối/đăng nhập ở lần gửi đầu, tự kết nối lại khi máy chủ ngắt hoặc sau
+      `max_per_connection` email (nhiều nhà cung cấp giới hạn số thư mỗi phiên).
+    - `rate_per_second` > 0: giãn cách giữa hai lần gửi để không vượt hạn mức của SMTP.
+    - Không có username thì bỏ qua bước đăng nhập (máy chủ SMTP nội bộ / debug server khi test).
+    """
+
+    def __init__(self, smtp_server: str, smtp_port: int, username: str = '', password: str = '',
+                 use_tls: bool = True, use_ssl: bool = False, timeout: float = 30,
+                 max_per_connection: int = 100, rate_per_second: float = 0):
+        self.smtp_server = smtp_server
+        self.smtp_port = smtp_port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.use_ssl = use_ssl
+        self.timeout = timeout
+        self.max_per_connection = max(int(max_per_connection or 0), 0)
+        self.min_interval = 1.0 / rate_per_second if rate_per_second else 0.0
+        self.server = None
+        self.sent_on_connection = 0
+        self.connections = 0
+        self._last_sent_at = 0.0
+
+    @classmethod
+    def from_config(cls, config) -> 'SMTPSession':
+        return cls(
+            smtp_server=config.get('MAIL_SERVER', ''),
+            smtp_port=config.get('MAIL_PORT', 587),
+            username=config.get('MAIL_USERNAME', ''),
+            password=config.get('MAIL_PASSWORD', ''),
+            use_tls=config.get('MAIL_USE_TLS', True),
+            use_ssl=config.get('MAIL_USE_SSL', False),
+            timeout=config.get('MAIL_TIMEOUT', 30),
+            max_per_connection=config.get('MAIL_MAX_PER_CONNECTION', 100),
+            rate_per_second=config.get('MAIL_RATE_LIMIT', 0),
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _connect(self):
+        if self.use_ssl:
+            server = smtplib.SMTP_SSL(self.smtp_server, self.smtp_port, timeout=self.timeout)
+        else:
+            server = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=self.timeout)
+            if self.use_tls:
+                server.starttls()
+        try:
+            if self.username:
+                server.login(self.username, self.password)
+        except Exception:
+            server.close()
+            raise
+        self.server = server
+        self.sent_on_connection = 0
+        self.connections += 1
+
+    def close(self):
+        server, self.server = self.server, None
+        if server is None:
+            return
+        try:
+            server.quit()
+        except Exception:
+            server.close()
+
+    def _throttle(self):
+        if self.min_interval:
+            wait = self._last_sent_at + self.min_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+        self._last_sent_at = time.monotonic()
+
+    def send(self, from_email: str, to_emails: List[str], message: str):
+        """Gửi một email; lỗi SMTP được ném ra nguyên dạng để người gọi quyết định thử lại hay bỏ"""
+        if self.server is not None and self.max_per_connection and self.sent_on_connection >= self.max_per_connection:
+            self.close()
+        reused = self.server is not None
+        if not reused:
+            self._connect()
+        self._throttle()
+        try:
+            self.server.sendmail(from_email, to_emails, message)
+        except smtplib.SMTPServerDisconnected:
+            # Kết nối cũ bị máy chủ đóng khi rảnh: mở lại và thử đúng một lần
+            self.server = None
+            if not reused:
+                raise
+            self._connect()
+            self.server.sendmail(from_email, to_emails, message)
+        self.sent_on_connection += 1
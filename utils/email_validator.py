@@ -1,11 +1,20 @@
 """
 Module xác thực email
 Hỗ trợ kiểm tra cú pháp email và xác minh tên miền MX
+
+Kết quả tra MX được cache theo tên miền (`mx_cache`): có bản ghi giữ MX_POSITIVE_TTL giây, tên miền
+không tồn tại / không có MX giữ MX_NEGATIVE_TTL giây, lỗi tạm thời (timeout) chỉ MX_ERROR_TTL giây.
+`validate_emails(list)` kiểm tra hàng loạt: mỗi tên miền chỉ tra một lần, các tên miền khác nhau
+được tra song song trên thread pool. Hàm tra DNS thay được bằng `set_mx_resolver` (test dùng bản giả).
 """
 import re
 import dns.resolver
 import socket
-from typing import Tuple, Optional, List, Dict, Any
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Tuple, Optional, List, Dict, Any
 import logging
 
 logger = logging.getLogger(__name__)
@@ -48,42 +57,139 @@ def validate_email_syntax(email: str) -> Tuple[bool, str]:
     return True, "Cú pháp email hợp lệ"
 
 
-def check_mx_record(domain: str) -> Tuple[bool, str, Optional[List[Dict[str, Any]]]]:
+MX_POSITIVE_TTL = 3600
+MX_NEGATIVE_TTL = 300
+MX_ERROR_TTL = 30
+MX_CACHE_SIZE = 4096
+MX_LOOKUP_TIMEOUT = 5.0
+MX_MAX_WORKERS = 8
+
+# Trạng thái tra MX: có bản ghi / chắc chắn không nhận thư / chưa xác định được (lỗi mạng, timeout)
+MX_FOUND = 'found'
+MX_MISSING = 'missing'
+MX_ERROR = 'error'
+
+MXResult = Tuple[bool, str, Optional[List[Dict[str, Any]]]]
+
+
+def _dns_mx_resolver(domain: str) -> List[Dict[str, Any]]:
+    """Tra MX qua dnspython; ném ngoại lệ dns.resolver.* như `dns.resolver.resolve`"""
+    answers = dns.resolver.resolve(domain, 'MX', lifetime=MX_LOOKUP_TIMEOUT)
+    return [{'priority': mx.preference, 'exchange': str(mx.exchange)} for mx in answers]
+
+
+_mx_resolver: Callable[[str], List[Dict[str, Any]]] = _dns_mx_resolver
+
+
+def set_mx_resolver(resolver: Optional[Callable[[str], List[Dict[str, Any]]]] = None):
     """
-    Kiểm tra bản ghi MX (Mail Exchange) của tên miền
-    
-    Args:
-        domain: Tên miền cần kiểm tra (ví dụ: gmail.com)
-    
-    Returns:
-        tuple: (has_mx: bool, message: str, mx_records: list or None)
+    Thay hàm tra MX (None = dnspython). Hàm nhận tên miền, trả về danh sách {'priority', 'exchange'}
+    hoặc ném dns.resolver.NXDOMAIN / NoAnswer / Timeout. Cache được xóa khi đổi resolver.
     """
+    global _mx_resolver
+    _mx_resolver = resolver or _dns_mx_resolver
+    mx_cache.clear()
+
+
+def _lookup_mx(domain: str) -> Tuple[str, MXResult]:
     try:
-        mx_records = dns.resolver.resolve(domain, 'MX')
-        mx_list = []
-        for mx in mx_records:
-            mx_list.append({
-                'priority': mx.preference,
-                'exchange': str(mx.exchange)
-            })
-        
+        mx_list = _mx_resolver(domain)
         if mx_list:
-            return True, f"Tìm thấy {len(mx_list)} bản ghi MX", mx_list
+            return MX_FOUND, (True, f"Tìm thấy {len(mx_list)} bản ghi MX", mx_list)
         else:
-            return False, "Không tìm thấy bản ghi MX", None
+            return MX_MISSING, (False, "Không tìm thấy bản ghi MX", None)
     
     except dns.resolver.NXDOMAIN:
-        return False, f"Tên miền '{domain}' không tồn tại", None
+        return MX_MISSING, (False, f"Tên miền '{domain}' không tồn tại", None)
     
     except dns.resolver.NoAnswer:
-        return False, f"Tên miền '{domain}' không có bản ghi MX", None
+        return MX_MISSING, (False, f"Tên miền '{domain}' không có bản ghi MX", None)
     
     except dns.resolver.Timeout:
-        return False, "Timeout khi kiểm tra bản ghi MX", None
+        return MX_ERROR, (False, "Timeout khi kiểm tra bản ghi MX", None)
     
     except Exception as e:
         logger.error(f"Lỗi khi kiểm tra MX record: {e}")
-        return False, f"Lỗi khi kiểm tra bản ghi MX: {str(e)}", None
+        return MX_ERROR, (False, f"Lỗi khi kiểm tra bản ghi MX: {str(e)}", None)
+
+
+class MXCache:
+    """Cache kết quả MX theo tên miền (LRU, TTL theo loại kết quả); tra trùng cùng lúc chỉ gọi DNS một lần"""
+
+    TTLS = {MX_FOUND: 'positive_ttl', MX_MISSING: 'negative_ttl', MX_ERROR: 'error_ttl'}
+
+    def __init__(self, positive_ttl: float = MX_POSITIVE_TTL, negative_ttl: float = MX_NEGATIVE_TTL,
+                 error_ttl: float = MX_ERROR_TTL, max_entries: int = MX_CACHE_SIZE):
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.error_ttl = error_ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[str, Tuple[float, str, MXResult]]' = OrderedDict()
+        self._inflight: Dict[str, threading.Event] = {}
+        self.lookups = 0  # Số lần thực sự gọi resolver
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _get(self, domain: str) -> Optional[Tuple[str, MXResult]]:
+        entry = self._entries.get(domain)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._entries[domain]
+            return None
+        self._entries.move_to_end(domain)
+        return entry[1], entry[2]
+
+    def lookup(self, domain: str) -> Tuple[str, MXResult]:
+        """(trạng thái, kết quả) của tên miền, dùng cache nếu còn hạn"""
+        domain = domain.strip().lower().rstrip('.')
+        while True:
+            with self._lock:
+                cached = self._get(domain)
+                if cached is not None:
+                    return cached
+                waiter = self._inflight.get(domain)
+                if waiter is None:
+                    waiter = self._inflight[domain] = threading.Event()
+                    break
+            # Thread khác đang tra cùng tên miền: chờ rồi đọc lại cache
+            waiter.wait(MX_LOOKUP_TIMEOUT * 2)
+        try:
+            with self._lock:
+                self.lookups += 1
+            status, result = _lookup_mx(domain)
+            with self._lock:
+                self._entries[domain] = (time.monotonic() + getattr(self, self.TTLS[status]), status, result)
+                self._entries.move_to_end(domain)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            return status, result
+        finally:
+            with self._lock:
+                self._inflight.pop(domain, None)
+            waiter.set()
+
+
+mx_cache = MXCache()
+
+
+def check_mx_record(domain: str, use_cache: bool = True) -> MXResult:
+    """
+    Kiểm tra bản ghi MX (Mail Exchange) của tên miền
+    
+    Args:
+        domain: Tên miền cần kiểm tra (ví dụ: gmail.com)
+        use_cache: Dùng kết quả đã cache của tên miền (mặc định True)
+    
+    Returns:
+        tuple: (has_mx: bool, message: str, mx_records: list or None)
+    """
+    if not use_cache:
+        return _lookup_mx(domain)[1]
+    return mx_cache.lookup(domain)[1]
 
 
 def validate_email_full(email: str, check_mx: bool = True) -> Dict[str, Any]:
@@ -99,6 +205,7 @@ def validate_email_full(email: str, check_mx: bool = True) -> Dict[str, Any]:
             'valid': bool,
             'syntax_valid': bool,
             'mx_valid': bool,
+            'mx_status': 'found' | 'missing' | 'error' | None,
             'domain': str,
             'messages': list,
             'mx_records': list or None
@@ -108,6 +215,7 @@ def validate_email_full(email: str, check_mx: bool = True) -> Dict[str, Any]:
         'valid': False,
         'syntax_valid': False,
         'mx_valid': False,
+        'mx_status': None,
         'domain': '',
         'messages': [],
         'mx_records': None
@@ -131,10 +239,7 @@ def validate_email_full(email: str, check_mx: bool = True) -> Dict[str, Any]:
     
     # Kiểm tra MX nếu được yêu cầu
     if check_mx:
-        mx_valid, mx_msg, mx_records = check_mx_record(domain)
-        result['mx_valid'] = mx_valid
-        result['messages'].append(mx_msg)
-        result['mx_records'] = mx_records
+        _apply_mx(result, mx_cache.lookup(domain))
     
     # Email hợp lệ nếu cú pháp đúng và (không cần MX hoặc MX hợp lệ)
     result['valid'] = syntax_valid and (not check_mx or result['mx_valid'])
@@ -142,6 +247,45 @@ def validate_email_full(email: str, check_mx: bool = True) -> Dict[str, Any]:
     return result
 
 
+def _apply_mx(result: Dict[str, Any], lookup: Tuple[str, MXResult]):
+    status, (mx_valid, mx_msg, mx_records) = lookup
+    result['mx_valid'] = mx_valid
+    result['mx_status'] = status
+    result['messages'].append(mx_msg)
+    result['mx_records'] = mx_records
+
+
+def validate_emails(emails: List[str], check_mx: bool = True, max_workers: int = MX_MAX_WORKERS) -> List[Dict[str, Any]]:
+    """
+    Xác thực hàng loạt email (cùng định dạng kết quả với `validate_email_full`, đúng thứ tự đầu vào).
+    Mỗi tên miền chỉ tra MX một lần; các tên miền chưa có trong cache được tra song song.
+    
+    Args:
+        emails: Danh sách địa chỉ email
+        check_mx: Có kiểm tra bản ghi MX không (mặc định True)
+        max_workers: Số thread tra DNS tối đa
+    
+    Returns:
+        list: Kết quả cho từng email
+    """
+    results = [validate_email_full(email, check_mx=False) for email in emails]
+    if not check_mx:
+        return results
+    
+    domains = list(dict.fromkeys(r['domain'].lower() for r in results if r['syntax_valid'] and r['domain']))
+    if len(domains) > 1 and max_workers > 1:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(domains)), thread_name_prefix='mx') as pool:
+            lookups = dict(zip(domains, pool.map(mx_cache.lookup, domains)))
+    else:
+        lookups = {domain: mx_cache.lookup(domain) for domain in domains}
+    
+    for result in results:
+        if result['syntax_valid'] and result['domain']:
+            _apply_mx(result, lookups[result['domain'].lower()])
+            result['valid'] = result['mx_valid']
+    return results
+
+
 def validate_email_with_api(email: str, api_key: Optional[str] = None, api_provider: str = 'zerobounce') -> Dict[str, Any]:
     """
     Xác thực email sử dụng API của dịch vụ bên thứ ba (ZeroBounce, etc.)
@@ -0,0 +1,246 @@
+"""
+Sinh danh mục tài sản theo sổ (inventory_result) cho một đợt kiểm kê bằng câu lệnh tập hợp.
+
+- Một câu `INSERT ... SELECT ... WHERE NOT EXISTS` chép snapshot sổ sách của mọi tài sản trong phạm vi
+  chưa có dòng; chỉ mục duy nhất (inventory_id, asset_id) bảo đảm không trùng khi chạy lại.
+- Phạm vi lớn (INVENTORY_LINES_SYNC_LIMIT): tác vụ nền `inventory_lines` chèn theo khoảng id tài sản
+  (keyset), mỗi lô commit cùng con trỏ tiếp tục trong tham số tác vụ - worker chết giữa chừng thì
+  lần chạy lại tiếp tục từ lô chưa xong.
+- `apply_results_batch`: nhập kết quả thực tế của hàng nghìn tài sản trong một lần commit.
+"""
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from flask import current_app
+from sqlalchemy import and_, exists, func, select, update
+
+from models import db, Asset, BackgroundJob, Inventory, InventoryLog, InventoryResult
+from utils.jobs import JobContext, job_handler
+from utils.sql_upsert import dialect_insert
+from utils.timezone import now_vn
+
+JOB_KIND = 'inventory_lines'
+# Trạng thái tài sản được đưa vào danh mục kiểm kê
+SCOPE_STATUSES = ('active', 'idle', 'paused')
+
+
+def scope_conditions(inv: Inventory) -> List[Any]:
+    """Điều kiện lọc tài sản thuộc phạm vi đợt kiểm kê"""
+    conditions = [Asset.deleted_at.is_(None), Asset.status.in_(SCOPE_STATUSES)]
+    scope_locations = json.loads(inv.scope_locations) if inv.scope_locations else []
+    scope_asset_groups = json.loads(inv.scope_asset_groups) if inv.scope_asset_groups else []
+    if inv.scope_type == 'by_location' and scope_locations and hasattr(Asset, 'location_id'):
+        conditions.append(Asset.location_id.in_(scope_locations))
+    if inv.scope_type == 'by_asset_group' and scope_asset_groups:
+        conditions.append(Asset.asset_type_id.in_(scope_asset_groups))
+    return conditions
+
+
+def count_scope_assets(inv: Inventory) -> int:
+    return db.session.query(func.count(Asset.id)).filter(*scope_conditions(inv)).scalar() or 0
+
+
+def _insert_lines(inv: Inventory, extra_conditions=()) -> int:
+    """
+    INSERT ... SELECT các tài sản trong phạm vi chưa có dòng sổ; trả về số dòng đã tạo.
+    Hai lần sinh chạy đồng thời cùng chèn một tài sản: ON CONFLICT DO NOTHING bỏ qua dòng trùng
+    (index duy nhất inventory_id, asset_id) thay vì lỗi IntegrityError, rowcount chỉ đếm dòng thực sự chèn.
+    """
+    seq = Inventory.next_sync_seq(db.session.connection(), inv.id)
+    columns = {
+        'inventory_id': db.literal(inv.id),
+        'asset_id': Asset.id,
+        'book_quantity': func.coalesce(func.nullif(Asset.quantity, 0), 1),
+        'book_value': func.coalesce(Asset.price, 0),
+        'book_asset_type_id': Asset.asset_type_id,
+        'book_status': Asset.status,
+        'row_version': db.literal(1),
+        'change_seq': db.literal(seq),
+    }
+    if hasattr(Asset, 'location_id'):
+        columns['book_location_id'] = Asset.location_id
+    has_line = exists().where(and_(InventoryResult.inventory_id == inv.id, InventoryResult.asset_id == Asset.id))
+    rows = select(*columns.values()).where(*scope_conditions(inv), *extra_conditions, ~has_line)
+    statement = dialect_insert(InventoryResult, db.session).from_select(list(columns), rows)
+    result = db.session.execute(statement.on_conflict_do_nothing(index_elements=['inventory_id', 'asset_id']))
+    return max(result.rowcount or 0, 0)
+
+
+def _next_chunk(inv: Inventory, after_asset_id: int, chunk_size: int) -> Tuple[Optional[int], int]:
+    """(id tài sản lớn nhất, số tài sản) của lô kế tiếp sau `after_asset_id`; id None = hết"""
+    ids = select(Asset.id).where(
+        *scope_conditions(inv), Asset.id > after_asset_id
+    ).order_by(Asset.id).limit(chunk_size).subquery()
+    upper, count = db.session.execute(select(func.max(ids.c.id), func.count())).one()
+    return upper, count
+
+
+def _mark_generated(inv: Inventory, actor_id: Optional[int], created: int, skipped: int):
+    if inv.status == 'draft':
+        inv.status = 'in_progress'
+    db.session.add(InventoryLog(
+        inventory_id=inv.id, action='generate_book_lines', actor_id=actor_id,
+        payload=json.dumps({'created': created, 'skipped': skipped}),
+    ))
+
+
+def generate_book_lines(inv: Inventory, actor_id: Optional[int] = None) -> Dict[str, int]:
+    """Sinh danh mục trong một câu lệnh (người gọi commit); skipped = tài sản đã có dòng từ trước"""
+    total = count_scope_assets(inv)
+    created = _insert_lines(inv)
+    skipped = max(total - created, 0)
+    _mark_generated(inv, actor_id, created, skipped)
+    return {'created': created, 'skipped': skipped, 'total': total}
+
+
+def active_job(inventory_id: int) -> Optional[BackgroundJob]:
+    """Tác vụ sinh danh mục đang chờ/đang chạy của đợt kiểm kê (tránh xếp hàng hai lần)"""
+    jobs = BackgroundJob.query.filter(
+        BackgroundJob.kind == JOB_KIND,
+        BackgroundJob.status.in_([BackgroundJob.QUEUED, BackgroundJob.RUNNING]),
+    ).all()
+    return next((job for job in jobs if job.params_dict.get('inventory_id') == inventory_id), None)
+
+
+@job_handler(JOB_KIND)
+def generate_lines_job(ctx: JobContext) -> str:
+    """Tác vụ nền: sinh danh mục theo lô id tài sản, lưu con trỏ sau mỗi lô để chạy tiếp được"""
+    params = dict(ctx.params)
+    inv = db.session.get(Inventory, params['inventory_id'])
+    if inv is None:
+        raise LookupError('Không tìm thấy đợt kiểm kê')
+    chunk_size = int(current_app.config.get('INVENTORY_LINES_CHUNK_SIZE', 5000))
+    total = count_scope_assets(inv)
+    after = int(params.get('after_asset_id') or 0)
+    created = int(params.get('created') or 0)
+    done = db.session.query(func.count(Asset.id)).filter(*scope_conditions(inv), Asset.id <= after).scalar() or 0
+    table = BackgroundJob.__table__
+    while True:
+        upper, count = _next_chunk(inv, after, chunk_size)
+        if upper is None:
+            break
+        created += _insert_lines(inv, (Asset.id > after, Asset.id <= upper))
+        done += count
+        after = upper
+        params.update(after_asset_id=after, created=created)
+        # Con trỏ tiếp tục được commit cùng lô vừa chèn (ctx.progress commit)
+        db.session.execute(table.update().where(table.c.id == ctx.job_id).values(params=json.dumps(params, ensure_ascii=False)))
+        ctx.progress(done, total)
+    skipped = max(total - created, 0)
+    _mark_generated(inv, ctx.user_id, created, skipped)
+    db.session.commit()
+    return f'Đã tạo {created} dòng danh mục; {skipped} tài sản đã có dòng từ trước.'
+
+
+# ---------- Nhập kết quả theo lô (máy quét mã vạch) ----------
+
+# Tình trạng thực tế hợp lệ của một dòng kiểm kê
+ACTUAL_CONDITIONS = ('in_use', 'minor_damage', 'severe_damage', 'missing', 'transferred')
+# Số tham số tối đa của một câu IN (...) khi nạp dòng sổ theo asset_id
+_IN_CHUNK = 500
+
+
+def _line_map(inventory_id: int, asset_ids: List[int]) -> Dict[int, Tuple[int, float, int]]:
+    """asset_id -> (id dòng, giá trị sổ, row_version) cho các tài sản trong lô"""
+    lines = {}
+    for start in range(0, len(asset_ids), _IN_CHUNK):
+        rows = db.session.query(
+            InventoryResult.asset_id, InventoryResult.id, InventoryResult.book_value, InventoryResult.row_version
+        ).filter(
+            InventoryResult.inventory_id == inventory_id,
+            InventoryResult.asset_id.in_(asset_ids[start:start + _IN_CHUNK]),
+        )
+        for asset_id, line_id, book_value, row_version in rows:
+            lines[asset_id] = (line_id, book_value, row_version)
+    return lines
+
+
+def _optional(value, cast, field: str):
+    if value is None or value == '':
+        return None
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{field} không hợp lệ')
+
+
+def _result_values(item: Dict[str, Any], book_value: float) -> Dict[str, Any]:
+    """Giá trị cập nhật của một dòng (giống nhập từng tài sản); lỗi dữ liệu -> ValueError"""
+    condition = item.get('actual_condition') or None
+    if condition is not None and condition not in ACTUAL_CONDITIONS:
+        raise ValueError(f'Tình trạng không hợp lệ: {condition}')
+    quantity = _optional(item.get('actual_quantity'), int, 'actual_quantity')
+    if quantity is not None and quantity < 0:
+        raise ValueError('actual_quantity phải >= 0')
+    values = {
+        'actual_quantity': quantity,
+        'actual_condition': condition,
+        'actual_status': condition,
+        'actual_value': _optional(item.get('actual_value'), float, 'actual_value'),
+        'actual_location_id': _optional(item.get('actual_location_id'), int, 'actual_location_id'),
+        'actual_serial_plate': item.get('actual_serial_plate'),
+        'notes': item.get('notes'),
+    }
+    if values['actual_value'] is not None:
+        values['difference'] = values['actual_value'] - (book_value or 0)
+    return values
+
+
+def apply_results_batch(inv: Inventory, items: List[Any], actor_id: Optional[int],
+                        require_version: bool = False, log_action: str = 'input_result_batch') -> Dict[str, Any]:
+    """
+    Ghi kết quả thực tế cho nhiều tài sản: kiểm tra theo bản đồ dòng sổ nạp trước, cập nhật hàng loạt
+    theo khóa chính và một dòng InventoryLog tổng hợp (người gọi commit). Mục lỗi được báo riêng
+    (index trong lô), không làm hỏng cả lô; một tài sản xuất hiện nhiều lần thì lấy lần quét cuối.
+    Mục có `row_version` (bắt buộc nếu `require_version`) khác phiên bản hiện tại là xung đột: không ghi,
+    trả về `conflict` kèm phiên bản hiện tại để client kéo dòng mới về.
+    """
+    errors = []
+    valid = {}
+    for index, item in enumerate(items):
+        asset_id = item.get('asset_id') if isinstance(item, dict) else None
+        try:
+            valid[int(asset_id)] = (index, item)
+        except (TypeError, ValueError):
+            errors.append({'index': index, 'asset_id': asset_id, 'message': 'Thiếu hoặc sai asset_id'})
+
+    # Khóa dòng đợt (UPDATE sync_seq) trước khi đọc row_version: lần đẩy khác cùng đợt chờ tới khi
+    # transaction này commit rồi mới đọc phiên bản, nên hai máy đẩy cùng phiên bản gốc không ghi đè nhau
+    seq = Inventory.next_sync_seq(db.session.connection(), inv.id) if valid else None
+    lines = _line_map(inv.id, list(valid))
+    checked_at = now_vn()
+    updates = []
+    for asset_id, (index, item) in valid.items():
+        line = lines.get(asset_id)
+        if line is None:
+            errors.append({'index': index, 'asset_id': asset_id, 'message': 'Tài sản không thuộc đợt này'})
+            continue
+        base_version = item.get('row_version')
+        if base_version is None and require_version:
+            errors.append({'index': index, 'asset_id': asset_id, 'message': 'Thiếu row_version'})
+            continue
+        if base_version is not None and str(base_version) != str(line[2]):
+            errors.append({'index': index, 'asset_id': asset_id, 'message': 'Dòng đã bị thay đổi trên máy chủ',
+                           'conflict': True, 'row_version': line[2]})
+            continue
+        try:
+            values = _result_values(item, line[1])
+        except ValueError as e:
+            errors.append({'index': index, 'asset_id': asset_id, 'message': str(e)})
+            continue
+        values.update(id=line[0], checked_by_id=actor_id, checked_at=checked_at, row_version=line[2] + 1)
+        updates.append(values)
+
+    applied = []
+    if updates:
+        for values in updates:
+            values['change_seq'] = seq
+        db.session.execute(update(InventoryResult), updates)
+        db.session.add(InventoryLog(
+            inventory_id=inv.id, action=log_action, actor_id=actor_id,
+            payload=json.dumps({'updated': len(updates), 'failed': len(errors)}),
+        ))
+        line_assets = {line[0]: asset_id for asset_id, line in lines.items()}
+        applied = [{'asset_id': line_assets[values['id']], 'row_version': values['row_version']} for values in updates]
+    errors.sort(key=lambda error: error['index'])
+    return {'updated': len(updates), 'failed': len(errors), 'errors': errors, 'applied': applied}
@@ -0,0 +1,196 @@
+"""
+Đối chiếu kết quả kiểm kê với sổ sách (thiếu, thừa, chênh lệch giá trị, tình trạng) cho một đợt.
+
+- Các dòng inventory_result được nạp bằng một truy vấn cột vào DataFrame; tổng hợp theo loại tài sản,
+  nơi dùng và tình trạng bằng groupby/crosstab của pandas thay vì lặp `inv.results` trong template.
+- Khi đợt được duyệt & khóa, kết quả được lưu vào inventory_reconciliation; đợt đã khóa/đóng đọc ảnh
+  chụp đó (còn khớp `Inventory.sync_seq`) nên báo cáo trả về ngay, không tính lại.
+"""
+import json
+from typing import Any, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from models import db, AssetType, Inventory, InventoryReconciliation, InventoryResult, InventorySurplusAsset
+from utils.timezone import now_vn
+
+# Trạng thái đợt có thể dùng ảnh chụp đã lưu
+LOCKED_STATUSES = ('approved_locked', 'closed')
+UNCHECKED = 'unchecked'
+MISSING = 'missing'
+
+_LINE_COLUMNS = (
+    'asset_id', 'book_quantity', 'book_value', 'book_asset_type_id', 'book_location_id',
+    'actual_quantity', 'actual_condition', 'actual_value', 'actual_location_id', 'checked_at',
+)
+
+
+def load_lines(inventory_id: int) -> pd.DataFrame:
+    """Dòng kiểm kê của đợt dạng cột (một truy vấn, không nạp đối tượng ORM)"""
+    rows = db.session.query(
+        InventoryResult.asset_id, InventoryResult.book_quantity, InventoryResult.book_value,
+        InventoryResult.book_asset_type_id, InventoryResult.book_location_id,
+        InventoryResult.actual_quantity, InventoryResult.actual_condition, InventoryResult.actual_value,
+        InventoryResult.actual_location_id, InventoryResult.checked_at,
+    ).filter(InventoryResult.inventory_id == inventory_id).all()
+    return pd.DataFrame.from_records(rows, columns=_LINE_COLUMNS)
+
+
+def _prepare(lines: pd.DataFrame) -> pd.DataFrame:
+    """Thêm các cột tính toán: đã kiểm, thiếu, số lượng/giá trị thực tế và chênh lệch"""
+    df = lines.copy()
+    df['book_quantity'] = pd.to_numeric(df['book_quantity'], errors='coerce').fillna(1)
+    df['book_value'] = pd.to_numeric(df['book_value'], errors='coerce').fillna(0.0)
+    actual_quantity = pd.to_numeric(df['actual_quantity'], errors='coerce')
+    actual_value = pd.to_numeric(df['actual_value'], errors='coerce')
+
+    checked = df['checked_at'].notna() | df['actual_condition'].notna() | actual_quantity.notna()
+    missing = checked & ((df['actual_condition'] == MISSING) | (actual_quantity == 0))
+    df['condition'] = np.where(checked, df['actual_condition'].fillna('in_use'), UNCHECKED)
+    df.loc[missing, 'condition'] = MISSING
+    df['checked'] = checked
+    df['missing'] = missing
+    df['unchecked'] = ~checked
+    # Dòng đã kiểm: số lượng/giá trị thực tế mặc định bằng sổ (thiếu = 0); dòng chưa kiểm không tính chênh lệch
+    df['actual_quantity'] = np.where(missing, 0, actual_quantity.fillna(df['book_quantity'])).astype(float)
+    df['actual_value'] = np.where(missing, 0.0, actual_value.fillna(df['book_value']))
+    df.loc[~checked, ['actual_quantity', 'actual_value']] = np.nan
+    df['quantity_difference'] = (df['actual_quantity'] - df['book_quantity']).where(checked, 0.0)
+    df['value_difference'] = (df['actual_value'] - df['book_value']).where(checked, 0.0)
+    df['missing_value'] = df['book_value'].where(missing, 0.0)
+    df['moved'] = checked & df['actual_location_id'].notna() & (df['actual_location_id'] != df['book_location_id'])
+    return df
+
+
+def _group_key(series: pd.Series) -> pd.Series:
+    """Khóa nhóm số nguyên; giá trị trống gom vào nhóm -1 (trả về None)"""
+    return pd.to_numeric(series, errors='coerce').fillna(-1).astype(int).rename('group')
+
+
+def _group_records(totals: pd.DataFrame, conditions: Optional[pd.DataFrame] = None) -> list:
+    by_group = json.loads(totals.to_json(orient='index'))
+    condition_counts = json.loads(conditions.to_json(orient='index')) if conditions is not None else {}
+    records = []
+    for group, values in by_group.items():
+        record = {'group': None if group == '-1' else int(group), **values}
+        if conditions is not None:
+            record['conditions'] = {name: count for name, count in condition_counts.get(group, {}).items() if count}
+        records.append(record)
+    return records
+
+
+def _group(df: pd.DataFrame, key: str) -> list:
+    """Ma trận chênh lệch theo `key` (loại / nơi dùng) kèm số dòng theo tình trạng"""
+    if df.empty:
+        return []
+    group = _group_key(df[key])
+    totals = df.groupby(group).agg(
+        lines=('asset_id', 'size'),
+        checked=('checked', 'sum'),
+        missing=('missing', 'sum'),
+        moved=('moved', 'sum'),
+        book_quantity=('book_quantity', 'sum'),
+        actual_quantity=('actual_quantity', 'sum'),
+        book_value=('book_value', 'sum'),
+        actual_value=('actual_value', 'sum'),
+        value_difference=('value_difference', 'sum'),
+        missing_value=('missing_value', 'sum'),
+    )
+    return _group_records(totals, pd.crosstab(group, df['condition']))
+
+
+def _surplus(inventory_id: int) -> Dict[str, Any]:
+    rows = db.session.query(
+        InventorySurplusAsset.asset_type_id, InventorySurplusAsset.location_id, InventorySurplusAsset.quantity,
+        InventorySurplusAsset.status,
+    ).filter(InventorySurplusAsset.inventory_id == inventory_id).all()
+    df = pd.DataFrame.from_records(rows, columns=('asset_type_id', 'location_id', 'quantity', 'status'))
+    if df.empty:
+        return {'items': 0, 'quantity': 0, 'by_type': [], 'by_location': [], 'by_status': {}}
+    df['quantity'] = pd.to_numeric(df['quantity'], errors='coerce').fillna(1)
+
+    def grouped(key):
+        return _group_records(df.groupby(_group_key(df[key])).agg(items=('quantity', 'size'), quantity=('quantity', 'sum')))
+
+    return {
+        'items': int(len(df)),
+        'quantity': int(df['quantity'].sum()),
+        'by_type': grouped('asset_type_id'),
+        'by_location': grouped('location_id'),
+        'by_status': {key: int(value) for key, value in df['status'].value_counts().items()},
+    }
+
+
+def reconcile(inv: Inventory) -> Dict[str, Any]:
+    """Tính tổng hợp đối chiếu của đợt kiểm kê (không ghi CSDL)"""
+    df = _prepare(load_lines(inv.id))
+    totals = {
+        'lines': int(len(df)),
+        'checked': int(df['checked'].sum()) if len(df) else 0,
+        'unchecked': int(df['unchecked'].sum()) if len(df) else 0,
+        'missing': int(df['missing'].sum()) if len(df) else 0,
+        'moved': int(df['moved'].sum()) if len(df) else 0,
+        'book_quantity': float(df['book_quantity'].sum()),
+        'actual_quantity': float(df['actual_quantity'].sum()),
+        'quantity_difference': float(df['quantity_difference'].sum()),
+        'book_value': float(df['book_value'].sum()),
+        'actual_value': float(df['actual_value'].sum()),
+        'value_difference': float(df['value_difference'].sum()),
+        'missing_value': float(df['missing_value'].sum()),
+    }
+    type_ids = [int(v) for v in df['book_asset_type_id'].dropna().unique()] if len(df) else []
+    type_names = dict(db.session.query(AssetType.id, AssetType.name).filter(AssetType.id.in_(type_ids)).all()) if type_ids else {}
+    by_type = _group(df, 'book_asset_type_id')
+    for record in by_type:
+        record['name'] = type_names.get(record['group'])
+    return {
+        'inventory_id': inv.id,
+        'status': inv.status,
+        'totals': totals,
+        'conditions': {key: int(value) for key, value in df['condition'].value_counts().items()} if len(df) else {},
+        'by_type': by_type,
+        'by_location': _group(df, 'book_location_id'),
+        'surplus': _surplus(inv.id),
+        'computed_at': now_vn().isoformat(timespec='seconds'),
+    }
+
+
+def _current_seq(inventory_id: int) -> int:
+    return db.session.query(Inventory.sync_seq).filter(Inventory.id == inventory_id).scalar() or 0
+
+
+def save_snapshot(inv: Inventory, actor_id: Optional[int] = None) -> Dict[str, Any]:
+    """Tính và lưu ảnh chụp đối chiếu của đợt (người gọi commit, thường cùng lúc duyệt & khóa)"""
+    summary = reconcile(inv)
+    sync_seq = _current_seq(inv.id)
+    snapshot = InventoryReconciliation.query.filter_by(inventory_id=inv.id).first()
+    if snapshot is None:
+        snapshot = InventoryReconciliation(inventory_id=inv.id)
+        db.session.add(snapshot)
+    snapshot.sync_seq = sync_seq
+    snapshot.summary = json.dumps(summary, ensure_ascii=False)
+    snapshot.computed_at = now_vn()
+    snapshot.computed_by_id = actor_id
+    return summary
+
+
+def discard_snapshot(inventory_id: int):
+    """Bỏ ảnh chụp khi đợt được mở khóa (kết quả có thể còn thay đổi)"""
+    InventoryReconciliation.query.filter_by(inventory_id=inventory_id).delete(synchronize_session=False)
+
+
+def get_reconciliation(inv: Inventory) -> Dict[str, Any]:
+    """Đợt đã khóa/đóng: đọc ảnh chụp (tạo nếu thiếu hoặc lệch sync_seq); đợt khác: tính trực tiếp"""
+    if inv.status not in LOCKED_STATUSES:
+        return reconcile(inv)
+    snapshot = db.session.query(InventoryReconciliation.summary, InventoryReconciliation.sync_seq).filter(
+        InventoryReconciliation.inventory_id == inv.id
+    ).first()
+    if snapshot is not None and snapshot.sync_seq == _current_seq(inv.id):
+        summary = json.loads(snapshot.summary)
+        summary['status'] = inv.status
+        return summary
+    summary = save_snapshot(inv, inv.locked_by_id)
+    db.session.commit()
+    return summary
@@ -0,0 +1,119 @@
+"""
+Đồng bộ offline các dòng kiểm kê (inventory_result) cho máy tính bảng của tổ kiểm kê.
+
+- Mỗi transaction ghi dòng của một đợt nhận một số `Inventory.sync_seq` mới và gắn vào các dòng đã ghi
+  (`change_seq`); `row_version` tăng mỗi lần dòng đổi.
+- Kéo về: các dòng theo thứ tự (change_seq, id) sau cursor "<seq>.<id>". Cursor rỗng = ảnh chụp đầy đủ;
+  dòng bị sửa trong lúc đang tải ảnh chụp chỉ dời ra sau nên không bị sót - client cứ kéo tới khi
+  `has_more` = False rồi lưu cursor, lần sau chỉ nhận phần thay đổi.
+- Đẩy lên: mỗi thay đổi kèm `row_version` client đang có; lệch phiên bản là xung đột (không ghi).
+- Dữ liệu dạng mảng theo danh sách `fields` (không lặp tên khóa) và được nén gzip nếu client chấp nhận.
+"""
+import gzip
+import json
+from typing import Any, Dict, Optional, Tuple
+
+from flask import Response, current_app, request
+from sqlalchemy import and_, or_
+
+from models import db, Asset, Inventory, InventoryResult, InventoryTeam, InventoryTeamMember
+
+# Thứ tự cột của mỗi dòng trong `rows`
+SYNC_FIELDS = (
+    'id', 'asset_id', 'row_version', 'name', 'device_code',
+    'book_quantity', 'book_value', 'book_asset_type_id', 'book_location_id', 'book_status',
+    'actual_quantity', 'actual_condition', 'actual_value', 'actual_location_id', 'actual_serial_plate',
+    'notes', 'checked_by_id', 'checked_at',
+)
+# Vai trò được đồng bộ mọi đợt kiểm kê; người khác phải là tổ trưởng/thành viên tổ của đợt
+MANAGER_ROLES = ('admin', 'manager', 'accountant')
+EDITABLE_STATUSES = ('draft', 'in_progress')
+# Không nén phản hồi nhỏ hơn ngưỡng này (byte)
+GZIP_MIN_SIZE = 1024
+
+
+def encode_cursor(change_seq: int, line_id: int) -> str:
+    return f'{change_seq}.{line_id}'
+
+
+def decode_cursor(cursor: Optional[str]) -> Tuple[int, int]:
+    """(change_seq, id) của dòng cuối client đã nhận; rỗng = từ đầu. Sai định dạng -> ValueError"""
+    if not cursor:
+        return 0, 0
+    seq, _, line_id = cursor.partition('.')
+    return int(seq), int(line_id or 0)
+
+
+def can_sync(user, inv: Inventory) -> bool:
+    """Quản lý/kế toán hoặc thành viên một tổ kiểm kê của đợt"""
+    if user is None or not user.is_active:
+        return False
+    if user.role_name in MANAGER_ROLES:
+        return True
+    team_ids = db.session.query(InventoryTeam.id).filter(InventoryTeam.inventory_id == inv.id)
+    leader = team_ids.filter(InventoryTeam.leader_id == user.id).first()
+    member = db.session.query(InventoryTeamMember.id).filter(
+        InventoryTeamMember.team_id.in_(team_ids.scalar_subquery()), InventoryTeamMember.user_id == user.id
+    ).first()
+    return leader is not None or member is not None
+
+
+def _row(row) -> list:
+    values = list(row)
+    checked_at = values[-1]
+    values[-1] = checked_at.isoformat(timespec='seconds') if checked_at else None
+    return values
+
+
+def pull_changes(inv: Inventory, cursor: Optional[str], limit: Optional[int] = None) -> Dict[str, Any]:
+    """Một trang dòng đã đổi sau `cursor` (ảnh chụp nếu cursor rỗng)"""
+    seq, line_id = decode_cursor(cursor)
+    max_limit = int(current_app.config.get('INVENTORY_SYNC_MAX_LIMIT', 20000))
+    limit = min(max(int(limit or current_app.config.get('INVENTORY_SYNC_PAGE_SIZE', 5000)), 1), max_limit)
+    rows = db.session.query(
+        InventoryResult.id, InventoryResult.asset_id, InventoryResult.row_version, Asset.name, Asset.device_code,
+        InventoryResult.book_quantity, InventoryResult.book_value, InventoryResult.book_asset_type_id,
+        InventoryResult.book_location_id, InventoryResult.book_status,
+        InventoryResult.actual_quantity, InventoryResult.actual_condition, InventoryResult.actual_value,
+        InventoryResult.actual_location_id, InventoryResult.actual_serial_plate,
+        InventoryResult.notes, InventoryResult.checked_by_id, InventoryResult.checked_at,
+        InventoryResult.change_seq,
+    ).outerjoin(Asset, Asset.id == InventoryResult.asset_id).filter(
+        InventoryResult.inventory_id == inv.id,
+        or_(InventoryResult.change_seq > seq, and_(InventoryResult.change_seq == seq, InventoryResult.id > line_id)),
+    ).order_by(InventoryResult.change_seq, InventoryResult.id).limit(limit + 1).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if rows:
+        cursor = encode_cursor(rows[-1].change_seq, rows[-1].id)
+    else:
+        cursor = encode_cursor(seq, line_id)
+    return {
+        'inventory_id': inv.id,
+        'status': inv.status,
+        'snapshot': seq == 0 and line_id == 0,
+        'fields': list(SYNC_FIELDS),
+        'rows': [_row(row[:-1]) for row in rows],
+        'cursor': cursor,
+        'has_more': has_more,
+    }
+
+
+def sync_response(payload: Dict[str, Any], status: int = 200) -> Response:
+    """JSON gọn (không khoảng trắng), nén gzip khi client gửi Accept-Encoding: gzip"""
+    body = json.dumps(payload, ensure_ascii=False, separators=(',', ':'), default=str).encode('utf-8')
+    response = Response(body, status=status, mimetype='application/json')
+    response.vary.add('Accept-Encoding')
+    if len(body) >= GZIP_MIN_SIZE and 'gzip' in request.accept_encodings:
+        response.set_data(gzip.compress(body, compresslevel=6))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+def push_changes(inv: Inventory, actor_id: Optional[int], changes: list) -> Dict[str, Any]:
+    """Ghi thay đổi từ client (mỗi mục bắt buộc có row_version); người gọi commit"""
+    from utils.inventory_lines import apply_results_batch
+    outcome = apply_results_batch(inv, changes, actor_id, require_version=True, log_action='sync_push')
+    outcome['conflicts'] = sum(1 for error in outcome['errors'] if error.get('conflict'))
+    return outcome
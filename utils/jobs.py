@@ -0,0 +1,431 @@
+"""
+Tác vụ nền không cần broker: hàng đợi là bảng background_job (chạy được trên một VM đơn lẻ).
+
+- Handler đăng ký bằng `@job_handler('kind')`, nhận `JobContext`: tham số, báo tiến độ / kiểm tra
+  hủy (`ctx.progress`), file kết quả trong EXPORT_DIR/jobs/<id>/ (`ctx.artifact_path`, `ctx.set_result`).
+- `enqueue(kind, params)` ghi tác vụ rồi gọi `job_runner.kick()`: nếu JOB_WORKER_EMBEDDED, tiến trình
+  web mở thread xử lý hết hàng đợi rồi tự dừng; `flask worker` chạy pool thread thường trực.
+- Cả hai chế độ định kỳ đưa lại vào hàng đợi các tác vụ của worker đã chết (mất heartbeat) và nhận
+  tác vụ hẹn giờ đã tới hạn (`run_after`), nên tiến trình web khởi động lại không bỏ sót tác vụ.
+- Route xuất file dùng `@background_export(title)`: `?background=1` đưa request vào hàng đợi, worker
+  chạy lại chính view đó trong request giả lập (session dựng lại từ user yêu cầu) và lưu file trả về.
+"""
+import importlib
+import json
+import os
+import socket
+import threading
+import traceback
+from datetime import datetime
+from functools import wraps
+from typing import Any, Callable, Dict, Optional
+from urllib.parse import unquote
+
+from flask import current_app, flash, redirect, request, session, url_for
+
+from models import db, BackgroundJob
+from utils.timezone import now_vn
+
+JOBS_SUBDIR = 'jobs'
+BACKGROUND_ARG = 'background'
+
+_HANDLERS: Dict[str, Callable] = {}
+# Handler khai báo trong module chỉ được import khi cần (worker nạp module ở lần chạy đầu tiên)
+HANDLER_MODULES = {
+    'asset_import': 'utils.asset_import',
+    'depreciation': 'utils.depreciation',
+    'email_outbox': 'utils.email_outbox',
+    'inventory_lines': 'utils.inventory_lines',
+}
+
+
+class JobCancelled(Exception):
+    """Người dùng đã yêu cầu hủy tác vụ"""
+
+
+def job_handler(kind: str):
+    """Đăng ký hàm xử lý cho loại tác vụ `kind`; hàm nhận JobContext, trả về thông báo kết quả"""
+    def decorator(fn):
+        _HANDLERS[kind] = fn
+        return fn
+    return decorator
+
+
+def export_root(app=None) -> str:
+    app = app or current_app
+    export_dir = app.config.get('EXPORT_DIR', 'instance/exports')
+    if not os.path.isabs(export_dir):
+        export_dir = os.path.join(app.root_path, export_dir)
+    return export_dir
+
+
+def result_file(job: BackgroundJob) -> Optional[str]:
+    """Đường dẫn tuyệt đối tới file kết quả của tác vụ (None nếu không có / đã bị xóa)"""
+    if not job.result_path:
+        return None
+    path = os.path.join(export_root(), job.result_path)
+    return path if os.path.isfile(path) else None
+
+
+class JobContext:
+    """Thông tin và tiện ích cho handler đang chạy"""
+
+    def __init__(self, job: BackgroundJob):
+        self.job_id = job.id
+        self.kind = job.kind
+        self.params: Dict[str, Any] = job.params_dict
+        self.user_id = job.created_by_id
+        self.result: Dict[str, Any] = {}
+
+    def progress(self, done: int, total: Optional[int] = None, message: Optional[str] = None):
+        """Ghi tiến độ (commit ngay để trang /jobs thấy) và dừng nếu người dùng đã hủy"""
+        values = {'progress_done': done, 'heartbeat_at': now_vn()}
+        if total is not None:
+            values['progress_total'] = total
+        if message:
+            values['message'] = message[:500]
+        table = BackgroundJob.__table__
+        db.session.execute(table.update().where(table.c.id == self.job_id).values(**values))
+        db.session.commit()
+        self.check_cancelled()
+
+    def check_cancelled(self):
+        cancelled = db.session.query(BackgroundJob.cancel_requested).filter(
+            BackgroundJob.id == self.job_id
+        ).scalar()
+        if cancelled:
+            raise JobCancelled()
+
+    def artifact_path(self, filename: str) -> str:
+        """Đường dẫn ghi file kết quả (thư mục riêng của tác vụ)"""
+        directory = os.path.join(export_root(), JOBS_SUBDIR, str(self.job_id))
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, filename)
+
+    def set_result(self, path: str, download_name: Optional[str] = None, mimetype: Optional[str] = None):
+        self.result = {
+            'result_path': os.path.relpath(path, export_root()),
+            'result_name': (download_name or os.path.basename(path))[:255],
+            'result_mimetype': mimetype,
+        }
+
+
+class _Heartbeat(threading.Thread):
+    """Cập nhật heartbeat_at định kỳ khi handler chạy lâu mà không báo tiến độ"""
+
+    def __init__(self, engine, job_id: int, interval: float):
+        super().__init__(name=f'job-heartbeat-{job_id}', daemon=True)
+        self.engine = engine
+        self.job_id = job_id
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        table = BackgroundJob.__table__
+        while not self.stopped.wait(self.interval):
+            try:
+                with self.engine.begin() as connection:
+                    connection.execute(table.update().where(table.c.id == self.job_id).values(heartbeat_at=now_vn()))
+            except Exception:
+                pass
+
+
+def run_job(job_id: int) -> BackgroundJob:
+    """Chạy một tác vụ đã được nhận (status running) và ghi kết quả (cần app context)"""
+    job = db.session.get(BackgroundJob, job_id)
+    ctx = JobContext(job)
+    heartbeat = _Heartbeat(db.engine, job_id, float(current_app.config.get('JOB_HEARTBEAT_INTERVAL', 30)))
+    heartbeat.start()
+    try:
+        if job.kind not in _HANDLERS and job.kind in HANDLER_MODULES:
+            importlib.import_module(HANDLER_MODULES[job.kind])
+        handler = _HANDLERS.get(job.kind)
+        if handler is None:
+            raise LookupError(f'Không có handler cho tác vụ "{job.kind}"')
+        ctx.check_cancelled()
+        status, message = BackgroundJob.COMPLETED, handler(ctx) or 'Hoàn tất'
+    except JobCancelled:
+        db.session.rollback()
+        status, message = BackgroundJob.CANCELLED, 'Đã hủy theo yêu cầu'
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"[Jobs] Job {job_id} ({job.kind}) failed: {e}\n{traceback.format_exc()}")
+        status, message = BackgroundJob.FAILED, str(e) or e.__class__.__name__
+    finally:
+        heartbeat.stopped.set()
+
+    job = db.session.get(BackgroundJob, job_id)
+    job.status = status
+    job.message = str(message)[:500]
+    job.finished_at = now_vn()
+    job.heartbeat_at = job.finished_at
+    for key, value in ctx.result.items():
+        setattr(job, key, value)
+    db.session.commit()
+    return job
+
+
+def enqueue(kind: str, params: Optional[Dict[str, Any]] = None, title: Optional[str] = None,
+            user_id: Optional[int] = None, run_after: Optional[datetime] = None) -> BackgroundJob:
+    """Thêm tác vụ vào hàng đợi (commit) và đánh thức worker trong tiến trình; `run_after` để hẹn giờ"""
+    job = BackgroundJob(
+        kind=kind, title=title, created_by_id=user_id, run_after=run_after,
+        params=json.dumps(params or {}, ensure_ascii=False, default=str),
+    )
+    db.session.add(job)
+    db.session.commit()
+    job_runner.kick(run_after)
+    return job
+
+
+def cancel(job: BackgroundJob) -> bool:
+    """Hủy tác vụ: đang chờ thì hủy ngay, đang chạy thì handler dừng ở lần báo tiến độ kế tiếp"""
+    if job.is_finished:
+        return False
+    table = BackgroundJob.__table__
+    cancelled_now = db.session.execute(table.update().where(
+        table.c.id == job.id, table.c.status == BackgroundJob.QUEUED
+    ).values(status=BackgroundJob.CANCELLED, cancel_requested=True, finished_at=now_vn(),
+             message='Đã hủy trước khi chạy')).rowcount
+    if not cancelled_now:
+        db.session.execute(table.update().where(table.c.id == job.id).values(cancel_requested=True))
+    db.session.commit()
+    db.session.refresh(job)
+    return True
+
+
+class JobRunner:
+    """Extension Flask: `job_runner.init_app(app)`; `kick()` sau khi thêm tác vụ, `serve_forever()` cho `flask worker`"""
+
+    def __init__(self):
+        self.app = None
+        self._lock = threading.Lock()
+        self._threads = set()
+        self._generation = 0
+        self._stop = threading.Event()
+
+    def init_app(self, app):
+        app.config.setdefault('JOB_WORKER_EMBEDDED', True)   # Tiến trình web tự xử lý hàng đợi
+        app.config.setdefault('JOB_WORKER_THREADS', 2)
+        app.config.setdefault('JOB_POLL_INTERVAL', 2.0)      # Giây chờ khi hàng đợi trống (flask worker)
+        app.config.setdefault('JOB_HEARTBEAT_INTERVAL', 30.0)
+        app.config.setdefault('JOB_STALE_AFTER', 600.0)      # Không có heartbeat quá lâu -> chạy lại
+        app.config.setdefault('JOB_SUPERVISE_INTERVAL', 30.0)  # Giây giữa hai lần quét (chế độ nhúng), 0 = tắt
+        app.extensions['job_runner'] = self
+        self.app = app
+        if app.config['JOB_WORKER_EMBEDDED']:
+            supervisor = threading.Thread(target=self._supervise, name='job-supervisor', daemon=True)
+            supervisor.start()
+
+    @staticmethod
+    def worker_name() -> str:
+        return f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'[:100]
+
+    def run_pending(self, limit: Optional[int] = None) -> int:
+        """Nhận và chạy tác vụ đang chờ trong thread hiện tại cho tới khi hết (hoặc đủ `limit`)"""
+        count = 0
+        while limit is None or count < limit:
+            job_id = BackgroundJob.claim_next(self.worker_name())
+            if job_id is None:
+                break
+            run_job(job_id)
+            count += 1
+        return count
+
+    # ---------- Worker trong tiến trình web ----------
+
+    def kick(self, at: Optional[datetime] = None):
+        """Đánh thức/khởi động thread xử lý hàng đợi (không làm gì nếu tắt JOB_WORKER_EMBEDDED)"""
+        app = self.app
+        if app is None or not app.config.get('JOB_WORKER_EMBEDDED', True):
+            return
+        delay = (at - now_vn()).total_seconds() if at is not None else 0
+        if delay > 0:
+            # Tác vụ hẹn giờ: đánh thức lại khi tới hạn (mất nếu tiến trình dừng - thread giám sát sẽ nhận)
+            timer = threading.Timer(delay + 0.05, self.kick)
+            timer.daemon = True
+            timer.start()
+            return
+        with self._lock:
+            self._generation += 1
+            self._threads = {thread for thread in self._threads if thread.is_alive()}
+            if len(self._threads) >= int(app.config.get('JOB_WORKER_THREADS', 2)):
+                return
+            thread = threading.Thread(target=self._drain, name='job-drain', daemon=True)
+            self._threads.add(thread)
+        thread.start()
+
+    def _drain(self):
+        with self.app.app_context():
+            try:
+                while True:
+                    with self._lock:
+                        seen = self._generation
+                    try:
+                        self.run_pending()
+                    except Exception as e:
+                        db.session.rollback()
+                        self.app.logger.error(f"[Jobs] Queue drain failed: {e}")
+                    # Có tác vụ mới trong lúc đang chạy thì quét lại, ngược lại thread kết thúc
+                    with self._lock:
+                        if self._generation == seen:
+                            self._threads.discard(threading.current_thread())
+                            return
+            finally:
+                db.session.remove()
+
+    def supervise_once(self) -> int:
+        """Đưa lại tác vụ mất heartbeat vào hàng đợi và đánh thức worker nếu có tác vụ tới hạn (cần app context)"""
+        app = self.app
+        requeued = BackgroundJob.requeue_stale(float(app.config.get('JOB_STALE_AFTER', 600.0)))
+        if requeued:
+            app.logger.warning(f"[Jobs] Đưa lại {requeued} tác vụ bị gián đoạn vào hàng đợi")
+        if BackgroundJob.has_due():
+            self.kick()
+        return requeued
+
+    def _supervise(self):
+        """Thread nền của chế độ nhúng: quét mỗi JOB_SUPERVISE_INTERVAL giây (lần đầu sau một chu kỳ)"""
+        while not self._stop.is_set():
+            interval = float(self.app.config.get('JOB_SUPERVISE_INTERVAL', 30.0))
+            self._stop.wait(interval if interval > 0 else 5.0)
+            if interval <= 0 or not self.app.config.get('JOB_WORKER_EMBEDDED', True) or self._stop.is_set():
+                continue
+            with self.app.app_context():
+                try:
+                    self.supervise_once()
+                except Exception as e:
+                    db.session.rollback()
+                    self.app.logger.error(f"[Jobs] Supervise failed: {e}")
+                finally:
+                    db.session.remove()
+
+    # ---------- flask worker ----------
+
+    def serve_forever(self, threads: Optional[int] = None):
+        """Pool thread thường trực (lệnh `flask worker`), dừng bằng Ctrl+C"""
+        app = self.app
+        threads = threads or int(app.config.get('JOB_WORKER_THREADS', 2))
+        poll = float(app.config.get('JOB_POLL_INTERVAL', 2.0))
+        stale_after = float(app.config.get('JOB_STALE_AFTER', 600.0))
+        self._stop.clear()
+
+        def loop():
+            with app.app_context():
+                while not self._stop.is_set():
+                    processed = 0
+                    try:
+                        processed = self.run_pending(limit=1)
+                    except Exception as e:
+                        db.session.rollback()
+                        app.logger.error(f"[Jobs] Worker loop failed: {e}")
+                    finally:
+                        db.session.remove()
+                    if not processed:
+                        self._stop.wait(poll)
+
+        pool = [threading.Thread(target=loop, name=f'job-worker-{i}', daemon=True) for i in range(threads)]
+        for thread in pool:
+            thread.start()
+        try:
+            while not self._stop.is_set():
+                with app.app_context():
+                    try:
+                        requeued = BackgroundJob.requeue_stale(stale_after)
+                        if requeued:
+                            print(f"[Jobs] Đưa lại {requeued} tác vụ bị gián đoạn vào hàng đợi")
+                    except Exception as e:
+                        db.session.rollback()
+                        app.logger.error(f"[Jobs] Requeue failed: {e}")
+                    finally:
+                        db.session.remove()
+                self._stop.wait(max(stale_after / 2, poll))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._stop.set()
+            for thread in pool:
+                thread.join()
+
+    def stop(self):
+        self._stop.set()
+
+
+job_runner = JobRunner()
+
+
+# ---------- Xuất file từ route có sẵn ----------
+
+def parse_download_name(disposition: str) -> Optional[str]:
+    """Tên file từ header Content-Disposition (ưu tiên filename*=UTF-8'')"""
+    name = None
+    for part in disposition.split(';'):
+        part = part.strip()
+        if part.startswith("filename*=UTF-8''"):
+            return unquote(part[len("filename*=UTF-8''"):])
+        if part.startswith('filename='):
+            name = part[len('filename='):].strip('"')
+    return name
+
+
+def background_export(title: str):
+    """
+    Decorator cho route xuất file: `?background=1` đưa request vào hàng đợi và chuyển tới trang
+    theo dõi tác vụ; không có tham số thì chạy trực tiếp như cũ. Đặt sau các decorator phân quyền.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.args.get(BACKGROUND_ARG) != '1':
+                return view(*args, **kwargs)
+            job = enqueue('view_export', {
+                'path': request.path,
+                'args': [(k, v) for k, values in request.args.lists() if k != BACKGROUND_ARG for v in values],
+                # Chỉ lưu danh tính được decorator phân quyền kiểm tra; phần còn lại dựng lại từ bảng user
+                'user_id': session.get('user_id'),
+                'role': session.get('role'),
+            }, title=title, user_id=session.get('user_id'))
+            flash('Đã đưa yêu cầu xuất file vào hàng đợi. Tải file khi tác vụ hoàn tất.', 'info')
+            return redirect(url_for('job_detail', job_id=job.id))
+        return wrapper
+    return decorator
+
+
+def _export_session(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Session của người yêu cầu dựng lại từ bảng user; tài khoản bị khóa/xóa hoặc đổi vai trò thì không chạy"""
+    from models import User
+    user = db.session.get(User, params.get('user_id')) if params.get('user_id') else None
+    if user is None or not user.is_active or user.deleted_at is not None:
+        raise PermissionError('Tài khoản yêu cầu xuất file không còn hoạt động')
+    role = user.role.name if user.role else None
+    if role != params.get('role'):
+        raise PermissionError('Vai trò của người yêu cầu đã thay đổi, vui lòng xuất lại')
+    return {'user_id': user.id, 'username': user.username, 'role': role}
+
+
+@job_handler('view_export')
+def run_view_export(ctx: JobContext) -> str:
+    """Chạy lại view xuất file trong request giả lập (danh tính người yêu cầu) và lưu file trả về"""
+    app = current_app._get_current_object()
+    params = ctx.params
+    identity = _export_session(params)
+    ctx.progress(0, message='Đang tạo file...')
+    with app.test_request_context(params['path'], query_string=params.get('args') or []):
+        session.update(identity)
+        view = app.view_functions[request.endpoint]
+        response = app.make_response(view(**(request.view_args or {})))
+        try:
+            if response.status_code != 200:
+                flashes = session.get('_flashes') or []
+                raise RuntimeError(flashes[-1][1] if flashes else f'Xuất file thất bại (HTTP {response.status_code})')
+            download_name = parse_download_name(response.headers.get('Content-Disposition', '')) or f'ket_qua_{ctx.job_id}'
+            path = ctx.artifact_path('result' + os.path.splitext(download_name)[1])
+            size = 0
+            with open(path, 'wb') as f:
+                for chunk in response.iter_encoded():
+                    f.write(chunk)
+                    size += len(chunk)
+        finally:
+            response.close()
+    ctx.set_result(path, download_name, response.mimetype)
+    return f'Đã tạo file {download_name} ({size:,} bytes)'
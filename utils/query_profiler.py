@@ -0,0 +1,189 @@
+"""
+Đếm truy vấn SQL theo request và ghi nhận truy vấn chậm (bật bằng QUERY_PROFILER_ENABLED).
+
+- Sự kiện before/after_cursor_execute của SQLAlchemy đo thời gian từng câu lệnh.
+- before_request/after_request của Flask gom số truy vấn, tổng thời gian DB theo endpoint,
+  giữ các câu lệnh chậm nhất kèm vị trí gọi trong mã nguồn.
+- Kết quả trả về qua header `Server-Timing` và endpoint JSON cho Admin (/dev/diag/queries).
+"""
+import heapq
+import os
+import re
+import threading
+import time
+import traceback
+from typing import Any, Dict, List
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_WHITESPACE = re.compile(r'\s+')
+# Độ dài tối đa của câu lệnh SQL lưu lại
+MAX_STATEMENT_LENGTH = 500
+
+
+class QueryProfiler:
+    """Extension Flask: `query_profiler.init_app(app)`"""
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._endpoints: Dict[str, Dict[str, Any]] = {}
+        self._root = None
+        self._listening = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('QUERY_PROFILER_ENABLED', False)
+        app.config.setdefault('QUERY_PROFILER_SLOW_MS', 100.0)  # Ngưỡng ghi log truy vấn chậm
+        app.config.setdefault('QUERY_PROFILER_TOP_N', 5)  # Số câu lệnh chậm nhất giữ lại mỗi endpoint
+        app.config.setdefault('QUERY_PROFILER_WARN_QUERIES', 50)  # Cảnh báo nghi N+1 khi vượt số truy vấn này
+        app.extensions['query_profiler'] = self
+        self._root = os.path.abspath(app.root_path)
+
+        if not self._listening:
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+            self._listening = True
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+
+    # ---------- SQLAlchemy events ----------
+
+    # Thời điểm bắt đầu gắn với execution context của câu lệnh (không phải conn.info): câu lệnh lỗi
+    # bỏ context đi cùng giá trị này, không để lại phần tử thừa trên kết nối trong pool
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None and has_request_context() and g.get('_query_profile') is not None:
+            context._query_profiler_start = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, '_query_profiler_start', None)
+        if start is None or not has_request_context():
+            return
+        context._query_profiler_start = None
+        elapsed_ms = (time.perf_counter() - start) * 1000.0
+        profile = g.get('_query_profile')
+        if profile is None:
+            return
+        profile['count'] += 1
+        profile['db_ms'] += elapsed_ms
+        slowest = profile['slowest']
+        # Chỉ lấy call stack khi câu lệnh lọt vào top N (tránh chi phí cho mọi truy vấn)
+        if len(slowest) < profile['top_n'] or elapsed_ms > slowest[0][0]:
+            entry = (elapsed_ms, profile['count'], _normalize(statement), self._call_site())
+            if len(slowest) < profile['top_n']:
+                heapq.heappush(slowest, entry)
+            else:
+                heapq.heapreplace(slowest, entry)
+
+    def _call_site(self) -> str:
+        """Frame gần nhất thuộc mã nguồn dự án (bỏ qua thư viện và chính module này)"""
+        for frame in reversed(traceback.extract_stack()[:-3]):
+            filename = os.path.abspath(frame.filename)
+            if not filename.startswith(self._root) or 'site-packages' in filename:
+                continue
+            if filename == os.path.abspath(__file__):
+                continue
+            return f'{os.path.relpath(filename, self._root)}:{frame.lineno} in {frame.name}'
+        return ''
+
+    # ---------- Flask hooks ----------
+
+    def _start_request(self):
+        if not current_app.config.get('QUERY_PROFILER_ENABLED'):
+            return
+        g._query_profile = {
+            'count': 0,
+            'db_ms': 0.0,
+            'slowest': [],
+            'top_n': int(current_app.config.get('QUERY_PROFILER_TOP_N', 5)),
+            'started': time.perf_counter(),
+        }
+
+    def _finish_request(self, response):
+        profile = g.pop('_query_profile', None)
+        if profile is None:
+            return response
+        total_ms = (time.perf_counter() - profile['started']) * 1000.0
+        endpoint = request.endpoint or request.path
+        response.headers.add(
+            'Server-Timing',
+            f'db;dur={profile["db_ms"]:.1f};desc="{profile["count"]} queries", app;dur={total_ms:.1f}'
+        )
+        self._record(endpoint, profile, total_ms)
+
+        slow_ms = float(current_app.config.get('QUERY_PROFILER_SLOW_MS', 100.0))
+        for elapsed_ms, _, statement, call_site in profile['slowest']:
+            if elapsed_ms >= slow_ms:
+                current_app.logger.warning(
+                    f"[QueryProfiler] Slow query {elapsed_ms:.1f}ms at {call_site} ({endpoint}): {statement}"
+                )
+        warn_queries = int(current_app.config.get('QUERY_PROFILER_WARN_QUERIES', 50))
+        if warn_queries and profile['count'] > warn_queries:
+            current_app.logger.warning(
+                f"[QueryProfiler] {endpoint} executed {profile['count']} queries (possible N+1)"
+            )
+        return response
+
+    # ---------- Aggregation ----------
+
+    def _record(self, endpoint: str, profile: Dict[str, Any], total_ms: float):
+        with self._lock:
+            stats = self._endpoints.get(endpoint)
+            if stats is None:
+                stats = self._endpoints[endpoint] = {
+                    'requests': 0, 'queries': 0, 'max_queries': 0,
+                    'db_ms': 0.0, 'max_db_ms': 0.0, 'total_ms': 0.0, 'slowest': [],
+                }
+            stats['requests'] += 1
+            stats['queries'] += profile['count']
+            stats['max_queries'] = max(stats['max_queries'], profile['count'])
+            stats['db_ms'] += profile['db_ms']
+            stats['max_db_ms'] = max(stats['max_db_ms'], profile['db_ms'])
+            stats['total_ms'] += total_ms
+            slowest = stats['slowest']
+            for elapsed_ms, _, statement, call_site in profile['slowest']:
+                entry = (elapsed_ms, statement, call_site)
+                if len(slowest) < profile['top_n']:
+                    heapq.heappush(slowest, entry)
+                elif elapsed_ms > slowest[0][0]:
+                    heapq.heapreplace(slowest, entry)
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """Thống kê theo endpoint, endpoint có số truy vấn trung bình cao nhất đứng đầu"""
+        with self._lock:
+            items = [(endpoint, dict(stats, slowest=list(stats['slowest'])))
+                     for endpoint, stats in self._endpoints.items()]
+        result = []
+        for endpoint, stats in items:
+            requests = stats['requests'] or 1
+            result.append({
+                'endpoint': endpoint,
+                'requests': stats['requests'],
+                'avg_queries': round(stats['queries'] / requests, 2),
+                'max_queries': stats['max_queries'],
+                'avg_db_ms': round(stats['db_ms'] / requests, 2),
+                'max_db_ms': round(stats['max_db_ms'], 2),
+                'avg_total_ms': round(stats['total_ms'] / requests, 2),
+                'slowest': [
+                    {'ms': round(ms, 2), 'statement': statement, 'call_site': call_site}
+                    for ms, statement, call_site in sorted(stats['slowest'], reverse=True)
+                ],
+            })
+        result.sort(key=lambda item: item['avg_queries'], reverse=True)
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+
+
+def _normalize(statement: str) -> str:
+    statement = _WHITESPACE.sub(' ', statement or '').strip()
+    if len(statement) > MAX_STATEMENT_LENGTH:
+        statement = statement[:MAX_STATEMENT_LENGTH] + '...'
+    return statement
+
+
+query_profiler = QueryProfiler()
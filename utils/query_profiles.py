@@ -0,0 +1,57 @@
+"""
+Loader profile cho các endpoint REST: tập loader options (joinedload/selectinload/lazyload)
+đặt tên theo endpoint, và phân trang cho truy vấn chiếu cột (projection).
+
+Mục tiêu: số truy vấn mỗi trang là hằng số, không phụ thuộc per_page (không còn N+1 lazy load).
+"""
+import math
+from typing import Any, List, Tuple
+
+from sqlalchemy.orm import joinedload, lazyload, selectinload
+
+from models import Asset, MaintenanceRecord, User
+
+# Các collection mặc định nạp kiểu subquery nhưng không dùng trong serializer REST
+_SKIP_ASSET_COLLECTIONS = (lazyload(Asset.assigned_users),)
+
+
+def _asset_user():
+    return joinedload(Asset.user).lazyload(User.assigned_assets)
+
+
+LOADER_PROFILES = {
+    # GET /api/v1/assets/<id>: loại tài sản trong cùng câu SELECT
+    'asset_detail': (joinedload(Asset.asset_type),) + _SKIP_ASSET_COLLECTIONS,
+    # GET /api/v1/maintenance/<id>: tài sản + loại + người dùng + người yêu cầu trong một câu SELECT
+    'maintenance_detail': (
+        joinedload(MaintenanceRecord.asset).options(
+            joinedload(Asset.asset_type), _asset_user(), lazyload(Asset.assigned_users)
+        ),
+        joinedload(MaintenanceRecord.requested_by).lazyload(User.assigned_assets),
+    ),
+    # Danh sách bảo trì dạng object (xuất Excel): tài sản nạp theo lô bằng selectinload
+    'maintenance_batch': (
+        selectinload(MaintenanceRecord.asset).options(
+            joinedload(Asset.asset_type), _asset_user(), lazyload(Asset.assigned_users)
+        ),
+        selectinload(MaintenanceRecord.requested_by).lazyload(User.assigned_assets),
+    ),
+}
+
+
+def with_profile(query, name: str):
+    """Gắn loader options của profile `name` vào truy vấn ORM"""
+    return query.options(*LOADER_PROFILES[name])
+
+
+def paginate_rows(query, page: int, per_page: int) -> Tuple[List[Any], int, int]:
+    """
+    Phân trang cho truy vấn chiếu cột (db.paginate chỉ lấy cột đầu tiên của select nhiều cột).
+    Trả về (rows, total, pages) - đúng 2 truy vấn: COUNT và trang dữ liệu.
+    """
+    page = max(page or 1, 1)
+    per_page = max(per_page or 20, 1)
+    total = query.order_by(None).count()
+    rows = query.limit(per_page).offset((page - 1) * per_page).all()
+    pages = int(math.ceil(total / float(per_page))) if total else 0
+    return rows, total, pages
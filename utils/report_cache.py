@@ -0,0 +1,152 @@
+"""
+Snapshot cache cho các báo cáo theo thông tư (màn hình và file Excel).
+
+- Khóa: (báo cáo, tham số lọc gồm năm/quý/trang, vai trò người xem).
+- Mỗi snapshot gắn với phiên bản dữ liệu `DataVersion` tại lúc tính; ghi Asset/AssetType/User
+  làm tăng phiên bản nên snapshot cũ tự hết hiệu lực (mọi worker cùng đọc một bộ đếm).
+- Dữ liệu trang lưu trong bộ nhớ tiến trình (LRU); file XLSX lưu trong EXPORT_DIR/report_snapshots
+  để các worker dùng chung và phục vụ lại bằng send_file.
+"""
+import glob
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Callable, Dict, Optional
+
+from flask import current_app, request, send_file, session
+
+from models import DataVersion
+from utils.jobs import export_root, parse_download_name
+
+SNAPSHOT_SUBDIR = 'report_snapshots'
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+def snapshot_key(report: str, args, ignore=()) -> str:
+    """Khóa ổn định cho (báo cáo, tham số, vai trò) - thứ tự tham số trên URL không ảnh hưởng"""
+    params = sorted((k, v) for k, values in args.lists() if k not in ignore for v in values)
+    raw = json.dumps([report, params, session.get('role')], ensure_ascii=False)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:20]
+
+
+class ReportCache:
+    """LRU trong tiến trình cho dữ liệu báo cáo + file XLSX theo phiên bản dữ liệu"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[str, tuple]' = OrderedDict()
+
+    @staticmethod
+    def enabled() -> bool:
+        return bool(current_app.config.get('REPORT_CACHE_ENABLED', True))
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any]) -> Any:
+        """Snapshot của `key` nếu còn đúng phiên bản dữ liệu, ngược lại tính lại và lưu"""
+        if not self.enabled():
+            return compute()
+        version = DataVersion.current()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                return entry[1]
+        value = compute()
+        max_entries = int(current_app.config.get('REPORT_CACHE_MAX_ENTRIES', 256))
+        with self._lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    # ---------- File XLSX ----------
+
+    @staticmethod
+    def snapshot_dir() -> str:
+        return os.path.join(export_root(), SNAPSHOT_SUBDIR)
+
+    def _snapshot_path(self, key: str, version: int) -> str:
+        return os.path.join(self.snapshot_dir(), f'{key}_v{version}.xlsx')
+
+    def send_cached_export(self, key: str, version: int):
+        """Response từ file snapshot (None nếu chưa có)"""
+        path = self._snapshot_path(key, version)
+        try:
+            with open(path + '.json', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not os.path.exists(path):
+            return None
+        return send_file(os.path.abspath(path), mimetype=XLSX_MIMETYPE,
+                         as_attachment=True, download_name=meta.get('download_name'))
+
+    def store_export(self, key: str, version: int, data: bytes, download_name: Optional[str]):
+        """Ghi file snapshot (ghi tạm rồi đổi tên) và xóa các phiên bản cũ của cùng khóa"""
+        path = self._snapshot_path(key, version)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'download_name': download_name}, f, ensure_ascii=False)
+            os.replace(tmp_path, path + '.json')
+        except OSError:
+            print('[ReportCache] Failed to persist report snapshot to disk.')
+            return
+        for stale in glob.glob(os.path.join(self.snapshot_dir(), f'{key}_v*.xlsx*')):
+            if not stale.startswith(path):
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass
+
+    def clear(self, remove_files: bool = False):
+        """Xóa snapshot trong bộ nhớ (và file XLSX nếu `remove_files`)"""
+        with self._lock:
+            self._entries.clear()
+        if remove_files:
+            for path in glob.glob(os.path.join(self.snapshot_dir(), '*.xlsx*')):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+report_cache = ReportCache()
+
+
+def cached_report_export(report: str):
+    """
+    Decorator cho các route /reports/<...>/export: phục vụ file XLSX đã tạo cho cùng tham số
+    và cùng phiên bản dữ liệu; lần đầu chạy view rồi lưu nội dung file trả về.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not report_cache.enabled():
+                return view(*args, **kwargs)
+            key = snapshot_key(report, request.args, ignore=('after', 'per_page'))
+            version = DataVersion.current()
+            cached = report_cache.send_cached_export(key, version)
+            if cached is not None:
+                return cached
+            response = view(*args, **kwargs)
+            if getattr(response, 'status_code', None) == 200 and response.mimetype == XLSX_MIMETYPE:
+                response.direct_passthrough = False
+                data = response.get_data()
+                download_name = parse_download_name(response.headers.get('Content-Disposition', ''))
+                report_cache.store_export(key, version, data, download_name)
+            return response
+        return wrapper
+    return decorator
+
+
+def cached_report_context(report: str, compute: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+    """Dữ liệu trang báo cáo (dòng + tổng hợp) qua snapshot cache"""
+    return report_cache.get_or_compute(snapshot_key(report, request.args), compute)
@@ -0,0 +1,225 @@
+"""
+Lớp truy vấn dùng chung cho các báo cáo theo thông tư (TT144/TT23, TT24, TT35, đặc thù).
+
+- Bộ lọc của từng báo cáo khai báo một lần, dùng cho cả màn hình và file xuất.
+- Phân trang keyset theo (created_at DESC, id DESC): trang thứ N tốn chi phí như trang đầu,
+  không dùng OFFSET.
+- Tổng hợp theo loại, theo trạng thái và tổng cộng tính bằng một câu GROUP BY trong SQL.
+- Loại tài sản và người dùng nạp bằng joinedload (không còn lazy load từng dòng trong template).
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, extract, func, or_, tuple_
+from sqlalchemy.orm import joinedload, lazyload
+
+from models import db, Asset, AssetType, User
+
+# Số dòng mỗi trang mặc định / tối đa
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+# Từ khóa nhận diện tài sản đặc thù (tên tài sản hoặc tên loại tài sản)
+SPECIAL_KEYWORDS = {
+    'medical': (('y tế', 'thiết bị y tế', 'medical'), 'y tế'),
+    'intangible': (('vô hình', 'bản quyền', 'thương hiệu'), 'vô hình'),
+}
+
+REPORT_LOADER_OPTIONS = (
+    joinedload(Asset.asset_type),
+    joinedload(Asset.user).lazyload(User.assigned_assets),
+    lazyload(Asset.assigned_users),
+)
+
+# Thứ tự báo cáo / keyset: mới nhất trước, created_at NULL xếp cuối
+KEYSET_ORDER = (Asset.created_at.desc().nulls_last(), Asset.id.desc())
+
+
+def _filter_tt144_tt23(query, args):
+    asset_type_id = args.get('asset_type_id', type=int)
+    if asset_type_id:
+        query = query.filter(Asset.asset_type_id == asset_type_id)
+    quarter = args.get('quarter', type=int)
+    if quarter and 1 <= quarter <= 4:
+        start_month = (quarter - 1) * 3 + 1
+        query = query.filter(extract('month', Asset.created_at).between(start_month, start_month + 2))
+    return query
+
+
+def _filter_status(query, args):
+    status = args.get('status', '')
+    if status:
+        query = query.filter(Asset.status == status)
+    return query
+
+
+def _filter_tt35(query, args):
+    location = args.get('location', '')
+    if location:
+        query = query.filter(Asset.user_text.contains(location))
+    return query
+
+
+def _filter_special(query, args):
+    query = _filter_status(query, args)
+    keywords = SPECIAL_KEYWORDS.get(args.get('report_type', 'all'))
+    if keywords:
+        name_keywords, type_keyword = keywords
+        query = query.filter(or_(
+            *[Asset.name.contains(k) for k in name_keywords],
+            Asset.asset_type.has(AssetType.name.contains(type_keyword))
+        ))
+    return query
+
+
+REPORT_FILTERS = {
+    'tt144_tt23': _filter_tt144_tt23,
+    'tt24': _filter_status,
+    'tt35': _filter_tt35,
+    'special': _filter_special,
+}
+
+
+def report_query(report: str, args):
+    """Truy vấn tài sản chưa xóa đã áp bộ lọc của báo cáo `report` (chưa sắp xếp)"""
+    return REPORT_FILTERS[report](Asset.query.filter(Asset.deleted_at.is_(None)), args)
+
+
+def report_assets(report: str, args) -> List[Asset]:
+    """Toàn bộ tài sản của báo cáo (file xuất), quan hệ đã nạp sẵn"""
+    return report_query(report, args).options(*REPORT_LOADER_OPTIONS).order_by(*KEYSET_ORDER).all()
+
+
+def report_row(asset: Asset) -> Dict[str, Any]:
+    """
+    Dòng báo cáo dạng dict (cùng tên thuộc tính mà template dùng: asset.asset_type.name, asset.user.username...)
+    để snapshot không giữ đối tượng ORM gắn với session của request trước.
+    """
+    return {
+        'id': asset.id,
+        'device_code': asset.device_code,
+        'name': asset.name,
+        'asset_type': {'name': asset.asset_type.name} if asset.asset_type else None,
+        'price': asset.price,
+        'quantity': asset.quantity,
+        'purchase_date': asset.purchase_date,
+        'user': {'username': asset.user.username} if asset.user else None,
+        'user_text': asset.user_text,
+        'condition_label': asset.condition_label,
+        'status': asset.status,
+        'notes': asset.notes,
+    }
+
+
+# ---------- Keyset cursor ----------
+
+def encode_cursor(created_at: Optional[datetime], asset_id: int, position: int) -> str:
+    """Cursor mờ cho tham số ?after=: (created_at, id) của dòng cuối trang và số dòng đã qua"""
+    payload = json.dumps([created_at.isoformat() if created_at else None, asset_id, position])
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[Optional[datetime], int, int]]:
+    """Giải mã cursor, None nếu rỗng hoặc không hợp lệ (quay về trang đầu)"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, asset_id, position = json.loads(raw.decode('utf-8'))
+        created_at = datetime.fromisoformat(created_at) if created_at else None
+        return created_at, int(asset_id), max(int(position), 0)
+    except (binascii.Error, ValueError, TypeError, UnicodeDecodeError):
+        return None
+
+
+def keyset_after(created_at: datetime, asset_id: int):
+    """
+    Dòng có created_at đứng sau (created_at, id) theo thứ tự created_at DESC, id DESC.
+    So sánh bộ (row value) không có nhánh OR nên dùng được khoảng index; dòng created_at NULL lấy riêng.
+    """
+    return tuple_(Asset.created_at, Asset.id) < tuple_(created_at, asset_id)
+
+
+def keyset_null_tail(asset_id: Optional[int] = None):
+    """Các dòng created_at NULL (xếp cuối), sau id `asset_id` nếu có"""
+    condition = Asset.created_at.is_(None)
+    return and_(condition, Asset.id < asset_id) if asset_id is not None else condition
+
+
+def keyset_page(query, after: Optional[str] = None, per_page: int = DEFAULT_PAGE_SIZE) -> Dict[str, Any]:
+    """
+    Một trang tài sản sau cursor `after`.
+    Trả về {'items', 'start', 'next_cursor', 'per_page'}: `start` là STT của dòng đầu trang,
+    `next_cursor` là None ở trang cuối. Lấy dư một dòng để biết còn trang sau hay không.
+    """
+    per_page = min(max(per_page or DEFAULT_PAGE_SIZE, 1), MAX_PAGE_SIZE)
+    cursor = decode_cursor(after)
+    position = 0
+    query = query.options(*REPORT_LOADER_OPTIONS)
+    if not cursor:
+        rows = query.order_by(*KEYSET_ORDER).limit(per_page + 1).all()
+    else:
+        created_at, asset_id, position = cursor
+        if created_at is None:
+            rows = query.filter(keyset_null_tail(asset_id)).order_by(Asset.id.desc()).limit(per_page + 1).all()
+        else:
+            # Mỗi phần là một khoảng index (created_at DESC NULLS LAST, id DESC); phần NULL chỉ đọc khi hết phần trước
+            rows = query.filter(keyset_after(created_at, asset_id)).order_by(*KEYSET_ORDER).limit(per_page + 1).all()
+            if len(rows) <= per_page:
+                rows += query.filter(keyset_null_tail()).order_by(Asset.id.desc()).limit(per_page + 1 - len(rows)).all()
+    items = rows[:per_page]
+    next_cursor = None
+    if len(rows) > per_page:
+        last = items[-1]
+        next_cursor = encode_cursor(last.created_at, last.id, position + len(items))
+    return {'items': items, 'start': position + 1, 'next_cursor': next_cursor, 'per_page': per_page}
+
+
+# ---------- Tổng hợp ----------
+
+def _empty_total() -> Dict[str, Any]:
+    return {'count': 0, 'quantity': 0, 'value': 0.0}
+
+
+def _accumulate(total: Dict[str, Any], count: int, quantity: int, value: float):
+    total['count'] += count
+    total['quantity'] += quantity
+    total['value'] += value
+
+
+def report_subtotals(query) -> Dict[str, Any]:
+    """
+    Tổng hợp trên toàn bộ kết quả lọc (không chỉ trang hiện tại): một câu GROUP BY (loại, trạng thái).
+    Số lượng NULL/0 tính là 1, giá trị = nguyên giá × số lượng (như bảng asset_type_rollup).
+    Trả về {'by_type': [...], 'by_status': [...], 'total': {...}}.
+    """
+    qty = func.coalesce(func.nullif(Asset.quantity, 0), 1)
+    ids = query.with_entities(Asset.id).subquery()
+    rows = db.session.query(
+        Asset.asset_type_id,
+        AssetType.name,
+        Asset.status,
+        func.count(Asset.id),
+        func.sum(qty),
+        func.sum(func.coalesce(Asset.price, 0) * qty),
+    ).join(ids, ids.c.id == Asset.id).outerjoin(
+        AssetType, AssetType.id == Asset.asset_type_id
+    ).group_by(Asset.asset_type_id, AssetType.name, Asset.status).all()
+
+    by_type: Dict[Any, Dict[str, Any]] = {}
+    by_status: Dict[str, Dict[str, Any]] = {}
+    total = _empty_total()
+    for type_id, type_name, status, count, quantity, value in rows:
+        count, quantity, value = int(count or 0), int(quantity or 0), float(value or 0)
+        type_total = by_type.setdefault(type_id, dict(_empty_total(), asset_type_id=type_id, name=type_name or 'N/A'))
+        status_total = by_status.setdefault(status or '', dict(_empty_total(), status=status or ''))
+        for bucket in (type_total, status_total, total):
+            _accumulate(bucket, count, quantity, value)
+    return {
+        'by_type': sorted(by_type.values(), key=lambda t: t['value'], reverse=True),
+        'by_status': sorted(by_status.values(), key=lambda t: t['count'], reverse=True),
+        'total': total,
+    }
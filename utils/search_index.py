@@ -0,0 +1,149 @@
+"""
+Tìm kiếm không dấu cho tài sản và bảo trì qua bảng search_document.
+
+- SQLite: FTS5 tokenizer trigram (bảng search_fts), mỗi token khớp chuỗi con như LIKE, xếp hạng bằng bm25;
+  token ngắn hơn 3 ký tự (trigram không chỉ mục được) lọc thêm bằng LIKE trên content.
+- PostgreSQL: pg_trgm (GIN trên content), mỗi token khớp LIKE '%token%', xếp hạng bằng similarity.
+- CSDL khác / chưa có chỉ mục: LIKE trên content đã chuẩn hóa (vẫn không phân biệt dấu).
+
+Cách dùng: `apply_search(query, SearchDocument.ASSET, Asset.id, term, ranked=True)`.
+"""
+import threading
+from typing import Optional
+
+from sqlalchemy import Float, Integer, and_, func, literal, select, text
+
+from models import db, Asset, MaintenanceRecord, SearchDocument
+from utils.db_batch import chunked
+from utils.search_text import search_tokens
+
+_backend_cache = {}
+_populated = set()
+_lock = threading.Lock()
+
+
+def search_backend() -> str:
+    """'fts5', 'trgm' hoặc 'like' theo CSDL đang dùng (kiểm tra một lần mỗi engine)"""
+    engine = db.engine
+    key = str(engine.url)
+    backend = _backend_cache.get(key)
+    if backend is None:
+        backend = 'like'
+        if engine.dialect.name == 'sqlite':
+            ddl = db.session.execute(text(
+                "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'search_fts'"
+            )).scalar()
+            # Bảng FTS cũ (unicode61) chỉ khớp tiền tố - dùng LIKE cho tới khi chạy migration
+            backend = 'fts5' if ddl and 'trigram' in ddl else 'like'
+        elif engine.dialect.name == 'postgresql':
+            found = db.session.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).first()
+            backend = 'trgm' if found else 'like'
+        with _lock:
+            _backend_cache[key] = backend
+    return backend
+
+
+def reset_backend_cache():
+    """Quên backend/trạng thái đã dò (sau khi tạo lại bảng, ví dụ trong test)"""
+    with _lock:
+        _backend_cache.clear()
+        _populated.clear()
+
+
+# Độ dài token tối thiểu tokenizer trigram khớp được
+FTS_MIN_TOKEN = 3
+
+
+def _fts_query(tokens):
+    # Token đã chuẩn hóa chỉ gồm [0-9a-z] nên đặt trong ngoặc kép là an toàn
+    return ' '.join(f'"{token}"' for token in tokens)
+
+
+def search_hits(entity: str, term: Optional[str]):
+    """
+    Subquery (entity_id, rank) các bản ghi khớp `term` - rank nhỏ hơn là liên quan hơn.
+    None nếu `term` không có token nào (không lọc).
+    """
+    tokens = search_tokens(term)
+    if not tokens:
+        return None
+    ensure_search_index()
+    backend = search_backend()
+    fts_tokens = [token for token in tokens if len(token) >= FTS_MIN_TOKEN]
+    if backend == 'fts5' and fts_tokens:
+        short_tokens = [token for token in tokens if len(token) < FTS_MIN_TOKEN]
+        likes = {f'like{i}': f'%{token}%' for i, token in enumerate(short_tokens)}
+        return text(
+            "SELECT search_document.entity_id AS entity_id, bm25(search_fts) AS rank "
+            "FROM search_fts JOIN search_document ON search_document.id = search_fts.rowid "
+            "WHERE search_fts MATCH :match AND search_document.entity = :entity"
+            + ''.join(f" AND search_document.content LIKE :{name}" for name in likes)
+        ).bindparams(match=_fts_query(fts_tokens), entity=entity, **likes).columns(
+            entity_id=Integer, rank=Float
+        ).subquery('search_hits')
+
+    content = SearchDocument.content
+    if backend == 'trgm':
+        rank = -func.similarity(content, ' '.join(tokens))
+    else:
+        rank = func.length(content) + literal(0.0)
+    return select(
+        SearchDocument.entity_id.label('entity_id'), rank.label('rank')
+    ).where(
+        SearchDocument.entity == entity,
+        and_(*[content.like(f'%{token}%') for token in tokens])
+    ).subquery('search_hits')
+
+
+def apply_search(query, entity: str, id_column, term: Optional[str], ranked: bool = False):
+    """Lọc truy vấn ORM theo kết quả tìm kiếm; `ranked=True` sắp xếp theo độ liên quan trước"""
+    hits = search_hits(entity, term)
+    if hits is None:
+        return query
+    query = query.join(hits, hits.c.entity_id == id_column)
+    if ranked:
+        query = query.order_by(hits.c.rank)
+    return query
+
+
+# ---------- Dựng lại chỉ mục ----------
+
+def rebuild_search_index(batch_size: int = 1000) -> int:
+    """Dựng lại toàn bộ search_document từ asset và maintenance_record (`flask rebuild-search-index`)"""
+    SearchDocument.query.delete(synchronize_session=False)
+    assets = {}
+    for asset_id, name, device_code in db.session.query(Asset.id, Asset.name, Asset.device_code):
+        assets[asset_id] = (name, device_code)
+    rows = [{
+        'entity': SearchDocument.ASSET,
+        'entity_id': asset_id,
+        'content': SearchDocument.asset_content(name, device_code),
+    } for asset_id, (name, device_code) in assets.items()]
+    maintenance = db.session.query(
+        MaintenanceRecord.id, MaintenanceRecord.asset_id, MaintenanceRecord.description,
+        MaintenanceRecord.vendor, MaintenanceRecord.person_in_charge
+    )
+    for record_id, asset_id, description, vendor, person_in_charge in maintenance:
+        asset_name, asset_code = assets.get(asset_id, (None, None))
+        rows.append({
+            'entity': SearchDocument.MAINTENANCE,
+            'entity_id': record_id,
+            'content': SearchDocument.maintenance_content(description, vendor, person_in_charge, asset_name, asset_code),
+        })
+    for chunk in chunked(rows, batch_size):
+        db.session.execute(SearchDocument.__table__.insert(), chunk)
+    if db.engine.dialect.name == 'sqlite' and search_backend() == 'fts5':
+        db.session.execute(text("INSERT INTO search_fts(search_fts) VALUES ('rebuild')"))
+    db.session.commit()
+    return len(rows)
+
+
+def ensure_search_index():
+    """Tự dựng chỉ mục nếu còn trống trong khi đã có tài sản (CSDL cũ trước khi có bảng này)"""
+    key = str(db.engine.url)
+    if key in _populated:
+        return
+    if db.session.query(SearchDocument.id).first() is None and db.session.query(Asset.id).first() is not None:
+        rebuild_search_index()
+    with _lock:
+        _populated.add(key)
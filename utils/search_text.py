@@ -0,0 +1,33 @@
+"""
+Chuẩn hóa văn bản cho tìm kiếm: bỏ dấu tiếng Việt, chữ thường, tách token.
+
+"Máy tính Đồng Nai" -> "may tinh dong nai". Module thuần Python (không import models) để
+models.py dùng được khi đồng bộ bảng search_document.
+"""
+import re
+import unicodedata
+from typing import Iterable, List
+
+_NON_WORD = re.compile(r'[^0-9a-z]+')
+# đ/Đ không phải chữ có dấu tổ hợp nên NFD không tách được
+_SPECIAL_LETTERS = str.maketrans({'đ': 'd', 'Đ': 'd'})
+
+
+def normalize_search_text(value) -> str:
+    """Chuỗi đã bỏ dấu, chữ thường, các token cách nhau một khoảng trắng"""
+    if not value:
+        return ''
+    text = str(value).translate(_SPECIAL_LETTERS)
+    text = unicodedata.normalize('NFD', text)
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch)).lower()
+    return _NON_WORD.sub(' ', text).strip()
+
+
+def search_tokens(value) -> List[str]:
+    """Các token (không trùng, giữ thứ tự) của chuỗi tìm kiếm"""
+    return list(dict.fromkeys(normalize_search_text(value).split()))
+
+
+def build_search_content(parts: Iterable) -> str:
+    """Nội dung tìm kiếm của một bản ghi từ các trường văn bản"""
+    return ' '.join(filter(None, (normalize_search_text(p) for p in parts)))
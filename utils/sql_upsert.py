@@ -0,0 +1,20 @@
+"""INSERT theo dialect (PostgreSQL / SQLite) có ON CONFLICT - chèn hoặc cập nhật trong một câu lệnh, không đua nhau"""
+from sqlalchemy.dialects import postgresql, sqlite
+
+_INSERTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+
+def dialect_insert(table, bind):
+    """
+    insert() của dialect đang dùng (có on_conflict_do_nothing / on_conflict_do_update).
+    `bind` là Connection/Session/Engine; chỉ hỗ trợ PostgreSQL và SQLite như phần còn lại của ứng dụng.
+    """
+    if hasattr(bind, 'get_bind'):
+        bind = bind.get_bind()
+    name = bind.dialect.name
+    if name not in _INSERTS:
+        raise NotImplementedError(f'ON CONFLICT chưa hỗ trợ cho dialect {name}')
+    return _INSERTS[name](table)
@@ -0,0 +1,324 @@
+"""
+Chỉ mục gợi ý (autocomplete) trong bộ nhớ tiến trình cho các endpoint /<...>/suggest.
+
+- Mỗi nguồn (tài sản, loại tài sản, người dùng, bảo trì) là một mảng đã sắp xếp các cặp
+  (token đã bỏ dấu, id); tra tiền tố bằng bisect, không truy vấn CSDL.
+- Dựng một lần khi khởi động (hoặc lần gọi đầu), sau đó làm mới tăng dần: khi phiên bản
+  `DataVersion.SUGGEST` đổi thì chỉ nạp các dòng có updated_at mới hơn mốc đã đọc.
+  Phiên bản được kiểm tra tối đa mỗi SUGGEST_INDEX_VERSION_CHECK giây; thay đổi do chính
+  tiến trình ghi thì thấy ngay.
+- Chỉ mục đã công bố không bị sửa: lần làm mới đọc phần thay đổi, bỏ các dòng không đổi, trộn vào
+  một bản mới (một lần sắp xếp; thay đổi nhiều thì dựng lại nguồn) rồi thay thế nguyên khối.
+  Lượt tra cứu không chờ lần làm mới đang chạy ở thread khác mà dùng bản hiện có.
+- Mỗi mục lưu chủ sở hữu (user_id của tài sản) để lọc theo quyền của vai trò `user`.
+"""
+import heapq
+import threading
+import time
+from bisect import bisect_left
+from datetime import timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from flask import current_app
+from sqlalchemy import case, func, or_
+
+from models import db, Asset, AssetType, DataVersion, MaintenanceRecord, User
+from utils.search_text import search_tokens
+
+# Nạp lại cả các dòng cập nhật ngay trước mốc (transaction commit muộn hơn updated_at của nó)
+WATERMARK_OVERLAP = timedelta(minutes=5)
+# Ký tự lớn hơn mọi ký tự của token đã chuẩn hóa ([0-9a-z]) - cận trên của khoảng tiền tố
+_PREFIX_END = '{'
+# Số dòng thay đổi vượt tỷ lệ này so với kích thước nguồn thì dựng lại cả nguồn thay vì trộn
+FULL_BUILD_RATIO = 0.25
+
+
+class _Entry:
+    __slots__ = ('tokens', 'sort_key', 'owner', 'payload')
+
+    def __init__(self, tokens, sort_key, owner, payload):
+        self.tokens = tokens
+        self.sort_key = sort_key
+        self.owner = owner
+        self.payload = payload
+
+    def __eq__(self, other):
+        return isinstance(other, _Entry) and (self.tokens, self.sort_key, self.owner, self.payload) == (
+            other.tokens, other.sort_key, other.owner, other.payload)
+
+
+class PrefixIndex:
+    """Mảng (token, id) đã sắp xếp + thông tin từng mục; không sửa tại chỗ, thay đổi tạo bản mới (`merged`)"""
+
+    def __init__(self):
+        self.entries: Dict[int, _Entry] = {}
+        self.keys: List[Tuple[str, int]] = []
+
+    @classmethod
+    def build(cls, items: Iterable[Tuple[int, _Entry]]) -> 'PrefixIndex':
+        index = cls()
+        index.entries = dict(items)
+        index.keys = sorted((token, entry_id) for entry_id, entry in index.entries.items() for token in entry.tokens)
+        return index
+
+    def merged(self, changes: Dict[int, Optional[_Entry]]) -> 'PrefixIndex':
+        """Bản mới sau khi áp `changes` (id -> mục mới, None = xóa): O(n + m log m), bản cũ giữ nguyên"""
+        index = PrefixIndex()
+        index.entries = dict(self.entries)
+        added = []
+        for entry_id, entry in changes.items():
+            if entry is None:
+                index.entries.pop(entry_id, None)
+            else:
+                index.entries[entry_id] = entry
+                added.extend((token, entry_id) for token in entry.tokens)
+        kept = [key for key in self.keys if key[1] not in changes]
+        index.keys = list(heapq.merge(kept, sorted(added)))
+        return index
+
+    def _range(self, prefix: str) -> Tuple[int, int]:
+        return bisect_left(self.keys, (prefix,)), bisect_left(self.keys, (prefix + _PREFIX_END,))
+
+    def search(self, tokens: List[str], limit: int, owner: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Các mục có token bắt đầu bằng từng token tìm kiếm, theo thứ tự sort_key"""
+        if not tokens:
+            return []
+        # Bắt đầu từ token có khoảng hẹp nhất, các token còn lại kiểm tra trên từng ứng viên
+        ranges = sorted(((self._range(token), token) for token in tokens), key=lambda item: item[0][1] - item[0][0])
+        (lo, hi), _ = ranges[0]
+        rest = [token for _, token in ranges[1:]]
+        matches = []
+        for entry_id in {self.keys[pos][1] for pos in range(lo, hi)}:
+            entry = self.entries[entry_id]
+            if owner is not None and entry.owner != owner:
+                continue
+            if all(any(t.startswith(token) for t in entry.tokens) for token in rest):
+                matches.append(entry)
+        return [entry.payload for entry in heapq.nsmallest(limit, matches, key=lambda e: e.sort_key)]
+
+
+# ---------- Nguồn dữ liệu ----------
+
+def _tokens(*values) -> Tuple[str, ...]:
+    tokens = []
+    for value in values:
+        tokens.extend(search_tokens(value))
+    return tuple(dict.fromkeys(tokens))
+
+
+def _newest_first(value, entry_id):
+    return (-value.timestamp() if value else 0.0, -entry_id)
+
+
+def _asset_entry(row) -> Optional[_Entry]:
+    if row.deleted_at is not None:
+        return None
+    label = f"{row.name} ({row.device_code})" if row.device_code else row.name
+    return _Entry(_tokens(row.name, row.device_code), _newest_first(row.created_at, row.id), row.user_id, {
+        "id": row.id,
+        "label": label,
+        "name": row.name,
+        "device_code": row.device_code or ""
+    })
+
+
+def _asset_type_entry(row) -> Optional[_Entry]:
+    if row.deleted_at is not None:
+        return None
+    return _Entry(_tokens(row.name), _newest_first(row.created_at, row.id), None, {
+        "id": row.id,
+        "label": row.name,
+        "name": row.name
+    })
+
+
+def _user_entry(row) -> Optional[_Entry]:
+    if row.deleted_at is not None:
+        return None
+    label = row.username
+    if row.email:
+        label += f" ({row.email})"
+    if row.name:
+        label += f" - {row.name}"
+    return _Entry(_tokens(row.username, row.email, row.name), ((row.username or '').lower(), row.id), None, {
+        "id": row.id,
+        "label": label,
+        "username": row.username,
+        "email": row.email or "",
+        "name": row.name or ""
+    })
+
+
+def _maintenance_entry(row) -> Optional[_Entry]:
+    if row.deleted_at is not None:
+        return None
+    pieces = [row.asset_name or "Không rõ tài sản"]
+    if row.vendor:
+        pieces.append(row.vendor)
+    if row.description:
+        pieces.append(row.description[:60])
+    # Ngày bảo trì mới nhất trước, chưa có ngày xếp cuối
+    sort_key = (0, -row.maintenance_date.toordinal(), -row.id) if row.maintenance_date else (1, 0, -row.id)
+    tokens = _tokens(row.description, row.vendor, row.person_in_charge, row.asset_name, row.asset_device_code)
+    return _Entry(tokens, sort_key, row.asset_user_id, {
+        "id": row.id,
+        "label": " - ".join(pieces)
+    })
+
+
+def _asset_rows(since):
+    query = db.session.query(
+        Asset.id, Asset.name, Asset.device_code, Asset.user_id, Asset.created_at, Asset.deleted_at, Asset.updated_at
+    )
+    return query.filter(Asset.updated_at >= since) if since else query.filter(Asset.deleted_at.is_(None))
+
+
+def _asset_type_rows(since):
+    query = db.session.query(
+        AssetType.id, AssetType.name, AssetType.created_at, AssetType.deleted_at, AssetType.updated_at
+    )
+    return query.filter(AssetType.updated_at >= since) if since else query.filter(AssetType.deleted_at.is_(None))
+
+
+def _user_rows(since):
+    query = db.session.query(User.id, User.username, User.email, User.name, User.deleted_at, User.updated_at)
+    return query.filter(User.updated_at >= since) if since else query.filter(User.deleted_at.is_(None))
+
+
+def _maintenance_rows(since):
+    query = db.session.query(
+        MaintenanceRecord.id, MaintenanceRecord.description, MaintenanceRecord.vendor,
+        MaintenanceRecord.person_in_charge, MaintenanceRecord.maintenance_date, MaintenanceRecord.deleted_at,
+        # Mốc thay đổi của dòng = thời điểm mới hơn giữa bản ghi bảo trì và tài sản của nó
+        case((Asset.updated_at > MaintenanceRecord.updated_at, Asset.updated_at),
+             else_=MaintenanceRecord.updated_at).label('updated_at'),
+        Asset.name.label('asset_name'), Asset.device_code.label('asset_device_code'), Asset.user_id.label('asset_user_id'),
+    ).outerjoin(Asset, Asset.id == MaintenanceRecord.asset_id)
+    if since:
+        # Đổi tên / giao lại tài sản cũng làm đổi nhãn và quyền xem của bản ghi bảo trì
+        return query.filter(or_(MaintenanceRecord.updated_at >= since, Asset.updated_at >= since))
+    return query.filter(MaintenanceRecord.deleted_at.is_(None))
+
+
+class _Source:
+    def __init__(self, model, rows: Callable, to_entry: Callable):
+        self.model = model
+        self.rows = rows
+        self.to_entry = to_entry
+
+    def live_count(self) -> int:
+        return db.session.query(func.count(self.model.id)).filter(self.model.deleted_at.is_(None)).scalar() or 0
+
+
+SOURCES = {
+    'assets': _Source(Asset, _asset_rows, _asset_entry),
+    'asset_types': _Source(AssetType, _asset_type_rows, _asset_type_entry),
+    'users': _Source(User, _user_rows, _user_entry),
+    'maintenance': _Source(MaintenanceRecord, _maintenance_rows, _maintenance_entry),
+}
+
+
+class SuggestIndex:
+    """Extension Flask: `suggest_index.init_app(app)`; tra cứu bằng `suggest_index.suggest(name, term)`"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.reset()
+
+    def init_app(self, app):
+        app.config.setdefault('SUGGEST_INDEX_VERSION_CHECK', 1.0)  # Giây giữa hai lần đọc phiên bản
+        app.config.setdefault('SUGGEST_INDEX_PRELOAD', True)
+        app.extensions['suggest_index'] = self
+        if app.config['SUGGEST_INDEX_PRELOAD']:
+            with app.app_context():
+                try:
+                    self.refresh(force=True)
+                except Exception as e:
+                    # CSDL chưa tạo bảng (lần chạy đầu / đang migrate): dựng ở lần gọi đầu tiên
+                    db.session.rollback()
+                    print(f"[SuggestIndex] Preload skipped: {e}")
+                finally:
+                    db.session.remove()
+
+    def reset(self):
+        with self._lock:
+            self._indexes: Dict[str, PrefixIndex] = {}
+            self._watermarks: Dict[str, Any] = {}
+            self._version = None
+            self._local_serial = None
+            self._checked_at = 0.0
+
+    @staticmethod
+    def _full_build(name: str) -> Tuple[PrefixIndex, Any]:
+        source = SOURCES[name]
+        items, watermark = [], None
+        for row in source.rows(None):
+            entry = source.to_entry(row)
+            if entry is not None:
+                items.append((row.id, entry))
+            if row.updated_at and (watermark is None or row.updated_at > watermark):
+                watermark = row.updated_at
+        return PrefixIndex.build(items), watermark
+
+    @classmethod
+    def _incremental(cls, name: str, index: PrefixIndex, watermark) -> Tuple[PrefixIndex, Any]:
+        """Bản chỉ mục mới của nguồn `name` (chính `index` nếu không có dòng nào thực sự đổi)"""
+        source = SOURCES[name]
+        if watermark is None:
+            return cls._full_build(name)
+        changes: Dict[int, Optional[_Entry]] = {}
+        for row in source.rows(watermark - WATERMARK_OVERLAP):
+            entry = source.to_entry(row)
+            # Dòng nạp lại do khoảng chồng mốc thường không đổi: bỏ qua
+            if entry != index.entries.get(row.id):
+                changes[row.id] = entry
+            if row.updated_at and row.updated_at > watermark:
+                watermark = row.updated_at
+        if len(changes) > max(len(index.entries) * FULL_BUILD_RATIO, 1000):
+            return cls._full_build(name)
+        if changes:
+            index = index.merged(changes)
+        # Xóa vĩnh viễn không để lại dấu updated_at: lệch số lượng thì dựng lại nguồn này
+        if source.live_count() != len(index.entries):
+            return cls._full_build(name)
+        return index, watermark
+
+    def refresh(self, force: bool = False, wait: bool = True):
+        """
+        Đồng bộ chỉ mục với CSDL: dựng toàn bộ khi `force`/chưa có, ngược lại nạp phần thay đổi.
+        Chỉ một thread làm mới tại một thời điểm; `wait=False` bỏ qua nếu thread khác đang làm mới.
+        """
+        if not self._lock.acquire(blocking=wait):
+            return
+        try:
+            now = time.monotonic()
+            local_serial = DataVersion.local_serial(DataVersion.SUGGEST)
+            if not force and self._indexes:
+                interval = float(current_app.config.get('SUGGEST_INDEX_VERSION_CHECK', 1.0))
+                if local_serial == self._local_serial and now - self._checked_at < interval:
+                    return
+            version = DataVersion.current(DataVersion.SUGGEST)
+            self._checked_at = now
+            self._local_serial = local_serial
+            if not force and self._indexes and version == self._version:
+                return
+            indexes, watermarks = dict(self._indexes), dict(self._watermarks)
+            for name in SOURCES:
+                if force or name not in indexes:
+                    indexes[name], watermarks[name] = self._full_build(name)
+                else:
+                    indexes[name], watermarks[name] = self._incremental(name, indexes[name], watermarks.get(name))
+            # Công bố bản mới nguyên khối: lượt tra cứu đang chạy vẫn đọc bản cũ nhất quán
+            self._indexes, self._watermarks = indexes, watermarks
+            self._version = version
+        finally:
+            self._lock.release()
+
+    def suggest(self, name: str, term: str, limit: int = 10, owner: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Tối đa `limit` gợi ý cho `term`; `owner` giới hạn theo chủ sở hữu (vai trò user)"""
+        # Đã có chỉ mục thì không chờ lần làm mới của thread khác (trả theo bản hiện có)
+        self.refresh(wait=not self._indexes)
+        return self._indexes[name].search(search_tokens(term), limit, owner)
+
+
+suggest_index = SuggestIndex()
@@ -12,3 +12,8 @@ def today_vn():
     """Return today's date in Vietnam timezone."""
     return now_vn().date()
 
+
+
+def from_timestamp_vn(timestamp) -> datetime:
+    """Convert a UNIX timestamp (e.g. JWT `exp`) to Vietnam local datetime."""
+    return datetime.utcfromtimestamp(timestamp) + _VN_OFFSET